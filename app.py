@@ -1,20 +1,26 @@
 # app.py
+from __future__ import annotations
+
 import os
-import io
 import time
-import zipfile
-import threading
-import queue
 from datetime import date
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-import pandas as pd
 import streamlit as st
 
-
+import app_cache
 import auth
+import catalog
 import config as cfgmod
 import data_store
+import eta
+import file_index
+import job_manager
+import lazy_import
+import run_ledger
+import zip_cache
+
+pd = lazy_import.modulo("pandas", "as tabelas do app")
 
 st.set_page_config(
     page_title="Portal NFS-e",
@@ -213,207 +219,156 @@ def sidebar(user: auth.User) -> str:
 # ----------------------------
 # Bot helpers
 # ----------------------------
-COLUNAS_LOG_ORDEM = [
-    "NUMERO_NF",
-    "DATA_EMISSAO",
-    "DATA_COMPETENCIA",
-    "CNPJ_PRESTADOR",
-    "RAZAO_PRESTADOR",
-    "CNPJ_TOMADOR",
-    "RAZAO_TOMADOR",
-    "OPTANTE_SN",
-    "CODIGO_TRIBUTACAO_NACIONAL",
-    "VALOR_SERVICO",
-    "IR",
-    "ISS",
-    "ISS_RETIDO",
-    "CSLL",
-    "DEDUCOES",
-    "PIS",
-    "COFINS",
-    "INSS",
-    "DESC_INCOND",
-    "DESC_COND",
-    "OUTRAS_RET",
-    "ALIQUOTA",
-    "BASE_CALCULO",
-    "VALOR_LIQUIDO",
-    "SITUACAO",
-]
-
-
-def _patch_bot_paths(cfg: cfgmod.AppConfig):
-    """
-    Mantém o bot original e só padroniza caminhos.
-    """
-    import bot_nfse
-
-    # Padrão de produção: usar Selenium Manager (Selenium>=4.6) e evitar binário errado/corrompido do webdriver_manager
-    # Isso mitiga o clássico [WinError 193] ao iniciar o ChromeDriver.
-    try:
-        bot_nfse.USE_WEBDRIVER_MANAGER = False
-    except Exception:
-        pass
-
-    bot_nfse.CAMINHO_PLANILHA = os.path.abspath(cfg.caminho_planilha)
-    bot_nfse.PASTA_BASE_SAIDA = os.path.abspath(cfg.pasta_base_saida)
-    bot_nfse.PASTA_DOWNLOAD_TEMP = os.path.abspath(cfg.pasta_download_temp)
-    bot_nfse.PASTA_IMAGENS_CERT = os.path.abspath(cfg.pasta_imagens_cert)
-    bot_nfse.DELAY_ACAO = float(cfg.delay_acao)
-
-    os.makedirs(bot_nfse.PASTA_DOWNLOAD_TEMP, exist_ok=True)
-    os.makedirs(bot_nfse.PASTA_BASE_SAIDA, exist_ok=True)
-    os.makedirs(bot_nfse.PASTA_IMAGENS_CERT, exist_ok=True)
-
-    return bot_nfse
-
-
-def _zip_dir(folder: str) -> bytes:
+def _botao_zip(folder: str, nome_zip: str, rotulo: str) -> None:
     """
-    Compacta a pasta para download.
-
-    Hardening (Windows):
-    - ignora arquivos temporários do Excel (prefixo '~$')
-    - ignora arquivos bloqueados (PermissionError) para não quebrar a auditoria
-    """
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
-        for root, _, files in os.walk(folder):
-            for fn in files:
-                if fn.startswith("~$"):
-                    continue
-                full = os.path.join(root, fn)
-                rel = os.path.relpath(full, folder)
-                try:
-                    z.write(full, rel)
-                except PermissionError:
-                    continue
-                except FileNotFoundError:
-                    continue
-    buf.seek(0)
-    return buf.read()
-
-
-def _emit(q: "queue.Queue", evt: Dict[str, Any]) -> None:
-    try:
-        q.put(evt, block=False)
-    except Exception:
-        pass
-
-
-def run_bot_job(cfg: cfgmod.AppConfig, ano: int, mes: int, empresas: List[str], events: "queue.Queue", stop_evt: threading.Event):
-    """
-    Worker thread: NÃO chama st.* (evita 'missing ScriptRunContext').
-    Progresso é comunicado por eventos na fila.
+    ZIP sob demanda: "Preparar" monta o arquivo em disco (zip_cache, reaproveitado entre reruns/sessões
+    enquanto a pasta não mudar); "Baixar" entrega o arquivo uma vez e limpa o estado. Só o rerun do
+    "Baixar" lê o ZIP para a memória; os demais reruns da página não tocam nele.
     """
-    try:
-        bot_nfse = _patch_bot_paths(cfg)
-        data_store.garantir_planilha_modelo(cfg.caminho_planilha)
-
-        clientes = bot_nfse.carregar_clientes_da_planilha()
-        clientes = [c for c in clientes if c.get("EMPRESA") in empresas]
-
-        if not clientes:
-            _emit(events, {"type": "error", "message": "Nenhum cliente selecionado (ou nenhum ATIVO)."})
-            return
-
-        bot = bot_nfse.NFSePortalBot(ano, mes)
-        _emit(events, {"type": "init", "output_folder": bot.pasta_competencia})
-
-        for c in clientes:
-            if stop_evt.is_set():
-                _emit(events, {"type": "log", "message": "[INFO] Execução interrompida pelo operador."})
-                break
-
-            empresa = c.get("EMPRESA", "")
-            _emit(
-                events,
-                {
-                    "type": "client_start",
-                    "empresa": empresa,
-                    "row": {
-                        "EMPRESA": empresa,
-                        "CNPJ": c.get("CNPJ", ""),
-                        "PREFEITURA": c.get("PREFEITURA", ""),
-                        "TIPO_ACESSO": c.get("TIPO_ACESSO", ""),
-                        "STATUS": "EM EXECUÇÃO",
-                        "DETALHE": "",
-                    },
-                },
-            )
-
-            try:
-                bot._processar_cliente(c)
-                _emit(events, {"type": "client_end", "empresa": empresa, "status": "OK", "detalhe": ""})
-            except Exception as e:
-                _emit(events, {"type": "client_end", "empresa": empresa, "status": "FALHA", "detalhe": str(e)})
-
-        if bot.registros_log:
-            df_log = pd.DataFrame(bot.registros_log)
-            for col in COLUNAS_LOG_ORDEM:
-                if col not in df_log.columns:
-                    df_log[col] = ""
-            df_log = df_log.reindex(columns=COLUNAS_LOG_ORDEM)
-            os.makedirs(bot.pasta_competencia, exist_ok=True)
-            caminho_log = os.path.join(bot.pasta_competencia, f"LOG_NFSE_{bot.competencia_str}.xlsx")
-            df_log.to_excel(caminho_log, index=False)
-            _emit(events, {"type": "log", "message": f"[INFO] Log salvo em: {caminho_log}"})
+    prontos = st.session_state.setdefault("zips_prontos", {})  # pasta -> caminho do zip
+    if st.button(f"📦 Preparar {rotulo}", use_container_width=True, key=f"prep_{folder}"):
+        with st.spinner("Gerando ZIP..."):
+            prontos[folder] = zip_cache.obter_zip(folder)
 
-        _emit(events, {"type": "done"})
+    caminho = prontos.get(folder)
+    if not caminho:
+        return
+    if not zip_cache.em_dia(caminho, folder):
+        prontos.pop(folder, None)
+        st.info("Os arquivos mudaram depois que o ZIP foi preparado. Prepare de novo.")
+        return
+    if not st.button(f"📥 Baixar {rotulo}", use_container_width=True, key=f"baixar_{folder}"):
+        st.caption(f"ZIP pronto ({os.path.getsize(caminho) / 1024 / 1024:.1f} MB).")
+        return
 
-    except Exception as e:
-        _emit(events, {"type": "error", "message": str(e)})
+    prontos.pop(folder, None)
+    with open(caminho, "rb") as f:
+        st.download_button(
+            "💾 Salvar o ZIP",
+            data=f,
+            file_name=nome_zip + ".zip",
+            mime="application/zip",
+            use_container_width=True,
+            key=f"dl_{folder}",
+        )
 
 
 # ----------------------------
-# Job state (session)
+# Job state (processo: job_manager; a sessão só guarda qual job acompanha)
 # ----------------------------
 def job_init_if_needed():
-    st.session_state.setdefault("job", {"active": False, "status": [], "logs": [], "error": None, "output_folder": None})
-    st.session_state.setdefault("job_index", {})  # empresa -> idx
-    st.session_state.setdefault("job_events", None)
-    st.session_state.setdefault("job_stop_evt", None)
-    st.session_state.setdefault("job_thread", None)
-
+    st.session_state.setdefault("job_id", None)
 
-def drain_events():
-    q = st.session_state.get("job_events")
-    if not q:
-        return
 
-    while True:
-        try:
-            evt = q.get_nowait()
-        except Exception:
-            break
+def job_snapshot() -> Dict[str, Any]:
+    mgr = job_manager.obter_gerenciador()
+    jid = st.session_state.get("job_id")
+    job = mgr.obter(jid)
+    canal = mgr.canal(jid)
 
-        t = evt.get("type")
-        if t == "init":
-            st.session_state.job["output_folder"] = evt.get("output_folder")
-            st.session_state.job["active"] = True
+    if canal is not None:
+        snap = canal.snapshot()
+    else:
+        snap = {"status": [], "logs": [], "error": None, "output_folder": None,
+                "contadores": {}, "decorrido": 0.0, "versao": 0}
+        if job is not None:
+            # job de um processo anterior: só o que ficou no registro
+            snap["contadores"] = dict(job.progresso)
+            snap["error"] = job.erro
+
+    snap["active"] = bool(job and job.status in job_manager.ATIVOS)
+    snap["job"] = job.resumo() if job else None
+    return snap
+
+
+# Fragmento com auto-refresh (Streamlit >= 1.37; experimental nas versões anteriores).
+# Sem suporte, cai no rerun da página inteira.
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+
+def _estimar_job(snap: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """ETA do job acompanhado. O histórico é lido uma vez por job (estimador fica na sessão)."""
+    jid = st.session_state.get("job_id")
+    job = job_manager.obter_gerenciador().obter(jid)
+    if job is None or (not snap.get("status") and not snap.get("active")):
+        return None
+    cache = st.session_state.get("eta_estimador")
+    if not cache or cache[0] != jid:
+        estimador = eta.EstimadorETA(os.path.abspath(cfg.pasta_base_saida), job.empresas)
+        st.session_state.eta_estimador = cache = (jid, estimador)
+    return cache[1].estimar(snap.get("status", []))
+
+
+def _tabela_status(snap: Dict[str, Any], previsao: Optional[Dict[str, Any]]) -> pd.DataFrame:
+    status = {s.get("EMPRESA"): s for s in snap.get("status", [])}
+    if previsao is None:
+        df = pd.DataFrame(list(status.values()))
+        return df.drop(columns=[c for c in ("INICIO", "FIM") if c in df.columns])
+    linhas = []
+    for p in previsao["clientes"]:
+        s = status.get(p["EMPRESA"], {})
+        linhas.append({
+            "EMPRESA": p["EMPRESA"],
+            "STATUS": s.get("STATUS", "NA FILA"),
+            "SITUAÇÃO": p["SITUACAO"],
+            "ESPERADO (min)": p["ESPERADO_MIN"],
+            "REAL (min)": p["REAL_MIN"],
+            "NOTAS": s.get("NOTAS", 0),
+            "DETALHE": s.get("DETALHE", ""),
+        })
+    return pd.DataFrame(linhas)
+
+
+def _render_progresso() -> None:
+    snap = job_snapshot()
+    cont = snap.get("contadores", {})
+
+    if snap.get("error"):
+        st.error(snap["error"])
+
+    previsao = _estimar_job(snap)
+
+    m1, m2, m3, m4, m5 = st.columns(5)
+    m1.metric("Clientes", f"{cont.get('clientes_concluidos', 0)}/{cont.get('clientes_total', 0)}")
+    m2.metric("Falhas", cont.get("clientes_falha", 0))
+    m3.metric("Notas baixadas", cont.get("notas", 0))
+    m4.metric("Volume", f"{cont.get('bytes', 0) / (1024 * 1024):.1f} MB")
+    if previsao is not None and snap.get("active"):
+        termino = previsao["termino_previsto"]
+        m5.metric(
+            "Tempo restante (estimado)",
+            eta.formatar_duracao(previsao["restante_s"]) + ("+" if previsao["parcial"] else ""),
+            time.strftime("término ~%H:%M", time.localtime(termino)) if termino else None,
+            delta_color="off",
+        )
+    else:
+        m5.metric("Decorrido", eta.formatar_duracao(snap.get("decorrido")))
 
-        elif t == "client_start":
-            row = evt.get("row", {})
-            empresa = evt.get("empresa", row.get("EMPRESA", ""))
-            st.session_state.job["status"].append(row)
-            st.session_state.job_index[empresa] = len(st.session_state.job["status"]) - 1
+    st.subheader("Status por cliente")
+    st.dataframe(_tabela_status(snap, previsao), use_container_width=True, hide_index=True)
+    if previsao is not None and previsao["fator"] != 1.0:
+        st.caption(
+            f"Ritmo de hoje: {previsao['fator']}x o histórico"
+            + (f" • {previsao['seg_por_nota']}s por nota" if previsao.get("seg_por_nota") else "")
+        )
 
-        elif t == "client_end":
-            empresa = evt.get("empresa", "")
-            idx = st.session_state.job_index.get(empresa)
-            if idx is not None and idx < len(st.session_state.job["status"]):
-                st.session_state.job["status"][idx]["STATUS"] = evt.get("status", "")
-                st.session_state.job["status"][idx]["DETALHE"] = evt.get("detalhe", "")
+    st.subheader("Logs (resumo)")
+    logs = snap.get("logs", [])
+    if logs:
+        st.code("\n".join(logs))
+    else:
+        st.caption("Sem logs ainda.")
 
-        elif t == "log":
-            st.session_state.job["logs"].append(evt.get("message", ""))
+    # terminou enquanto só o fragmento atualizava: um rerun completo reabilita botões/ZIP
+    if st.session_state.get("job_era_ativo") and not snap.get("active"):
+        st.session_state.job_era_ativo = False
+        st.rerun()
 
-        elif t == "error":
-            st.session_state.job["error"] = evt.get("message", "Erro desconhecido.")
-            st.session_state.job["active"] = False
 
-        elif t == "done":
-            st.session_state.job["active"] = False
+if _fragment is not None:
+    _render_progresso_auto = _fragment(run_every=1.0)(_render_progresso)
+else:
+    _render_progresso_auto = None
 
 
 # ----------------------------
@@ -422,25 +377,92 @@ def drain_events():
 user = require_login()
 page = sidebar(user)
 render_topbar(user)
-cfg = cfgmod.load_config()
+cfg = app_cache.config()
 
 job_init_if_needed()
-drain_events()
+job = job_snapshot()
 
 if page == "📊 Painel":
     st.title("📊 Painel")
-    df = data_store.ler_clientes(cfg.caminho_planilha)
+    df = app_cache.clientes(cfg.caminho_planilha)
     ativos = (df["ATIVO"].astype(str).str.upper().str.strip() == "S").sum()
 
     c1, c2, c3, c4 = st.columns(4)
     c1.metric("Clientes (total)", len(df))
     c2.metric("Clientes ativos", int(ativos))
     c3.metric("Competência padrão", "Mês anterior")
-    c4.metric("Execução em andamento", "SIM" if st.session_state.job["active"] else "NÃO")
+    c4.metric("Execução em andamento", "SIM" if job_manager.obter_gerenciador().tem_ativo() else "NÃO")
 
     st.subheader("Clientes (visão rápida)")
     st.dataframe(df, use_container_width=True, hide_index=True)
 
+    st.subheader("Notas baixadas (catálogo)")
+    base = os.path.abspath(cfg.pasta_base_saida)
+    resumo = catalog.resumo_por_competencia(base) if os.path.isdir(base) else []
+    if resumo:
+        st.dataframe(pd.DataFrame(resumo), use_container_width=True, hide_index=True)
+    else:
+        st.caption("Catálogo vazio. Use 'Indexar pastas existentes' na Auditoria.")
+
+    st.subheader("Histórico de execuções")
+    execucoes = run_ledger.listar_execucoes(base, limite=50)
+    if not execucoes:
+        st.caption("Nenhuma execução registrada ainda.")
+    else:
+        n_exec = len(execucoes)
+        if n_exec > 1:
+            n_exec = st.slider("Janela de análise (últimas execuções)", 1, n_exec, min(20, n_exec))
+        df_exec = pd.DataFrame(execucoes[:n_exec])
+
+        ult = execucoes[0]
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Última execução", ult["inicio_fmt"], ult.get("status") or "")
+        m2.metric("Notas/min (última)", ult["notas_por_min"])
+        m3.metric("Notas/min (média janela)", round(float(df_exec["notas_por_min"].mean()), 2))
+        total_cli = int(df_exec["clientes"].sum())
+        m4.metric("Falhas (janela)", f"{int(df_exec['falhas'].sum())}/{total_cli}")
+
+        t1, t2, t3, t4 = st.tabs(["Vazão", "Clientes mais lentos", "Falhas por cliente", "Fases"])
+        with t1:
+            serie = df_exec.sort_values("inicio").set_index("inicio_fmt")[["notas_por_min"]]
+            st.line_chart(serie)
+            st.dataframe(
+                df_exec[["inicio_fmt", "competencia", "origem", "usuario", "status", "duracao_min",
+                         "clientes", "falhas", "notas", "notas_por_min"]],
+                use_container_width=True,
+                hide_index=True,
+            )
+
+        por_cliente = pd.DataFrame(run_ledger.resumo_por_cliente(base, ultimas_execucoes=n_exec))
+        with t2:
+            if por_cliente.empty:
+                st.caption("Sem dados por cliente.")
+            else:
+                lentos = por_cliente.sort_values("media_s", ascending=False).head(15)
+                st.bar_chart(lentos.set_index("empresa")[["media_s"]])
+                st.dataframe(lentos, use_container_width=True, hide_index=True)
+        with t3:
+            if por_cliente.empty:
+                st.caption("Sem dados por cliente.")
+            else:
+                falhas = por_cliente[por_cliente["falhas"] > 0].sort_values("taxa_falha_pct", ascending=False)
+                if falhas.empty:
+                    st.success("Nenhuma falha na janela.")
+                else:
+                    st.bar_chart(falhas.set_index("empresa")[["taxa_falha_pct"]])
+                    st.dataframe(
+                        falhas[["empresa", "execucoes", "falhas", "taxa_falha_pct"]],
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+        with t4:
+            fases = pd.DataFrame(run_ledger.fases_por_execucao(base, ultimas_execucoes=n_exec))
+            if fases.empty:
+                st.caption("Sem dados de fases.")
+            else:
+                st.caption("Média por cliente de cada fase (segundos), por execução.")
+                st.line_chart(fases.set_index("inicio_fmt")[list(run_ledger.FASES)])
+
 elif page == "🧾 Processar NFS-e":
     st.title("🧾 Processar NFS-e")
 
@@ -455,7 +477,7 @@ elif page == "🧾 Processar NFS-e":
     mes = colB.number_input("Mês (competência)", 1, 12, int(mes_padrao), 1)
     somente_login = colC.checkbox("Somente clientes com LOGIN/SENHA", value=True)
 
-    df = data_store.ler_clientes(cfg.caminho_planilha)
+    df = app_cache.clientes(cfg.caminho_planilha)
     df["ATIVO"] = df["ATIVO"].astype(str).str.upper().str.strip()
     df_vis = df[df["ATIVO"] == "S"].copy()
     if somente_login:
@@ -466,55 +488,57 @@ elif page == "🧾 Processar NFS-e":
     st.subheader("Selecionar clientes")
     selecionadas = st.multiselect("Clientes ativos", options=empresas, default=empresas[:10])
 
+    mgr = job_manager.obter_gerenciador()
+    competencia_sel = f"{int(ano):04d}-{int(mes):02d}"
+    ocupada = any(j.competencia == competencia_sel for j in mgr.listar(somente_ativos=True))
+    if ocupada:
+        st.info(f"Já há execução ativa/na fila para {competencia_sel}. Um novo job aguardará a anterior terminar.")
+
     c1, c2, _ = st.columns([1, 1, 2])
-    iniciar = c1.button("✅ Iniciar", use_container_width=True, disabled=st.session_state.job["active"])
-    parar = c2.button("⛔ Parar", use_container_width=True, disabled=not st.session_state.job["active"])
+    iniciar = c1.button("✅ Iniciar", use_container_width=True, disabled=not selecionadas)
+    parar = c2.button("⛔ Parar", use_container_width=True, disabled=not job["active"])
 
     if iniciar:
-        st.session_state.job = {"active": True, "status": [], "logs": [], "error": None, "output_folder": None}
-        st.session_state.job_index = {}
-        st.session_state.job_events = queue.Queue()
-        st.session_state.job_stop_evt = threading.Event()
-
-        t = threading.Thread(
-            target=run_bot_job,
-            args=(cfg, int(ano), int(mes), selecionadas, st.session_state.job_events, st.session_state.job_stop_evt),
-            daemon=True,
-        )
-        st.session_state.job_thread = t
-        t.start()
-        st.success("Execução iniciada.")
+        novo = mgr.submeter(cfg, int(ano), int(mes), selecionadas, usuario=user.username)
+        st.session_state.job_id = novo.id
+        st.success(f"Execução {novo.id} enviada.")
         st.rerun()
 
-    if parar and st.session_state.job_stop_evt:
-        st.session_state.job_stop_evt.set()
+    if parar and st.session_state.job_id:
+        mgr.parar(st.session_state.job_id)
         st.warning("Sinal de parada enviado (para no próximo cliente).")
 
-    if st.session_state.job.get("error"):
-        st.error(st.session_state.job["error"])
-
-    st.subheader("Status por cliente")
-    st.dataframe(pd.DataFrame(st.session_state.job.get("status", [])), use_container_width=True, hide_index=True)
+    # Acompanhar qualquer job do processo (sobrevive a reload da aba / outra sessão)
+    jobs = mgr.listar()[:20]
+    if jobs:
+        ids = [j.id for j in jobs]
+        if st.session_state.job_id not in ids:
+            ativos = [j.id for j in jobs if j.status in job_manager.ATIVOS]
+            st.session_state.job_id = ativos[0] if ativos else ids[0]
+        with st.expander("Execuções (registro)", expanded=False):
+            st.dataframe(pd.DataFrame([j.resumo() for j in jobs]), use_container_width=True, hide_index=True)
+        escolhido = st.selectbox(
+            "Acompanhar execução",
+            ids,
+            index=ids.index(st.session_state.job_id),
+            format_func=lambda i: next(f"{j.id} • {j.competencia} • {j.status}" for j in jobs if j.id == i),
+        )
+        if escolhido != st.session_state.job_id:
+            st.session_state.job_id = escolhido
+            st.rerun()
 
-    st.subheader("Logs (resumo)")
-    logs = st.session_state.job.get("logs", [])
-    if logs:
-        st.code("\n".join(logs[-200:]))
+    # Região de progresso: só ela é reexecutada a cada segundo durante o job
+    st.session_state.job_era_ativo = bool(job["active"])
+    if job["active"] and _render_progresso_auto is not None:
+        _render_progresso_auto()
     else:
-        st.caption("Sem logs ainda.")
+        _render_progresso()
 
-    out_folder = st.session_state.job.get("output_folder")
-    if out_folder and os.path.isdir(out_folder) and not st.session_state.job["active"]:
-        zip_bytes = _zip_dir(out_folder)
-        st.download_button(
-            "📥 Baixar resultado (ZIP)",
-            data=zip_bytes,
-            file_name=os.path.basename(out_folder) + ".zip",
-            mime="application/zip",
-            use_container_width=True,
-        )
+    out_folder = job.get("output_folder")
+    if out_folder and os.path.isdir(out_folder) and not job["active"]:
+        _botao_zip(out_folder, os.path.basename(out_folder), "resultado (ZIP)")
 
-    if st.session_state.job["active"]:
+    if job["active"] and _render_progresso_auto is None:
         time.sleep(1.0)
         st.rerun()
 
@@ -524,7 +548,12 @@ elif page == "🧩 Clientes":
         st.warning("Somente ADMIN pode editar clientes.")
         st.stop()
 
-    df = data_store.ler_clientes(cfg.caminho_planilha)
+    df = app_cache.clientes(cfg.caminho_planilha)
+    if data_store.planilha_divergente(cfg.caminho_planilha):
+        st.warning(
+            "A planilha foi alterada fora do app e não bate com o cadastro abaixo. Nada foi importado: "
+            "escolha em 'Planilha (importar / exportar)' se ela substitui o cadastro ou se é sobrescrita por ele."
+        )
     st.subheader("Lista")
     st.dataframe(df, use_container_width=True, hide_index=True)
 
@@ -535,7 +564,7 @@ elif page == "🧩 Clientes":
     escolhido = st.selectbox("Cliente", options=empresas)
 
     if escolhido == "(novo)":
-        rec = {c: "" for c in data_store.COLUNAS_OBRIGATORIAS}
+        rec = {c: "" for c in data_store.COLUNAS}
         rec["ATIVO"] = "S"
         rec["TIPO_ACESSO"] = "LOGIN_SENHA"
     else:
@@ -558,24 +587,54 @@ elif page == "🧩 Clientes":
         rec["SENHA"] = st.text_input("Senha (se houver)", value=rec.get("SENHA", ""), type="password")
         rec["IDENT_CERT"] = st.text_input("IDENT_CERT (certificado)", value=rec.get("IDENT_CERT", ""))
         rec["IMG_CERT"] = st.text_input("IMG_CERT (arquivo imagem)", value=rec.get("IMG_CERT", ""))
+        rec["CERT_PFX"] = st.text_input(
+            "CERT_PFX (arquivo .pfx/.p12, login headless)",
+            value=rec.get("CERT_PFX", ""),
+            help="Com o modo de certificado 'auto' ou 'headless', o login é feito sem tela (Linux).",
+        )
+        rec["CERT_SENHA"] = st.text_input(
+            "Senha do .pfx",
+            value=rec.get("CERT_SENHA", ""),
+            type="password",
+            help="Gravada cifrada. Ou informe env:NOME_DA_VARIAVEL para ler de uma variável de ambiente.",
+        )
 
     a, b = st.columns([1, 1])
     if a.button("💾 Salvar", use_container_width=True):
-        df2 = df.copy()
-        if escolhido != "(novo)":
-            df2 = df2[df2["EMPRESA"] != escolhido]
-        df2 = pd.concat([df2, pd.DataFrame([rec])], ignore_index=True).fillna("")
-        df2 = df2[data_store.COLUNAS_OBRIGATORIAS]
-        data_store.salvar_clientes(cfg.caminho_planilha, df2)
-        st.success("Salvo.")
-        st.rerun()
+        try:
+            app_cache.salvar_cliente(cfg.caminho_planilha, rec, None if escolhido == "(novo)" else escolhido)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.success("Salvo.")
+            st.rerun()
 
     if escolhido != "(novo)" and b.button("🗑️ Excluir", use_container_width=True):
-        df2 = df[df["EMPRESA"] != escolhido].copy()
-        data_store.salvar_clientes(cfg.caminho_planilha, df2)
+        app_cache.excluir_cliente(cfg.caminho_planilha, escolhido)
         st.success("Excluído.")
         st.rerun()
 
+    st.divider()
+    st.subheader("Planilha (importar / exportar)")
+    st.caption(
+        "O cadastro fica em SQLite ao lado da planilha. Alterações feitas direto no Excel só entram com "
+        "'Reimportar da planilha', que substitui o cadastro inteiro (inclusive o que foi editado aqui)."
+    )
+    e1, e2 = st.columns([1, 1])
+    if e1.button("📤 Exportar para a planilha", use_container_width=True):
+        destino = data_store.exportar_planilha(cfg.caminho_planilha)
+        app_cache.invalidar()
+        st.success(f"Planilha atualizada: {destino}")
+    if e2.button("📥 Reimportar da planilha", use_container_width=True):
+        try:
+            n = data_store.importar_planilha(cfg.caminho_planilha)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            app_cache.invalidar()
+            st.success(f"{n} cliente(s) importado(s).")
+            st.rerun()
+
 elif page == "⚙️ Configurações":
     st.title("⚙️ Configurações")
     if user.role != "admin":
@@ -590,10 +649,54 @@ elif page == "⚙️ Configurações":
     pasta_download = c3.text_input("Pasta de download temporário", value=cfg.pasta_download_temp)
     pasta_imagens = c4.text_input("Pasta imagens (certificado)", value=cfg.pasta_imagens_cert)
     delay = st.number_input("Delay ações (segundos)", 0.0, 10.0, float(cfg.delay_acao), 0.1)
+    layouts = list(file_index.LAYOUTS_SAIDA)
+    layout = st.selectbox(
+        "Organização da saída",
+        layouts,
+        index=layouts.index(cfg.layout_saida) if cfg.layout_saida in layouts else 0,
+        format_func=lambda k: file_index.LAYOUTS_SAIDA[k],
+    )
+    modos = list(cfgmod.MODOS_CERTIFICADO)
+    modo_cert = st.selectbox(
+        "Login por certificado",
+        modos,
+        index=modos.index(cfg.modo_certificado) if cfg.modo_certificado in modos else 0,
+        format_func=lambda k: cfgmod.MODOS_CERTIFICADO[k],
+    )
+    workers = st.number_input(
+        "Clientes em paralelo",
+        1,
+        16,
+        int(cfg.workers_paralelos),
+        1,
+        help="Acima de 1: cada cliente roda num processo com tela virtual própria (Linux com Xvfb).",
+    )
+    abas = st.number_input(
+        "Notas simultâneas por cliente (abas)",
+        1,
+        8,
+        int(cfg.abas_visualizar),
+        1,
+        help="Abre várias telas de Visualizar de uma vez na mesma sessão e baixa os arquivos juntos. 1 = uma nota por vez.",
+    )
+    with st.expander("Isolamento dos clientes", expanded=bool(cfg.isolar_clientes)):
+        isolar = st.checkbox(
+            "Rodar cada cliente num processo próprio",
+            value=bool(cfg.isolar_clientes),
+            help="Crash ou travamento do Chrome num cliente não afeta o app nem os demais clientes. "
+            "Sempre ativo com mais de um cliente em paralelo.",
+        )
+        i1, i2, i3 = st.columns(3)
+        timeout_cliente = i1.number_input("Tempo máximo por cliente (min)", 0, 24 * 60, int(cfg.timeout_cliente_min), 5, help="0 = sem limite")
+        limite_memoria = i2.number_input("Memória máxima (MB)", 0, 65536, int(cfg.limite_memoria_mb), 256, help="Processo + Chrome; 0 = sem limite (só Linux)")
+        limite_cpu = i3.number_input("CPU máxima (min)", 0, 24 * 60, int(cfg.limite_cpu_min), 5, help="Por processo; 0 = sem limite (só Linux)")
 
     if st.button("💾 Salvar configurações", use_container_width=True):
-        novo = cfgmod.AppConfig(caminho_planilha, pasta_saida, pasta_download, pasta_imagens, float(delay))
-        cfgmod.save_config(novo)
+        novo = cfgmod.AppConfig(
+            caminho_planilha, pasta_saida, pasta_download, pasta_imagens, float(delay), layout, modo_cert, int(workers),
+            bool(isolar), int(timeout_cliente), int(limite_memoria), int(limite_cpu), int(abas),
+        )
+        app_cache.salvar_config(novo)
         st.success("Config salvo.")
         st.rerun()
 
@@ -606,23 +709,78 @@ elif page == "🧾 Auditoria":
         st.warning("Pasta base de saída não existe ainda.")
         st.stop()
 
-    pastas = sorted([p for p in os.listdir(base) if os.path.isdir(os.path.join(base, p))], reverse=True)
-    sel = st.selectbox("Competências", options=pastas) if pastas else None
+    c1, c2 = st.columns([3, 1])
+    if c2.button("🔎 Indexar pastas existentes", use_container_width=True):
+        with st.spinner("Catalogando XMLs já baixados..."):
+            n = catalog.backfill(base, empresas_por_cnpj=data_store.empresas_por_cnpj(cfg.caminho_planilha))
+        st.success(f"{n} nota(s) incluída(s) no catálogo.")
+
+    # competências do catálogo + pastas AAAA-MM da base (um listdir, sem varrer a pasta de rede)
+    pastas = catalog.listar_competencias(base, incluir_pastas=True)
+    sel = c1.selectbox("Competências", options=pastas) if pastas else None
+    if not pastas:
+        st.info("Nenhuma competência encontrada na pasta de saída.")
 
     if sel:
+        # pasta que ainda não passou pelo catálogo (ex.: baixada antes dele): cataloga só ela, uma vez
+        backfill_feito = st.session_state.setdefault("auditoria_backfill", set())
+        if (base, sel) not in backfill_feito and not catalog.competencia_catalogada(base, sel):
+            with st.spinner(f"Catalogando {sel} pela primeira vez..."):
+                catalog.backfill(base, sel, empresas_por_cnpj=data_store.empresas_por_cnpj(cfg.caminho_planilha))
+        backfill_feito.add((base, sel))
         folder = os.path.join(base, sel)
-        files = []
-        for root, _, fns in os.walk(folder):
-            for fn in fns:
-                files.append(os.path.relpath(os.path.join(root, fn), folder))
-        st.subheader("Arquivos")
-        st.dataframe(pd.DataFrame({"arquivo": files}), use_container_width=True, hide_index=True)
+        f1, f2, f3 = st.columns([2, 1, 1])
+        texto = f1.text_input("Empresa / tomador contém", value="")
+        cnpj = f2.text_input("CNPJ (prestador ou tomador)", value="")
+        numero = f3.text_input("Nº NF", value="")
+
+        notas = catalog.consultar_notas(
+            base,
+            competencia=sel,
+            cnpj=cnpj or None,
+            numero_nf=numero or None,
+            texto=texto or None,
+            limite=5000,
+        )
+        st.subheader(f"Notas ({len(notas)})")
+        colunas = ["empresa", "numero_nf", "data_emissao", "cnpj_prestador", "cnpj_tomador", "razao_tomador",
+                   "valor_servico", "valor_liquido", "situacao", "caminho_xml", "caminho_pdf"]
+        st.dataframe(pd.DataFrame(notas, columns=colunas), use_container_width=True, hide_index=True)
+
+        # Arquivos: índice em cache por competência (revalidado por mtime das pastas)
+        idx = file_index.obter_indice_competencia(folder)
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Arquivos", idx.total_arquivos)
+        m2.metric("Tamanho", f"{idx.total_bytes / (1024 * 1024):.1f} MB")
+        m3.metric("Pastas de cliente", len(idx.clientes))
+
+        if idx.clientes:
+            st.subheader("Por cliente")
+            st.dataframe(pd.DataFrame(idx.resumo_por_cliente()), use_container_width=True, hide_index=True)
 
-        zip_bytes = _zip_dir(folder)
-        st.download_button(
-            "📥 Baixar competência (ZIP)",
-            data=zip_bytes,
-            file_name=sel + ".zip",
-            mime="application/zip",
+        st.subheader("Arquivos")
+        g1, g2, g3 = st.columns([2, 1, 1])
+        filtro_nome = g1.text_input("Nome do arquivo contém", value="")
+        cli = g2.selectbox("Pasta", ["(todas)", file_index.RAIZ] + idx.clientes) if idx.clientes else "(todas)"
+        tipo = g3.selectbox("Tipo", ["(todos)", "xml", "pdf", "outros"])
+
+        lista = idx.filtrar(
+            texto=filtro_nome,
+            cliente=None if cli == "(todas)" else cli,
+            tipo=None if tipo == "(todos)" else tipo,
+        )
+        por_pagina = 200
+        paginas = max(1, -(-len(lista) // por_pagina))
+        pag = int(st.number_input("Página", 1, paginas, 1, 1)) if paginas > 1 else 1
+        st.caption(f"{len(lista)} arquivo(s) • página {pag}/{paginas}")
+        st.dataframe(
+            pd.DataFrame(lista[(pag - 1) * por_pagina: pag * por_pagina]),
             use_container_width=True,
+            hide_index=True,
         )
+
+        # ZIP da pasta do cliente escolhida (ou da competência inteira)
+        alvo, nome_zip = folder, sel
+        if cli not in ("(todas)", file_index.RAIZ):
+            alvo, nome_zip = os.path.join(folder, cli), f"{sel} - {cli}"
+        _botao_zip(alvo, nome_zip, "competência (ZIP)")
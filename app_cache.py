@@ -0,0 +1,98 @@
+# app_cache.py
+from __future__ import annotations
+
+import dataclasses
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import config as cfgmod
+import data_store
+import lazy_import
+
+pd = lazy_import.modulo("pandas", "o cadastro de clientes")
+
+# chave -> (assinatura da origem, valor carregado)
+_entradas: Dict[str, Tuple[Any, Any]] = {}
+_lock = threading.Lock()
+
+
+def _assinatura(caminho: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(caminho)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _obter(chave: str, assinar: Callable[[], Any], carregar: Callable[[], Any]) -> Any:
+    """
+    Devolve o valor em cache enquanto a assinatura da origem ((mtime, tamanho) dos arquivos) não mudar.
+
+    A assinatura é lida ANTES de carregar: se o arquivo mudar durante a leitura,
+    a próxima chamada vê outra assinatura e recarrega.
+    """
+    assinatura = assinar()
+    with _lock:
+        entrada = _entradas.get(chave)
+    if entrada is not None and assinatura is not None and entrada[0] == assinatura:
+        return entrada[1]
+
+    valor = carregar()
+    with _lock:
+        _entradas[chave] = (assinatura, valor)
+    return valor
+
+
+def invalidar(chave: Optional[str] = None) -> None:
+    """Descarta uma entrada (ou todas). Chamado após gravações feitas pela própria UI."""
+    with _lock:
+        if chave is None:
+            _entradas.clear()
+        else:
+            _entradas.pop(chave, None)
+
+
+def _chave_clientes(caminho: str) -> str:
+    return "clientes:" + os.path.abspath(caminho)
+
+
+# ----------------------------
+# Config
+# ----------------------------
+def config() -> cfgmod.AppConfig:
+    """load_config() com cache do processo (cópia: quem chama pode alterar sem afetar o cache)."""
+    cfg = _obter("config", lambda: _assinatura(cfgmod.CONFIG_LOCAL), cfgmod.load_config)
+    return dataclasses.replace(cfg)
+
+
+def salvar_config(cfg: cfgmod.AppConfig) -> None:
+    cfgmod.save_config(cfg)
+    invalidar("config")
+
+
+# ----------------------------
+# Clientes
+# ----------------------------
+def clientes(caminho: str) -> pd.DataFrame:
+    """data_store.ler_clientes() com cache do processo (devolve cópia do DataFrame).
+
+    A assinatura cobre a planilha e o banco: edição manual no Excel também invalida.
+    """
+    df = _obter(_chave_clientes(caminho), lambda: data_store.assinatura(caminho), lambda: data_store.ler_clientes(caminho))
+    return df.copy()
+
+
+def salvar_cliente(caminho: str, registro: Dict[str, Any], empresa_original: Optional[str] = None) -> None:
+    data_store.salvar_cliente(caminho, registro, empresa_original)
+    invalidar(_chave_clientes(caminho))
+
+
+def excluir_cliente(caminho: str, empresa: str) -> None:
+    data_store.excluir_cliente(caminho, empresa)
+    invalidar(_chave_clientes(caminho))
+
+
+def salvar_clientes(caminho: str, df: pd.DataFrame) -> None:
+    data_store.salvar_clientes(caminho, df)
+    invalidar(_chave_clientes(caminho))
@@ -0,0 +1,243 @@
+# bot_logging.py
+import contextlib
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import uuid
+from typing import Any, Dict, Optional
+
+LOGGER_RAIZ = "portalnfse"
+PASTA_LOGS = "_logs"  # dentro da pasta base de saída ('_' = ignorada na Auditoria)
+
+TAMANHO_MAX_ARQUIVO = 10 * 1024 * 1024
+BACKUPS_ARQUIVO = 5
+
+CAMPOS_CONTEXTO = ("execucao", "competencia", "cliente", "nf")
+
+ROTULOS = {
+    logging.DEBUG: "DEBUG",
+    logging.INFO: "INFO",
+    logging.WARNING: "AVISO",
+    logging.ERROR: "ERRO",
+    logging.CRITICAL: "ERRO",
+}
+
+_contexto: contextvars.ContextVar = contextvars.ContextVar("portalnfse_contexto", default={})
+
+
+# ----------------------------
+# Contexto (cliente / competência / NF)
+# ----------------------------
+@contextlib.contextmanager
+def contexto(**campos: Any):
+    """Campos de contexto válidos dentro do bloco (na thread atual)."""
+    token = _contexto.set({**_contexto.get(), **campos})
+    try:
+        yield
+    finally:
+        _contexto.reset(token)
+
+
+def definir_contexto(**campos: Any) -> None:
+    """Atualiza o contexto corrente sem abrir bloco (ex.: NF conhecida no meio do fluxo)."""
+    _contexto.set({**_contexto.get(), **campos})
+
+
+class _FiltroContexto(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        ctx = _contexto.get()
+        for campo in CAMPOS_CONTEXTO:
+            if not hasattr(record, campo):
+                setattr(record, campo, ctx.get(campo))
+        return True
+
+
+class _FiltroExecucao(logging.Filter):
+    def __init__(self, execucao_id: str):
+        super().__init__()
+        self.execucao_id = execucao_id
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return getattr(record, "execucao", None) == self.execucao_id
+
+
+# ----------------------------
+# Formatadores / handlers
+# ----------------------------
+class FormatadorTexto(logging.Formatter):
+    """Mantém o padrão antigo dos prints: '[INFO] mensagem'."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        texto = f"[{ROTULOS.get(record.levelno, record.levelname)}] {record.getMessage()}"
+        if record.exc_info:
+            texto += "\n" + self.formatException(record.exc_info)
+        return texto
+
+
+class FormatadorJSON(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        rec: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": ROTULOS.get(record.levelno, record.levelname),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for campo in CAMPOS_CONTEXTO:
+            valor = getattr(record, campo, None)
+            if valor is not None:
+                rec[campo] = valor
+        if record.exc_info:
+            rec["exc"] = self.formatException(record.exc_info)
+        return json.dumps(rec, ensure_ascii=False)
+
+
+class HandlerCanal(logging.Handler):
+    """Entrega as linhas no CanalProgresso da UI (ring buffer em memória, sem I/O)."""
+
+    def __init__(self, canal, level: int = logging.INFO):
+        super().__init__(level)
+        self.canal = canal
+        self.setFormatter(FormatadorTexto())
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.canal.log(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+# ----------------------------
+# Configuração
+# ----------------------------
+_setup_lock = threading.Lock()
+_listener_stdout: Optional[logging.handlers.QueueListener] = None
+_handler_stdout: Optional[logging.Handler] = None
+_encaminhado = False  # processo filho: registros vão para o processo pai (encaminhar_para_fila)
+
+
+def _garantir_saida_padrao() -> None:
+    """
+    Saída em stdout do processo (uma vez): o logger só enfileira (QueueHandler não bloqueia)
+    e uma thread do QueueListener escreve no console.
+    """
+    global _listener_stdout, _handler_stdout
+    with _setup_lock:
+        if _listener_stdout is not None or _encaminhado:
+            return
+        raiz = logging.getLogger(LOGGER_RAIZ)
+        raiz.setLevel(logging.DEBUG)
+        raiz.propagate = False
+
+        fila: queue.SimpleQueue = queue.SimpleQueue()
+        qh = logging.handlers.QueueHandler(fila)
+        qh.setLevel(logging.INFO)
+        qh.addFilter(_FiltroContexto())
+        raiz.addHandler(qh)
+        _handler_stdout = qh
+
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(FormatadorTexto())
+        _listener_stdout = logging.handlers.QueueListener(fila, console, respect_handler_level=True)
+        _listener_stdout.start()
+
+
+def encaminhar_para_fila(fila) -> None:
+    """
+    Processo filho (worker): em vez do console próprio, todo registro vai para `fila`
+    (multiprocessing.Queue) já com o contexto do filho; o pai os entrega com ReceptorProcessos.
+    """
+    global _listener_stdout, _handler_stdout, _encaminhado
+    with _setup_lock:
+        raiz = logging.getLogger(LOGGER_RAIZ)
+        if _handler_stdout is not None:
+            raiz.removeHandler(_handler_stdout)
+            _handler_stdout = None
+        if _listener_stdout is not None:
+            _listener_stdout.stop()
+            _listener_stdout = None
+        raiz.setLevel(logging.DEBUG)
+        raiz.propagate = False
+        qh = logging.handlers.QueueHandler(fila)
+        qh.setLevel(logging.DEBUG)
+        qh.addFilter(_FiltroContexto())
+        raiz.addHandler(qh)
+        _encaminhado = True
+
+
+class _Reemitir(logging.Handler):
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger(record.name).handle(record)
+
+
+class ReceptorProcessos:
+    """
+    Processo pai: lê a fila dos workers e reemite cada registro no logger de origem,
+    passando pelos mesmos destinos (console, JSONL da execução, canal da UI).
+    """
+
+    def __init__(self, fila):
+        _garantir_saida_padrao()
+        self._listener = logging.handlers.QueueListener(fila, _Reemitir())
+        self._listener.start()
+
+    def encerrar(self) -> None:
+        self._listener.stop()
+
+
+def obter_logger(nome: str) -> logging.Logger:
+    _garantir_saida_padrao()
+    return logging.getLogger(f"{LOGGER_RAIZ}.{nome}")
+
+
+class ExecucaoLog:
+    """
+    Destinos de log de UMA execução: JSONL rotativo por tamanho e (opcional) o canal da UI.
+    Só recebe registros emitidos dentro de contexto(execucao=self.id).
+    """
+
+    def __init__(self, pasta_logs: str, canal=None, prefixo: str = "run", nivel_arquivo: int = logging.DEBUG):
+        _garantir_saida_padrao()
+        self.id = uuid.uuid4().hex[:8]
+        os.makedirs(pasta_logs, exist_ok=True)
+        carimbo = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.caminho_arquivo = os.path.join(pasta_logs, f"{prefixo}_{carimbo}_{self.id}.jsonl")
+
+        arquivo = logging.handlers.RotatingFileHandler(
+            self.caminho_arquivo,
+            maxBytes=TAMANHO_MAX_ARQUIVO,
+            backupCount=BACKUPS_ARQUIVO,
+            encoding="utf-8",
+        )
+        arquivo.setLevel(nivel_arquivo)
+        arquivo.setFormatter(FormatadorJSON())
+        destinos = [arquivo]
+        if canal is not None:
+            destinos.append(HandlerCanal(canal))
+
+        fila: queue.SimpleQueue = queue.SimpleQueue()
+        self._qh = logging.handlers.QueueHandler(fila)
+        self._qh.setLevel(logging.DEBUG)
+        self._qh.addFilter(_FiltroContexto())
+        self._qh.addFilter(_FiltroExecucao(self.id))
+        self._listener = logging.handlers.QueueListener(fila, *destinos, respect_handler_level=True)
+        self._listener.start()
+        logging.getLogger(LOGGER_RAIZ).addHandler(self._qh)
+
+    def encerrar(self) -> None:
+        logging.getLogger(LOGGER_RAIZ).removeHandler(self._qh)
+        self._listener.stop()  # esvazia a fila antes de parar
+        for h in self._listener.handlers:
+            try:
+                h.close()
+            except Exception:
+                pass
+
+
+def configurar_execucao(pasta_base_saida: str, canal=None, prefixo: str = "run") -> ExecucaoLog:
+    return ExecucaoLog(os.path.join(pasta_base_saida, PASTA_LOGS), canal=canal, prefixo=prefixo)
@@ -1,34 +1,46 @@
 # bot_nfse.py
+import collections
 import os
 import re
 import time
 import shutil
+import sqlite3
 import datetime
-from typing import List, Dict, Optional, Tuple
-
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-
-try:
-    import pyautogui as pg
-except Exception:
-    pg = None
-import xml.etree.ElementTree as ET
-
-from cert_image_selector import selecionar_certificado_por_imagem
-
-try:
-    from webdriver_manager.chrome import ChromeDriverManager
-    USE_WEBDRIVER_MANAGER = True
-except ImportError:
-    USE_WEBDRIVER_MANAGER = False
-
-if pg is not None:
-    pg.FAILSAFE = True
-    pg.PAUSE = 0.2
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
+
+import catalog
+import cert_headless
+import data_store
+import lazy_import
+import run_ledger
+import sessao_store
+import template_match
+from file_index import IndiceDestino, limpar_nome_arquivo, pasta_do_cliente
+from log_writer import LogStreamWriter
+from nfse_xml import _formatar_id_para_excel, extrair_dados_nfse_do_xml
+import bot_logging
+
+
+def _configurar_pyautogui(mod) -> None:
+    mod.FAILSAFE = True
+    mod.PAUSE = 0.2
+
+
+# Selenium / pyautogui / webdriver_manager só são importados quando o robô realmente usa
+# (importar bot_nfse para ler constantes ou XML não custa a subida do Selenium).
+webdriver = lazy_import.modulo("selenium.webdriver", "o robô (navegador)", pacote_pip="selenium")
+By = lazy_import.objeto("selenium.webdriver.common.by", "By", "o robô (navegador)", pacote_pip="selenium")
+Options = lazy_import.objeto("selenium.webdriver.chrome.options", "Options", "o robô (navegador)", pacote_pip="selenium")
+Service = lazy_import.objeto("selenium.webdriver.chrome.service", "Service", "o robô (navegador)", pacote_pip="selenium")
+pg = (
+    lazy_import.modulo("pyautogui", "o login por certificado", ao_carregar=_configurar_pyautogui)
+    if lazy_import.disponivel("pyautogui")
+    else None
+)
+
+USE_WEBDRIVER_MANAGER = lazy_import.disponivel("webdriver_manager")
+
+log = bot_logging.obter_logger("bot")
 
 # ==============================
 # CONFIGURAÇÕES GERAIS
@@ -42,8 +54,29 @@ PASTA_IMAGENS_CERT = r"C:\Python\INNOVE\PortalNFSe\imagens"
 
 DELAY_ACAO = 3.5
 
+# "plano" (tudo em AAAA-MM), "cnpj" ou "empresa" (AAAA-MM/<cliente>/...)
+LAYOUT_SAIDA = "plano"
+
 URL_PORTAL = "https://www.nfse.gov.br/EmissorNacional/Login?ReturnUrl=%2fEmissorNacional"
 
+# Página inicial logada (sonda da sessão restaurada)
+URL_PORTAL_INICIO = "https://www.nfse.gov.br/EmissorNacional"
+
+# Sessão autenticada salva por cliente (cifrada; requer `cryptography`) e reaproveitada na próxima execução
+REAPROVEITAR_SESSAO = os.environ.get("PORTALNFSE_REAPROVEITAR_SESSAO", "1").strip().lower() not in {"0", "false", "no", "n"}
+PASTA_SESSOES = sessao_store.PASTA_PADRAO
+TIMEOUT_SONDA_SESSAO = 8
+
+# Login por certificado: "auto" (headless com CERT_PFX quando suportado, senão imagem), "imagem" ou "headless"
+MODO_CERTIFICADO = "auto"
+# URLs em que o Chrome escolhe o certificado sozinho (AutoSelectCertificateForUrls)
+PADROES_CERTIFICADO = list(cert_headless.PADROES_PORTAL)
+# Link "Acesso via certificado digital" da tela de login (login headless clica por aqui, sem imagem)
+XPATH_LINK_CERTIFICADO = (
+    "//a[contains(translate(., 'CERTIFICADO', 'certificado'), 'certificado')"
+    " or contains(@href, 'Certificado')]"
+)
+
 ID_INPUT_LOGIN = "Inscricao"
 ID_INPUT_SENHA = "Senha"
 ID_BTN_ACESSAR = ""  # se descobrir um id fixo, coloca aqui
@@ -53,6 +86,17 @@ XPATH_MENU_NFSE_EMITIDAS = '//*[@id="navbar"]/ul/li[3]/a'
 # XPaths da tela de Visualizar NF:
 XPATH_BTN_XML = '//*[@id="searchbar"]/ul/li[3]/a'
 XPATH_BTN_PDF = '//*[@id="searchbar"]/ul/li[4]/a'
+# fallbacks genéricos (layout da barra mudou)
+XPATHS_BTN_XML = (XPATH_BTN_XML, "//a[contains(@class,'btn') and (contains(., 'XML') or contains(@title,'XML'))]")
+XPATHS_BTN_PDF = (
+    XPATH_BTN_PDF,
+    "//a[contains(@class,'btn') and "
+    "(contains(., 'DANFS') or contains(., 'DANF') "
+    "or contains(., 'PDF') or contains(@title,'DANFSe'))]",
+)
+
+# Abas de Visualizar abertas ao mesmo tempo por cliente (1 = uma nota por vez, fluxo original)
+ABAS_VISUALIZAR = 1
 
 # XPATH do botão "próxima página" na listagem de NFS-e emitidas
 XPATH_BTN_PROXIMA_PAGINA = '/html/body/div[1]/div[3]/div[1]/ul/li[8]/a'
@@ -88,34 +132,9 @@ def garantir_pasta(caminho: str) -> None:
     os.makedirs(caminho, exist_ok=True)
 
 
-def limpar_nome_arquivo(nome: str) -> str:
-    proibidos = r'\/:*?"<>|'
-    for ch in proibidos:
-        nome = nome.replace(ch, " ")
-    return " ".join(nome.split())
-
-
 def carregar_clientes_da_planilha() -> List[Dict]:
-    df = pd.read_excel(CAMINHO_PLANILHA)
-    df = df.fillna("")
-
-    colunas_obrigatorias = [
-        "EMPRESA",
-        "CNPJ",
-        "TIPO_ACESSO",
-        "LOGIN",
-        "SENHA",
-        "ATIVO",
-        "PREFEITURA",
-        "IDENT_CERT",
-        "IMG_CERT",
-    ]
-    for col in colunas_obrigatorias:
-        if col not in df.columns:
-            raise ValueError(f"Coluna obrigatória ausente na planilha: {col}")
-
-    df_ativos = df[df["ATIVO"].astype(str).str.upper().str.strip() == "S"]
-    return df_ativos.to_dict(orient="records")
+    """Clientes ATIVOS do cadastro (SQLite ao lado da planilha; importada sozinha só com o cadastro vazio)."""
+    return data_store.listar_clientes(CAMINHO_PLANILHA, somente_ativos=True)
 
 
 def aguardar_novo_arquivo(extensao: str, timeout: int = 30) -> Optional[str]:
@@ -134,6 +153,55 @@ def aguardar_novo_arquivo(extensao: str, timeout: int = 30) -> Optional[str]:
     return None
 
 
+SUFIXO_DOWNLOAD_PARCIAL = ".crdownload"
+
+
+def aguardar_inicio_download(
+    extensao: str, antes: set, timeout: int = 40, ignorar: Optional[Iterable[str]] = None
+) -> Optional[str]:
+    """
+    Caminho final do download de `extensao` que apareceu depois da foto `antes` da pasta temporária.
+    Volta assim que o Chrome cria o arquivo (ainda .crdownload), sem esperar o fim: o download
+    segue em segundo plano e aguardar_downloads() espera todos juntos.
+
+    Um .crdownload que já estava em `antes` é de um download anterior: quando ele termina e vira o
+    nome final, esse nome não conta como novo. `ignorar`: caminhos finais já atribuídos a outras abas.
+    """
+    extensao = extensao.lower()
+    vistos = set(antes)
+    for nome in antes:
+        if nome.lower().endswith(SUFIXO_DOWNLOAD_PARCIAL):
+            vistos.add(nome[: -len(SUFIXO_DOWNLOAD_PARCIAL)])
+    for caminho in ignorar or ():
+        vistos.add(os.path.basename(caminho))
+    inicio = time.time()
+    while time.time() - inicio < timeout:
+        for nome in sorted(set(os.listdir(PASTA_DOWNLOAD_TEMP)) - vistos):
+            baixo = nome.lower()
+            if baixo.endswith(extensao):
+                return os.path.join(PASTA_DOWNLOAD_TEMP, nome)
+            if baixo.endswith(extensao + SUFIXO_DOWNLOAD_PARCIAL):
+                final = nome[: -len(SUFIXO_DOWNLOAD_PARCIAL)]
+                if final not in vistos:
+                    return os.path.join(PASTA_DOWNLOAD_TEMP, final)
+        time.sleep(0.3)
+    return None
+
+
+def aguardar_downloads(caminhos: List[str], timeout: int = 60) -> Dict[str, bool]:
+    """Espera os downloads em andamento terminarem (arquivo final presente, sem o .crdownload)."""
+    inicio = time.time()
+    pendentes = set(caminhos)
+    while pendentes and time.time() - inicio < timeout:
+        pendentes = {
+            c for c in pendentes
+            if not os.path.exists(c) or os.path.exists(c + SUFIXO_DOWNLOAD_PARCIAL)
+        }
+        if pendentes:
+            time.sleep(0.5)
+    return {c: c not in pendentes for c in caminhos}
+
+
 def mover_com_nome_base(caminho_origem: str, pasta_destino: str, nome_base: str) -> str:
     garantir_pasta(pasta_destino)
     base_limpo = limpar_nome_arquivo(nome_base)
@@ -149,294 +217,6 @@ def mover_com_nome_base(caminho_origem: str, pasta_destino: str, nome_base: str)
     return destino
 
 
-def _parse_valor_monetario(texto: Optional[str]) -> Optional[float]:
-    """
-    Parser de valor robusto para:
-    - "281.31"
-    - "281,31"
-    - "1.234,56"
-    - "R$ 1.234,56"
-    """
-    if not texto:
-        return None
-    s = texto.strip()
-    if not s:
-        return None
-    s = s.replace("R$", "").strip()
-
-    # Se tiver . e , assume padrão brasileiro (1.234,56)
-    if "." in s and "," in s:
-        s = s.replace(".", "").replace(",", ".")
-    # Se tiver só , assume que é decimal
-    elif "," in s and "." not in s:
-        s = s.replace(",", ".")
-
-    s = re.sub(r"[^\d\.\-]", "", s)
-    if not s or s in (".", "-", ".-"):
-        return None
-    try:
-        return float(s)
-    except Exception:
-        return None
-
-
-def _formatar_data_iso_para_br(data_str: Optional[str]) -> Optional[str]:
-    """
-    Converte 'YYYY-MM-DD' ou 'YYYY-MM-DDTHH:MM...' para 'DD/MM/YYYY'.
-    """
-    if not data_str:
-        return None
-    m = re.match(r"(\d{4})-(\d{2})-(\d{2})", data_str)
-    if not m:
-        return None
-    ano, mes, dia = m.groups()
-    return f"{dia}/{mes}/{ano}"
-
-
-def _formatar_id_para_excel(id_str: Optional[str]) -> Optional[str]:
-    """
-    Formata CNPJ/CPF como string para não virar notação científica no Excel.
-    Retorna algo como: '01234567000189 (com apóstrofo).
-    """
-    if not id_str:
-        return None
-    digits = re.sub(r"\D", "", id_str)
-    if not digits:
-        return None
-    return f"'{digits}"
-
-
-def extrair_dados_nfse_do_xml(caminho_xml: str) -> Dict[str, Optional[str]]:
-    """
-    Extrai dados relevantes da NFS-e (layout NFSe Nacional) para o relatório:
-
-    - numero_nf
-    - data_emissao (DD/MM/AAAA)
-    - data_competencia (DD/MM/AAAA quando disponível)
-    - cnpj_prestador, razao_prestador
-    - cnpj_tomador, razao_tomador
-    - optante_sn (S/N)
-    - codigo_trib_nacional
-    - valor_servico
-    - ir, iss, iss_retido, csll, deducoes, pis, cofins, inss
-    - desc_incond, desc_cond
-    - outras_retencoes
-    - aliquota
-    - base_calculo
-    - valor_liquido
-    - situacao (NORMAL / CANCELADA / COD_xxx)
-    """
-    dados = {k: None for k in [
-        "numero_nf",
-        "data_emissao",
-        "data_competencia",
-        "cnpj_prestador",
-        "razao_prestador",
-        "cnpj_tomador",
-        "razao_tomador",
-        "optante_sn",
-        "codigo_trib_nacional",
-        "valor_servico",
-        "ir",
-        "iss",
-        "iss_retido",
-        "csll",
-        "deducoes",
-        "pis",
-        "cofins",
-        "inss",
-        "desc_incond",
-        "desc_cond",
-        "outras_retencoes",
-        "aliquota",
-        "base_calculo",
-        "valor_liquido",
-        "situacao",
-    ]}
-
-    try:
-        tree = ET.parse(caminho_xml)
-        root = tree.getroot()
-    except Exception as e:
-        print(f"[AVISO] Não consegui ler o XML '{caminho_xml}': {e}")
-        return dados
-
-    if "}" in root.tag:
-        ns_uri = root.tag.split("}")[0].strip("{")
-        ns = {"n": ns_uri}
-    else:
-        ns = {"n": ""}
-
-    def get_text(xpath: str) -> Optional[str]:
-        try:
-            el = root.find(xpath, ns)
-        except Exception:
-            el = None
-        if el is not None and el.text:
-            t = el.text.strip()
-            return t or None
-        return None
-
-    # Número da NF
-    numero_raw = None
-    for xp in [".//n:nNFSe", ".//n:nDFSe", ".//n:nDPS"]:
-        t = get_text(xp)
-        if t:
-            numero_raw = t
-            break
-
-    if numero_raw:
-        dig = re.sub(r"\D", "", numero_raw)
-        dados["numero_nf"] = dig.lstrip("0") or dig
-
-    # Datas
-    dh_emi = get_text(".//n:DPS/n:infDPS/n:dhEmi") or get_text(".//n:dhProc")
-    d_comp = get_text(".//n:DPS/n:infDPS/n:dCompet")
-
-    dados["data_emissao"] = _formatar_data_iso_para_br(dh_emi)
-    dados["data_competencia"] = _formatar_data_iso_para_br(d_comp)
-
-    # Prestador
-    emit = root.find(".//n:emit", ns)
-    if emit is not None:
-        for tagname in ("CNPJ", "CPF", "NIF"):
-            el = emit.find(f"n:{tagname}", ns)
-            if el is not None and el.text:
-                dados["cnpj_prestador"] = re.sub(r"\D", "", el.text)
-                break
-        xN = emit.find("n:xNome", ns)
-        if xN is not None and xN.text:
-            dados["razao_prestador"] = xN.text.strip().upper()
-
-    # Tomador
-    toma = root.find(".//n:DPS/n:infDPS/n:toma", ns)
-    if toma is not None:
-        for tagname in ("CNPJ", "CPF", "NIF"):
-            el = toma.find(f"n:{tagname}", ns)
-            if el is not None and el.text:
-                dados["cnpj_tomador"] = re.sub(r"\D", "", el.text)
-                break
-        xN = toma.find("n:xNome", ns)
-        if xN is not None and xN.text:
-            dados["razao_tomador"] = xN.text.strip().upper()
-
-    # Optante Simples Nacional
-    op_simp = get_text(".//n:DPS/n:infDPS/n:prest/n:regTrib/n:opSimpNac")
-    if op_simp:
-        # Heurística: 1 = Não optante / 2 ou 3 = Optante
-        dados["optante_sn"] = "S" if op_simp in ("2", "3") else "N"
-
-    # Código de Tributação Nacional
-    codigo_trib = get_text(".//n:DPS/n:infDPS/n:serv/n:cServ/n:cTribNac") or get_text(".//n:cTribNac")
-    if codigo_trib:
-        dados["codigo_trib_nacional"] = codigo_trib.strip()
-
-    # Valores principais
-    v_serv = get_text(".//n:DPS/n:infDPS/n:valores/n:vServPrest/n:vServ")
-    dados["valor_servico"] = _parse_valor_monetario(v_serv) if v_serv else None
-
-    v_bc = get_text(".//n:infNFSe/n:valores/n:vBC")
-    dados["base_calculo"] = _parse_valor_monetario(v_bc) if v_bc else None
-
-    v_liq = get_text(".//n:infNFSe/n:valores/n:vLiq")
-    dados["valor_liquido"] = _parse_valor_monetario(v_liq) if v_liq else None
-
-    v_total_ret_txt = get_text(".//n:infNFSe/n:valores/n:vTotalRet")
-    v_total_ret = _parse_valor_monetario(v_total_ret_txt) if v_total_ret_txt else None
-
-    # Alíquota ISS (quando vier)
-    aliq_txt = get_text(".//n:DPS/n:infDPS/n:valores/n:trib/n:tribMun/n:pAliq")
-    dados["aliquota"] = _parse_valor_monetario(aliq_txt) if aliq_txt else None
-
-    # ISS e ISS Retido
-    v_iss_txt = get_text(".//n:infNFSe/n:valores/n:vISSQN") or get_text(".//n:valores/n:vISSQN")
-    dados["iss"] = _parse_valor_monetario(v_iss_txt) if v_iss_txt else None
-
-    v_iss_ret_txt = None
-    for elem in root.iter():
-        tag = elem.tag.split('}')[-1].lower()
-        txt = (elem.text or "").strip()
-        if not txt:
-            continue
-        if tag in ("vissqnret", "vretissqn"):
-            v_iss_ret_txt = txt
-            break
-    dados["iss_retido"] = _parse_valor_monetario(v_iss_ret_txt) if v_iss_ret_txt else None
-
-    # Tributos federais
-    tribFed = root.find(".//n:DPS/n:infDPS/n:valores/n:trib/n:tribFed", ns)
-    if tribFed is not None:
-        piscofins = tribFed.find("n:piscofins", ns)
-        if piscofins is not None:
-            vpis = piscofins.find("n:vPis", ns)
-            vcof = piscofins.find("n:vCofins", ns)
-            if vpis is not None and vpis.text:
-                dados["pis"] = _parse_valor_monetario(vpis.text)
-            if vcof is not None and vcof.text:
-                dados["cofins"] = _parse_valor_monetario(vcof.text)
-        vRetCSLL = tribFed.find("n:vRetCSLL", ns)
-        if vRetCSLL is not None and vRetCSLL.text:
-            dados["csll"] = _parse_valor_monetario(vRetCSLL.text)
-
-        # INSS / IRRF se existirem
-        for elem in tribFed.iter():
-            tag = elem.tag.split('}')[-1].lower()
-            txt = (elem.text or "").strip()
-            if not txt:
-                continue
-            if tag in ("vretinss", "vinss"):
-                dados["inss"] = _parse_valor_monetario(txt)
-            if tag in ("vretir", "vretirrf", "virrf"):
-                dados["ir"] = _parse_valor_monetario(txt)
-
-    # Deduções / Descontos (somente tags vDesc*)
-    for elem in root.iter():
-        tag = elem.tag.split('}')[-1]
-        txt = (elem.text or "").strip()
-        if not txt or txt == "-":
-            continue
-        tag_low = tag.lower()
-        # Descontos incondicional/condicional
-        if tag_low.startswith("vdesc"):
-            if "cond" in tag_low:
-                if dados["desc_cond"] is None:
-                    dados["desc_cond"] = _parse_valor_monetario(txt)
-            else:
-                if dados["desc_incond"] is None:
-                    dados["desc_incond"] = _parse_valor_monetario(txt)
-        # Deduções
-        if "deduc" in tag_low or "dedu" in tag_low:
-            if dados["deducoes"] is None:
-                dados["deducoes"] = _parse_valor_monetario(txt)
-
-    # Outras retenções = vTotalRet - (IR + ISS_RET + CSLL + PIS + COFINS + INSS)
-    soma_explicita = 0.0
-    for k in ("ir", "iss_retido", "csll", "pis", "cofins", "inss"):
-        v = dados[k]
-        if isinstance(v, (int, float)):
-            soma_explicita += v
-
-    if v_total_ret is not None:
-        outras = v_total_ret - soma_explicita
-        if abs(outras) > 0.009:
-            dados["outras_retencoes"] = outras
-        else:
-            dados["outras_retencoes"] = 0.0
-    else:
-        dados["outras_retencoes"] = None
-
-    # Situação via cStat
-    cstat = get_text(".//n:infNFSe/n:cStat")
-    if cstat == "100":
-        dados["situacao"] = "NORMAL"
-    elif cstat in ("135", "136", "151"):
-        dados["situacao"] = "CANCELADA"
-    elif cstat:
-        dados["situacao"] = f"COD_{cstat}"
-
-    return dados
-
-
 # ==============================
 # CLASSE DO ROBÔ
 # ==============================
@@ -454,11 +234,43 @@ class NFSePortalBot:
         garantir_pasta(PASTA_IMAGENS_CERT)
 
         self.driver: Optional[webdriver.Chrome] = None
-        self.registros_log: List[Dict] = []
+        # LOG gravado nota a nota (journal JSONL + xlsx final), sem acumular em memória
+        self.log_writer = LogStreamWriter(self.pasta_competencia, self.competencia_str)
+        # índice das pastas de destino (um scandir por pasta por execução)
+        self._indices: Dict[str, IndiceDestino] = {}
+        # conexão com o catálogo aberta na primeira nota do cliente e fechada no fim dele
+        self._catalogo: Optional[sqlite3.Connection] = None
+        # gancho opcional chamado a cada nota concluída: callback_nota(cliente, {"numero_nf", "bytes"})
+        self.callback_nota: Optional[Callable[[Dict, Dict], None]] = None
+        # histórico de execuções (_execucoes.sqlite3): id da execução e métricas do cliente corrente
+        self.execucao_id: Optional[str] = None
+        self.metricas: Optional[run_ledger.MetricasCliente] = None
+        # banco NSS temporário com o .pfx do cliente corrente (login headless por certificado)
+        self.perfil_cert: Optional[cert_headless.PerfilCertificado] = None
+        # por que o cliente corrente ficou sem login headless (modo 'headless' vira erro explícito)
+        self.motivo_sem_cert_headless: Optional[str] = None
+        # cofre de sessões salvas (aberto no primeiro uso; None = indisponível/desligado)
+        self._cofre: Optional[sessao_store.CofreSessoes] = None
+        self._cofre_aberto = False
+
+    def _indice_destino(self, pasta: str) -> IndiceDestino:
+        if pasta not in self._indices:
+            self._indices[pasta] = IndiceDestino(pasta)
+        return self._indices[pasta]
+
+    def _salvar_indices(self) -> None:
+        for indice in self._indices.values():
+            indice.salvar()
+
+    def _fechar_catalogo(self) -> None:
+        if self._catalogo is not None:
+            self._catalogo.close()
+            self._catalogo = None
 
     # ---------- Navegador ----------
 
-    def _inicializar_navegador(self) -> None:
+    def _inicializar_navegador(self, perfil: Optional[cert_headless.PerfilCertificado] = None) -> None:
+        """perfil: Chrome headless com HOME no banco NSS do cliente (login por certificado sem tela)."""
         chrome_options = Options()
 
         chrome_options.add_experimental_option("prefs", {
@@ -470,7 +282,7 @@ class NFSePortalBot:
 
         # Modo cloud/headless (ex.: Render/Docker)
         headless = os.getenv("HEADLESS", "").strip().lower() in {"1", "true", "yes", "y"}
-        if headless:
+        if headless or perfil is not None:
             chrome_options.add_argument("--headless=new")
             chrome_options.add_argument("--no-sandbox")
             chrome_options.add_argument("--disable-dev-shm-usage")
@@ -478,6 +290,12 @@ class NFSePortalBot:
         else:
             chrome_options.add_argument("--start-maximized")
 
+        # O Chrome lê o certificado de $HOME/.pki/nssdb: HOME vai no ambiente do chromedriver (herdado pelo Chrome)
+        service_kwargs = {}
+        if perfil is not None:
+            chrome_options.add_argument(f"--user-data-dir={perfil.user_data_dir}")
+            service_kwargs["env"] = perfil.env()
+
         # Permite informar o binário do Chrome/Chromium via env (útil em Docker)
         chrome_bin = os.getenv("CHROME_BIN") or os.getenv("GOOGLE_CHROME_BIN")
         if chrome_bin:
@@ -486,13 +304,17 @@ class NFSePortalBot:
         # Permite informar o caminho do chromedriver via env (útil em Docker)
         chromedriver_path = os.getenv("CHROMEDRIVER_PATH")
         if chromedriver_path and os.path.exists(chromedriver_path):
-            service = Service(executable_path=chromedriver_path)
+            service = Service(executable_path=chromedriver_path, **service_kwargs)
             self.driver = webdriver.Chrome(service=service, options=chrome_options)
             return
 
         if USE_WEBDRIVER_MANAGER:
-            service = Service(ChromeDriverManager().install())
+            from webdriver_manager.chrome import ChromeDriverManager
+
+            service = Service(ChromeDriverManager().install(), **service_kwargs)
             self.driver = webdriver.Chrome(service=service, options=chrome_options)
+        elif service_kwargs:
+            self.driver = webdriver.Chrome(service=Service(**service_kwargs), options=chrome_options)
         else:
             self.driver = webdriver.Chrome(options=chrome_options)
 
@@ -529,17 +351,17 @@ class NFSePortalBot:
         try:
             link_emitidas = driver.find_element(By.XPATH, XPATH_MENU_NFSE_EMITIDAS)
         except Exception:
-            print("[ERRO] Não encontrei o menu 'NFS-e Emitidas' no topo.")
+            log.error("Não encontrei o menu 'NFS-e Emitidas' no topo.")
             return False
 
         try:
             link_emitidas.click()
         except Exception as e:
-            print(f"[ERRO] Falha ao clicar no menu 'NFS-e Emitidas': {e}")
+            log.error(f"Falha ao clicar no menu 'NFS-e Emitidas': {e}")
             return False
 
         time.sleep(5)
-        print("[INFO] Naveguei para a tela 'NFS-e Emitidas'.")
+        log.info("Naveguei para a tela 'NFS-e Emitidas'.")
         return True
 
 
@@ -568,6 +390,25 @@ class NFSePortalBot:
 
     # ---------- Download PDF/XML na Visualização \+ LOG ----------
 
+    def _achar_botao(self, xpaths: Tuple[str, ...]):
+        """Primeiro elemento encontrado pelos XPaths (sem esperar)."""
+        assert self.driver is not None
+        for xpath in xpaths:
+            try:
+                return self.driver.find_element(By.XPATH, xpath)
+            except Exception:
+                continue
+        return None
+
+    def _aguardar_botao(self, xpaths: Tuple[str, ...], timeout: int = 25):
+        inicio = time.time()
+        while time.time() - inicio < timeout:
+            botao = self._achar_botao(xpaths)
+            if botao is not None:
+                return botao
+            time.sleep(1)
+        return None
+
     def _baixar_pdf_xml_da_visualizacao(
         self,
         cliente: Dict,
@@ -575,47 +416,55 @@ class NFSePortalBot:
         competencia_tabela: str,
         is_cancelada: bool = False,
     ) -> None:
-        assert self.driver is not None
-        driver = self.driver
+        bot_logging.definir_contexto(nf=None)
 
         # XML
-        print("[INFO] Aguardando botão 'Download XML' na tela de Visualizar...")
-
-        btn_xml = None
-        inicio = time.time()
-        while time.time() - inicio < 25:
-            try:
-                btn_xml = driver.find_element(By.XPATH, XPATH_BTN_XML)
-            except Exception:
-                try:
-                    btn_xml = driver.find_element(
-                        By.XPATH,
-                        "//a[contains(@class,'btn') and (contains(., 'XML') or contains(@title,'XML'))]"
-                    )
-                except Exception:
-                    btn_xml = None
-
-            if btn_xml is not None:
-                break
-            time.sleep(1)
-
+        log.info("Aguardando botão 'Download XML' na tela de Visualizar...")
+        btn_xml = self._aguardar_botao(XPATHS_BTN_XML)
         if btn_xml is None:
-            print("[ERRO] Botão 'Download XML' não encontrado na tela de Visualizar.")
+            log.error("Botão 'Download XML' não encontrado na tela de Visualizar.")
             return
 
         try:
             btn_xml.click()
         except Exception as e:
-            print(f"[ERRO] Falha ao clicar em 'Download XML': {e}")
+            log.error(f"Falha ao clicar em 'Download XML': {e}")
             return
 
         caminho_xml = aguardar_novo_arquivo(".xml", timeout=40)
         if not caminho_xml:
-            print("[ERRO] Nenhum XML novo encontrado após o clique em Download XML.")
+            log.error("Nenhum XML novo encontrado após o clique em Download XML.")
             return
 
-        print(f"[INFO] XML baixado: {caminho_xml}")
+        log.info(f"XML baixado: {caminho_xml}")
 
+        # PDF
+        log.info("Aguardando botão 'Download DANFS-e/PDF' na tela de Visualizar...")
+        caminho_pdf = None
+        btn_pdf = self._aguardar_botao(XPATHS_BTN_PDF)
+        if btn_pdf is not None:
+            try:
+                btn_pdf.click()
+                caminho_pdf = aguardar_novo_arquivo(".pdf", timeout=40)
+                if not caminho_pdf:
+                    log.warning("Nenhum PDF novo encontrado após o clique em Download DANFS-e/PDF.")
+            except Exception as e:
+                log.error(f"Falha ao clicar em Download DANFS-e/PDF: {e}")
+        else:
+            log.warning("Botão de Download PDF/DANFS-e não encontrado. Vou seguir só com o XML.")
+
+        self._registrar_nota(cliente, caminho_xml, caminho_pdf, emissao_tabela, competencia_tabela, is_cancelada)
+
+    def _registrar_nota(
+        self,
+        cliente: Dict,
+        caminho_xml: str,
+        caminho_pdf: Optional[str],
+        emissao_tabela: str,
+        competencia_tabela: str,
+        is_cancelada: bool = False,
+    ) -> None:
+        """XML/PDF já baixados (pasta temporária) -> pasta da competência, LOG, catálogo e métricas."""
         # Extrair dados do XML
         dados_xml = extrair_dados_nfse_do_xml(caminho_xml)
         # ===== Situação (CANCELADA) =====
@@ -652,54 +501,39 @@ class NFSePortalBot:
             base_nome_nf = os.path.splitext(os.path.basename(caminho_xml))[0]
             digitos = re.sub(r"\D", "", base_nome_nf)
             numero_nf = digitos if digitos else "SEM_NUMERO"
+        bot_logging.definir_contexto(nf=numero_nf)
 
         razao_tomador_raw = dados_xml.get("razao_tomador") or cliente["EMPRESA"]
         razao_tomador = (razao_tomador_raw or "").strip().upper() or cliente["EMPRESA"].strip().upper()
         nome_base = f"{razao_tomador} - NF {numero_nf}"
 
-        # Mover XML para pasta por competência
-        caminho_xml_final = mover_com_nome_base(caminho_xml, self.pasta_competencia, nome_base)
-        print(f"[INFO] XML movido para: {caminho_xml_final}")
-
-        # PDF
-        print("[INFO] Aguardando botão 'Download DANFS-e/PDF' na tela de Visualizar...")
-
-        btn_pdf = None
-        inicio = time.time()
-        while time.time() - inicio < 25:
-            try:
-                btn_pdf = driver.find_element(By.XPATH, XPATH_BTN_PDF)
-            except Exception:
-                try:
-                    btn_pdf = driver.find_element(
-                        By.XPATH,
-                        "//a[contains(@class,'btn') and "
-                        "(contains(., 'DANFS') or contains(., 'DANF') "
-                        "or contains(., 'PDF') or contains(@title,'DANFSe'))]"
-                    )
-                except Exception:
-                    btn_pdf = None
-
-            if btn_pdf is not None:
-                break
-            time.sleep(1)
+        # Colocar XML na pasta da competência (idempotente: mesmo conteúdo não duplica)
+        chave_nf = (re.sub(r"\D", "", dados_xml.get("cnpj_prestador") or ""), numero_nf)
+        indice = self._indice_destino(pasta_do_cliente(self.pasta_competencia, cliente, LAYOUT_SAIDA))
+        caminho_xml_final, acao_xml, hash_xml = indice.colocar(caminho_xml, nome_base, chave=chave_nf)
+        if acao_xml == "identico":
+            log.info(f"XML idêntico já existia, download descartado: {caminho_xml_final}")
+        else:
+            log.info(f"XML movido para: {caminho_xml_final} ({acao_xml})")
 
-        if btn_pdf is not None:
+        # PDF: o DANFS-e é gerado na hora (bytes mudam a cada download); se o XML é o
+        # mesmo, a nota é a mesma e o PDF já salvo é mantido.
+        caminho_pdf_final = None
+        if caminho_pdf:
             try:
-                btn_pdf.click()
-                caminho_pdf = aguardar_novo_arquivo(".pdf", timeout=40)
-                if caminho_pdf:
-                    caminho_pdf_final = mover_com_nome_base(caminho_pdf, self.pasta_competencia, nome_base)
-                    print(f"[INFO] PDF movido para: {caminho_pdf_final}")
+                pdf_existente = None
+                if acao_xml == "identico":
+                    pdf_existente = indice.existente(nome_base, ".pdf", chave=chave_nf)
+                if pdf_existente:
+                    os.remove(caminho_pdf)
+                    caminho_pdf_final = pdf_existente
+                    log.info(f"PDF da mesma nota já existia, download descartado: {caminho_pdf_final}")
                 else:
-                    caminho_pdf_final = None
-                    print("[AVISO] Nenhum PDF novo encontrado após o clique em Download DANFS-e/PDF.")
+                    caminho_pdf_final, _, _ = indice.colocar(caminho_pdf, nome_base, chave=chave_nf)
+                    log.info(f"PDF movido para: {caminho_pdf_final}")
             except Exception as e:
                 caminho_pdf_final = None
-                print(f"[ERRO] Falha ao clicar em Download DANFS-e/PDF: {e}")
-        else:
-            caminho_pdf_final = None
-            print("[AVISO] Botão de Download PDF/DANFS-e não encontrado. Vou seguir só com o XML.")
+                log.error(f"Falha ao salvar o PDF da NF {numero_nf}: {e}")
 
         # ===== Montagem do LOG conforme layout solicitado =====
 
@@ -769,8 +603,127 @@ class NFSePortalBot:
             "SITUACAO": dados_xml.get("situacao"),
         }
 
-        self.registros_log.append(registro)
-        print(f"[INFO] Registro de log incluído para NF {numero_nf}.")
+        self.log_writer.adicionar(registro)
+        log.info(f"Registro de log incluído para NF {numero_nf}.")
+
+        try:
+            if self._catalogo is None:
+                self._catalogo = catalog.conectar(PASTA_BASE_SAIDA)
+            catalog.registrar_nota(PASTA_BASE_SAIDA, {
+                **dados_xml,
+                "competencia": self.competencia_str,
+                "empresa": cliente["EMPRESA"],
+                "numero_nf": numero_nf,
+                "razao_tomador": razao_tomador,
+                "data_emissao": data_emissao_log,
+                "caminho_xml": caminho_xml_final,
+                "caminho_pdf": caminho_pdf_final,
+                "hash_xml": hash_xml,
+            }, con=self._catalogo)
+        except Exception as e:
+            # catálogo é índice de consulta; a nota já está salva em disco e no LOG
+            log.warning(f"Falha ao registrar NF {numero_nf} no catálogo: {e}")
+
+        tamanho = 0
+        for caminho in (caminho_xml_final, caminho_pdf_final):
+            if caminho:
+                try:
+                    tamanho += os.path.getsize(caminho)
+                except OSError:
+                    pass
+        if self.metricas is not None:
+            self.metricas.notas += 1
+            self.metricas.bytes += tamanho
+
+        if self.callback_nota is not None:
+            try:
+                self.callback_nota(cliente, {"numero_nf": numero_nf, "bytes": tamanho})
+            except Exception:
+                pass
+
+    # ---------- Várias abas de Visualizar na mesma sessão ----------
+
+    def _disparar_downloads(self, lote: List[Dict], xpaths: Tuple[str, ...], extensao: str, rotulo: str, timeout: int = 25) -> Dict[str, str]:
+        """
+        Percorre as abas em rodízio: a que já tem o botão recebe o clique; as que ainda carregam ficam
+        para a próxima volta. Depois de cada clique espera só o download COMEÇAR, então cada arquivo
+        novo da pasta temporária pertence à aba que acabou de ser clicada.
+        Retorna {aba: caminho final do download}.
+        """
+        assert self.driver is not None
+        driver = self.driver
+        resultado: Dict[str, str] = {}
+        fila = collections.deque(lote)
+        limite = time.time() + timeout
+        sem_botao = 0
+        while fila and time.time() < limite:
+            aba = fila.popleft()
+            driver.switch_to.window(aba["aba"])
+            botao = self._achar_botao(xpaths)
+            if botao is None:
+                fila.append(aba)
+                sem_botao += 1
+                if sem_botao >= len(fila):
+                    # uma volta inteira sem nenhuma aba pronta
+                    time.sleep(0.5)
+                    sem_botao = 0
+                continue
+            sem_botao = 0
+            antes = set(os.listdir(PASTA_DOWNLOAD_TEMP))
+            try:
+                botao.click()
+            except Exception as e:
+                log.error(f"Linha {aba['linha']}: falha ao clicar em Download {rotulo}: {e}")
+                continue
+            caminho = aguardar_inicio_download(extensao, antes, ignorar=resultado.values())
+            if caminho:
+                resultado[aba["aba"]] = caminho
+                limite = time.time() + timeout
+            else:
+                log.error(f"Linha {aba['linha']}: nenhum download de {rotulo} começou após o clique.")
+        for aba in fila:
+            log.warning(f"Linha {aba['linha']}: botão 'Download {rotulo}' não encontrado na aba de Visualizar.")
+        return resultado
+
+    def _processar_abas(self, cliente: Dict, lote: List[Dict], janela_lista: str) -> None:
+        """
+        Lote de abas de Visualizar já abertas (mesma sessão/login): XMLs disparados em rodízio e baixados
+        juntos, depois os PDFs, e cada nota registrada como no fluxo de uma aba. As abas são fechadas no fim.
+        """
+        assert self.driver is not None
+        driver = self.driver
+        bot_logging.definir_contexto(nf=None)
+        log.info(f"Baixando {len(lote)} nota(s) em abas simultâneas.")
+        try:
+            xmls = self._disparar_downloads(lote, XPATHS_BTN_XML, ".xml", "XML")
+            xml_ok = aguardar_downloads(list(xmls.values()))
+            com_xml = [a for a in lote if xml_ok.get(xmls.get(a["aba"], ""))]
+            pdfs = self._disparar_downloads(com_xml, XPATHS_BTN_PDF, ".pdf", "DANFS-e/PDF")
+            pdf_ok = aguardar_downloads(list(pdfs.values()))
+
+            for aba in lote:
+                bot_logging.definir_contexto(nf=None)
+                caminho_xml = xmls.get(aba["aba"])
+                if not caminho_xml or not xml_ok.get(caminho_xml):
+                    log.error(f"Linha {aba['linha']}: XML não baixado; nota fica para a próxima execução.")
+                    continue
+                caminho_pdf = pdfs.get(aba["aba"])
+                if caminho_pdf and not pdf_ok.get(caminho_pdf):
+                    log.warning(f"Linha {aba['linha']}: download do PDF não terminou. Vou seguir só com o XML.")
+                    caminho_pdf = None
+                log.info(f"XML baixado: {caminho_xml}")
+                self._registrar_nota(
+                    cliente, caminho_xml, caminho_pdf, aba["emissao"], aba["competencia"], is_cancelada=aba["cancelada"]
+                )
+        finally:
+            for aba in lote:
+                try:
+                    driver.switch_to.window(aba["aba"])
+                    driver.close()
+                except Exception:
+                    pass
+            driver.switch_to.window(janela_lista)
+            time.sleep(1)
 
     # ---------- Processar todas as páginas de Notas Emitidas ----------
 
@@ -786,15 +739,18 @@ class NFSePortalBot:
         alvo_mes = self.mes
         alvo_label = self.competencia_label
 
-        print(f"[INFO] Competência ALVO para esse cliente: {alvo_label}")
+        log.info(f"Competência ALVO para esse cliente: {alvo_label}")
 
         pagina = 1
         chave_primeira_anterior = None
+        # ABAS_VISUALIZAR > 1: notas da página abertas em lotes de abas e baixadas juntas (_processar_abas)
+        abas = max(1, int(ABAS_VISUALIZAR))
+        lote: List[Dict] = []
 
         while True:
             linhas = driver.find_elements(By.CSS_SELECTOR, "table tbody tr")
             if not linhas:
-                print(f"[INFO] Nenhuma linha encontrada na página {pagina}. Encerrando paginação.")
+                log.info(f"Nenhuma linha encontrada na página {pagina}. Encerrando paginação.")
                 break
 
             try:
@@ -803,11 +759,13 @@ class NFSePortalBot:
                 chave_primeira = f"pag_{pagina}_linha_0"
 
             if chave_primeira == chave_primeira_anterior:
-                print("[INFO] Primeira linha repetida em relação à página anterior. Parece ser a última página. Encerrando paginação.")
+                log.info("Primeira linha repetida em relação à página anterior. Parece ser a última página. Encerrando paginação.")
                 break
 
             chave_primeira_anterior = chave_primeira
-            print(f"[INFO] Processando página {pagina}. Total de linhas: {len(linhas)}")
+            log.info(f"Processando página {pagina}. Total de linhas: {len(linhas)}")
+            if self.metricas is not None:
+                self.metricas.paginas += 1
 
             # percorre linhas da página
             for idx in range(len(linhas)):
@@ -837,15 +795,15 @@ class NFSePortalBot:
                     comp_parsed = (ano_linha, mes_linha)
 
                 if not comp_parsed:
-                    print(f"[INFO] Linha {idx+1}: competência '{competencia_texto}' não reconhecida, pulando.")
+                    log.info(f"Linha {idx+1}: competência '{competencia_texto}' não reconhecida, pulando.")
                     continue
 
                 if comp_parsed != (alvo_ano, alvo_mes):
-                    print(f"[INFO] Linha {idx+1}: competência {competencia_texto} != alvo {alvo_label}, pulando.")
+                    log.debug(f"Linha {idx+1}: competência {competencia_texto} != alvo {alvo_label}, pulando.")
                     continue
 
-                print(
-                    f"[INFO] Linha {idx+1}: Emissão={emissao} | Competência={competencia_texto} (ALVO) | Cancelada={is_cancelada} "
+                log.info(
+                    f"Linha {idx+1}: Emissão={emissao} | Competência={competencia_texto} (ALVO) | Cancelada={is_cancelada} "
                     "-> iniciando fluxo Visualizar"
                 )
 
@@ -856,13 +814,13 @@ class NFSePortalBot:
                         "./td[7]//a[contains(@class,'icone-trigger')]"
                     )
                 except Exception as e:
-                    print(f"[ERRO] Não achei o menu de ações (3 pontinhos) na linha {idx+1}: {e}")
+                    log.error(f"Não achei o menu de ações (3 pontinhos) na linha {idx+1}: {e}")
                     continue
 
                 try:
                     driver.execute_script("arguments[0].click();", menu_3_pontos)
                 except Exception as e:
-                    print(f"[ERRO] Falha ao clicar nos 3 pontinhos da linha {idx+1}: {e}")
+                    log.error(f"Falha ao clicar nos 3 pontinhos da linha {idx+1}: {e}")
                     continue
 
                 time.sleep(1.5)
@@ -875,7 +833,7 @@ class NFSePortalBot:
                         "//a[contains(@class,'list-group-item') and contains(., 'Visualizar')]"
                     )
                 except Exception as e:
-                    print(f"[ERRO] Não encontrei a opção 'Visualizar' para a linha {idx+1}: {e}")
+                    log.error(f"Não encontrei a opção 'Visualizar' para a linha {idx+1}: {e}")
                     continue
 
                 janela_atual = driver.current_window_handle
@@ -884,18 +842,36 @@ class NFSePortalBot:
                 try:
                     link_visualizar.click()
                 except Exception as e:
-                    print(f"[ERRO] Falha ao clicar em 'Visualizar' na linha {idx+1}: {e}")
+                    log.error(f"Falha ao clicar em 'Visualizar' na linha {idx+1}: {e}")
                     continue
 
-                time.sleep(3)
+                if abas > 1:
+                    # a aba carrega em segundo plano; só espera ela existir
+                    limite_aba = time.time() + 3
+                    while len(driver.window_handles) <= len(handles_antes) and time.time() < limite_aba:
+                        time.sleep(0.2)
+                else:
+                    time.sleep(3)
 
                 handles_depois = set(driver.window_handles)
 
-                if len(handles_depois) > len(handles_antes):
+                if len(handles_depois) > len(handles_antes) and abas > 1:
+                    lote.append({
+                        "aba": list(handles_depois - handles_antes)[0],
+                        "linha": idx + 1,
+                        "emissao": emissao,
+                        "competencia": competencia_texto,
+                        "cancelada": is_cancelada,
+                    })
+                    log.info(f"Visualização da linha {idx+1} aberta em nova aba ({len(lote)}/{abas}).")
+                    if len(lote) >= abas:
+                        self._processar_abas(cliente, lote, janela_atual)
+                        lote = []
+                elif len(handles_depois) > len(handles_antes):
                     nova_janela = list(handles_depois - handles_antes)[0]
                     try:
                         driver.switch_to.window(nova_janela)
-                        print(f"[INFO] Visualização da linha {idx+1} aberta em nova aba.")
+                        log.info(f"Visualização da linha {idx+1} aberta em nova aba.")
                         self._baixar_pdf_xml_da_visualizacao(cliente, emissao, competencia_texto, is_cancelada=is_cancelada)
                         time.sleep(2)
                         driver.close()
@@ -903,12 +879,17 @@ class NFSePortalBot:
                         driver.switch_to.window(janela_atual)
                         time.sleep(3)
                 else:
-                    print(f"[INFO] Visualização da linha {idx+1} aberta na mesma aba.")
+                    log.info(f"Visualização da linha {idx+1} aberta na mesma aba.")
                     self._baixar_pdf_xml_da_visualizacao(cliente, emissao, competencia_texto, is_cancelada=is_cancelada)
                     time.sleep(2)
                     driver.back()
                     time.sleep(3)
 
+            # abas que sobraram da página (a listagem muda ao paginar)
+            if lote:
+                self._processar_abas(cliente, lote, driver.current_window_handle)
+                lote = []
+
             # tenta ir para a próxima página de notas
             try:
                 btn_prox = driver.find_element(By.XPATH, XPATH_BTN_PROXIMA_PAGINA)
@@ -923,7 +904,7 @@ class NFSePortalBot:
                     btn_prox = None
 
             if not btn_prox:
-                print("[INFO] Não encontrei botão de próxima página. Encerrando paginação.")
+                log.info("Não encontrei botão de próxima página. Encerrando paginação.")
                 break
 
             try:
@@ -931,10 +912,10 @@ class NFSePortalBot:
                 pagina += 1
                 time.sleep(4)
             except Exception as e:
-                print(f"[INFO] Falha ao clicar na próxima página ({e}). Encerrando paginação.")
+                log.info(f"Falha ao clicar na próxima página ({e}). Encerrando paginação.")
                 break
 
-        print("[INFO] Ciclo de páginas (Visualizar + Download) concluído para todas as notas da competência alvo.")
+        log.info("Ciclo de páginas (Visualizar + Download) concluído para todas as notas da competência alvo.")
 
     # ---------- Login: LOGIN/SENHA ----------
 
@@ -949,7 +930,7 @@ class NFSePortalBot:
             input_login = driver.find_element(By.ID, ID_INPUT_LOGIN)
             input_senha = driver.find_element(By.ID, ID_INPUT_SENHA)
         except Exception:
-            print(f"[ERRO] Não encontrei campos de login/senha para o cliente: {cliente['EMPRESA']}")
+            log.error(f"Não encontrei campos de login/senha para o cliente: {cliente['EMPRESA']}")
             return False
 
         input_login.clear()
@@ -971,17 +952,146 @@ class NFSePortalBot:
                     " and not(contains(., 'certificado')) ]"
                 )
         except Exception:
-            print(f"[ERRO] Não encontrei botão de login para o cliente: {cliente['EMPRESA']}")
+            log.error(f"Não encontrei botão de login para o cliente: {cliente['EMPRESA']}")
             return False
 
         btn_entrar.click()
         time.sleep(DELAY_ACAO)
 
         if not self._aguardar_tela_logada(timeout=60):
-            print(f"[ERRO] Não identifiquei a tela logada após login/senha de {cliente['EMPRESA']}.")
+            log.error(f"Não identifiquei a tela logada após login/senha de {cliente['EMPRESA']}.")
             return False
 
-        print(f"[INFO] Login (usuário/senha) OK para {cliente['EMPRESA']}")
+        log.info(f"Login (usuário/senha) OK para {cliente['EMPRESA']}")
+        return True
+
+    # ---------- Sessão salva ----------
+
+    def _cofre_sessoes(self) -> Optional[sessao_store.CofreSessoes]:
+        if self._cofre_aberto or not REAPROVEITAR_SESSAO:
+            return self._cofre
+        self._cofre_aberto = True
+        if not sessao_store.disponivel():
+            log.info("Reaproveitamento de sessão desligado: instale 'cryptography' para salvar sessões cifradas.")
+            return None
+        try:
+            self._cofre = sessao_store.CofreSessoes(PASTA_SESSOES)
+        except Exception as e:
+            log.warning(f"Cofre de sessões indisponível ({PASTA_SESSOES}): {e}")
+        return self._cofre
+
+    def _restaurar_sessao(self, cliente: Dict) -> bool:
+        """Cookies/storage da última sessão do cliente + sonda na página inicial. False = fazer login."""
+        cofre = self._cofre_sessoes()
+        if cofre is None:
+            return False
+        identidade = data_store.identidade_cliente(cliente)
+        sessao = cofre.carregar(identidade, sessao_store.conta_cliente(cliente))
+        if sessao is None:
+            return False
+
+        assert self.driver is not None
+        driver = self.driver
+        try:
+            # cookies só podem ser definidos com uma página do domínio aberta
+            driver.get(URL_PORTAL)
+            for cookie in sessao.get("cookies", []):
+                try:
+                    driver.add_cookie(cookie)
+                except Exception as e:
+                    log.debug(f"Cookie {cookie.get('name')} não restaurado: {e}")
+            for area in ("localStorage", "sessionStorage"):
+                itens = sessao.get(area) or {}
+                if itens:
+                    driver.execute_script(
+                        f"for (const [k, v] of Object.entries(arguments[0])) {{ window.{area}.setItem(k, v); }}", itens
+                    )
+            driver.get(URL_PORTAL_INICIO)
+            valida = self._aguardar_tela_logada(timeout=TIMEOUT_SONDA_SESSAO)
+        except Exception as e:
+            log.warning(f"Falha ao restaurar a sessão de {cliente['EMPRESA']}: {e}")
+            valida = False
+
+        if valida:
+            idade_min = (time.time() - float(sessao.get("salva_em") or time.time())) / 60
+            log.info(f"Sessão salva reaproveitada para {cliente['EMPRESA']} (de {idade_min:.0f} min atrás); login dispensado.")
+            return True
+        log.info(f"Sessão salva de {cliente['EMPRESA']} expirou no Portal; fazendo login.")
+        cofre.descartar(identidade)
+        try:
+            driver.delete_all_cookies()
+        except Exception:
+            pass
+        return False
+
+    def _salvar_sessao(self, cliente: Dict) -> None:
+        cofre = self._cofre_sessoes()
+        if cofre is None or self.driver is None:
+            return
+        try:
+            sessao = {
+                "cookies": self.driver.get_cookies(),
+                "localStorage": self.driver.execute_script("return Object.assign({}, window.localStorage);"),
+                "sessionStorage": self.driver.execute_script("return Object.assign({}, window.sessionStorage);"),
+            }
+            cofre.salvar(data_store.identidade_cliente(cliente), sessao_store.conta_cliente(cliente), sessao)
+        except Exception as e:
+            log.warning(f"Não consegui salvar a sessão de {cliente['EMPRESA']}: {e}")
+
+    # ---------- Login: CERTIFICADO (headless, .pfx) ----------
+
+    def _preparar_cert_headless(self, cliente: Dict) -> Optional[cert_headless.PerfilCertificado]:
+        """
+        Monta o banco NSS com o .pfx do cliente e instala a política de auto-seleção.
+        None quando o cliente não usa (ou não pode usar) o login headless.
+        """
+        self.motivo_sem_cert_headless = None
+        if str(cliente.get("TIPO_ACESSO", "")).strip().upper() != "CERTIFICADO" or MODO_CERTIFICADO == "imagem":
+            return None
+        pfx = str(cliente.get("CERT_PFX", "") or "").strip()
+        if not pfx:
+            if MODO_CERTIFICADO == "headless":
+                self.motivo_sem_cert_headless = "sem CERT_PFX no cadastro (modo de certificado 'headless')"
+            return None
+        if MODO_CERTIFICADO == "auto" and not cert_headless.suportado():
+            log.info("Login headless por certificado indisponível aqui (requer Linux + libnss3-tools): usando imagem.")
+            return None
+        if not os.path.isabs(pfx):
+            pfx = os.path.join(PASTA_IMAGENS_CERT, pfx)
+
+        try:
+            cert_headless.garantir_politica(PADROES_CERTIFICADO)
+            senha = data_store.resolver_segredo(cliente.get("CERT_SENHA", ""))
+            perfil = cert_headless.preparar_perfil(pfx, senha)
+        except (cert_headless.CertHeadlessErro, ValueError) as e:
+            if MODO_CERTIFICADO == "headless":
+                self.motivo_sem_cert_headless = f"login headless por certificado indisponível: {e}"
+            else:
+                log.warning(f"Login headless por certificado indisponível para {cliente['EMPRESA']} ({e}): usando imagem.")
+            return None
+        log.info(f"Certificado {os.path.basename(pfx)} carregado em perfil próprio do navegador.")
+        return perfil
+
+    def _login_por_certificado_headless(self, cliente: Dict) -> bool:
+        """Com a política AutoSelectCertificateForUrls o desafio TLS é respondido pelo Chrome: login vira navegação."""
+        assert self.driver is not None
+        driver = self.driver
+
+        driver.get(URL_PORTAL)
+        time.sleep(DELAY_ACAO)
+
+        try:
+            link = driver.find_element(By.XPATH, XPATH_LINK_CERTIFICADO)
+        except Exception:
+            log.error(f"Não encontrei o link 'Acesso via certificado digital' para {cliente['EMPRESA']}.")
+            return False
+        driver.execute_script("arguments[0].click();", link)
+
+        if not self._aguardar_tela_logada(timeout=60):
+            log.error(f"Não identifiquei a tela logada após o login headless por certificado de {cliente['EMPRESA']}.")
+            return False
+
+        log.info(f"Login (certificado, headless) OK para {cliente['EMPRESA']}")
         return True
 
     # ---------- Login: CERTIFICADO (imagem) ----------
@@ -1002,49 +1112,42 @@ class NFSePortalBot:
 
         img_btn_cert = os.path.join(PASTA_IMAGENS_CERT, "btn_acesso_cert.png")
         if not os.path.exists(img_btn_cert):
-            print(f"[ERRO] Imagem do botão de certificado não encontrada: {img_btn_cert}")
+            log.error(f"Imagem do botão de certificado não encontrada: {img_btn_cert}")
             return False
 
-        print(f"[INFO] Vou procurar o botão 'Acesso via certificado digital' na tela: {img_btn_cert}")
-        inicio = time.time()
-        pos_btn = None
+        log.info(f"Vou procurar o botão 'Acesso via certificado digital' na tela: {img_btn_cert}")
 
-        time.sleep(3)
-
-        while time.time() - inicio < 30:
-            try:
-                pos_btn = pg.locateOnScreen(img_btn_cert, confidence=0.8)
-            except Exception as e:
-                print(f"[ERRO] locateOnScreen (botão certificado) falhou: {e}")
-                return False
-
-            if pos_btn:
-                x, y = pg.center(pos_btn)
-                print(f"[INFO] Botão de certificado localizado em ({x}, {y}). Vou clicar.")
-                try:
-                    pg.moveTo(x, y, duration=0.5)
-                    pg.click()
-                except Exception as e:
-                    print(f"[ERRO] Falha ao clicar no botão de certificado: {e}")
-                    return False
-                break
+        try:
+            achado = template_match.aguardar(img_btn_cert, timeout=30, confianca=0.8)
+        except Exception as e:
+            log.error(f"Busca do botão de certificado na tela falhou: {e}")
+            return False
 
-            time.sleep(1.0)
+        if achado is None:
+            log.error("Não localizei o botão 'Acesso via certificado digital' na tela dentro do timeout.")
+            return False
 
-        if not pos_btn:
-            print("[ERRO] Não localizei o botão 'Acesso via certificado digital' na tela dentro do timeout.")
+        x, y = achado.centro()
+        log.info(f"Botão de certificado localizado em ({x}, {y}). Vou clicar.")
+        try:
+            pg.moveTo(x, y, duration=0.5)
+            pg.click()
+        except Exception as e:
+            log.error(f"Falha ao clicar no botão de certificado: {e}")
             return False
 
-        print(f"[INFO] Clique no botão de certificado disparado para {cliente['EMPRESA']}. Aguardando popup...")
+        log.info(f"Clique no botão de certificado disparado para {cliente['EMPRESA']}. Aguardando popup...")
 
         nome_img_cert = str(cliente.get("IMG_CERT", "")).strip()
         if not nome_img_cert:
-            print(f"[ERRO] Cliente {cliente['EMPRESA']} com TIPO_ACESSO=CERTIFICADO, mas IMG_CERT vazio na planilha.")
+            log.error(f"Cliente {cliente['EMPRESA']} com TIPO_ACESSO=CERTIFICADO, mas IMG_CERT vazio na planilha.")
             return False
 
         time.sleep(3)
 
-        print(f"[INFO] Vou selecionar o certificado por imagem: {nome_img_cert}")
+        log.info(f"Vou selecionar o certificado por imagem: {nome_img_cert}")
+        from cert_image_selector import selecionar_certificado_por_imagem
+
         ok = selecionar_certificado_por_imagem(
             base_dir_imagens=PASTA_IMAGENS_CERT,
             nome_img_cert=nome_img_cert,
@@ -1053,110 +1156,144 @@ class NFSePortalBot:
             debug=True,
         )
         if not ok:
-            print(f"[ERRO] Falha ao selecionar certificado por imagem para {cliente['EMPRESA']}.")
+            log.error(f"Falha ao selecionar certificado por imagem para {cliente['EMPRESA']}.")
             return False
 
-        print("[INFO] Certificado selecionado. Aguardando tela logada do Portal...")
+        log.info("Certificado selecionado. Aguardando tela logada do Portal...")
         if not self._aguardar_tela_logada(timeout=60):
-            print(f"[ERRO] Não identifiquei a tela logada após seleção de certificado para {cliente['EMPRESA']}.")
+            log.error(f"Não identifiquei a tela logada após seleção de certificado para {cliente['EMPRESA']}.")
             return False
 
-        print(f"[INFO] Login (certificado) OK para {cliente['EMPRESA']}")
+        log.info(f"Login (certificado) OK para {cliente['EMPRESA']}")
         return True
 
     # ---------- Processar cliente ----------
 
     def _processar_cliente(self, cliente: Dict) -> None:
-        print(f"\n=== Processando cliente: {cliente['EMPRESA']} | TIPO_ACESSO={cliente['TIPO_ACESSO']} ===")
-
-        self._inicializar_navegador()
-
-        try:
-            tipo_acesso = str(cliente["TIPO_ACESSO"]).strip().upper()
-            if tipo_acesso == "LOGIN_SENHA":
-                autenticado = self._login_por_login_senha(cliente)
-            elif tipo_acesso == "CERTIFICADO":
-                autenticado = self._login_por_certificado(cliente)
-            else:
-                print(f"[ERRO] TIPO_ACESSO inválido para {cliente['EMPRESA']}: {tipo_acesso}")
-                autenticado = False
+        m = run_ledger.MetricasCliente(
+            empresa=cliente["EMPRESA"],
+            cnpj=str(cliente.get("CNPJ", "")),
+            tipo_acesso=str(cliente.get("TIPO_ACESSO", "")),
+        )
+        self.metricas = m
+        with bot_logging.contexto(cliente=cliente["EMPRESA"], competencia=self.competencia_str):
+            log.info(f"=== Processando cliente: {cliente['EMPRESA']} | TIPO_ACESSO={cliente['TIPO_ACESSO']} ===")
 
-            if not autenticado:
-                print(f"[ERRO] Falha no login para o cliente: {cliente['EMPRESA']}")
-                return
+            try:
+                with m.fase("navegador"):
+                    self.perfil_cert = self._preparar_cert_headless(cliente)
+                    self._inicializar_navegador(self.perfil_cert)
+
+                tipo_acesso = str(cliente["TIPO_ACESSO"]).strip().upper()
+                with m.fase("login"):
+                    sessao_restaurada = self._restaurar_sessao(cliente)
+                    if sessao_restaurada:
+                        autenticado = True
+                    elif tipo_acesso == "LOGIN_SENHA":
+                        autenticado = self._login_por_login_senha(cliente)
+                    elif tipo_acesso == "CERTIFICADO" and self.perfil_cert is not None:
+                        autenticado = self._login_por_certificado_headless(cliente)
+                    elif tipo_acesso == "CERTIFICADO" and MODO_CERTIFICADO == "headless":
+                        motivo = self.motivo_sem_cert_headless or "login headless por certificado indisponível"
+                        log.error(f"Cliente {cliente['EMPRESA']}: {motivo}.")
+                        m.falhar(run_ledger.FALHA_LOGIN, motivo)
+                        return
+                    elif tipo_acesso == "CERTIFICADO":
+                        autenticado = self._login_por_certificado(cliente)
+                    else:
+                        log.error(f"TIPO_ACESSO inválido para {cliente['EMPRESA']}: {tipo_acesso}")
+                        autenticado = False
+
+                if not autenticado:
+                    log.error(f"Falha no login para o cliente: {cliente['EMPRESA']}")
+                    m.falhar(run_ledger.FALHA_LOGIN, "Falha no login")
+                    return
+
+                log.info(f"Login bem-sucedido para {cliente['EMPRESA']} | Competência alvo: {self.competencia_str}")
+
+                if not sessao_restaurada:
+                    self._salvar_sessao(cliente)
+                    time.sleep(3)
 
-            print(f"[INFO] Login bem-sucedido para {cliente['EMPRESA']} | Competência alvo: {self.competencia_str}")
+                with m.fase("navegacao"):
+                    navegou = self._ir_para_nfse_emitidas()
+                if not navegou:
+                    log.error(f"Não consegui navegar para 'NFS-e Emitidas' para {cliente['EMPRESA']}.")
+                    m.falhar(run_ledger.FALHA_NAVEGACAO, "Não abriu 'NFS-e Emitidas'")
+                    return
 
-            time.sleep(3)
+                with m.fase("notas"):
+                    self._processar_notas_emitidas(cliente)
 
-            if not self._ir_para_nfse_emitidas():
-                print(f"[ERRO] Não consegui navegar para 'NFS-e Emitidas' para {cliente['EMPRESA']}.")
-                return
+                # cookies renovados durante a navegação valem para a próxima execução
+                self._salvar_sessao(cliente)
 
-            self._processar_notas_emitidas(cliente)
+            except Exception as e:
+                m.falhar(run_ledger.ERRO, str(e))
+                raise
+
+            finally:
+                self._finalizar_navegador()
+                self._salvar_indices()
+                self._fechar_catalogo()
+                if self.perfil_cert is not None:
+                    self.perfil_cert.remover()
+                    self.perfil_cert = None
+                m.encerrar()
+                log.info(
+                    f"Cliente {m.empresa}: {m.status} em {m.duracao:.0f}s | páginas={m.paginas} notas={m.notas}"
+                )
+                if self.execucao_id:
+                    self._historico(run_ledger.registrar_cliente, self.execucao_id, self.competencia_str, m)
 
-        finally:
-            self._finalizar_navegador()
+    def _historico(self, funcao: Callable, *args, **kwargs) -> None:
+        """O histórico é só observabilidade: falha ao gravar não interrompe a execução."""
+        try:
+            funcao(PASTA_BASE_SAIDA, *args, **kwargs)
+        except Exception as e:
+            log.warning(f"Falha ao gravar histórico de execuções: {e}")
 
     # ---------- Execução geral ----------
 
     def rodar(self) -> None:
+        execucao = bot_logging.configurar_execucao(PASTA_BASE_SAIDA, prefixo=f"run_{self.competencia_str}")
+        self.execucao_id = execucao.id
+        try:
+            with bot_logging.contexto(execucao=execucao.id, competencia=self.competencia_str):
+                self._rodar_clientes()
+        finally:
+            execucao.encerrar()
+
+    def _rodar_clientes(self) -> None:
         clientes = carregar_clientes_da_planilha()
         if not clientes:
-            print("[AVISO] Nenhum cliente ATIVO na planilha.")
+            log.warning("Nenhum cliente ATIVO na planilha.")
             return
 
-        print(f"=== Rodando PortalNFSe para competência {self.competencia_str} ({self.competencia_label}) ===")
-        print(f"Total de clientes ativos: {len(clientes)}")
-
-        for cliente in clientes:
-            self._processar_cliente(cliente)
-
-        if self.registros_log:
-            df_log = pd.DataFrame(self.registros_log)
-
-            # Garante a ordem das colunas no Excel
-            colunas_ordem = [
-                "NUMERO_NF",
-                "DATA_EMISSAO",
-                "DATA_COMPETENCIA",
-                "CNPJ_PRESTADOR",
-                "RAZAO_PRESTADOR",
-                "CNPJ_TOMADOR",
-                "RAZAO_TOMADOR",
-                "OPTANTE_SN",
-                "CODIGO_TRIBUTACAO_NACIONAL",
-                "VALOR_SERVICO",
-                "IR",
-                "ISS",
-                "ISS_RETIDO",
-                "CSLL",
-                "DEDUCOES",
-                "PIS",
-                "COFINS",
-                "INSS",
-                "DESC_INCOND",
-                "DESC_COND",
-                "OUTRAS_RET",
-                "ALIQUOTA",
-                "BASE_CALCULO",
-                "VALOR_LIQUIDO",
-                "SITUACAO",
-            ]
-            df_log = df_log.reindex(columns=colunas_ordem)
-
-            caminho_log = os.path.join(
-                self.pasta_competencia,
-                f"LOG_NFSE_{self.competencia_str}.xlsx"
-            )
-            df_log.to_excel(caminho_log, index=False)
-            print(f"[INFO] Log salvo em: {caminho_log}")
-        else:
-            print("[INFO] Nenhum registro para log.")
+        log.info(f"=== Rodando PortalNFSe para competência {self.competencia_str} ({self.competencia_label}) ===")
+        log.info(f"Total de clientes ativos: {len(clientes)}")
 
-        print("\n=== Fim da execução geral ===")
+        self._historico(run_ledger.iniciar_execucao, self.execucao_id, self.competencia_str, len(clientes), origem="script")
+        status = "FALHA"
+        try:
+            for cliente in clientes:
+                self._processar_cliente(cliente)
+            status = "CONCLUÍDO"
+        finally:
+            self._historico(run_ledger.finalizar_execucao, self.execucao_id, status)
+            caminho_log = self.log_writer.finalizar()
+            if caminho_log:
+                log.info(f"Log salvo em: {caminho_log}")
+            else:
+                log.info("Nenhum registro para log.")
+
+        log.info("=== Fim da execução geral ===")
 
 
 if __name__ == "__main__":
-    bot = NFSePortalBot()
-    bot.rodar()
+    # parâmetros (competência, clientes, workers, formato...): ver `python cli.py --help`
+    import sys
+
+    import cli
+
+    sys.exit(cli.main())
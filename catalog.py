@@ -0,0 +1,305 @@
+# catalog.py
+import datetime
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+ARQUIVO_CATALOGO = "_catalogo.sqlite3"
+
+_RE_PASTA_COMPETENCIA = re.compile(r"^\d{4}-\d{2}$")
+
+# bancos já com schema/migração aplicados neste processo (conectar() faz isso uma vez por arquivo)
+_preparados: set = set()
+_preparados_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notas (
+    id INTEGER PRIMARY KEY,
+    competencia TEXT NOT NULL,
+    empresa TEXT,
+    numero_nf TEXT NOT NULL,
+    cnpj_prestador TEXT NOT NULL DEFAULT '',
+    razao_prestador TEXT,
+    cnpj_tomador TEXT,
+    razao_tomador TEXT,
+    data_emissao TEXT,
+    valor_servico REAL,
+    valor_liquido REAL,
+    iss REAL,
+    situacao TEXT,
+    caminho_xml TEXT,
+    caminho_pdf TEXT,
+    hash_xml TEXT,
+    atualizado_em TEXT,
+    UNIQUE (competencia, cnpj_prestador, numero_nf)
+);
+CREATE INDEX IF NOT EXISTS ix_notas_competencia ON notas (competencia);
+CREATE INDEX IF NOT EXISTS ix_notas_empresa ON notas (empresa, competencia);
+CREATE INDEX IF NOT EXISTS ix_notas_prestador ON notas (cnpj_prestador, competencia);
+CREATE INDEX IF NOT EXISTS ix_notas_tomador ON notas (cnpj_tomador);
+CREATE INDEX IF NOT EXISTS ix_notas_numero ON notas (numero_nf);
+CREATE INDEX IF NOT EXISTS ix_notas_hash ON notas (hash_xml);
+"""
+
+COLUNAS_NOTA = [
+    "competencia",
+    "empresa",
+    "numero_nf",
+    "cnpj_prestador",
+    "razao_prestador",
+    "cnpj_tomador",
+    "razao_tomador",
+    "data_emissao",
+    "valor_servico",
+    "valor_liquido",
+    "iss",
+    "situacao",
+    "caminho_xml",
+    "caminho_pdf",
+    "hash_xml",
+]
+
+
+def caminho_catalogo(pasta_base_saida: str) -> str:
+    return os.path.join(pasta_base_saida, ARQUIVO_CATALOGO)
+
+
+def conectar(pasta_base_saida: str) -> sqlite3.Connection:
+    """
+    Conexão com o catálogo. Fica no journal padrão (rollback), não em WAL: a pasta de saída costuma ser
+    um compartilhamento de rede (SMB), onde o WAL (memória compartilhada do -shm) não é seguro.
+    Schema e migração rodam só na primeira conexão de cada catálogo no processo.
+    """
+    os.makedirs(pasta_base_saida, exist_ok=True)
+    caminho = os.path.abspath(caminho_catalogo(pasta_base_saida))
+    con = sqlite3.connect(caminho, timeout=30)
+    con.row_factory = sqlite3.Row
+    with _preparados_lock:
+        if caminho not in _preparados:
+            con.executescript(_SCHEMA)
+            _migrar(con)
+            _preparados.add(caminho)
+    return con
+
+
+def _migrar(con: sqlite3.Connection) -> None:
+    """
+    user_version 1: catálogos antigos gravavam numero_nf com zeros à esquerda; normaliza uma vez.
+    user_version 2: catálogos criados em WAL voltam ao journal padrão.
+    """
+    versao = con.execute("PRAGMA user_version").fetchone()[0]
+    if versao < 1:
+        with con:
+            # OR IGNORE: se a versão sem zeros já existe, ela fica e a repetida é descartada
+            con.execute(
+                "UPDATE OR IGNORE notas SET numero_nf = ltrim(numero_nf, '0') "
+                "WHERE numero_nf GLOB '0*' AND ltrim(numero_nf, '0') <> ''"
+            )
+            con.execute("DELETE FROM notas WHERE numero_nf GLOB '0*' AND ltrim(numero_nf, '0') <> ''")
+            con.execute("PRAGMA user_version = 1")
+    if versao < 2:
+        # o modo WAL fica gravado no arquivo; sair dele exige que ninguém mais esteja com o banco aberto
+        if con.execute("PRAGMA journal_mode=DELETE").fetchone()[0].lower() == "delete":
+            con.execute("PRAGMA user_version = 2")
+
+
+def hash_arquivo(caminho: str, bloco: int = 1 << 16) -> str:
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for chunk in iter(lambda: f.read(bloco), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _so_digitos(v: Optional[str]) -> str:
+    return re.sub(r"\D", "", str(v or ""))
+
+
+def normalizar_numero(v) -> str:
+    """Número da NF sem zeros à esquerda ('000123' -> '123'; '0' continua '0'). Mesma forma na gravação e na busca."""
+    numero = str(v or "").strip()
+    return numero.lstrip("0") or numero
+
+
+def _gravar_nota(con: sqlite3.Connection, nota: Dict) -> None:
+    rec = {c: nota.get(c) for c in COLUNAS_NOTA}
+    rec["cnpj_prestador"] = _so_digitos(rec["cnpj_prestador"])
+    rec["cnpj_tomador"] = _so_digitos(rec["cnpj_tomador"]) or None
+    rec["numero_nf"] = normalizar_numero(rec["numero_nf"])
+    rec["atualizado_em"] = datetime.datetime.now().isoformat(timespec="seconds")
+
+    cols = COLUNAS_NOTA + ["atualizado_em"]
+    atualiza = ", ".join(f"{c}=excluded.{c}" for c in cols if c not in ("competencia", "cnpj_prestador", "numero_nf"))
+    con.execute(
+        f"INSERT INTO notas ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+        f"ON CONFLICT (competencia, cnpj_prestador, numero_nf) DO UPDATE SET {atualiza}",
+        [rec[c] for c in cols],
+    )
+
+
+def registrar_nota(pasta_base_saida: str, nota: Dict, con: Optional[sqlite3.Connection] = None) -> None:
+    """
+    Insere/atualiza uma NFS-e no catálogo (chave: competência + CNPJ prestador + número).
+    Campos ausentes ficam NULL; CNPJ/CPF são gravados só com dígitos.
+    con: conexão já aberta com conectar() (o robô usa uma por cliente); sem ela, abre e fecha uma.
+    """
+    if con is not None:
+        with con:
+            _gravar_nota(con, nota)
+        return
+    con = conectar(pasta_base_saida)
+    try:
+        with con:
+            _gravar_nota(con, nota)
+    finally:
+        con.close()
+
+
+def consultar_notas(
+    pasta_base_saida: str,
+    competencia: Optional[str] = None,
+    empresa: Optional[str] = None,
+    cnpj: Optional[str] = None,
+    numero_nf: Optional[str] = None,
+    texto: Optional[str] = None,
+    limite: int = 1000,
+    offset: int = 0,
+) -> List[Dict]:
+    """
+    Busca notas no catálogo. cnpj casa com prestador OU tomador;
+    texto faz LIKE em empresa / razão do tomador.
+    """
+    where, params = [], []
+    if competencia:
+        where.append("competencia = ?")
+        params.append(competencia)
+    if empresa:
+        where.append("empresa = ?")
+        params.append(empresa)
+    if cnpj:
+        d = _so_digitos(cnpj)
+        where.append("(cnpj_prestador = ? OR cnpj_tomador = ?)")
+        params += [d, d]
+    if numero_nf:
+        where.append("numero_nf = ?")
+        params.append(normalizar_numero(numero_nf))
+    if texto:
+        where.append("(empresa LIKE ? OR razao_tomador LIKE ?)")
+        params += [f"%{texto}%", f"%{texto}%"]
+
+    sql = "SELECT * FROM notas"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY competencia DESC, empresa, CAST(numero_nf AS INTEGER) LIMIT ? OFFSET ?"
+    params += [int(limite), int(offset)]
+
+    con = conectar(pasta_base_saida)
+    try:
+        return [dict(r) for r in con.execute(sql, params)]
+    finally:
+        con.close()
+
+
+def listar_competencias(pasta_base_saida: str, incluir_pastas: bool = False) -> List[str]:
+    """
+    Competências com notas no catálogo, da mais recente para a mais antiga.
+    incluir_pastas: junta as pastas AAAA-MM da base de saída (só um listdir, sem recursão), para
+    competências que ainda não passaram pelo backfill aparecerem também.
+    """
+    con = conectar(pasta_base_saida)
+    try:
+        comps = {r[0] for r in con.execute("SELECT DISTINCT competencia FROM notas")}
+    finally:
+        con.close()
+    if incluir_pastas:
+        comps.update(
+            p for p in os.listdir(pasta_base_saida)
+            if _RE_PASTA_COMPETENCIA.match(p) and os.path.isdir(os.path.join(pasta_base_saida, p))
+        )
+    return sorted(comps, reverse=True)
+
+
+def competencia_catalogada(pasta_base_saida: str, competencia: str) -> bool:
+    con = conectar(pasta_base_saida)
+    try:
+        return con.execute("SELECT 1 FROM notas WHERE competencia = ? LIMIT 1", (competencia,)).fetchone() is not None
+    finally:
+        con.close()
+
+
+def resumo_por_competencia(pasta_base_saida: str) -> List[Dict]:
+    sql = """
+        SELECT competencia,
+               COUNT(*) AS notas,
+               COUNT(DISTINCT cnpj_prestador) AS prestadores,
+               SUM(CASE WHEN situacao = 'CANCELADA' THEN 1 ELSE 0 END) AS canceladas,
+               ROUND(COALESCE(SUM(valor_servico), 0), 2) AS valor_servico
+          FROM notas
+         GROUP BY competencia
+         ORDER BY competencia DESC
+    """
+    con = conectar(pasta_base_saida)
+    try:
+        return [dict(r) for r in con.execute(sql)]
+    finally:
+        con.close()
+
+
+def backfill(
+    pasta_base_saida: str,
+    competencia: Optional[str] = None,
+    empresas_por_cnpj: Optional[Dict[str, str]] = None,
+) -> int:
+    """
+    Varre as pastas AAAA-MM já existentes e cataloga os XMLs que ainda não estão no banco.
+    empresas_por_cnpj (CNPJ só com dígitos -> EMPRESA do cadastro) dá às notas o mesmo nome de empresa
+    que o robô grava; prestador fora do cadastro fica com a razão social do XML.
+    Retorna quantas notas foram incluídas.
+    """
+    from nfse_xml import extrair_dados_nfse_do_xml
+
+    if not os.path.isdir(pasta_base_saida):
+        return 0
+    empresas = {_so_digitos(k): v for k, v in (empresas_por_cnpj or {}).items() if _so_digitos(k)}
+
+    comps = [competencia] if competencia else sorted(
+        p for p in os.listdir(pasta_base_saida) if _RE_PASTA_COMPETENCIA.match(p)
+    )
+
+    incluidas = 0
+    con = conectar(pasta_base_saida)
+    try:
+        conhecidos = {r[0] for r in con.execute("SELECT caminho_xml FROM notas WHERE caminho_xml IS NOT NULL")}
+        # uma transação para a varredura inteira (o commit é o que custa no compartilhamento de rede)
+        with con:
+            for comp in comps:
+                pasta = os.path.join(pasta_base_saida, comp)
+                if not os.path.isdir(pasta):
+                    continue
+                for root, _, fns in os.walk(pasta):
+                    for fn in fns:
+                        if not fn.lower().endswith(".xml") or fn.startswith("~$"):
+                            continue
+                        caminho_xml = os.path.join(root, fn)
+                        if caminho_xml in conhecidos:
+                            continue
+                        dados = extrair_dados_nfse_do_xml(caminho_xml)
+                        numero = dados.get("numero_nf") or re.sub(r"\D", "", os.path.splitext(fn)[0]) or fn
+                        caminho_pdf = os.path.splitext(caminho_xml)[0] + ".pdf"
+                        empresa = empresas.get(_so_digitos(dados.get("cnpj_prestador"))) or dados.get("razao_prestador")
+                        _gravar_nota(con, {
+                            **dados,
+                            "competencia": comp,
+                            "empresa": empresa,
+                            "numero_nf": numero,
+                            "caminho_xml": caminho_xml,
+                            "caminho_pdf": caminho_pdf if os.path.exists(caminho_pdf) else None,
+                            "hash_xml": hash_arquivo(caminho_xml),
+                        })
+                        incluidas += 1
+    finally:
+        con.close()
+    return incluidas
@@ -0,0 +1,173 @@
+# cert_headless.py
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import bot_logging
+
+log = bot_logging.obter_logger("cert_headless")
+
+# Login por certificado A1 (PKCS#12) sem tela: o .pfx do cliente vai para um banco NSS próprio
+# ($HOME/.pki/nssdb de um HOME temporário, um por navegador) e a política AutoSelectCertificateForUrls
+# faz o Chrome escolher o certificado sozinho. Como cada banco só tem o certificado daquele cliente,
+# um filtro vazio ({}) basta e a mesma política serve para todos os workers.
+
+PADROES_PORTAL = ["https://[*.]nfse.gov.br"]
+
+ARQUIVO_POLITICA = "portalnfse_cert.json"
+DIRETORIOS_POLITICA = [
+    "/etc/opt/chrome/policies/managed",  # Google Chrome
+    "/etc/chromium/policies/managed",  # Chromium (Debian/Docker)
+]
+
+
+class CertHeadlessErro(RuntimeError):
+    pass
+
+
+def ferramentas_disponiveis() -> bool:
+    """certutil/pk12util (pacote libnss3-tools)."""
+    return bool(shutil.which("certutil") and shutil.which("pk12util"))
+
+
+def suportado() -> bool:
+    return sys.platform.startswith("linux") and ferramentas_disponiveis()
+
+
+def _rodar(cmd: List[str]) -> None:
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        saida = (proc.stderr or proc.stdout or "").strip()
+        raise CertHeadlessErro(f"{os.path.basename(cmd[0])} falhou ({proc.returncode}): {saida}")
+
+
+@dataclass
+class PerfilCertificado:
+    """HOME temporário com o banco NSS do cliente; o Chrome roda com HOME apontando para cá."""
+
+    home: str
+
+    @property
+    def nssdb(self) -> str:
+        return os.path.join(self.home, ".pki", "nssdb")
+
+    @property
+    def user_data_dir(self) -> str:
+        return os.path.join(self.home, "chrome-profile")
+
+    def env(self) -> Dict[str, str]:
+        return {**os.environ, "HOME": self.home}
+
+    def remover(self) -> None:
+        shutil.rmtree(self.home, ignore_errors=True)
+
+
+def preparar_perfil(
+    caminho_pfx: str,
+    senha: str = "",
+    pasta_base: Optional[str] = None,
+    cas_confiaveis: Iterable[str] = (),
+) -> PerfilCertificado:
+    """
+    Cria o HOME temporário, o banco NSS (sem senha) e importa o PKCS#12.
+    cas_confiaveis: PEMs extras a confiar para TLS de servidor (ex.: servidor de teste local).
+    """
+    if not suportado():
+        raise CertHeadlessErro("Login headless por certificado requer Linux com certutil/pk12util (libnss3-tools).")
+    if not caminho_pfx or not os.path.exists(caminho_pfx):
+        raise CertHeadlessErro(f"Arquivo do certificado não encontrado: {caminho_pfx}")
+
+    if pasta_base:
+        os.makedirs(pasta_base, exist_ok=True)
+    perfil = PerfilCertificado(tempfile.mkdtemp(prefix="portalnfse_cert_", dir=pasta_base))
+    try:
+        os.makedirs(perfil.nssdb)
+        db = f"sql:{perfil.nssdb}"
+        _rodar(["certutil", "-N", "-d", db, "--empty-password"])
+
+        # senha do .pfx por arquivo (0600), não na linha de comando (visível no ps)
+        fd, arq_senha = tempfile.mkstemp(dir=perfil.home)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(senha or "")
+            _rodar(["pk12util", "-i", caminho_pfx, "-d", db, "-w", arq_senha])
+        finally:
+            os.remove(arq_senha)
+
+        for i, ca in enumerate(cas_confiaveis):
+            _rodar(["certutil", "-A", "-d", db, "-n", f"ca_extra_{i}", "-t", "C,,", "-i", ca])
+    except Exception:
+        perfil.remover()
+        raise
+    return perfil
+
+
+def politica_auto_selecao(padroes: Iterable[str] = PADROES_PORTAL) -> Dict[str, List[str]]:
+    return {"AutoSelectCertificateForUrls": [json.dumps({"pattern": p, "filter": {}}) for p in padroes]}
+
+
+_politica_lock = threading.Lock()
+_politica_resultado: Dict[Tuple[str, ...], object] = {}  # padrões -> arquivos gravados ou o erro
+
+
+def garantir_politica(padroes: Iterable[str] = PADROES_PORTAL) -> List[str]:
+    """
+    instalar_politica() uma vez por processo (não a cada cliente). A falha também é lembrada:
+    é registrada uma vez, em ERRO, e levantada de novo para os clientes seguintes.
+    """
+    chave = tuple(padroes)
+    with _politica_lock:
+        if chave not in _politica_resultado:
+            try:
+                _politica_resultado[chave] = instalar_politica(chave)
+            except CertHeadlessErro as e:
+                log.error(f"Política de auto-seleção de certificado não instalada: {e}")
+                _politica_resultado[chave] = e
+        resultado = _politica_resultado[chave]
+    if isinstance(resultado, CertHeadlessErro):
+        raise resultado
+    return list(resultado)
+
+
+def instalar_politica(padroes: Iterable[str] = PADROES_PORTAL, diretorios: Optional[List[str]] = None) -> List[str]:
+    """
+    Grava a política gerenciada do Chrome/Chromium. Os diretórios padrão (/etc) exigem root; sem root,
+    aponte PORTALNFSE_CHROME_POLICY_DIR para um diretório gravável lido pelo navegador ou instale o arquivo
+    uma vez (ex.: no Dockerfile). Retorna os arquivos gravados; sem nenhum, levanta erro com o JSON a instalar.
+    """
+    if diretorios is None:
+        extra = os.environ.get("PORTALNFSE_CHROME_POLICY_DIR")
+        diretorios = [extra] if extra else DIRETORIOS_POLITICA
+    conteudo = json.dumps(politica_auto_selecao(padroes), indent=2)
+
+    gravados = []
+    for pasta in diretorios:
+        destino = os.path.join(pasta, ARQUIVO_POLITICA)
+        try:
+            if os.path.exists(destino):
+                with open(destino, "r", encoding="utf-8") as f:
+                    if f.read() == conteudo:
+                        gravados.append(destino)
+                        continue
+            os.makedirs(pasta, exist_ok=True)
+            tmp = destino + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(conteudo)
+            os.replace(tmp, destino)
+            gravados.append(destino)
+        except OSError as e:
+            log.warning(f"Não consegui gravar a política do Chrome em {pasta}: {e}")
+
+    if not gravados:
+        raise CertHeadlessErro(
+            f"Não consegui gravar a política do Chrome em {diretorios} (sem root?). "
+            f"Instale manualmente (root) o arquivo {ARQUIVO_POLITICA} com: {conteudo}"
+        )
+    log.info(f"Política de auto-seleção de certificado em: {', '.join(gravados)}")
+    return gravados
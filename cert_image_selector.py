@@ -1,12 +1,21 @@
 # cert_image_selector.py
 import os
 import time
-from typing import Optional
 
-import pyautogui as pg
+import bot_logging
+import lazy_import
+import template_match
 
-pg.FAILSAFE = True
-pg.PAUSE = 0.2
+log = bot_logging.obter_logger("cert_imagem")
+
+
+def _configurar_pyautogui(mod) -> None:
+    mod.FAILSAFE = True
+    mod.PAUSE = 0.2
+
+
+# importado (e configurado) só no primeiro clique: sem DISPLAY o import do pyautogui já falha
+pg = lazy_import.modulo("pyautogui", "o login por certificado (imagem)", ao_carregar=_configurar_pyautogui)
 
 
 def _caminho_imagem(base_dir: str, nome_arquivo: str) -> str:
@@ -31,59 +40,44 @@ def selecionar_certificado_por_imagem(
     Retorna True se conseguiu clicar no certificado e mandar ENTER, False caso contrário.
     """
     if not nome_img_cert:
-        print("[ERRO] nome_img_cert vazio em selecionar_certificado_por_imagem.")
+        log.error("nome_img_cert vazio em selecionar_certificado_por_imagem.")
         return False
 
     caminho_cert = _caminho_imagem(base_dir_imagens, nome_img_cert)
 
     if not os.path.exists(caminho_cert):
-        print(f"[ERRO] Imagem do certificado não encontrada: {caminho_cert}")
+        log.error(f"Imagem do certificado não encontrada: {caminho_cert}")
         return False
 
-    print(f"[INFO] Vou procurar a imagem do certificado na tela: {caminho_cert}")
-    print(f"[INFO] Timeout para achar certificado: {timeout_cert} segundos | confidence={confidence}")
-
-    inicio = time.time()
-    tentativa = 0
-    pos_cert: Optional[pg.Box] = None
-
-    while time.time() - inicio < timeout_cert:
-        tentativa += 1
-        if debug:
-            print(f"[DEBUG] Tentativa {tentativa} para localizar o certificado...")
-
-        try:
-            pos_cert = pg.locateOnScreen(caminho_cert, confidence=confidence)
-        except Exception as e:
-            print(f"[ERRO] locateOnScreen (certificado) falhou: {e}")
-            return False
-
-        if pos_cert:
-            if debug:
-                print(f"[DEBUG] Certificado encontrado! Bounding box: {pos_cert}")
-            x, y = pg.center(pos_cert)
-            print(f"[INFO] Certificado localizado, vou clicar em ({x}, {y}).")
-            try:
-                pg.moveTo(x, y, duration=0.5)
-                pg.click()
-            except Exception as e:
-                print(f"[ERRO] Falha ao clicar na posição do certificado: {e}")
-                return False
-
-            # Depois do clique, ENTER para confirmar (OK)
-            time.sleep(0.5)
-            try:
-                pg.press("enter")
-                print("[INFO] Tecla ENTER enviada no popup de certificado.")
-                return True
-            except Exception as e:
-                print(f"[ERRO] Falha ao enviar ENTER após clicar no certificado: {e}")
-                return False
-
-        # não achou ainda
-        if debug:
-            print("[DEBUG] Ainda não localizei o certificado, aguardando 1s e tentando de novo...")
-        time.sleep(1.0)
-
-    print("[ERRO] Não localizei a imagem do certificado na tela dentro do timeout.")
-    return False
+    log.info(f"Vou procurar a imagem do certificado na tela: {caminho_cert}")
+    log.info(f"Timeout para achar certificado: {timeout_cert} segundos | confidence={confidence}")
+
+    try:
+        achado = template_match.aguardar(caminho_cert, timeout=timeout_cert, confianca=confidence)
+    except Exception as e:
+        log.error(f"Busca da imagem do certificado falhou: {e}")
+        return False
+    if achado is None:
+        log.error("Não localizei a imagem do certificado na tela dentro do timeout.")
+        return False
+
+    if debug:
+        log.debug(f"Certificado encontrado! {achado}")
+    x, y = achado.centro()
+    log.info(f"Certificado localizado, vou clicar em ({x}, {y}).")
+    try:
+        pg.moveTo(x, y, duration=0.5)
+        pg.click()
+    except Exception as e:
+        log.error(f"Falha ao clicar na posição do certificado: {e}")
+        return False
+
+    # Depois do clique, ENTER para confirmar (OK)
+    time.sleep(0.5)
+    try:
+        pg.press("enter")
+        log.info("Tecla ENTER enviada no popup de certificado.")
+        return True
+    except Exception as e:
+        log.error(f"Falha ao enviar ENTER após clicar no certificado: {e}")
+        return False
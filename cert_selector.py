@@ -2,7 +2,12 @@
 import time
 from typing import Optional
 
-from pywinauto import Desktop
+import bot_logging
+import lazy_import
+
+log = bot_logging.obter_logger("cert_selector")
+
+Desktop = lazy_import.objeto("pywinauto", "Desktop", "a seleção de certificado pela janela do Windows")
 
 POSSIVEIS_TITULOS = [
     "Selecione um certificado",
@@ -68,13 +73,13 @@ def selecionar_certificado(ident_cert: str, timeout: int = 15, debug: bool = Fal
 
     ident_cert = (ident_cert or "").strip()
     if not ident_cert:
-        print("[ERRO] IDENT_CERT vazio ao selecionar certificado.")
+        log.error("IDENT_CERT vazio ao selecionar certificado.")
         return False
 
     # 1) achar a janela do certificado
     janela = _encontrar_janela_certificado(timeout=timeout)
     if janela is None:
-        print("[ERRO] Não encontrei nenhuma janela com 'Selecione um certificado' dentro do timeout.")
+        log.error("Não encontrei nenhuma janela com 'Selecione um certificado' dentro do timeout.")
         return False
 
     try:
@@ -87,7 +92,7 @@ def selecionar_certificado(ident_cert: str, timeout: int = 15, debug: bool = Fal
             titulo = janela.window_text()
         except Exception:
             titulo = ""
-        print(f"[DEBUG] Janela de certificado localizada. Título: {repr(titulo)}")
+        log.debug(f"Janela de certificado localizada. Título: {repr(titulo)}")
 
     # 2) achar o item do certificado pelo texto
     item_alvo = None
@@ -102,19 +107,19 @@ def selecionar_certificado(ident_cert: str, timeout: int = 15, debug: bool = Fal
                 continue
 
             if debug and ident_cert.lower() in txt.lower():
-                print(f"[DEBUG] Match de IDENT_CERT em: {repr(txt)}")
+                log.debug(f"Match de IDENT_CERT em: {repr(txt)}")
 
             if ident_cert.lower() in txt.lower():
                 item_alvo = ctrl
                 break
     except Exception as e:
-        print(f"[ERRO] Exceção ao varrer itens da janela: {e}")
+        log.error(f"Exceção ao varrer itens da janela: {e}")
         return False
 
     if item_alvo is None:
-        print(f"[ERRO] Nenhum controle na UI contém o texto IDENT_CERT='{ident_cert}'.")
+        log.error(f"Nenhum controle na UI contém o texto IDENT_CERT='{ident_cert}'.")
         if not debug:
-            print("[DICA] Confirme se o IDENT_CERT na planilha está escrito igual ao texto que aparece na coluna Tema.")
+            log.info("Confirme se o IDENT_CERT na planilha está escrito igual ao texto que aparece na coluna Tema.")
         return False
 
     # 3) clicar / selecionar o item do certificado
@@ -124,7 +129,7 @@ def selecionar_certificado(ident_cert: str, timeout: int = 15, debug: bool = Fal
         except Exception:
             item_alvo.click_input()
     except Exception as e:
-        print(f"[ERRO] Falha ao clicar no item do certificado: {e}")
+        log.error(f"Falha ao clicar no item do certificado: {e}")
         return False
 
     time.sleep(0.5)
@@ -145,15 +150,15 @@ def selecionar_certificado(ident_cert: str, timeout: int = 15, debug: bool = Fal
         pass
 
     if botao_ok is None:
-        print("[ERRO] Botão OK/Confirmar não encontrado na janela do certificado.")
+        log.error("Botão OK/Confirmar não encontrado na janela do certificado.")
         return False
 
     try:
         botao_ok.click_input()
     except Exception as e:
-        print(f"[ERRO] Falha ao clicar no botão OK do certificado: {e}")
+        log.error(f"Falha ao clicar no botão OK do certificado: {e}")
         return False
 
     time.sleep(1.0)
-    print(f"[INFO] Certificado selecionado com sucesso para IDENT_CERT='{ident_cert}'.")
+    log.info(f"Certificado selecionado com sucesso para IDENT_CERT='{ident_cert}'.")
     return True
@@ -0,0 +1,362 @@
+# cli.py
+"""
+Execução em lote do robô, sem o Streamlit (cron, CI, servidor).
+
+Exemplos:
+    python cli.py                                           # competência anterior, todos os clientes ATIVOS
+    python cli.py --competencia 2025-03 --cliente "EMPRESA X" --cliente 12345678000199
+    python cli.py --competencia 2025-01..2025-03 --workers 3 --resumo resumo.json
+    python cli.py --config ci.json --saida ./saidas --formato jsonl --retomar
+    python cli.py --shard 2/4 --saida ./saidas_2 --formato jsonl           # um runner de 4
+    python cli.py --juntar ./saidas_1 ./saidas_2 ./saidas_3 ./saidas_4 --saida ./saidas
+
+Código de saída: 0 = todos os clientes OK; 1 = algum cliente/competência falhou; 2 = parâmetros inválidos;
+130 = interrompido (Ctrl+C: os clientes em andamento terminam, os demais não começam).
+"""
+import argparse
+import datetime
+import getpass
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import bot_logging
+import bot_nfse
+import config as cfgmod
+import data_store
+import escalonamento
+import job_manager
+import log_writer
+import progress
+import run_ledger
+import shards
+
+log = bot_logging.obter_logger("cli")
+
+SAIDA_OK = 0
+SAIDA_FALHA = 1
+SAIDA_USO = 2
+SAIDA_INTERROMPIDO = 130
+
+_RE_COMPETENCIA = re.compile(r"^(\d{4})-(\d{2})$")
+
+
+# ----------------------------
+# Parâmetros
+# ----------------------------
+def _competencia(texto: str) -> Tuple[int, int]:
+    m = _RE_COMPETENCIA.match(texto.strip())
+    if not m or not 1 <= int(m.group(2)) <= 12:
+        raise argparse.ArgumentTypeError(f"competência inválida: {texto!r} (use AAAA-MM)")
+    return int(m.group(1)), int(m.group(2))
+
+
+def competencias(especificacoes: List[str]) -> List[Tuple[int, int]]:
+    """'AAAA-MM', 'AAAA-MM..AAAA-MM' ou 'anterior'; sem nada, a competência anterior (como o robô sempre fez)."""
+    saida: List[Tuple[int, int]] = []
+    for espec in especificacoes or ["anterior"]:
+        if espec.strip().lower() == "anterior":
+            itens = [bot_nfse.calcular_competencia_anterior()]
+        elif ".." in espec:
+            ini, fim = (_competencia(p) for p in espec.split("..", 1))
+            if fim < ini:
+                raise argparse.ArgumentTypeError(f"intervalo invertido: {espec!r}")
+            itens = []
+            ano, mes = ini
+            while (ano, mes) <= fim:
+                itens.append((ano, mes))
+                ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+        else:
+            itens = [_competencia(espec)]
+        saida.extend(c for c in itens if c not in saida)
+    return saida
+
+
+def _criar_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(
+        prog="cli.py",
+        description="PortalNFSe: baixa XML/PDF das NFS-e emitidas dos clientes, em lote.",
+    )
+    g = ap.add_argument_group("competência")
+    g.add_argument(
+        "--competencia", "-c", action="append", default=[], metavar="AAAA-MM[..AAAA-MM]",
+        help="competência ou intervalo (repetível). Padrão: a anterior ao mês atual",
+    )
+
+    g = ap.add_argument_group("clientes")
+    g.add_argument("--cliente", action="append", default=[], metavar="EMPRESA|CNPJ", help="só estes clientes (repetível)")
+    g.add_argument("--excluir", action="append", default=[], metavar="EMPRESA|CNPJ", help="pular estes clientes (repetível)")
+    g.add_argument("--tipo-acesso", choices=["LOGIN_SENHA", "CERTIFICADO"], help="só clientes com este tipo de acesso")
+    g.add_argument("--shard", metavar="K/N", help="só a parte K de N dos clientes (divisão estável pelo CNPJ)")
+    g.add_argument("--retomar", action="store_true", help="pular clientes cuja última tentativa na competência foi OK")
+    g.add_argument("--listar", action="store_true", help="só lista os clientes selecionados e sai")
+
+    g = ap.add_argument_group("configuração")
+    g.add_argument("--config", metavar="ARQUIVO.json", help="config (mesmas chaves do config.example.json)")
+    g.add_argument("--planilha", help="caminho da planilha de clientes")
+    g.add_argument("--saida", help="pasta base de saída")
+    g.add_argument("--download", help="pasta de download temporário")
+    g.add_argument("--imagens", help="pasta de imagens do certificado")
+    g.add_argument("--layout", choices=["plano", "cnpj", "empresa"], help="organização da saída")
+    g.add_argument("--modo-certificado", choices=list(cfgmod.MODOS_CERTIFICADO), help="login por certificado")
+    g.add_argument("--workers", type=int, help="clientes em paralelo (Linux + Xvfb)")
+    g.add_argument("--abas", type=int, metavar="K", help="notas simultâneas por cliente (abas de Visualizar)")
+    g.add_argument("--isolar", action="store_true", default=None, help="cada cliente num processo próprio, supervisionado")
+    g.add_argument("--timeout-cliente", type=int, metavar="MIN", help="tempo máximo por cliente no modo isolado (0 = sem limite)")
+
+    g = ap.add_argument_group("saída")
+    g.add_argument("--formato", choices=log_writer.FORMATOS_LOG, default="xlsx", help="formato do LOG da competência")
+    g.add_argument("--resumo", metavar="ARQUIVO.json", help="grava o resumo da execução em JSON ('-' = stdout)")
+    g.add_argument(
+        "--juntar", nargs="+", metavar="PASTA",
+        help="não roda o robô: junta as pastas de saída dos shards na pasta de saída (--saida)",
+    )
+    return ap
+
+
+def carregar_config(args: argparse.Namespace) -> cfgmod.AppConfig:
+    cfg = cfgmod.ler_config(args.config) if args.config else cfgmod.load_config()
+    sobrescrever = {
+        "caminho_planilha": args.planilha,
+        "pasta_base_saida": args.saida,
+        "pasta_download_temp": args.download,
+        "pasta_imagens_cert": args.imagens,
+        "layout_saida": args.layout,
+        "modo_certificado": args.modo_certificado,
+        "workers_paralelos": args.workers,
+        "isolar_clientes": args.isolar,
+        "timeout_cliente_min": args.timeout_cliente,
+        "abas_visualizar": args.abas,
+    }
+    for campo, valor in sobrescrever.items():
+        if valor is not None:
+            setattr(cfg, campo, valor)
+    return cfg
+
+
+def _corresponde(cliente: Dict, chaves: List[str]) -> bool:
+    empresa = str(cliente.get("EMPRESA", "")).strip().upper()
+    cnpj = re.sub(r"\D", "", str(cliente.get("CNPJ", "")))
+    for chave in chaves:
+        chave = chave.strip()
+        if chave.upper() == empresa or (re.sub(r"\D", "", chave) and re.sub(r"\D", "", chave) == cnpj):
+            return True
+    return False
+
+
+def selecionar_clientes(clientes: List[Dict], args: argparse.Namespace) -> List[Dict]:
+    if args.cliente:
+        nao_encontrados = [k for k in args.cliente if not any(_corresponde(c, [k]) for c in clientes)]
+        if nao_encontrados:
+            log.warning(f"Cliente(s) não encontrado(s) entre os ATIVOS: {', '.join(nao_encontrados)}")
+        clientes = [c for c in clientes if _corresponde(c, args.cliente)]
+    if args.excluir:
+        clientes = [c for c in clientes if not _corresponde(c, args.excluir)]
+    if args.tipo_acesso:
+        clientes = [c for c in clientes if str(c.get("TIPO_ACESSO", "")).upper() == args.tipo_acesso]
+    if args.shard:
+        k, n = shards.interpretar(args.shard)
+        clientes = shards.filtrar(clientes, k, n)
+        log.info(f"Shard {k}/{n}: {len(clientes)} cliente(s).")
+    return clientes
+
+
+# ----------------------------
+# Execução
+# ----------------------------
+def _rodar_competencia(
+    cfg: cfgmod.AppConfig,
+    ano: int,
+    mes: int,
+    empresas: List[str],
+    formato: str,
+    stop_evt: threading.Event,
+) -> Dict:
+    """Uma competência pelo mesmo caminho dos jobs da UI (histórico, logs, modo paralelo)."""
+    canal = progress.CanalProgresso()
+    # relógio da execução inclui carregar a planilha e subir o robô (como nos jobs da UI)
+    canal.iniciar(None, len(empresas))
+    resultado: Dict = {}
+
+    def alvo() -> None:
+        resultado["execucao_id"] = job_manager.run_bot_job(
+            cfg, ano, mes, empresas, canal, stop_evt,
+            usuario=_usuario(), origem="cli", formato_log=formato,
+        )
+
+    inicio = time.time()
+    t = threading.Thread(target=alvo, name=f"cli-{ano:04d}-{mes:02d}")
+    t.start()
+    while t.is_alive():
+        try:
+            t.join(0.5)
+        except KeyboardInterrupt:
+            if not stop_evt.is_set():
+                log.warning("Interrompendo: os clientes em andamento terminam, os demais não começam (Ctrl+C de novo força a saída).")
+                stop_evt.set()
+            else:
+                raise
+
+    snap = canal.snapshot(ultimos_logs=0)
+    real = escalonamento.makespan_real(snap.get("status", []))
+    competencia = f"{ano:04d}-{mes:02d}"
+    pasta = snap.get("output_folder")
+    caminho_log = None
+    if pasta:
+        caminho_log = {
+            "xlsx": log_writer.caminho_log_xlsx(pasta, competencia),
+            "csv": log_writer.caminho_log_csv(pasta, competencia),
+            "jsonl": log_writer.caminho_journal(pasta, competencia),
+        }[formato]
+    return {
+        "competencia": competencia,
+        "execucao_id": resultado.get("execucao_id"),
+        "status": (
+            job_manager.FALHA if snap.get("error")
+            else job_manager.INTERROMPIDO if stop_evt.is_set()
+            else job_manager.CONCLUIDO
+        ),
+        "erro": snap.get("error"),
+        "pasta": pasta,
+        "log": caminho_log if caminho_log and os.path.exists(caminho_log) else None,
+        "duracao_s": round(time.time() - inicio, 1),
+        "makespan_previsto_s": round(snap["makespan_previsto"], 1) if snap.get("makespan_previsto") else None,
+        "makespan_real_s": round(real, 1) if real is not None else None,
+        "contadores": snap.get("contadores", {}),
+        "clientes": [
+            {
+                "empresa": s.get("EMPRESA"),
+                "cnpj": s.get("CNPJ"),
+                "status": s.get("STATUS"),
+                "detalhe": s.get("DETALHE") or "",
+                "notas": s.get("NOTAS", 0),
+                "duracao_s": round(s["FIM"] - s["INICIO"], 1) if s.get("FIM") and s.get("INICIO") else None,
+            }
+            for s in snap.get("status", [])
+        ],
+    }
+
+
+def _usuario() -> str:
+    try:
+        return getpass.getuser()
+    except Exception:
+        return ""
+
+
+def _gravar_resumo(destino: str, resumo: Dict) -> None:
+    texto = json.dumps(resumo, ensure_ascii=False, indent=2)
+    if destino == "-":
+        print(texto)
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    tmp = destino + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(texto)
+    os.replace(tmp, destino)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = _criar_parser()
+    args = ap.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        ap.error("--workers deve ser 1 ou mais")
+    if args.abas is not None and args.abas < 1:
+        ap.error("--abas deve ser 1 ou mais")
+    try:
+        lista_competencias = competencias(args.competencia)
+        cfg = carregar_config(args)
+        if args.shard:
+            shards.interpretar(args.shard)
+    except (argparse.ArgumentTypeError, ValueError, OSError) as e:
+        ap.print_usage(sys.stderr)
+        print(f"{ap.prog}: erro: {e}", file=sys.stderr)
+        return SAIDA_USO
+
+    if args.juntar:
+        comps = [f"{a:04d}-{m:02d}" for a, m in lista_competencias] if args.competencia else None
+        try:
+            resumo = shards.juntar(
+                args.juntar, cfg.pasta_base_saida, comps, args.formato,
+                empresas_por_cnpj=data_store.empresas_por_cnpj(cfg.caminho_planilha),
+            )
+        except FileNotFoundError as e:
+            print(f"{ap.prog}: erro: {e}", file=sys.stderr)
+            return SAIDA_USO
+        if args.resumo:
+            _gravar_resumo(args.resumo, resumo)
+        return SAIDA_OK
+
+    job_manager.patch_bot_paths(cfg)
+    data_store.garantir_planilha_modelo(cfg.caminho_planilha)
+    selecionados = selecionar_clientes(bot_nfse.carregar_clientes_da_planilha(), args)
+
+    if args.listar:
+        for c in selecionados:
+            print(f"{c.get('EMPRESA')}\t{c.get('CNPJ')}\t{c.get('TIPO_ACESSO')}")
+        return SAIDA_OK
+
+    base = os.path.abspath(cfg.pasta_base_saida)
+    stop_evt = threading.Event()
+    resumo: Dict = {
+        "inicio": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "planilha": os.path.abspath(cfg.caminho_planilha),
+            "saida": base,
+            "layout": cfg.layout_saida,
+            "modo_certificado": cfg.modo_certificado,
+            "workers": cfg.workers_paralelos,
+            "isolar": cfg.isolar_clientes,
+            "abas": cfg.abas_visualizar,
+            "formato": args.formato,
+            "shard": args.shard,
+        },
+        "competencias": [],
+    }
+    codigo = SAIDA_OK
+
+    for ano, mes in lista_competencias:
+        if stop_evt.is_set():
+            break
+        competencia = f"{ano:04d}-{mes:02d}"
+        clientes = selecionados
+        pulados: List[str] = []
+        if args.retomar:
+            ultimos = run_ledger.ultimo_status_por_cliente(base, competencia)
+            pulados = [c["EMPRESA"] for c in clientes if ultimos.get(c["EMPRESA"]) == run_ledger.OK]
+            clientes = [c for c in clientes if c["EMPRESA"] not in pulados]
+            if pulados:
+                log.info(f"{competencia}: retomando; {len(pulados)} cliente(s) já concluído(s) pulado(s).")
+
+        if not clientes:
+            log.info(f"{competencia}: nenhum cliente para processar.")
+            resumo["competencias"].append(
+                {"competencia": competencia, "status": job_manager.CONCLUIDO, "clientes": [], "pulados": pulados}
+            )
+            continue
+
+        try:
+            r = _rodar_competencia(cfg, ano, mes, [c["EMPRESA"] for c in clientes], args.formato, stop_evt)
+        except KeyboardInterrupt:
+            codigo = SAIDA_INTERROMPIDO
+            break
+        r["pulados"] = pulados
+        resumo["competencias"].append(r)
+        if r["status"] == job_manager.FALHA or any(c["status"] != "OK" for c in r["clientes"]):
+            codigo = max(codigo, SAIDA_FALHA)
+
+    if stop_evt.is_set():
+        codigo = SAIDA_INTERROMPIDO
+    resumo["fim"] = datetime.datetime.now().isoformat(timespec="seconds")
+    resumo["codigo_saida"] = codigo
+    if args.resumo:
+        _gravar_resumo(args.resumo, resumo)
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,6 +10,13 @@ from typing import Any, Dict
 CONFIG_LOCAL = "config.local.json"
 CONFIG_EXAMPLE = "config.example.json"
 
+# Login de clientes TIPO_ACESSO=CERTIFICADO
+MODOS_CERTIFICADO = {
+    "auto": "Automático (headless com .pfx quando possível, senão imagem)",
+    "imagem": "Seleção pela imagem na tela (pyautogui)",
+    "headless": "Somente headless com .pfx (Linux)",
+}
+
 @dataclass
 class AppConfig:
     caminho_planilha: str
@@ -17,6 +24,36 @@ class AppConfig:
     pasta_download_temp: str
     pasta_imagens_cert: str
     delay_acao: float = 3.5
+    # organização da saída: "plano" (AAAA-MM/arquivos), "cnpj" ou "empresa" (AAAA-MM/<cliente>/arquivos)
+    layout_saida: str = "plano"
+    # login por certificado: ver MODOS_CERTIFICADO
+    modo_certificado: str = "auto"
+    # clientes ao mesmo tempo (>1: um processo + tela virtual Xvfb por cliente; só Linux)
+    workers_paralelos: int = 1
+    # cada cliente num processo supervisionado (sempre ligado com workers_paralelos > 1 no Linux com Xvfb)
+    isolar_clientes: bool = False
+    # limites por cliente no modo isolado (0 = sem limite); memória só no Linux
+    timeout_cliente_min: int = 60
+    limite_memoria_mb: int = 0
+    limite_cpu_min: int = 0
+    # abas de Visualizar abertas ao mesmo tempo por cliente (1 = uma nota por vez)
+    abas_visualizar: int = 1
+
+_PADRAO: Dict[str, Any] = {
+    "caminho_planilha": "./planilhas/ACESSO_PORTAL_NACIONAL.xlsx",
+    "pasta_base_saida": "./saidas",
+    "pasta_download_temp": "./downloads_temp",
+    "pasta_imagens_cert": "./imagens",
+    "delay_acao": 3.5,
+    "layout_saida": "plano",
+    "modo_certificado": "auto",
+    "workers_paralelos": 1,
+    "isolar_clientes": False,
+    "timeout_cliente_min": 60,
+    "limite_memoria_mb": 0,
+    "limite_cpu_min": 0,
+    "abas_visualizar": 1,
+}
 
 def _read_json(path: str) -> Dict[str, Any]:
     with open(path, "r", encoding="utf-8") as f:
@@ -38,19 +75,22 @@ def load_config() -> AppConfig:
     if os.path.exists(CONFIG_EXAMPLE):
         data = _read_json(CONFIG_EXAMPLE)
     else:
-        data = {
-            "caminho_planilha": "./planilhas/ACESSO_PORTAL_NACIONAL.xlsx",
-            "pasta_base_saida": "./saidas",
-            "pasta_download_temp": "./downloads_temp",
-            "pasta_imagens_cert": "./imagens",
-            "delay_acao": 3.5,
-        }
+        data = dict(_PADRAO)
 
     with open(CONFIG_LOCAL, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
     return AppConfig(**data)
 
+def ler_config(caminho: str) -> AppConfig:
+    """Config de um arquivo específico (CLI/CI), sem criar config.local.json. Chaves ausentes ficam no padrão."""
+    data = _read_json(caminho)
+    campos = set(AppConfig.__dataclass_fields__)
+    desconhecidas = sorted(set(data) - campos)
+    if desconhecidas:
+        raise ValueError(f"Chaves desconhecidas em {caminho}: {', '.join(desconhecidas)}")
+    return AppConfig(**{**_PADRAO, **data})
+
 def save_config(cfg: AppConfig) -> None:
     data = {
         "caminho_planilha": cfg.caminho_planilha,
@@ -58,6 +98,14 @@ def save_config(cfg: AppConfig) -> None:
         "pasta_download_temp": cfg.pasta_download_temp,
         "pasta_imagens_cert": cfg.pasta_imagens_cert,
         "delay_acao": float(cfg.delay_acao),
+        "layout_saida": cfg.layout_saida,
+        "modo_certificado": cfg.modo_certificado,
+        "workers_paralelos": int(cfg.workers_paralelos),
+        "isolar_clientes": bool(cfg.isolar_clientes),
+        "timeout_cliente_min": int(cfg.timeout_cliente_min),
+        "limite_memoria_mb": int(cfg.limite_memoria_mb),
+        "limite_cpu_min": int(cfg.limite_cpu_min),
+        "abas_visualizar": int(cfg.abas_visualizar),
     }
     with open(CONFIG_LOCAL, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
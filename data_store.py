@@ -1,6 +1,19 @@
 # data_store.py
+from __future__ import annotations
+
+import datetime
 import os
-import pandas as pd
+import re
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import bot_logging
+import lazy_import
+import sessao_store
+
+pd = lazy_import.modulo("pandas", "o cadastro de clientes")
+
+log = bot_logging.obter_logger("clientes")
 
 COLUNAS_OBRIGATORIAS = [
     "EMPRESA",
@@ -14,23 +27,389 @@ COLUNAS_OBRIGATORIAS = [
     "IMG_CERT",
 ]
 
+# Certificado A1 para o login headless (Linux): caminho do .pfx/.p12 e senha. Podem faltar na planilha.
+COLUNAS_OPCIONAIS = [
+    "CERT_PFX",
+    "CERT_SENHA",
+]
+
+COLUNAS = COLUNAS_OBRIGATORIAS + COLUNAS_OPCIONAIS
+
+# Nunca em texto puro no banco nem na planilha exportada: cifradas com a chave do cofre de sessões
+# ("fernet:<token>") ou uma referência "env:VARIAVEL", resolvida só na hora do uso (resolver_segredo).
+COLUNAS_SECRETAS = ["CERT_SENHA"]
+COLUNAS_EXPORTACAO = [c for c in COLUNAS if c not in COLUNAS_SECRETAS]
+PREFIXO_ENV = "env:"
+
+# Cadastro de clientes em SQLite, ao lado da planilha (ACESSO_PORTAL_NACIONAL.xlsx -> ACESSO_PORTAL_NACIONAL.sqlite3).
+# A planilha continua como formato de troca: é importada sozinha só com o cadastro vazio. Depois disso, planilha
+# alterada fora do app (Excel, cópia, checkout novo) não sobrescreve o que foi editado na UI: planilha_divergente()
+# avisa e o usuário escolhe entre importar_planilha() e exportar_planilha().
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS clientes (
+    id INTEGER PRIMARY KEY,
+    {", ".join(f"{c} TEXT NOT NULL DEFAULT ''" for c in COLUNAS)},
+    atualizado_em TEXT,
+    UNIQUE (EMPRESA)
+);
+CREATE INDEX IF NOT EXISTS ix_clientes_cnpj ON clientes (CNPJ);
+CREATE INDEX IF NOT EXISTS ix_clientes_ativo ON clientes (ATIVO);
+CREATE TABLE IF NOT EXISTS meta (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+
+def caminho_banco(caminho_planilha: str) -> str:
+    return os.path.splitext(caminho_planilha)[0] + ".sqlite3"
+
+
+def _assinatura_planilha(caminho: str) -> Optional[str]:
+    try:
+        st = os.stat(caminho)
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def _normalizar(registro: Dict) -> Dict[str, str]:
+    rec = {c: str(registro.get(c, "") or "").strip() for c in COLUNAS}
+    rec["ATIVO"] = rec["ATIVO"].upper()
+    rec["TIPO_ACESSO"] = rec["TIPO_ACESSO"].upper()
+    return rec
+
+
+def _proteger(rec: Dict[str, str]) -> Dict[str, str]:
+    """Cifra as colunas secretas antes de gravar (referência env: e valor já cifrado ficam como estão)."""
+    for c in COLUNAS_SECRETAS:
+        if rec[c] and not rec[c].startswith(PREFIXO_ENV):
+            rec[c] = sessao_store.cifrar_texto(rec[c])
+    return rec
+
+
+def resolver_segredo(valor: str) -> str:
+    """Valor de uma coluna secreta -> texto para uso (env:VARIAVEL lida do ambiente; fernet: decifrado)."""
+    valor = str(valor or "").strip()
+    if valor.startswith(PREFIXO_ENV):
+        nome = valor[len(PREFIXO_ENV):].strip()
+        if nome not in os.environ:
+            raise ValueError(f"Variável de ambiente {nome} (referenciada no cadastro) não definida.")
+        return os.environ[nome]
+    return sessao_store.decifrar_texto(valor)
+
+
+def _agora() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def _conectar_banco(caminho_planilha: str) -> sqlite3.Connection:
+    pasta = os.path.dirname(caminho_planilha) or "."
+    os.makedirs(pasta, exist_ok=True)
+    # journal padrão (sem WAL): cada commit altera o mtime do próprio .sqlite3, que o cache da UI observa
+    con = sqlite3.connect(caminho_banco(caminho_planilha), timeout=30)
+    con.row_factory = sqlite3.Row
+    con.executescript(_SCHEMA)
+    _migrar(con)
+    return con
+
+
+def _migrar(con: sqlite3.Connection) -> None:
+    """Bancos criados antes de uma coluna nova existir ganham a coluna (vazia); segredos antigos em texto são cifrados."""
+    existentes = {r[1] for r in con.execute("PRAGMA table_info(clientes)")}
+    faltando = [c for c in COLUNAS if c not in existentes]
+    if faltando:
+        with con:
+            for c in faltando:
+                con.execute(f"ALTER TABLE clientes ADD COLUMN {c} TEXT NOT NULL DEFAULT ''")
+
+    for c in COLUNAS_SECRETAS:
+        abertos = con.execute(
+            f"SELECT id, {c} FROM clientes WHERE {c} <> '' AND {c} NOT LIKE ? AND {c} NOT LIKE ?",
+            (sessao_store.PREFIXO_CIFRADO + "%", PREFIXO_ENV + "%"),
+        ).fetchall()
+        if not abertos:
+            continue
+        if not sessao_store.disponivel():
+            log.warning(f"{len(abertos)} {c} em texto puro no cadastro: instale 'cryptography' para cifrá-las.")
+            continue
+        with con:
+            con.executemany(
+                f"UPDATE clientes SET {c} = ? WHERE id = ?",
+                [(sessao_store.cifrar_texto(valor), i) for i, valor in abertos],
+            )
+
+
+def _meta(con: sqlite3.Connection, chave: str) -> Optional[str]:
+    row = con.execute("SELECT valor FROM meta WHERE chave = ?", (chave,)).fetchone()
+    return row[0] if row else None
+
+
+def _definir_meta(con: sqlite3.Connection, chave: str, valor: Optional[str]) -> None:
+    con.execute(
+        "INSERT INTO meta (chave, valor) VALUES (?, ?) ON CONFLICT (chave) DO UPDATE SET valor = excluded.valor",
+        (chave, valor),
+    )
+
+
+class PlanilhaInvalida(ValueError):
+    pass
+
+
+def _ler_planilha(caminho: str) -> List[Dict[str, str]]:
+    df = pd.read_excel(caminho, dtype=str).fillna("")
+    for col in COLUNAS_OBRIGATORIAS:
+        if col not in df.columns:
+            raise PlanilhaInvalida(f"Coluna obrigatória ausente na planilha: {col}")
+    registros = []
+    for rec in df.to_dict(orient="records"):
+        rec = _normalizar(rec)
+        if rec["EMPRESA"]:
+            registros.append(rec)
+    return registros
+
+
+def _substituir_todos(con: sqlite3.Connection, registros: List[Dict[str, str]]) -> None:
+    """
+    Troca o cadastro inteiro (chamar dentro de transação). EMPRESA repetida: vale a última linha.
+    Segredo em branco (a planilha exportada não os traz) mantém o que o cliente já tinha no banco.
+    """
+    cols = COLUNAS + ["atualizado_em"]
+    agora = _agora()
+    atuais = {
+        r["EMPRESA"]: dict(r)
+        for r in con.execute(f"SELECT EMPRESA, {', '.join(COLUNAS_SECRETAS)} FROM clientes")
+    }
+    linhas = []
+    for r in registros:
+        r = dict(r)
+        for c in COLUNAS_SECRETAS:
+            if not r[c]:
+                r[c] = (atuais.get(r["EMPRESA"]) or {}).get(c, "")
+        linhas.append([_proteger(r)[c] for c in COLUNAS] + [agora])
+    con.execute("DELETE FROM clientes")
+    con.executemany(
+        f"INSERT OR REPLACE INTO clientes ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})",
+        linhas,
+    )
+
+
+def _divergente(con: sqlite3.Connection, caminho_planilha: str) -> Optional[str]:
+    """Assinatura atual da planilha se ela mudou desde a última importação/exportação, senão None."""
+    assinatura = _assinatura_planilha(caminho_planilha)
+    if assinatura is None or assinatura == _meta(con, "assinatura_planilha"):
+        return None
+    return assinatura
+
+
+def conectar(caminho_planilha: str) -> sqlite3.Connection:
+    """
+    Abre o cadastro. Com o cadastro vazio, importa a planilha (primeira execução). Com clientes no banco,
+    planilha alterada fora do app só gera aviso: importar substituiria as edições feitas na UI.
+    """
+    con = _conectar_banco(caminho_planilha)
+    assinatura = _divergente(con, caminho_planilha)
+    if assinatura is None:
+        return con
+
+    if con.execute("SELECT 1 FROM clientes LIMIT 1").fetchone() is None:
+        try:
+            registros = _ler_planilha(caminho_planilha)
+        except PlanilhaInvalida:
+            con.close()
+            raise
+        except Exception as e:
+            # planilha aberta/bloqueada no Excel ou corrompida: tenta de novo na próxima leitura
+            log.warning(f"Não consegui importar {caminho_planilha}: {e}")
+        else:
+            with con:
+                _substituir_todos(con, registros)
+                _definir_meta(con, "assinatura_planilha", assinatura)
+    elif _meta(con, "assinatura_avisada") != assinatura:
+        log.warning(
+            f"{caminho_planilha} foi alterada fora do app e difere do cadastro; nada foi importado. "
+            "Use 'Reimportar da planilha' (substitui o cadastro) ou 'Exportar para a planilha' (mantém o cadastro)."
+        )
+        with con:
+            _definir_meta(con, "assinatura_avisada", assinatura)
+    return con
+
+
+def planilha_divergente(caminho_planilha: str) -> bool:
+    """True se a planilha mudou fora do app desde a última importação/exportação (e não foi importada)."""
+    con = conectar(caminho_planilha)
+    try:
+        return _divergente(con, caminho_planilha) is not None
+    finally:
+        con.close()
+
+
+# ----------------------------
+# Importação / exportação (layout da planilha)
+# ----------------------------
+def exportar_planilha(caminho_planilha: str, destino: Optional[str] = None) -> str:
+    """
+    Grava o cadastro no layout COLUNAS_EXPORTACAO (obrigatórias + opcionais, sem as secretas). Sem destino,
+    sobrescreve a planilha de origem (e registra a assinatura para não reimportá-la na próxima leitura).
+    """
+    destino = destino or caminho_planilha
+    con = _conectar_banco(caminho_planilha)
+    try:
+        rows = con.execute(f"SELECT {', '.join(COLUNAS_EXPORTACAO)} FROM clientes ORDER BY id").fetchall()
+        df = pd.DataFrame([dict(r) for r in rows], columns=COLUNAS_EXPORTACAO)
+        os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+        tmp = destino + ".tmp.xlsx"
+        df.to_excel(tmp, index=False)
+        os.replace(tmp, destino)
+        if os.path.abspath(destino) == os.path.abspath(caminho_planilha):
+            with con:
+                _definir_meta(con, "assinatura_planilha", _assinatura_planilha(destino))
+    finally:
+        con.close()
+    return destino
+
+
+def importar_planilha(caminho_planilha: str, origem: Optional[str] = None) -> int:
+    """Substitui o cadastro pelo conteúdo de uma planilha no layout padrão. Retorna o nº de clientes."""
+    origem = origem or caminho_planilha
+    registros = _ler_planilha(origem)
+    con = _conectar_banco(caminho_planilha)
+    try:
+        with con:
+            _substituir_todos(con, registros)
+            if os.path.abspath(origem) == os.path.abspath(caminho_planilha):
+                _definir_meta(con, "assinatura_planilha", _assinatura_planilha(origem))
+        return len(registros)
+    finally:
+        con.close()
+
+
 def garantir_planilha_modelo(caminho: str) -> None:
     pasta = os.path.dirname(caminho) or "."
     os.makedirs(pasta, exist_ok=True)
     if os.path.exists(caminho):
         return
-    df = pd.DataFrame(columns=COLUNAS_OBRIGATORIAS)
-    df.to_excel(caminho, index=False)
+    # sem planilha: exporta o cadastro atual (vazio na primeira vez) para manter o arquivo de troca
+    exportar_planilha(caminho)
+
+
+# ----------------------------
+# Leitura
+# ----------------------------
+def listar_clientes(caminho: str, somente_ativos: bool = False) -> List[Dict[str, str]]:
+    sql = f"SELECT {', '.join(COLUNAS)} FROM clientes"
+    if somente_ativos:
+        sql += " WHERE ATIVO = 'S'"
+    sql += " ORDER BY id"
+    con = conectar(caminho)
+    try:
+        return [dict(r) for r in con.execute(sql)]
+    finally:
+        con.close()
+
+
+def obter_cliente(caminho: str, empresa: Optional[str] = None, cnpj: Optional[str] = None) -> Optional[Dict[str, str]]:
+    if empresa:
+        where, valor = "EMPRESA = ?", str(empresa).strip()
+    elif cnpj:
+        where, valor = "CNPJ = ?", str(cnpj).strip()
+    else:
+        return None
+    con = conectar(caminho)
+    try:
+        row = con.execute(f"SELECT {', '.join(COLUNAS)} FROM clientes WHERE {where}", (valor,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        con.close()
+
+
+def identidade_cliente(cliente: Dict) -> str:
+    """CNPJ (só dígitos) ou, sem ele, o nome da empresa."""
+    cnpj = re.sub(r"\D", "", str(cliente.get("CNPJ", "") or ""))
+    return cnpj or str(cliente.get("EMPRESA", "")).strip().upper()
+
+
+def empresas_por_cnpj(caminho: str) -> Dict[str, str]:
+    """CNPJ (só dígitos) -> EMPRESA, para dar nome de cliente a notas achadas em disco. Vazio sem cadastro."""
+    if not (os.path.exists(caminho) or os.path.exists(caminho_banco(caminho))):
+        return {}
+    con = conectar(caminho)
+    try:
+        rows = con.execute("SELECT CNPJ, EMPRESA FROM clientes ORDER BY id").fetchall()
+    finally:
+        con.close()
+    saida: Dict[str, str] = {}
+    for cnpj, empresa in rows:
+        digitos = re.sub(r"\D", "", cnpj)
+        if digitos:
+            saida.setdefault(digitos, empresa)
+    return saida
+
 
 def ler_clientes(caminho: str) -> pd.DataFrame:
-    garantir_planilha_modelo(caminho)
-    df = pd.read_excel(caminho, dtype=str).fillna("")
-    for c in COLUNAS_OBRIGATORIAS:
-        if c not in df.columns:
-            df[c] = ""
-    return df[COLUNAS_OBRIGATORIAS].copy()
+    return pd.DataFrame(listar_clientes(caminho), columns=COLUNAS)
+
+
+# ----------------------------
+# Escrita (uma linha por transação)
+# ----------------------------
+def salvar_cliente(caminho: str, registro: Dict, empresa_original: Optional[str] = None) -> None:
+    """
+    Insere/atualiza um cliente. empresa_original permite renomear (EMPRESA é a chave);
+    as demais linhas não são tocadas.
+    """
+    rec = _normalizar(registro)
+    if not rec["EMPRESA"]:
+        raise ValueError("EMPRESA é obrigatória.")
+    rec = _proteger(rec)
+    cols = COLUNAS + ["atualizado_em"]
+    valores = [rec[c] for c in COLUNAS] + [_agora()]
+
+    con = conectar(caminho)
+    try:
+        with con:
+            original = str(empresa_original or "").strip()
+            if original and original != rec["EMPRESA"]:
+                existe = con.execute("SELECT 1 FROM clientes WHERE EMPRESA = ?", (rec["EMPRESA"],)).fetchone()
+                if existe:
+                    raise ValueError(f"Já existe cliente com EMPRESA = {rec['EMPRESA']}.")
+                con.execute(
+                    f"UPDATE clientes SET {', '.join(f'{c} = ?' for c in cols)} WHERE EMPRESA = ?",
+                    valores + [original],
+                )
+                return
+            atualiza = ", ".join(f"{c} = excluded.{c}" for c in cols if c != "EMPRESA")
+            con.execute(
+                f"INSERT INTO clientes ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+                f"ON CONFLICT (EMPRESA) DO UPDATE SET {atualiza}",
+                valores,
+            )
+    finally:
+        con.close()
+
+
+def excluir_cliente(caminho: str, empresa: str) -> bool:
+    con = conectar(caminho)
+    try:
+        with con:
+            cur = con.execute("DELETE FROM clientes WHERE EMPRESA = ?", (str(empresa).strip(),))
+        return cur.rowcount > 0
+    finally:
+        con.close()
+
 
 def salvar_clientes(caminho: str, df: pd.DataFrame) -> None:
-    pasta = os.path.dirname(caminho) or "."
-    os.makedirs(pasta, exist_ok=True)
-    df.to_excel(caminho, index=False)
+    """Troca o cadastro inteiro pelo DataFrame (operação em lote) e atualiza a planilha de troca."""
+    registros = [r for r in (_normalizar(rec) for rec in df.fillna("").to_dict(orient="records")) if r["EMPRESA"]]
+    con = conectar(caminho)
+    try:
+        with con:
+            _substituir_todos(con, registros)
+    finally:
+        con.close()
+    exportar_planilha(caminho)
+
+
+def assinatura(caminho: str) -> Tuple[Optional[str], Optional[str]]:
+    """(planilha, banco): muda quando o cadastro pode ter mudado. Usado pelo cache da UI."""
+    return _assinatura_planilha(caminho), _assinatura_planilha(caminho_banco(caminho))
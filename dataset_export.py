@@ -0,0 +1,203 @@
+# dataset_export.py
+import os
+import re
+import shutil
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from log_writer import COLUNAS_LOG_ORDEM, chave_registro, caminho_journal, ler_journal
+
+PASTA_DATASET = "_dataset"
+
+COLUNAS_MONETARIAS = [
+    "VALOR_SERVICO",
+    "IR",
+    "ISS",
+    "ISS_RETIDO",
+    "CSLL",
+    "DEDUCOES",
+    "PIS",
+    "COFINS",
+    "INSS",
+    "DESC_INCOND",
+    "DESC_COND",
+    "OUTRAS_RET",
+    "ALIQUOTA",
+    "BASE_CALCULO",
+    "VALOR_LIQUIDO",
+]
+COLUNAS_DATA = ["DATA_EMISSAO", "DATA_COMPETENCIA"]
+COLUNAS_ID = ["CNPJ_PRESTADOR", "CNPJ_TOMADOR"]
+# vêm do caminho da partição (competencia=.../cnpj_prestador=...), não da projeção lida do arquivo
+COLUNAS_PARTICAO = ["COMPETENCIA", "CNPJ_PRESTADOR"]
+
+_RE_COMPETENCIA = re.compile(r"^competencia=(\d{4}-\d{2})$")
+_RE_PRESTADOR = re.compile(r"^cnpj_prestador=(.+)$")
+# pasta das notas sem CNPJ do prestador (o valor da coluna continua "")
+SEM_CNPJ = "SEM_CNPJ"
+
+
+def _tem_parquet() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def pasta_dataset(pasta_base_saida: str) -> str:
+    return os.path.join(pasta_base_saida, PASTA_DATASET)
+
+
+def tipar_registros(registros: Iterable[Dict]) -> pd.DataFrame:
+    """
+    Converte linhas do LOG (strings/None) para os tipos certos:
+    valores em float64, datas em datetime64 e CNPJ/CPF como texto sem o apóstrofo do Excel.
+    """
+    df = pd.DataFrame(list(registros), columns=COLUNAS_LOG_ORDEM)
+    for c in COLUNAS_MONETARIAS:
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    for c in COLUNAS_DATA:
+        df[c] = pd.to_datetime(df[c], format="%d/%m/%Y", errors="coerce")
+    for c in COLUNAS_ID:
+        df[c] = df[c].fillna("").astype(str).str.lstrip("'")
+    for c in ("NUMERO_NF", "RAZAO_PRESTADOR", "RAZAO_TOMADOR", "OPTANTE_SN",
+              "CODIGO_TRIBUTACAO_NACIONAL", "SITUACAO"):
+        df[c] = df[c].fillna("").astype(str)
+    return df
+
+
+def _registros_deduplicados(journal: str) -> List[Dict]:
+    # mesma regra do xlsx: a última versão de cada NF vale
+    ultimos: Dict = {}
+    for pos, registro in enumerate(ler_journal(journal)):
+        ultimos[chave_registro(registro, pos)] = registro
+    return list(ultimos.values())
+
+
+def exportar_competencia(pasta_base_saida: str, competencia_str: str) -> Optional[str]:
+    """
+    (Re)gera a partição da competência no dataset colunar a partir do journal do LOG:
+
+        _dataset/competencia=AAAA-MM/cnpj_prestador=<CNPJ>/part-0.parquet   (ou .csv sem pyarrow)
+
+    A partição é montada numa pasta temporária e trocada no fim, então leitores
+    nunca veem uma competência pela metade. Retorna a pasta da partição ou None.
+    """
+    pasta_competencia = os.path.join(pasta_base_saida, competencia_str)
+    registros = _registros_deduplicados(caminho_journal(pasta_competencia, competencia_str))
+    if not registros:
+        return None
+
+    df = tipar_registros(registros)
+    parquet = _tem_parquet()
+
+    raiz = pasta_dataset(pasta_base_saida)
+    destino = os.path.join(raiz, f"competencia={competencia_str}")
+    tmp = destino + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    for cnpj, parte in df.groupby("CNPJ_PRESTADOR", sort=False):
+        pasta = os.path.join(tmp, f"cnpj_prestador={cnpj or SEM_CNPJ}")
+        os.makedirs(pasta, exist_ok=True)
+        if parquet:
+            parte.to_parquet(os.path.join(pasta, "part-0.parquet"), index=False)
+        else:
+            parte.to_csv(os.path.join(pasta, "part-0.csv"), index=False, date_format="%Y-%m-%d")
+
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(tmp, destino)
+    return destino
+
+
+def _ler_particao(caminho: str, colunas: Optional[List[str]]) -> pd.DataFrame:
+    if caminho.endswith(".parquet"):
+        return pd.read_parquet(caminho, columns=colunas)
+
+    usecols = colunas if colunas is not None else None
+    df = pd.read_csv(caminho, usecols=usecols, dtype=str, keep_default_na=False)
+    for c in df.columns:
+        if c in COLUNAS_MONETARIAS:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+        elif c in COLUNAS_DATA:
+            df[c] = pd.to_datetime(df[c], format="%Y-%m-%d", errors="coerce")
+    return df
+
+
+def listar_competencias(pasta_base_saida: str) -> List[str]:
+    raiz = pasta_dataset(pasta_base_saida)
+    if not os.path.isdir(raiz):
+        return []
+    comps = []
+    for nome in os.listdir(raiz):
+        m = _RE_COMPETENCIA.match(nome)
+        if m:
+            comps.append(m.group(1))
+    return sorted(comps)
+
+
+def iterar_dataset(
+    pasta_base_saida: str,
+    inicio: Optional[str] = None,
+    fim: Optional[str] = None,
+    colunas: Optional[List[str]] = None,
+    cnpj_prestador: Optional[str] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Percorre o dataset partição a partição (um DataFrame por competência/prestador),
+    sem abrir nada fora do intervalo [inicio, fim] (strings 'AAAA-MM', inclusivas).
+
+    colunas: projeção (só essas colunas são lidas do disco). As colunas de partição
+    COMPETENCIA e CNPJ_PRESTADOR são sempre anexadas.
+    cnpj_prestador: só esse prestador ("" = notas sem CNPJ do prestador).
+    """
+    raiz = pasta_dataset(pasta_base_saida)
+    proj = None
+    if colunas is not None:
+        proj = [c for c in colunas if c not in COLUNAS_PARTICAO]
+        if not proj:
+            # só colunas de partição: lê uma coluna qualquer para ter o número de linhas
+            proj = ["NUMERO_NF"]
+
+    for comp in listar_competencias(pasta_base_saida):
+        if inicio and comp < inicio:
+            continue
+        if fim and comp > fim:
+            continue
+        pasta_comp = os.path.join(raiz, f"competencia={comp}")
+        for sub in sorted(os.listdir(pasta_comp)):
+            m = _RE_PRESTADOR.match(sub)
+            if not m:
+                continue
+            cnpj = "" if m.group(1) == SEM_CNPJ else m.group(1)
+            if cnpj_prestador is not None and cnpj != cnpj_prestador:
+                continue
+            pasta = os.path.join(pasta_comp, sub)
+            for fn in sorted(os.listdir(pasta)):
+                if not (fn.endswith(".parquet") or fn.endswith(".csv")):
+                    continue
+                df = _ler_particao(os.path.join(pasta, fn), proj)
+                df["COMPETENCIA"] = comp
+                df["CNPJ_PRESTADOR"] = cnpj
+                if colunas is not None:
+                    df = df[list(dict.fromkeys(colunas + COLUNAS_PARTICAO))]
+                yield df
+
+
+def carregar_dataset(
+    pasta_base_saida: str,
+    inicio: Optional[str] = None,
+    fim: Optional[str] = None,
+    colunas: Optional[List[str]] = None,
+    cnpj_prestador: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Atalho para análise: concatena iterar_dataset() num único DataFrame.
+    Ex.: carregar_dataset("./saidas", "2025-01", "2025-06", ["NUMERO_NF", "VALOR_SERVICO"])
+    """
+    partes = list(iterar_dataset(pasta_base_saida, inicio, fim, colunas, cnpj_prestador))
+    if not partes:
+        cols = (colunas or COLUNAS_LOG_ORDEM) + ["COMPETENCIA"]
+        return pd.DataFrame(columns=list(dict.fromkeys(cols + ["CNPJ_PRESTADOR"])))
+    return pd.concat(partes, ignore_index=True)
@@ -0,0 +1,66 @@
+# escalonamento.py
+import heapq
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import eta
+
+# Ordem de despacho dos clientes no modo paralelo: maiores primeiro (LPT, "longest processing time").
+# Com a fila do pool (cada worker livre pega o próximo da lista), despachar em ordem decrescente de
+# duração evita que um cliente grande comece por último e defina sozinho o fim da execução.
+#
+# Duração esperada: mediana das últimas execuções OK do cliente (mesma base do ETA do Painel);
+# desempate pelas notas medianas. Sem histórico: mediana dos clientes que têm, ou DURACAO_PADRAO_S.
+
+DURACAO_PADRAO_S = 300.0
+
+
+@dataclass
+class PlanoExecucao:
+    clientes: List[Dict]  # na ordem de despacho
+    estimativas: Dict[str, float]  # empresa -> segundos esperados
+    sem_historico: List[str] = field(default_factory=list)
+    workers: int = 1
+    makespan_previsto_s: float = 0.0
+    makespan_ordem_original_s: float = 0.0  # mesma previsão, na ordem da planilha
+
+
+def simular_makespan(duracoes: List[float], workers: int) -> float:
+    """Fim previsto da execução com `workers` slots, cada um pegando o próximo item da lista ao ficar livre."""
+    slots = [0.0] * max(1, int(workers))
+    for d in duracoes:
+        heapq.heapreplace(slots, slots[0] + d)
+    return max(slots)
+
+
+def planejar(pasta_base_saida: str, clientes: List[Dict], workers: int, padrao_s: Optional[float] = None) -> PlanoExecucao:
+    empresas = [c.get("EMPRESA", "") for c in clientes]
+    estimador = eta.EstimadorETA(pasta_base_saida, empresas)
+    padrao = padrao_s or estimador.esperado_padrao or DURACAO_PADRAO_S
+
+    estimativas = {e: estimador.esperado.get(e, padrao) for e in empresas}
+    sem_historico = [e for e in empresas if e not in estimador.esperado]
+
+    # sorted é estável: empates mantêm a ordem da planilha
+    ordenados = sorted(
+        clientes,
+        key=lambda c: (estimativas[c.get("EMPRESA", "")], estimador.notas_esperadas.get(c.get("EMPRESA", ""), 0)),
+        reverse=True,
+    )
+    return PlanoExecucao(
+        clientes=ordenados,
+        estimativas=estimativas,
+        sem_historico=sem_historico,
+        workers=workers,
+        makespan_previsto_s=simular_makespan([estimativas[c.get("EMPRESA", "")] for c in ordenados], workers),
+        makespan_ordem_original_s=simular_makespan([estimativas[e] for e in empresas], workers),
+    )
+
+
+def makespan_real(status: List[Dict[str, Any]]) -> Optional[float]:
+    """Do início do primeiro ao fim do último cliente (linhas do CanalProgresso)."""
+    inicios = [s["INICIO"] for s in status if s.get("INICIO")]
+    fins = [s["FIM"] for s in status if s.get("FIM")]
+    if not inicios or not fins:
+        return None
+    return max(fins) - min(inicios)
@@ -0,0 +1,167 @@
+# eta.py
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+import run_ledger
+
+# Fator de ritmo do dia (real/esperado dos clientes já concluídos) fica limitado a este intervalo
+FATOR_MIN = 0.5
+FATOR_MAX = 3.0
+
+# Cliente em execução é sinalizado quando passa de ATRASO_FATOR x o esperado
+# (e de ATRASO_MIN_S segundos acima dele, para não alarmar clientes rápidos)
+ATRASO_FATOR = 1.5
+TRAVADO_FATOR = 3.0
+ATRASO_MIN_S = 120.0
+
+SITUACAO_AGUARDANDO = "⏳ aguardando"
+SITUACAO_NO_PRAZO = "🟢 no prazo"
+SITUACAO_ATRASADO = "🟡 acima do esperado"
+SITUACAO_TRAVADO = "🔴 possível travamento"
+SITUACAO_CONCLUIDO = "✅ concluído"
+SITUACAO_FALHA = "❌ falha"
+
+
+def _mediana(valores: List[float]) -> Optional[float]:
+    valores = [float(v) for v in valores if v is not None]
+    return statistics.median(valores) if valores else None
+
+
+class EstimadorETA:
+    """
+    Previsão de término de um job.
+
+    O histórico (_execucoes.sqlite3) é lido uma vez, na criação: duração mediana e notas medianas
+    de cada cliente nas últimas execuções OK. Durante a execução, estimar() combina isso com o
+    que já foi observado no próprio job:
+
+    - fator de ritmo: soma(real) / soma(esperado) dos clientes já concluídos (portal lento hoje -> fator > 1)
+    - segundos por nota observados no job, para o cliente em andamento e para clientes sem histórico
+    """
+
+    def __init__(self, pasta_base_saida: str, empresas: List[str], ultimas_execucoes: int = 10):
+        self.empresas = list(empresas)
+        self.esperado: Dict[str, float] = {}
+        self.notas_esperadas: Dict[str, float] = {}
+        seg_por_nota: List[float] = []
+        try:
+            hist = run_ledger.historico_clientes(pasta_base_saida, self.empresas, ultimas_execucoes)
+        except Exception:
+            hist = {}
+        for empresa, linhas in hist.items():
+            dur = _mediana([r["duracao_s"] for r in linhas])
+            if dur is not None:
+                self.esperado[empresa] = dur
+            notas = _mediana([r["notas"] for r in linhas])
+            if notas is not None:
+                self.notas_esperadas[empresa] = notas
+            for r in linhas:
+                if r["notas"] and r["t_notas"]:
+                    seg_por_nota.append(r["t_notas"] / r["notas"])
+
+        # cliente sem histórico: mediana dos que têm (ou None até o job concluir o primeiro)
+        self.esperado_padrao: Optional[float] = _mediana(list(self.esperado.values()))
+        self.seg_por_nota_hist: Optional[float] = _mediana(seg_por_nota)
+
+    def _base_esperada(self, empresa: str, observados: List[float]) -> Optional[float]:
+        if empresa in self.esperado:
+            return self.esperado[empresa]
+        if observados:
+            return statistics.median(observados)
+        return self.esperado_padrao
+
+    def estimar(self, status: List[Dict[str, Any]], agora: Optional[float] = None) -> Dict[str, Any]:
+        """
+        status: linhas do CanalProgresso (EMPRESA, STATUS, NOTAS, INICIO, FIM).
+        Retorna restante_s/termino_previsto (None se ainda não há base), fator e linhas por cliente.
+        """
+        agora = agora or time.time()
+        por_empresa = {s.get("EMPRESA"): s for s in status}
+
+        # ritmo observado no job (clientes concluídos)
+        concluidos = [s for s in status if s.get("FIM") and s.get("INICIO")]
+        observados = [s["FIM"] - s["INICIO"] for s in concluidos]
+        real_hist = sum(s["FIM"] - s["INICIO"] for s in concluidos if s.get("EMPRESA") in self.esperado)
+        esp_hist = sum(self.esperado[s["EMPRESA"]] for s in concluidos if s.get("EMPRESA") in self.esperado)
+        fator = min(FATOR_MAX, max(FATOR_MIN, real_hist / esp_hist)) if esp_hist > 0 else 1.0
+
+        notas_job = sum(int(s.get("NOTAS") or 0) for s in concluidos)
+        t_job = sum(observados)
+        seg_por_nota = (t_job / notas_job) if notas_job else self.seg_por_nota_hist
+
+        linhas: List[Dict[str, Any]] = []
+        restante = 0.0
+        sem_base = False
+        for empresa in self.empresas:
+            s = por_empresa.get(empresa)
+            base = self._base_esperada(empresa, observados)
+            esperado = base * fator if base is not None else None
+            linha: Dict[str, Any] = {
+                "EMPRESA": empresa,
+                "ESPERADO_MIN": round(esperado / 60, 1) if esperado is not None else None,
+                "REAL_MIN": None,
+                "SITUACAO": SITUACAO_AGUARDANDO,
+            }
+
+            if s is None:
+                # ainda não começou
+                if esperado is None:
+                    sem_base = True
+                else:
+                    restante += esperado
+            elif s.get("FIM"):
+                # concluído: compara com o histórico puro (o fator vem justamente destes clientes)
+                linha["ESPERADO_MIN"] = round(base / 60, 1) if base is not None else None
+                linha["REAL_MIN"] = round((s["FIM"] - s["INICIO"]) / 60, 1)
+                linha["SITUACAO"] = SITUACAO_CONCLUIDO if s.get("STATUS") == "OK" else SITUACAO_FALHA
+            else:
+                decorrido = agora - (s.get("INICIO") or agora)
+                linha["REAL_MIN"] = round(decorrido / 60, 1)
+                linha["SITUACAO"] = SITUACAO_NO_PRAZO
+                faltam_cli: Optional[float] = None
+                if esperado is not None:
+                    faltam_cli = max(0.0, esperado - decorrido)
+                    excesso = decorrido - esperado
+                    if excesso > ATRASO_MIN_S and decorrido > esperado * TRAVADO_FATOR:
+                        linha["SITUACAO"] = SITUACAO_TRAVADO
+                    elif excesso > ATRASO_MIN_S and decorrido > esperado * ATRASO_FATOR:
+                        linha["SITUACAO"] = SITUACAO_ATRASADO
+                # passou do esperado: usa as notas que ainda faltam pelo ritmo por nota
+                notas_previstas = self.notas_esperadas.get(empresa)
+                if (not faltam_cli) and seg_por_nota and notas_previstas:
+                    faltam_cli = max(0.0, notas_previstas - int(s.get("NOTAS") or 0)) * seg_por_nota
+                if faltam_cli is None:
+                    sem_base = True
+                else:
+                    restante += faltam_cli
+            linhas.append(linha)
+
+        pendentes = any(por_empresa.get(e) is None or not por_empresa[e].get("FIM") for e in self.empresas)
+        if not pendentes:
+            restante_s: Optional[float] = 0.0
+        elif sem_base and restante == 0.0:
+            restante_s = None
+        else:
+            restante_s = restante
+        return {
+            "restante_s": restante_s,
+            "termino_previsto": (agora + restante_s) if restante_s is not None else None,
+            "parcial": sem_base,  # alguns clientes sem base ainda (ETA subestimado)
+            "fator": round(fator, 2),
+            "seg_por_nota": round(seg_por_nota, 1) if seg_por_nota else None,
+            "clientes": linhas,
+        }
+
+
+def formatar_duracao(segundos: Optional[float]) -> str:
+    if segundos is None:
+        return "—"
+    segundos = int(round(segundos))
+    h, resto = divmod(segundos, 3600)
+    m, s = divmod(resto, 60)
+    if h:
+        return f"{h}h{m:02d}min"
+    if m:
+        return f"{m}min{s:02d}s"
+    return f"{s}s"
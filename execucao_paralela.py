@@ -0,0 +1,363 @@
+# execucao_paralela.py
+import contextlib
+import multiprocessing
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+
+import bot_logging
+import config as cfgmod
+import eta
+import run_ledger
+import xvfb_pool
+
+log = bot_logging.obter_logger("paralelo")
+
+# Cada cliente num processo próprio, supervisionado pelo processo pai (o do Streamlit ou da CLI).
+# Crash do Chrome/driver, estouro de memória ou chamada do WebDriver que nunca volta ficam contidos
+# no processo do cliente: o supervisor mata a árvore inteira (processo + chromedriver + Chrome),
+# registra a falha e, se configurado, tenta o cliente de novo num processo novo.
+#
+# No Linux com Xvfb cada processo ganha também a sua tela virtual, e vários clientes rodam ao mesmo
+# tempo (o pyautogui se conecta ao DISPLAY no import e a seleção de certificado por imagem disputa a
+# tela). Sem Xvfb os processos usam a tela normal, um cliente por vez.
+# Logs e progresso voltam ao processo pai por filas do multiprocessing.
+
+_ctx = multiprocessing.get_context("spawn")
+
+INTERVALO_SUPERVISAO_S = 2.0
+ESPERA_TERMINO_S = 5.0  # entre SIGTERM e SIGKILL
+
+
+def suportado() -> bool:
+    return xvfb_pool.disponivel()
+
+
+@dataclass
+class LimitesProcesso:
+    """0 = sem limite."""
+
+    timeout_s: float = 0
+    memoria_mb: int = 0  # soma do RSS do processo do cliente e de tudo o que ele abriu (Chrome)
+    cpu_s: int = 0  # RLIMIT_CPU de cada processo da árvore
+    reinicios: int = 1  # novas tentativas depois de crash, tempo limite ou memória
+
+
+def limites_de(cfg: cfgmod.AppConfig) -> LimitesProcesso:
+    return LimitesProcesso(
+        timeout_s=float(cfg.timeout_cliente_min) * 60,
+        memoria_mb=int(cfg.limite_memoria_mb),
+        cpu_s=int(cfg.limite_cpu_min) * 60,
+    )
+
+
+# ----------------------------
+# Árvore de processos
+# ----------------------------
+class LimiteCPUExcedido(Exception):
+    pass
+
+
+def _isolar_processo(limites: LimitesProcesso) -> None:
+    """No filho: sessão própria (o pai mata o grupo inteiro, Chrome incluso) e limite de CPU."""
+    if os.name != "posix":
+        return
+    os.setsid()
+    if limites.cpu_s:
+        import resource
+
+        def ao_estourar_cpu(_sinal, _frame) -> None:
+            # vira exceção no fluxo do robô: fecha o navegador, grava o histórico e reporta a falha ao pai.
+            # O kernel repete o SIGXCPU a cada segundo até o limite rígido (SIGKILL) se ela for engolida.
+            raise LimiteCPUExcedido(f"limite de CPU de {eta.formatar_duracao(limites.cpu_s)} excedido")
+
+        # SIGXCPU no limite suave (tratado acima); o rígido, 30 s depois, mata o processo de qualquer jeito.
+        # Chrome/chromedriver herdam o limite mas não o tratamento: no limite suave eles simplesmente terminam.
+        signal.signal(signal.SIGXCPU, ao_estourar_cpu)
+        resource.setrlimit(resource.RLIMIT_CPU, (limites.cpu_s, limites.cpu_s + 30))
+
+
+def memoria_sessao_mb(sid: int) -> Optional[float]:
+    """RSS somado dos processos da sessão `sid` (Linux, via /proc). None se não der para medir."""
+    if not sys.platform.startswith("linux"):
+        return None
+    pagina = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for nome in os.listdir("/proc"):
+        if not nome.isdigit():
+            continue
+        try:
+            with open(f"/proc/{nome}/stat", "rb") as f:
+                campos = f.read().rsplit(b")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        # depois do "(comm)": estado, ppid, pgrp, sessão, ... rss é o 22º
+        if int(campos[3]) == sid:
+            total += int(campos[21]) * pagina
+    return total / (1024 * 1024)
+
+
+def _encerrar_arvore(proc) -> None:
+    if os.name == "posix":
+        for sinal, espera in ((signal.SIGTERM, ESPERA_TERMINO_S), (signal.SIGKILL, 0)):
+            try:
+                os.killpg(proc.pid, sinal)
+            except (ProcessLookupError, PermissionError):
+                break
+            proc.join(espera)
+    else:
+        subprocess.run(
+            ["taskkill", "/T", "/F", "/PID", str(proc.pid)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False,
+        )
+    proc.join()
+
+
+def _supervisionar(proc, limites: LimitesProcesso) -> Optional[str]:
+    """Espera o processo do cliente; devolve o motivo se precisou matá-lo (tempo/memória), senão None."""
+    inicio = time.monotonic()
+    aviso_memoria = False
+    while True:
+        proc.join(INTERVALO_SUPERVISAO_S)
+        if not proc.is_alive():
+            # Chrome órfão de um filho que caiu continua na sessão dele
+            if os.name == "posix":
+                with contextlib.suppress(ProcessLookupError, PermissionError):
+                    os.killpg(proc.pid, signal.SIGKILL)
+            return None
+
+        motivo = None
+        if limites.timeout_s and time.monotonic() - inicio > limites.timeout_s:
+            motivo = f"tempo limite de {eta.formatar_duracao(limites.timeout_s)} excedido"
+        elif limites.memoria_mb:
+            usado = memoria_sessao_mb(proc.pid)
+            if usado is None and not aviso_memoria:
+                log.warning("Limite de memória por cliente só é aplicado no Linux.")
+                aviso_memoria = True
+            elif usado is not None and usado > limites.memoria_mb:
+                motivo = f"memória {usado:.0f} MB acima do limite de {limites.memoria_mb} MB"
+        if motivo:
+            _encerrar_arvore(proc)
+            return motivo
+
+
+class _SemDisplay:
+    """Mesma interface do PoolDisplays, para processos que usam a tela normal (sem Xvfb)."""
+
+    @dataclass
+    class _Vaga:
+        numero: int
+        nome: Optional[str] = None
+
+    def __init__(self, tamanho: int):
+        self.tamanho = max(1, int(tamanho))
+        self._vagas: queue.Queue = queue.Queue()
+        for n in range(1, self.tamanho + 1):
+            self._vagas.put(self._Vaga(n))
+
+    @contextlib.contextmanager
+    def emprestar(self) -> Iterator["_SemDisplay._Vaga"]:
+        vaga = self._vagas.get()
+        try:
+            yield vaga
+        finally:
+            self._vagas.put(vaga)
+
+    def __enter__(self) -> "_SemDisplay":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+# ----------------------------
+# Processo filho (um cliente)
+# ----------------------------
+def _rodar_cliente(
+    cfg: cfgmod.AppConfig,
+    ano: int,
+    mes: int,
+    cliente: Dict,
+    execucao_id: str,
+    display: Optional[str],
+    pasta_download: str,
+    fila_logs,
+    fila_eventos,
+    limites: LimitesProcesso,
+    concluido,
+) -> None:
+    _isolar_processo(limites)
+    # antes de qualquer import do pyautogui/Selenium (todos tardios)
+    if display:
+        os.environ["DISPLAY"] = display
+        os.environ["HEADLESS"] = "0"
+    bot_logging.encaminhar_para_fila(fila_logs)
+
+    from job_manager import patch_bot_paths
+
+    empresa = cliente.get("EMPRESA", "")
+    competencia = f"{ano:04d}-{mes:02d}"
+    with bot_logging.contexto(execucao=execucao_id, competencia=competencia, cliente=empresa):
+        try:
+            bot_nfse = patch_bot_paths(cfg)
+            bot_nfse.PASTA_DOWNLOAD_TEMP = pasta_download
+            os.makedirs(pasta_download, exist_ok=True)
+
+            bot = bot_nfse.NFSePortalBot(ano, mes)
+            bot.execucao_id = execucao_id
+            bot.callback_nota = lambda _c, info: fila_eventos.put(("nota", empresa, int(info.get("bytes", 0))))
+            try:
+                bot._processar_cliente(cliente)
+            finally:
+                # o xlsx da competência é montado uma vez só, pelo processo pai
+                bot.log_writer.fechar()
+
+            m = bot.metricas
+            if m is not None and m.status != run_ledger.OK:
+                fila_eventos.put(("fim", empresa, "FALHA", m.detalhe or m.status))
+            else:
+                fila_eventos.put(("fim", empresa, "OK", ""))
+        except Exception as e:
+            log.exception(f"Falha no cliente {empresa}: {e}")
+            fila_eventos.put(("fim", empresa, "FALHA", str(e)))
+        # resultado entregue: uma queda daqui em diante (ex.: ao encerrar) não repete o cliente
+        concluido.set()
+
+
+# ----------------------------
+# Processo pai (supervisor)
+# ----------------------------
+def processar_clientes(
+    cfg: cfgmod.AppConfig,
+    ano: int,
+    mes: int,
+    clientes: List[Dict],
+    workers: int,
+    execucao_id: str,
+    ao_iniciar: Callable[[Dict], None],
+    ao_finalizar: Callable[[str, str, str], None],
+    ao_baixar_nota: Callable[[str, int], None],
+    parar: Callable[[], bool],
+    limites: Optional[LimitesProcesso] = None,
+    com_display: bool = True,
+) -> None:
+    """
+    Roda os clientes em até `workers` processos simultâneos, na ordem da lista.
+
+    Callbacks (no processo pai, um de cada vez): ao_iniciar(cliente),
+    ao_finalizar(empresa, "OK"|"FALHA", detalhe), ao_baixar_nota(empresa, bytes).
+    parar() é consultado antes de cada cliente; os que já estão rodando terminam.
+    com_display=False: sem Xvfb (a tela normal é compartilhada, então use workers=1).
+    """
+    import bot_nfse  # já com os caminhos do patch_bot_paths
+
+    limites = limites or LimitesProcesso()
+    pasta_download_base = bot_nfse.PASTA_DOWNLOAD_TEMP
+    pasta_base_saida = bot_nfse.PASTA_BASE_SAIDA
+    competencia = f"{ano:04d}-{mes:02d}"
+    fila_logs = _ctx.Queue()
+    fila_eventos = _ctx.Queue()
+    receptor = bot_logging.ReceptorProcessos(fila_logs)
+    lock_inicio = threading.Lock()
+
+    def consumir_eventos() -> None:
+        finalizados = set()
+        while True:
+            evento = fila_eventos.get()
+            if evento is None:
+                return
+            tipo, empresa = evento[0], evento[1]
+            # mesmo motivo de rodar(): thread nova começa sem contexto
+            with bot_logging.contexto(execucao=execucao_id, competencia=competencia, cliente=empresa):
+                try:
+                    if tipo == "nota":
+                        ao_baixar_nota(empresa, evento[2])
+                    elif tipo == "fim":
+                        finalizados.add(empresa)
+                        ao_finalizar(empresa, evento[2], evento[3])
+                    elif tipo == "saiu" and empresa not in finalizados:
+                        # processo morto pelo supervisor ou que caiu sem avisar (crash do Chrome/driver, kill)
+                        ao_finalizar(empresa, "FALHA", evento[2])
+                except Exception as e:
+                    log.warning(f"Falha ao registrar progresso de {empresa}: {e}")
+
+    consumidor = threading.Thread(target=consumir_eventos, daemon=True, name="paralelo-eventos")
+    consumidor.start()
+
+    def registrar_falha(cliente: Dict, inicio: float, detalhe: str) -> None:
+        # o filho não chegou a registrar o cliente no histórico
+        m = run_ledger.MetricasCliente(
+            empresa=cliente.get("EMPRESA", ""),
+            cnpj=str(cliente.get("CNPJ", "")),
+            tipo_acesso=str(cliente.get("TIPO_ACESSO", "")),
+            inicio=inicio,
+        )
+        m.falhar(run_ledger.ERRO, detalhe)
+        try:
+            run_ledger.registrar_cliente(pasta_base_saida, execucao_id, competencia, m)
+        except Exception as e:
+            log.warning(f"Falha ao gravar histórico de {m.empresa}: {e}")
+
+    def rodar(cliente: Dict) -> None:
+        empresa = cliente.get("EMPRESA", "")
+        # thread do ThreadPoolExecutor: não herda o contexto de quem chamou, então o da execução vai explícito
+        # (sem `execucao` o ExecucaoLog descarta o registro)
+        with bot_logging.contexto(execucao=execucao_id, competencia=competencia, cliente=empresa):
+            _rodar_supervisionado(cliente, empresa)
+
+    def _rodar_supervisionado(cliente: Dict, empresa: str) -> None:
+        if parar():
+            return
+        with pool.emprestar() as vaga:
+            if parar():
+                return
+            with lock_inicio:
+                ao_iniciar(cliente)
+            pasta_download = os.path.join(
+                pasta_download_base, f"display_{vaga.numero}" if vaga.nome else f"processo_{vaga.numero}"
+            )
+            for tentativa in range(limites.reinicios + 1):
+                concluido = _ctx.Event()
+                inicio = time.time()
+                proc = _ctx.Process(
+                    target=_rodar_cliente,
+                    args=(
+                        cfg, ano, mes, cliente, execucao_id, vaga.nome, pasta_download,
+                        fila_logs, fila_eventos, limites, concluido,
+                    ),
+                    name=f"cliente-{empresa}",
+                    daemon=True,
+                )
+                proc.start()
+                log.info(f"Cliente {empresa} no processo {proc.pid}" + (f" ({vaga.nome})." if vaga.nome else "."))
+                motivo = _supervisionar(proc, limites)
+                if concluido.is_set():
+                    break
+                detalhe = motivo or f"processo do cliente terminou com código {proc.exitcode}"
+                log.error(f"Cliente {empresa}: {detalhe}.")
+                registrar_falha(cliente, inicio, detalhe)
+                if tentativa < limites.reinicios and not parar():
+                    log.warning(f"Cliente {empresa}: nova tentativa num processo novo ({tentativa + 2}/{limites.reinicios + 1}).")
+                    continue
+                # depois de tudo o que o filho enfileirou (mesma fila, mesma ordem)
+                fila_eventos.put(("saiu", empresa, detalhe[:1].upper() + detalhe[1:] + "."))
+                break
+
+    try:
+        with (xvfb_pool.PoolDisplays(workers) if com_display else _SemDisplay(workers)) as pool:
+            with ThreadPoolExecutor(max_workers=pool.tamanho, thread_name_prefix="paralelo") as executor:
+                list(executor.map(rodar, clientes))
+    finally:
+        fila_eventos.put(None)
+        consumidor.join()
+        receptor.encerrar()
+        for fila in (fila_logs, fila_eventos):
+            fila.close()
+            fila.join_thread()
@@ -0,0 +1,494 @@
+# file_index.py
+import contextlib
+import datetime
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import bot_logging
+from catalog import hash_arquivo
+
+log = bot_logging.obter_logger("file_index")
+
+ARQUIVO_INDICE = "_indice.json"
+# _indice.json é regravado inteiro: em lote, não a cada arquivo (pasta plana grande em rede = O(n²) bytes)
+SALVAR_A_CADA = 50  # arquivos colocados
+SALVAR_APOS_S = 30.0  # ou segundos desde a última gravação
+TRAVA_ESPERA_S = 30.0
+TRAVA_ABANDONADA_S = 120.0  # trava mais velha que isso é de processo que caiu
+
+LAYOUTS_SAIDA = {
+    "plano": "AAAA-MM/arquivos (tudo junto)",
+    "cnpj": "AAAA-MM/<CNPJ do cliente>/arquivos",
+    "empresa": "AAAA-MM/<EMPRESA>/arquivos",
+}
+
+# "NOME - NF 12 (3).pdf" -> base "NOME - NF 12", versão 3
+_RE_VERSAO = re.compile(r"^(?P<base>.*?)(?: \((?P<n>\d+)\))?$")
+
+
+def limpar_nome_arquivo(nome: str) -> str:
+    proibidos = r'\/:*?"<>|'
+    for ch in proibidos:
+        nome = nome.replace(ch, " ")
+    return " ".join(nome.split())
+
+
+def _separar_versao(stem: str) -> Tuple[str, int]:
+    m = _RE_VERSAO.match(stem)
+    base = m.group("base")
+    n = int(m.group("n")) if m.group("n") else 1
+    return base, n
+
+
+def pasta_do_cliente(pasta_competencia: str, cliente: Dict, layout: str = "plano") -> str:
+    """
+    Pasta de saída do cliente dentro da competência, conforme o layout configurado.
+    No layout "cnpj", cliente sem CNPJ cai no nome da empresa.
+    """
+    layout = (layout or "plano").strip().lower()
+    if layout == "cnpj":
+        digitos = re.sub(r"\D", "", str(cliente.get("CNPJ", "")))
+        sub = digitos or limpar_nome_arquivo(str(cliente.get("EMPRESA", "")).upper())
+    elif layout == "empresa":
+        sub = limpar_nome_arquivo(str(cliente.get("EMPRESA", "")).upper())
+    else:
+        return pasta_competencia
+    return os.path.join(pasta_competencia, sub or "SEM_IDENTIFICACAO")
+
+
+def ler_indice_pasta(pasta: str) -> Dict[str, Dict]:
+    """Entradas do _indice.json da pasta (nome -> metadados). Vazio se não houver índice."""
+    try:
+        with open(os.path.join(pasta, ARQUIVO_INDICE), "r", encoding="utf-8") as f:
+            return (json.load(f) or {}).get("arquivos", {})
+    except (OSError, ValueError):
+        return {}
+
+
+@contextlib.contextmanager
+def _trava_indice(pasta: str) -> Iterator[None]:
+    """
+    Exclusão mútua entre processos (workers paralelos gravam na mesma pasta no layout plano).
+    Arquivo criado com O_EXCL: funciona também em compartilhamento SMB, onde fcntl/msvcrt não são confiáveis.
+    """
+    caminho = os.path.join(pasta, ARQUIVO_INDICE + ".lock")
+    limite = time.monotonic() + TRAVA_ESPERA_S
+    while True:
+        try:
+            fd = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+            break
+        except FileExistsError:
+            try:
+                abandonada = time.time() - os.stat(caminho).st_mtime > TRAVA_ABANDONADA_S
+            except OSError:
+                continue  # liberada entre o open e o stat
+            if abandonada:
+                # processo que caiu segurando a trava
+                with contextlib.suppress(OSError):
+                    os.remove(caminho)
+                continue
+            if time.monotonic() > limite:
+                raise OSError(f"{caminho} travado por outro processo há mais de {TRAVA_ESPERA_S:.0f}s")
+            time.sleep(0.05)
+    try:
+        os.close(fd)
+        yield
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(caminho)
+
+
+def _gravar_indice_pasta(
+    pasta: str, arquivos: Dict[str, Dict], descartar: Optional[Dict[str, Dict]] = None
+) -> Dict[str, Dict]:
+    """
+    Junta `arquivos` ao _indice.json que está em disco (entradas de outros processos são mantidas,
+    as de `descartar` só se ainda forem as mesmas) e grava. Retorna o índice gravado.
+    """
+    destino = os.path.join(pasta, ARQUIVO_INDICE)
+    tmp = f"{destino}.{os.getpid()}.tmp"
+    with _trava_indice(pasta):
+        juntos = {
+            nome: meta for nome, meta in ler_indice_pasta(pasta).items()
+            if not descartar or descartar.get(nome) != meta
+        }
+        juntos.update(arquivos)
+        data = {
+            "atualizado_em": datetime.datetime.now().isoformat(timespec="seconds"),
+            "arquivos": juntos,
+        }
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, destino)
+    return juntos
+
+
+def _ignorar(nome: str) -> bool:
+    # _indice.json, a trava e os .tmp de cada processo
+    return nome.startswith("~$") or nome.startswith(ARQUIVO_INDICE) or nome.endswith(".tmp")
+
+
+def listar_arquivos_pasta(pasta: str) -> List[Dict]:
+    """
+    Lista os arquivos de UMA pasta (sem recursão) a partir do _indice.json.
+    Sem índice, faz um único scandir da pasta.
+    """
+    arquivos = ler_indice_pasta(pasta)
+    if arquivos:
+        return [{"arquivo": nome, **meta} for nome, meta in sorted(arquivos.items())]
+
+    saida = []
+    if not os.path.isdir(pasta):
+        return saida
+    with os.scandir(pasta) as it:
+        for entry in it:
+            if entry.is_file() and not _ignorar(entry.name):
+                st = entry.stat()
+                saida.append({"arquivo": entry.name, "tamanho": st.st_size, "mtime": st.st_mtime})
+    return sorted(saida, key=lambda x: x["arquivo"])
+
+
+def listar_pastas_clientes(pasta_competencia: str) -> List[str]:
+    """Subpastas de cliente da competência (um listdir; pastas '_' são internas)."""
+    if not os.path.isdir(pasta_competencia):
+        return []
+    with os.scandir(pasta_competencia) as it:
+        return sorted(e.name for e in it if e.is_dir() and not e.name.startswith("_"))
+
+
+class IndiceDestino:
+    """
+    Índice em memória de uma pasta de destino, montado UMA vez (um scandir)
+    e mantido atualizado pelo próprio robô durante a execução.
+
+    Evita o os.path.exists() por candidato (NOME (2), NOME (3), ...) que custa
+    uma ida e volta ao compartilhamento de rede a cada arquivo, e permite a
+    colocação idempotente: o mesmo conteúdo não é gravado duas vezes.
+
+    Vários processos podem ter o seu IndiceDestino da mesma pasta (workers no layout plano):
+    o nome final é reservado com O_EXCL antes do move e o _indice.json é juntado ao de disco sob trava.
+    """
+
+    def __init__(self, pasta: str):
+        self.pasta = pasta
+        os.makedirs(pasta, exist_ok=True)
+
+        # (base.lower(), ext) -> [(versão, nome do arquivo)]
+        self._versoes: Dict[Tuple[str, str], List[Tuple[int, str]]] = {}
+        self._nomes = set()  # nomes em minúsculas (Windows/SMB não diferenciam caixa)
+        self._hashes: Dict[str, str] = {}  # nome -> sha256 (calculado sob demanda)
+        # (cnpj_prestador, numero_nf, ext) -> [nomes]; preenchido conforme o robô coloca arquivos
+        self._por_chave: Dict[Tuple[str, str, str], List[str]] = {}
+
+        # _indice.json da pasta: reaproveita hashes já calculados se tamanho/mtime batem
+        self._meta: Dict[str, Dict] = {}
+        salvo = ler_indice_pasta(pasta)
+        self._pendentes = 0  # colocações ainda não gravadas no _indice.json
+        self._ultima_gravacao = time.monotonic()
+
+        with os.scandir(pasta) as it:
+            for entry in it:
+                if not entry.is_file() or _ignorar(entry.name):
+                    continue
+                st = entry.stat()
+                meta = {"tamanho": st.st_size, "mtime": st.st_mtime}
+                anterior = salvo.get(entry.name) or {}
+                if anterior.get("tamanho") == st.st_size and anterior.get("mtime") == st.st_mtime:
+                    meta = {**anterior, **meta}
+                self._meta[entry.name] = meta
+                chave = None
+                if meta.get("numero_nf"):
+                    chave = (meta.get("cnpj_prestador") or "", meta["numero_nf"])
+                self._registrar(entry.name, chave=chave, sha=meta.get("sha256"))
+        # entradas do índice salvo cujo arquivo sumiu: não voltam na junção com o índice em disco
+        self._descartar = {nome: meta for nome, meta in salvo.items() if nome not in self._meta}
+
+    def _registrar(self, nome: str, chave: Optional[Tuple[str, str]] = None, sha: Optional[str] = None) -> None:
+        stem, ext = os.path.splitext(nome)
+        base, n = _separar_versao(stem)
+        ext = ext.lower()
+        self._versoes.setdefault((base.lower(), ext), []).append((n, nome))
+        self._nomes.add(nome.lower())
+        if sha:
+            self._hashes[nome] = sha
+        if chave:
+            self._por_chave.setdefault((chave[0], chave[1], ext), []).append(nome)
+
+    def _hash(self, nome: str) -> str:
+        if nome not in self._hashes:
+            self._hashes[nome] = hash_arquivo(os.path.join(self.pasta, nome))
+            self._meta.setdefault(nome, {})["sha256"] = self._hashes[nome]
+        return self._hashes[nome]
+
+    def salvar(self) -> None:
+        """Grava o _indice.json se houver colocações pendentes (o robô chama no fim de cada cliente)."""
+        if not self._pendentes:
+            return
+        try:
+            juntos = _gravar_indice_pasta(self.pasta, self._meta, self._descartar)
+        except OSError as e:
+            # índice é só acelerador; a pasta continua sendo a fonte da verdade
+            log.warning(f"Não consegui gravar {ARQUIVO_INDICE} em {self.pasta}: {e}")
+        else:
+            # arquivos colocados por outros processos entram como candidatos (conteúdo igual não duplica);
+            # o nome pode já estar em _nomes por uma reserva perdida, mas ainda não é candidato
+            for nome, meta in juntos.items():
+                if nome not in self._meta:
+                    self._meta[nome] = meta
+                    chave = (meta.get("cnpj_prestador") or "", meta["numero_nf"]) if meta.get("numero_nf") else None
+                    self._registrar(nome, chave=chave, sha=meta.get("sha256"))
+        self._pendentes = 0
+        self._ultima_gravacao = time.monotonic()
+
+    def _salvar_em_lote(self) -> None:
+        self._pendentes += 1
+        if self._pendentes >= SALVAR_A_CADA or time.monotonic() - self._ultima_gravacao >= SALVAR_APOS_S:
+            self.salvar()
+
+    def _candidatos(self, base: str, ext: str, chave: Optional[Tuple[str, str]]) -> List[str]:
+        nomes = [nome for _, nome in sorted(self._versoes.get((base.lower(), ext), []))]
+        if chave:
+            for nome in self._por_chave.get((chave[0], chave[1], ext), []):
+                if nome not in nomes:
+                    nomes.append(nome)
+        return nomes
+
+    @staticmethod
+    def _reservar(destino: str) -> bool:
+        """Cria o arquivo final vazio, só se ninguém o criou antes (O_EXCL é atômico também em SMB)."""
+        try:
+            os.close(os.open(destino, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            return False
+        return True
+
+    def existente(self, nome_base: str, ext: str, chave: Optional[Tuple[str, str]] = None) -> Optional[str]:
+        """Caminho da versão mais recente já presente para esse nome/chave (ou None)."""
+        nomes = self._candidatos(limpar_nome_arquivo(nome_base), ext.lower(), chave)
+        return os.path.join(self.pasta, nomes[-1]) if nomes else None
+
+    def colocar(
+        self,
+        caminho_origem: str,
+        nome_base: str,
+        chave: Optional[Tuple[str, str]] = None,
+    ) -> Tuple[str, str, str]:
+        """
+        Move caminho_origem para a pasta com o nome base informado.
+
+        chave: (cnpj_prestador, numero_nf), quando conhecida.
+        Retorna (caminho_final, ação, sha256 do conteúdo), com ação:
+          - "identico": o mesmo conteúdo já existia; a origem é descartada
+          - "novo":     primeira cópia desse nome
+          - "versao":   conteúdo diferente (ex.: nota cancelada depois) -> NOME (n)
+        """
+        base = limpar_nome_arquivo(nome_base)
+        ext = os.path.splitext(caminho_origem)[1].lower()
+        sha = hash_arquivo(caminho_origem)
+
+        candidatos = self._candidatos(base, ext, chave)
+        for nome in candidatos:
+            try:
+                igual = self._hash(nome) == sha
+            except OSError:
+                continue
+            if igual:
+                try:
+                    os.remove(caminho_origem)
+                except OSError:
+                    pass
+                return os.path.join(self.pasta, nome), "identico", sha
+
+        contador = 1
+        while True:
+            nome_final = base + ext if contador == 1 else f"{base} ({contador}){ext}"
+            contador += 1
+            if nome_final.lower() in self._nomes:
+                continue
+            destino = os.path.join(self.pasta, nome_final)
+            if self._reservar(destino):
+                break
+            # outro processo acabou de usar esse nome
+            self._nomes.add(nome_final.lower())
+
+        try:
+            # por cima da reserva; entre discos (temp local -> rede) vira cópia
+            os.replace(caminho_origem, destino)
+        except OSError:
+            try:
+                shutil.copy2(caminho_origem, destino)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(destino)
+                raise
+            os.remove(caminho_origem)
+        self._registrar(nome_final, chave=chave, sha=sha)
+
+        meta = {"sha256": sha}
+        try:
+            st = os.stat(destino)
+            meta.update({"tamanho": st.st_size, "mtime": st.st_mtime})
+        except OSError:
+            pass
+        if chave:
+            meta.update({"cnpj_prestador": chave[0], "numero_nf": chave[1]})
+        self._meta[nome_final] = meta
+        self._salvar_em_lote()
+        return destino, ("versao" if candidatos else "novo"), sha
+
+
+def importar_pasta(origem: str, destino: str, ignorar: Callable[[str], bool] = lambda _n: False) -> Dict[str, int]:
+    """
+    Copia os arquivos de `origem` (sem recursão) para `destino` pelas mesmas regras do robô:
+    conteúdo igual não duplica, conteúdo diferente vira NOME (n). A origem não é alterada.
+    Retorna a contagem por ação: {"novo": .., "identico": .., "versao": ..}.
+    """
+    contagem = {"novo": 0, "identico": 0, "versao": 0}
+    meta_origem = ler_indice_pasta(origem)
+    indice = None
+    with os.scandir(origem) as it:
+        entradas = sorted((e for e in it if e.is_file() and not _ignorar(e.name) and not ignorar(e.name)), key=lambda e: e.name)
+    for entry in entradas:
+        if indice is None:
+            indice = IndiceDestino(destino)
+        stem = os.path.splitext(entry.name)[0]
+        meta = meta_origem.get(entry.name) or {}
+        chave = (meta.get("cnpj_prestador") or "", meta["numero_nf"]) if meta.get("numero_nf") else None
+        # cópia temporária ao lado do destino (colocar() move; '~$' é ignorado nas varreduras)
+        tmp = os.path.join(destino, f"~$importar_{os.getpid()}_{entry.name}")
+        shutil.copy2(entry.path, tmp)
+        try:
+            _, acao, _ = indice.colocar(tmp, _separar_versao(stem)[0], chave=chave)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        contagem[acao] += 1
+    if indice is not None:
+        indice.salvar()
+    return contagem
+
+
+# ==============================
+# ÍNDICE DA COMPETÊNCIA (Auditoria)
+# ==============================
+
+RAIZ = "(raiz)"
+
+
+def _tipo_arquivo(nome: str) -> str:
+    ext = os.path.splitext(nome)[1].lower()
+    return ext[1:] if ext in (".xml", ".pdf") else "outros"
+
+
+@dataclass
+class IndiceCompetencia:
+    pasta: str
+    arquivos: List[Dict] = field(default_factory=list)  # cliente, arquivo, tipo, tamanho, mtime
+    clientes: List[str] = field(default_factory=list)
+    assinatura: Tuple = ()
+
+    @property
+    def total_arquivos(self) -> int:
+        return len(self.arquivos)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(a["tamanho"] for a in self.arquivos)
+
+    def resumo_por_cliente(self) -> List[Dict]:
+        resumo: Dict[str, Dict] = {}
+        for a in self.arquivos:
+            r = resumo.setdefault(a["cliente"], {"cliente": a["cliente"], "xml": 0, "pdf": 0, "outros": 0, "bytes": 0})
+            r[a["tipo"]] += 1
+            r["bytes"] += a["tamanho"]
+        return sorted(resumo.values(), key=lambda r: r["cliente"])
+
+    def filtrar(self, texto: Optional[str] = None, cliente: Optional[str] = None, tipo: Optional[str] = None) -> List[Dict]:
+        texto = (texto or "").strip().lower()
+        return [
+            a for a in self.arquivos
+            if (not cliente or a["cliente"] == cliente)
+            and (not tipo or a["tipo"] == tipo)
+            and (not texto or texto in a["arquivo"].lower())
+        ]
+
+
+def _mtime_ns(caminho: str) -> int:
+    try:
+        return os.stat(caminho).st_mtime_ns
+    except OSError:
+        return -1
+
+
+def _assinatura(pasta: str, clientes: List[str]) -> Tuple:
+    """
+    mtime da pasta da competência + de cada subpasta de cliente conhecida.
+    Criar/remover/renomear arquivo altera o mtime do diretório que o contém,
+    então não é preciso listar os arquivos para saber se algo mudou.
+    """
+    return (_mtime_ns(pasta),) + tuple(_mtime_ns(os.path.join(pasta, c)) for c in clientes)
+
+
+def _montar_indice_competencia(pasta: str) -> IndiceCompetencia:
+    arquivos: List[Dict] = []
+    clientes: List[str] = []
+
+    def varrer(diretorio: str, cliente: str) -> None:
+        try:
+            with os.scandir(diretorio) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        if cliente == RAIZ and not entry.name.startswith("_"):
+                            clientes.append(entry.name)
+                        continue
+                    if _ignorar(entry.name):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    arquivos.append({
+                        "cliente": cliente,
+                        "arquivo": entry.name,
+                        "tipo": _tipo_arquivo(entry.name),
+                        "tamanho": st.st_size,
+                        "mtime": st.st_mtime,
+                    })
+        except OSError:
+            pass
+
+    varrer(pasta, RAIZ)
+    clientes.sort()
+    for c in clientes:
+        varrer(os.path.join(pasta, c), c)
+
+    arquivos.sort(key=lambda a: (a["cliente"], a["arquivo"]))
+    return IndiceCompetencia(pasta=pasta, arquivos=arquivos, clientes=clientes, assinatura=_assinatura(pasta, clientes))
+
+
+_cache_competencias: Dict[str, IndiceCompetencia] = {}
+_cache_lock = threading.Lock()
+
+
+def obter_indice_competencia(pasta_competencia: str) -> IndiceCompetencia:
+    """
+    Índice de arquivos da competência, em cache no processo (compartilhado entre sessões).
+    A cada chamada só os mtimes das pastas são conferidos; a varredura completa
+    acontece apenas quando algo mudou.
+    """
+    pasta = os.path.abspath(pasta_competencia)
+    with _cache_lock:
+        atual = _cache_competencias.get(pasta)
+    if atual is not None and _assinatura(pasta, atual.clientes) == atual.assinatura:
+        return atual
+
+    novo = _montar_indice_competencia(pasta)
+    with _cache_lock:
+        _cache_competencias[pasta] = novo
+    return novo
@@ -0,0 +1,407 @@
+# job_manager.py
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+import bot_logging
+import config as cfgmod
+import data_store
+import escalonamento
+import eta
+import execucao_paralela
+import progress
+import run_ledger
+
+log = bot_logging.obter_logger("jobs")
+
+JOBS_PATH_DEFAULT = "jobs.json"
+MAX_HISTORICO = 200
+
+# Status do job
+NA_FILA = "NA FILA"
+EM_EXECUCAO = "EM EXECUÇÃO"
+CONCLUIDO = "CONCLUÍDO"
+FALHA = "FALHA"
+INTERROMPIDO = "INTERROMPIDO"
+
+ATIVOS = (NA_FILA, EM_EXECUCAO)
+
+
+# ----------------------------
+# Execução do robô (worker)
+# ----------------------------
+def patch_bot_paths(cfg: cfgmod.AppConfig):
+    """
+    Mantém o bot original e só padroniza caminhos.
+    """
+    import bot_nfse
+
+    # Padrão de produção: usar Selenium Manager (Selenium>=4.6) e evitar binário errado/corrompido do webdriver_manager
+    # Isso mitiga o clássico [WinError 193] ao iniciar o ChromeDriver.
+    try:
+        bot_nfse.USE_WEBDRIVER_MANAGER = False
+    except Exception:
+        pass
+
+    bot_nfse.CAMINHO_PLANILHA = os.path.abspath(cfg.caminho_planilha)
+    bot_nfse.PASTA_BASE_SAIDA = os.path.abspath(cfg.pasta_base_saida)
+    bot_nfse.PASTA_DOWNLOAD_TEMP = os.path.abspath(cfg.pasta_download_temp)
+    bot_nfse.PASTA_IMAGENS_CERT = os.path.abspath(cfg.pasta_imagens_cert)
+    bot_nfse.DELAY_ACAO = float(cfg.delay_acao)
+    bot_nfse.LAYOUT_SAIDA = cfg.layout_saida
+    bot_nfse.MODO_CERTIFICADO = cfg.modo_certificado
+    bot_nfse.ABAS_VISUALIZAR = int(cfg.abas_visualizar)
+
+    os.makedirs(bot_nfse.PASTA_DOWNLOAD_TEMP, exist_ok=True)
+    os.makedirs(bot_nfse.PASTA_BASE_SAIDA, exist_ok=True)
+    os.makedirs(bot_nfse.PASTA_IMAGENS_CERT, exist_ok=True)
+
+    return bot_nfse
+
+
+def run_bot_job(
+    cfg: cfgmod.AppConfig,
+    ano: int,
+    mes: int,
+    empresas: List[str],
+    canal: progress.CanalProgresso,
+    stop_evt: threading.Event,
+    usuario: str = "",
+    origem: str = "ui",
+    formato_log: str = "xlsx",
+) -> str:
+    """
+    Worker thread: NÃO chama st.* (evita 'missing ScriptRunContext').
+    Progresso é comunicado pelo CanalProgresso. Retorna o id da execução.
+    """
+    execucao = bot_logging.configurar_execucao(
+        os.path.abspath(cfg.pasta_base_saida), canal=canal, prefixo=f"job_{ano:04d}-{mes:02d}"
+    )
+    try:
+        with bot_logging.contexto(execucao=execucao.id, competencia=f"{ano:04d}-{mes:02d}"):
+            _executar_clientes(cfg, ano, mes, empresas, canal, stop_evt, execucao.id, usuario, origem, formato_log)
+    finally:
+        execucao.encerrar()
+    return execucao.id
+
+
+def _linha_status(cliente: Dict) -> Dict[str, Any]:
+    return {
+        "EMPRESA": cliente.get("EMPRESA", ""),
+        "CNPJ": cliente.get("CNPJ", ""),
+        "PREFEITURA": cliente.get("PREFEITURA", ""),
+        "TIPO_ACESSO": cliente.get("TIPO_ACESSO", ""),
+    }
+
+
+def _executar_clientes(
+    cfg, ano, mes, empresas, canal, stop_evt, execucao_id: str, usuario: str, origem: str, formato_log: str
+) -> None:
+    try:
+        bot_nfse = patch_bot_paths(cfg)
+        data_store.garantir_planilha_modelo(cfg.caminho_planilha)
+
+        clientes = bot_nfse.carregar_clientes_da_planilha()
+        clientes = [c for c in clientes if c.get("EMPRESA") in empresas]
+
+        if not clientes:
+            canal.falhar("Nenhum cliente selecionado (ou nenhum ATIVO).")
+            return
+
+        bot = bot_nfse.NFSePortalBot(ano, mes)
+        bot.callback_nota = lambda cliente, info: canal.nota_baixada(cliente.get("EMPRESA", ""), info.get("bytes", 0))
+        bot.execucao_id = execucao_id
+        canal.iniciar(bot.pasta_competencia, len(clientes))
+        bot._historico(run_ledger.iniciar_execucao, execucao_id, bot.competencia_str, len(clientes), origem=origem, usuario=usuario)
+
+        plano = None
+        com_display = execucao_paralela.suportado()
+        workers = cfg.workers_paralelos if com_display else 1
+        if cfg.workers_paralelos > 1 and not com_display:
+            log.warning("Modo paralelo requer Linux com Xvfb; executando um cliente por vez.")
+
+        if workers > 1 or cfg.isolar_clientes:
+            if workers > 1:
+                plano = escalonamento.planejar(os.path.abspath(cfg.pasta_base_saida), clientes, workers)
+                clientes = plano.clientes
+                canal.planejar(plano.makespan_previsto_s)
+                log.info(
+                    f"Despacho por duração esperada (maiores primeiro): término previsto em "
+                    f"{eta.formatar_duracao(plano.makespan_previsto_s)} (na ordem da planilha: "
+                    f"{eta.formatar_duracao(plano.makespan_ordem_original_s)}); "
+                    f"{len(plano.sem_historico)} cliente(s) sem histórico."
+                )
+                log.info(f"Modo paralelo: até {workers} cliente(s) ao mesmo tempo, cada um com sua tela virtual.")
+            else:
+                log.info("Modo isolado: cada cliente num processo próprio, supervisionado.")
+            execucao_paralela.processar_clientes(
+                cfg, ano, mes, clientes, workers, execucao_id,
+                ao_iniciar=lambda c: canal.cliente_inicio(c.get("EMPRESA", ""), _linha_status(c)),
+                ao_finalizar=canal.cliente_fim,
+                ao_baixar_nota=canal.nota_baixada,
+                parar=stop_evt.is_set,
+                limites=execucao_paralela.limites_de(cfg),
+                com_display=com_display,
+            )
+        else:
+            for c in clientes:
+                if stop_evt.is_set():
+                    log.info("Execução interrompida pelo operador.")
+                    break
+
+                empresa = c.get("EMPRESA", "")
+                canal.cliente_inicio(empresa, _linha_status(c))
+
+                try:
+                    bot._processar_cliente(c)
+                    m = bot.metricas
+                    if m is not None and m.status != run_ledger.OK:
+                        canal.cliente_fim(empresa, "FALHA", m.detalhe or m.status)
+                    else:
+                        canal.cliente_fim(empresa, "OK")
+                except Exception as e:
+                    log.exception(f"Falha no cliente {empresa}: {e}")
+                    canal.cliente_fim(empresa, "FALHA", str(e))
+
+        if plano is not None:
+            real = escalonamento.makespan_real(canal.snapshot(ultimos_logs=0)["status"])
+            if real is not None:
+                log.info(
+                    f"Duração dos clientes: prevista {eta.formatar_duracao(plano.makespan_previsto_s)}, "
+                    f"real {eta.formatar_duracao(real)}."
+                )
+
+        status_execucao = INTERROMPIDO if stop_evt.is_set() else CONCLUIDO
+        bot._historico(run_ledger.finalizar_execucao, execucao_id, status_execucao)
+
+        caminho_log = bot.log_writer.finalizar(formato_log)
+        if caminho_log:
+            log.info(f"Log salvo em: {caminho_log}")
+
+        canal.concluir()
+
+    except Exception as e:
+        log.exception(f"Execução abortada: {e}")
+        try:
+            run_ledger.finalizar_execucao(os.path.abspath(cfg.pasta_base_saida), execucao_id, FALHA)
+        except Exception:
+            pass
+        canal.falhar(str(e))
+
+
+# ----------------------------
+# Registro de jobs
+# ----------------------------
+@dataclass
+class Job:
+    id: str
+    ano: int
+    mes: int
+    empresas: List[str]
+    usuario: str = ""
+    status: str = NA_FILA
+    criado_em: float = field(default_factory=time.time)
+    iniciado_em: Optional[float] = None
+    finalizado_em: Optional[float] = None
+    progresso: Dict[str, Any] = field(default_factory=dict)
+    erro: Optional[str] = None
+
+    @property
+    def competencia(self) -> str:
+        return f"{self.ano:04d}-{self.mes:02d}"
+
+    def resumo(self) -> Dict[str, Any]:
+        fim = self.finalizado_em or time.time()
+        return {
+            "id": self.id,
+            "competencia": self.competencia,
+            "status": self.status,
+            "clientes": len(self.empresas),
+            "concluidos": self.progresso.get("clientes_concluidos", 0),
+            "notas": self.progresso.get("notas", 0),
+            "usuario": self.usuario,
+            "criado_em": time.strftime("%d/%m %H:%M", time.localtime(self.criado_em)),
+            "duracao_min": round((fim - self.iniciado_em) / 60, 1) if self.iniciado_em else None,
+            "erro": self.erro or "",
+        }
+
+
+class GerenciadorJobs:
+    """
+    Gerenciador de execuções do processo (fora do st.session_state).
+
+    - registro persistido em JSON: recarregar a aba ou abrir outra sessão enxerga o mesmo job
+    - no máximo `capacidade` jobs rodando; os demais ficam NA FILA
+    - dois jobs da mesma competência nunca rodam juntos (o segundo espera na fila)
+    """
+
+    def __init__(self, caminho_registro: str = JOBS_PATH_DEFAULT, capacidade: int = 1):
+        self.caminho_registro = caminho_registro
+        self.capacidade = max(1, int(capacidade))
+
+        self._lock = threading.RLock()
+        self._jobs: Dict[str, Job] = {}
+        self._cfgs: Dict[str, cfgmod.AppConfig] = {}
+        self._canais: Dict[str, progress.CanalProgresso] = {}
+        self._stops: Dict[str, threading.Event] = {}
+        self._ultima_gravacao = 0.0
+
+        self._carregar()
+
+    # ---------- persistência ----------
+
+    def _carregar(self) -> None:
+        if not os.path.exists(self.caminho_registro):
+            return
+        try:
+            with open(self.caminho_registro, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for rec in data.get("jobs", []):
+            try:
+                job = Job(**rec)
+            except TypeError:
+                continue
+            # jobs de um processo anterior não têm mais thread: ficam registrados como interrompidos
+            if job.status in ATIVOS:
+                job.status = INTERROMPIDO
+                job.erro = job.erro or "Servidor reiniciado durante a execução."
+                job.finalizado_em = job.finalizado_em or time.time()
+            self._jobs[job.id] = job
+
+    def _gravar(self, forcar: bool = True) -> None:
+        agora = time.time()
+        if not forcar and agora - self._ultima_gravacao < 5.0:
+            return
+        self._ultima_gravacao = agora
+        jobs = sorted(self._jobs.values(), key=lambda j: j.criado_em)[-MAX_HISTORICO:]
+        tmp = self.caminho_registro + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"jobs": [asdict(j) for j in jobs]}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.caminho_registro)
+        except OSError as e:
+            log.warning(f"Não consegui gravar o registro de jobs ({self.caminho_registro}): {e}")
+
+    # ---------- API ----------
+
+    def submeter(self, cfg: cfgmod.AppConfig, ano: int, mes: int, empresas: List[str], usuario: str = "") -> Job:
+        job = Job(id=uuid.uuid4().hex[:8], ano=int(ano), mes=int(mes), empresas=list(empresas), usuario=usuario)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._cfgs[job.id] = cfg
+            canal = progress.CanalProgresso(observador=lambda snap, jid=job.id: self._ao_progresso(jid, snap))
+            canal.log(f"[INFO] Job {job.id} na fila (competência {job.competencia}, {len(job.empresas)} cliente(s)).")
+            self._canais[job.id] = canal
+            self._stops[job.id] = threading.Event()
+            self._gravar()
+            self._despachar()
+        return job
+
+    def parar(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if job.status == NA_FILA:
+                job.status = INTERROMPIDO
+                job.finalizado_em = time.time()
+                self._cfgs.pop(job_id, None)
+                self._canais[job_id].concluir()
+                self._gravar()
+            elif job_id in self._stops:
+                self._stops[job_id].set()
+
+    def obter(self, job_id: Optional[str]) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def canal(self, job_id: Optional[str]) -> Optional[progress.CanalProgresso]:
+        with self._lock:
+            return self._canais.get(job_id) if job_id else None
+
+    def listar(self, somente_ativos: bool = False) -> List[Job]:
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: j.criado_em, reverse=True)
+        if somente_ativos:
+            jobs = [j for j in jobs if j.status in ATIVOS]
+        return jobs
+
+    def tem_ativo(self) -> bool:
+        return bool(self.listar(somente_ativos=True))
+
+    # ---------- agendamento ----------
+
+    def _despachar(self) -> None:
+        """Inicia jobs da fila enquanto houver capacidade e a competência estiver livre."""
+        with self._lock:
+            rodando = [j for j in self._jobs.values() if j.status == EM_EXECUCAO]
+            ocupadas = {j.competencia for j in rodando}
+            fila = sorted((j for j in self._jobs.values() if j.status == NA_FILA), key=lambda j: j.criado_em)
+            for job in fila:
+                if len(rodando) >= self.capacidade:
+                    break
+                if job.competencia in ocupadas or job.id not in self._cfgs:
+                    continue
+                job.status = EM_EXECUCAO
+                job.iniciado_em = time.time()
+                rodando.append(job)
+                ocupadas.add(job.competencia)
+                t = threading.Thread(target=self._executar, args=(job.id,), daemon=True, name=f"job-{job.id}")
+                t.start()
+            self._gravar()
+
+    def _executar(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            cfg = self._cfgs[job_id]
+            canal = self._canais[job_id]
+            stop_evt = self._stops[job_id]
+
+        canal.iniciar(None, len(job.empresas))
+        try:
+            run_bot_job(cfg, job.ano, job.mes, job.empresas, canal, stop_evt, usuario=job.usuario)
+        finally:
+            snap = canal.snapshot(ultimos_logs=0)
+            with self._lock:
+                job.progresso = snap.get("contadores", {})
+                job.finalizado_em = time.time()
+                if snap.get("error"):
+                    job.status, job.erro = FALHA, snap["error"]
+                elif stop_evt.is_set():
+                    job.status = INTERROMPIDO
+                else:
+                    job.status = CONCLUIDO
+                self._cfgs.pop(job_id, None)
+                self._gravar()
+            self._despachar()
+
+    def _ao_progresso(self, job_id: str, snap: Dict[str, Any]) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.progresso = snap.get("contadores", {})
+                self._gravar(forcar=False)
+
+
+_gerenciador: Optional[GerenciadorJobs] = None
+_gerenciador_lock = threading.Lock()
+
+
+def obter_gerenciador(caminho_registro: str = JOBS_PATH_DEFAULT) -> GerenciadorJobs:
+    """
+    Singleton do processo. Módulos importados sobrevivem aos reruns do Streamlit,
+    então todas as sessões/abas compartilham o mesmo gerenciador.
+    Capacidade: PORTALNFSE_MAX_JOBS (padrão 1; as execuções dividem a pasta de download).
+    """
+    global _gerenciador
+    with _gerenciador_lock:
+        if _gerenciador is None:
+            capacidade = int(os.environ.get("PORTALNFSE_MAX_JOBS", "1") or 1)
+            _gerenciador = GerenciadorJobs(caminho_registro, capacidade=capacidade)
+        return _gerenciador
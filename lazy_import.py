@@ -0,0 +1,115 @@
+# lazy_import.py
+import importlib
+import importlib.util
+import threading
+import types
+from typing import Any, Callable, Optional
+
+# Dependências pesadas (pandas, Selenium, pyautogui, Tesseract) só são importadas no primeiro uso.
+# Se faltarem, o erro aparece ali, dizendo qual recurso precisa delas, e não na subida do app.
+
+_lock = threading.RLock()
+
+
+def _importar(nome: str, recurso: str, pacote_pip: Optional[str]) -> types.ModuleType:
+    try:
+        return importlib.import_module(nome)
+    except Exception as e:
+        # pyautogui, por exemplo, levanta KeyError/Xlib sem DISPLAY: tudo vira ImportError com o recurso
+        pip = pacote_pip or nome.split(".")[0]
+        raise ImportError(f"'{nome}' é necessário para {recurso}. Instale com: pip install {pip} ({e})") from e
+
+
+class ModuloTardio(types.ModuleType):
+    """
+    Substituto de um módulo que só faz o import real no primeiro acesso a um atributo.
+
+    ao_carregar(mod) roda uma vez, logo após o import (ex.: pg.FAILSAFE = True).
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        recurso: str = "",
+        pacote_pip: Optional[str] = None,
+        ao_carregar: Optional[Callable[[types.ModuleType], None]] = None,
+    ):
+        super().__init__(nome)
+        self.__dict__.update(
+            _nome=nome,
+            _recurso=recurso or nome,
+            _pacote_pip=pacote_pip,
+            _ao_carregar=ao_carregar,
+            _modulo=None,
+        )
+
+    def _carregar(self) -> types.ModuleType:
+        mod = self.__dict__["_modulo"]
+        if mod is not None:
+            return mod
+        with _lock:
+            mod = self.__dict__["_modulo"]
+            if mod is None:
+                mod = _importar(self._nome, self._recurso, self._pacote_pip)
+                if self._ao_carregar is not None:
+                    self._ao_carregar(mod)
+                self.__dict__["_modulo"] = mod
+        return mod
+
+    @property
+    def carregado(self) -> bool:
+        return self.__dict__["_modulo"] is not None
+
+    def __getattr__(self, atributo: str) -> Any:
+        return getattr(self._carregar(), atributo)
+
+    def __setattr__(self, atributo: str, valor: Any) -> None:
+        setattr(self._carregar(), atributo, valor)
+
+    def __repr__(self) -> str:
+        estado = "carregado" if self.carregado else "não carregado"
+        return f"<módulo tardio '{self._nome}' ({estado})>"
+
+
+class ObjetoTardio:
+    """Atributo de módulo (classe/função) resolvido no primeiro uso: By.XPATH, Options(), ..."""
+
+    def __init__(self, modulo: ModuloTardio, nome: str):
+        self._modulo = modulo
+        self._nome = nome
+        self._alvo: Any = None
+
+    def _resolver(self) -> Any:
+        if self._alvo is None:
+            self._alvo = getattr(self._modulo, self._nome)
+        return self._alvo
+
+    def __getattr__(self, atributo: str) -> Any:
+        return getattr(self._resolver(), atributo)
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return self._resolver()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"<{self._modulo._nome}.{self._nome} (tardio)>"
+
+
+def modulo(
+    nome: str,
+    recurso: str = "",
+    pacote_pip: Optional[str] = None,
+    ao_carregar: Optional[Callable[[types.ModuleType], None]] = None,
+) -> ModuloTardio:
+    return ModuloTardio(nome, recurso, pacote_pip, ao_carregar)
+
+
+def objeto(nome_modulo: str, nome: str, recurso: str = "", pacote_pip: Optional[str] = None) -> ObjetoTardio:
+    return ObjetoTardio(ModuloTardio(nome_modulo, recurso, pacote_pip), nome)
+
+
+def disponivel(nome: str) -> bool:
+    """Sem importar: só verifica se o pacote está instalado."""
+    try:
+        return importlib.util.find_spec(nome) is not None
+    except (ImportError, ValueError):
+        return False
@@ -0,0 +1,218 @@
+# log_writer.py
+import json
+import os
+import threading
+from typing import Dict, Iterator, Optional
+
+import bot_logging
+
+log = bot_logging.obter_logger("log_writer")
+
+COLUNAS_LOG_ORDEM = [
+    "NUMERO_NF",
+    "DATA_EMISSAO",
+    "DATA_COMPETENCIA",
+    "CNPJ_PRESTADOR",
+    "RAZAO_PRESTADOR",
+    "CNPJ_TOMADOR",
+    "RAZAO_TOMADOR",
+    "OPTANTE_SN",
+    "CODIGO_TRIBUTACAO_NACIONAL",
+    "VALOR_SERVICO",
+    "IR",
+    "ISS",
+    "ISS_RETIDO",
+    "CSLL",
+    "DEDUCOES",
+    "PIS",
+    "COFINS",
+    "INSS",
+    "DESC_INCOND",
+    "DESC_COND",
+    "OUTRAS_RET",
+    "ALIQUOTA",
+    "BASE_CALCULO",
+    "VALOR_LIQUIDO",
+    "SITUACAO",
+]
+
+
+def caminho_journal(pasta_competencia: str, competencia_str: str) -> str:
+    return os.path.join(pasta_competencia, f"LOG_NFSE_{competencia_str}.jsonl")
+
+
+def caminho_log_xlsx(pasta_competencia: str, competencia_str: str) -> str:
+    return os.path.join(pasta_competencia, f"LOG_NFSE_{competencia_str}.xlsx")
+
+
+def caminho_log_csv(pasta_competencia: str, competencia_str: str) -> str:
+    return os.path.join(pasta_competencia, f"LOG_NFSE_{competencia_str}.csv")
+
+
+# Formato do LOG ao fechar a competência: xlsx (padrão), csv (;, UTF-8 com BOM para o Excel) ou só o journal
+FORMATOS_LOG = ("xlsx", "csv", "jsonl")
+
+
+def ler_journal(caminho: str) -> Iterator[Dict]:
+    """
+    Lê o journal linha a linha (sem carregar o arquivo inteiro).
+    Uma última linha truncada (queda no meio da escrita) é ignorada.
+    """
+    if not os.path.exists(caminho):
+        return
+    with open(caminho, "r", encoding="utf-8") as f:
+        for linha in f:
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                yield json.loads(linha)
+            except ValueError:
+                continue
+
+
+def _termina_sem_quebra(caminho: str) -> bool:
+    try:
+        with open(caminho, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+    except OSError:
+        return False
+
+
+def chave_registro(registro: Dict, posicao: int):
+    """
+    Chave de deduplicação: mesma NF do mesmo prestador (reprocessamento da competência)
+    fica só com a versão mais recente. Sem número, cada linha vale por si.
+    """
+    numero = str(registro.get("NUMERO_NF") or "").strip()
+    if not numero or numero == "SEM_NUMERO":
+        return ("_linha", posicao)
+    return (str(registro.get("CNPJ_PRESTADOR") or "").strip(), numero)
+
+
+def reconstruir_log_xlsx(pasta_competencia: str, competencia_str: str) -> Optional[str]:
+    """
+    Gera o LOG_NFSE_AAAA-MM.xlsx a partir do journal, em modo write-only do openpyxl
+    (memória constante: as linhas vão direto para o arquivo).
+
+    Retorna o caminho do xlsx, ou None se não houver registros.
+    """
+    from openpyxl import Workbook
+
+    journal = caminho_journal(pasta_competencia, competencia_str)
+
+    # 1ª passada: só as chaves (pequenas) -> posição da última ocorrência
+    ultima: Dict = {}
+    for pos, registro in enumerate(ler_journal(journal)):
+        ultima[chave_registro(registro, pos)] = pos
+    if not ultima:
+        return None
+    manter = set(ultima.values())
+
+    destino = caminho_log_xlsx(pasta_competencia, competencia_str)
+    tmp = destino + ".tmp"
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title="Sheet1")
+    ws.append(COLUNAS_LOG_ORDEM)
+    for pos, registro in enumerate(ler_journal(journal)):
+        if pos in manter:
+            ws.append([registro.get(c) for c in COLUNAS_LOG_ORDEM])
+    wb.save(tmp)
+
+    # troca atômica: um xlsx antigo nunca fica pela metade
+    os.replace(tmp, destino)
+    return destino
+
+
+def reconstruir_log_csv(pasta_competencia: str, competencia_str: str) -> Optional[str]:
+    """Mesmo conteúdo do xlsx (deduplicado), em CSV, linha a linha."""
+    import csv
+
+    journal = caminho_journal(pasta_competencia, competencia_str)
+    ultima: Dict = {}
+    for pos, registro in enumerate(ler_journal(journal)):
+        ultima[chave_registro(registro, pos)] = pos
+    if not ultima:
+        return None
+    manter = set(ultima.values())
+
+    destino = caminho_log_csv(pasta_competencia, competencia_str)
+    tmp = destino + ".tmp"
+    with open(tmp, "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(COLUNAS_LOG_ORDEM)
+        for pos, registro in enumerate(ler_journal(journal)):
+            if pos in manter:
+                w.writerow(["" if registro.get(c) is None else registro.get(c) for c in COLUNAS_LOG_ORDEM])
+    os.replace(tmp, destino)
+    return destino
+
+
+class LogStreamWriter:
+    """
+    LOG da competência gravado de forma incremental.
+
+    Cada NFS-e concluída vira uma linha JSON no journal (append + fsync), então
+    uma queda no meio da execução não perde o que já foi baixado. O xlsx final
+    é montado a partir do journal em finalizar().
+    """
+
+    def __init__(self, pasta_competencia: str, competencia_str: str):
+        self.pasta_competencia = pasta_competencia
+        self.competencia_str = competencia_str
+        self.caminho_journal = caminho_journal(pasta_competencia, competencia_str)
+        self.total = 0  # registros gravados nesta execução
+
+        self._lock = threading.Lock()
+        self._arquivo = None
+
+    def adicionar(self, registro: Dict) -> None:
+        linha = json.dumps({c: registro.get(c) for c in COLUNAS_LOG_ORDEM}, ensure_ascii=False)
+        with self._lock:
+            if self._arquivo is None:
+                os.makedirs(self.pasta_competencia, exist_ok=True)
+                self._arquivo = open(self.caminho_journal, "a", encoding="utf-8")
+                if _termina_sem_quebra(self.caminho_journal):
+                    # linha truncada de uma queda anterior: isola para não corromper a próxima
+                    self._arquivo.write("\n")
+            self._arquivo.write(linha + "\n")
+            self._arquivo.flush()
+            os.fsync(self._arquivo.fileno())
+            self.total += 1
+
+    def fechar(self) -> None:
+        with self._lock:
+            if self._arquivo is not None:
+                try:
+                    self._arquivo.close()
+                finally:
+                    self._arquivo = None
+
+    def finalizar(self, formato: str = "xlsx") -> Optional[str]:
+        """
+        Fecha o journal e (re)gera o LOG com tudo o que já está nele,
+        inclusive linhas de execuções anteriores interrompidas.
+
+        formato "jsonl": só fecha o journal (ex.: shards que serão juntados depois).
+        """
+        self.fechar()
+        if formato == "jsonl":
+            return self.caminho_journal if os.path.exists(self.caminho_journal) else None
+        if formato == "csv":
+            caminho = reconstruir_log_csv(self.pasta_competencia, self.competencia_str)
+        else:
+            caminho = reconstruir_log_xlsx(self.pasta_competencia, self.competencia_str)
+        if caminho:
+            try:
+                from dataset_export import exportar_competencia
+
+                exportar_competencia(os.path.dirname(self.pasta_competencia), self.competencia_str)
+            except Exception as e:
+                # dataset colunar é derivado; o LOG xlsx continua sendo a saída oficial
+                log.warning(f"Falha ao exportar dataset colunar da competência: {e}")
+        return caminho
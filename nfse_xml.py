@@ -0,0 +1,299 @@
+# nfse_xml.py
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Optional
+
+import bot_logging
+
+# Leitura do XML da NFS-e (padrão nacional). Separado do robô para que catálogo/backfill
+# consigam ler XMLs sem importar Selenium/pyautogui.
+
+log = bot_logging.obter_logger("nfse_xml")
+
+
+def _parse_valor_monetario(texto: Optional[str]) -> Optional[float]:
+    """
+    Parser de valor robusto para:
+    - "281.31"
+    - "281,31"
+    - "1.234,56"
+    - "R$ 1.234,56"
+    """
+    if not texto:
+        return None
+    s = texto.strip()
+    if not s:
+        return None
+    s = s.replace("R$", "").strip()
+
+    # Se tiver . e , assume padrão brasileiro (1.234,56)
+    if "." in s and "," in s:
+        s = s.replace(".", "").replace(",", ".")
+    # Se tiver só , assume que é decimal
+    elif "," in s and "." not in s:
+        s = s.replace(",", ".")
+
+    s = re.sub(r"[^\d\.\-]", "", s)
+    if not s or s in (".", "-", ".-"):
+        return None
+    try:
+        return float(s)
+    except Exception:
+        return None
+
+
+def _formatar_data_iso_para_br(data_str: Optional[str]) -> Optional[str]:
+    """
+    Converte 'YYYY-MM-DD' ou 'YYYY-MM-DDTHH:MM...' para 'DD/MM/YYYY'.
+    """
+    if not data_str:
+        return None
+    m = re.match(r"(\d{4})-(\d{2})-(\d{2})", data_str)
+    if not m:
+        return None
+    ano, mes, dia = m.groups()
+    return f"{dia}/{mes}/{ano}"
+
+
+def _formatar_id_para_excel(id_str: Optional[str]) -> Optional[str]:
+    """
+    Formata CNPJ/CPF como string para não virar notação científica no Excel.
+    Retorna algo como: '01234567000189 (com apóstrofo).
+    """
+    if not id_str:
+        return None
+    digits = re.sub(r"\D", "", id_str)
+    if not digits:
+        return None
+    return f"'{digits}"
+
+
+def extrair_dados_nfse_do_xml(caminho_xml: str) -> Dict[str, Optional[str]]:
+    """
+    Extrai dados relevantes da NFS-e (layout NFSe Nacional) para o relatório:
+
+    - numero_nf
+    - data_emissao (DD/MM/AAAA)
+    - data_competencia (DD/MM/AAAA quando disponível)
+    - cnpj_prestador, razao_prestador
+    - cnpj_tomador, razao_tomador
+    - optante_sn (S/N)
+    - codigo_trib_nacional
+    - valor_servico
+    - ir, iss, iss_retido, csll, deducoes, pis, cofins, inss
+    - desc_incond, desc_cond
+    - outras_retencoes
+    - aliquota
+    - base_calculo
+    - valor_liquido
+    - situacao (NORMAL / CANCELADA / COD_xxx)
+    """
+    dados = {k: None for k in [
+        "numero_nf",
+        "data_emissao",
+        "data_competencia",
+        "cnpj_prestador",
+        "razao_prestador",
+        "cnpj_tomador",
+        "razao_tomador",
+        "optante_sn",
+        "codigo_trib_nacional",
+        "valor_servico",
+        "ir",
+        "iss",
+        "iss_retido",
+        "csll",
+        "deducoes",
+        "pis",
+        "cofins",
+        "inss",
+        "desc_incond",
+        "desc_cond",
+        "outras_retencoes",
+        "aliquota",
+        "base_calculo",
+        "valor_liquido",
+        "situacao",
+    ]}
+
+    try:
+        tree = ET.parse(caminho_xml)
+        root = tree.getroot()
+    except Exception as e:
+        log.warning(f"Não consegui ler o XML '{caminho_xml}': {e}")
+        return dados
+
+    if "}" in root.tag:
+        ns_uri = root.tag.split("}")[0].strip("{")
+        ns = {"n": ns_uri}
+    else:
+        ns = {"n": ""}
+
+    def get_text(xpath: str) -> Optional[str]:
+        try:
+            el = root.find(xpath, ns)
+        except Exception:
+            el = None
+        if el is not None and el.text:
+            t = el.text.strip()
+            return t or None
+        return None
+
+    # Número da NF
+    numero_raw = None
+    for xp in [".//n:nNFSe", ".//n:nDFSe", ".//n:nDPS"]:
+        t = get_text(xp)
+        if t:
+            numero_raw = t
+            break
+
+    if numero_raw:
+        dig = re.sub(r"\D", "", numero_raw)
+        dados["numero_nf"] = dig.lstrip("0") or dig
+
+    # Datas
+    dh_emi = get_text(".//n:DPS/n:infDPS/n:dhEmi") or get_text(".//n:dhProc")
+    d_comp = get_text(".//n:DPS/n:infDPS/n:dCompet")
+
+    dados["data_emissao"] = _formatar_data_iso_para_br(dh_emi)
+    dados["data_competencia"] = _formatar_data_iso_para_br(d_comp)
+
+    # Prestador
+    emit = root.find(".//n:emit", ns)
+    if emit is not None:
+        for tagname in ("CNPJ", "CPF", "NIF"):
+            el = emit.find(f"n:{tagname}", ns)
+            if el is not None and el.text:
+                dados["cnpj_prestador"] = re.sub(r"\D", "", el.text)
+                break
+        xN = emit.find("n:xNome", ns)
+        if xN is not None and xN.text:
+            dados["razao_prestador"] = xN.text.strip().upper()
+
+    # Tomador
+    toma = root.find(".//n:DPS/n:infDPS/n:toma", ns)
+    if toma is not None:
+        for tagname in ("CNPJ", "CPF", "NIF"):
+            el = toma.find(f"n:{tagname}", ns)
+            if el is not None and el.text:
+                dados["cnpj_tomador"] = re.sub(r"\D", "", el.text)
+                break
+        xN = toma.find("n:xNome", ns)
+        if xN is not None and xN.text:
+            dados["razao_tomador"] = xN.text.strip().upper()
+
+    # Optante Simples Nacional
+    op_simp = get_text(".//n:DPS/n:infDPS/n:prest/n:regTrib/n:opSimpNac")
+    if op_simp:
+        # Heurística: 1 = Não optante / 2 ou 3 = Optante
+        dados["optante_sn"] = "S" if op_simp in ("2", "3") else "N"
+
+    # Código de Tributação Nacional
+    codigo_trib = get_text(".//n:DPS/n:infDPS/n:serv/n:cServ/n:cTribNac") or get_text(".//n:cTribNac")
+    if codigo_trib:
+        dados["codigo_trib_nacional"] = codigo_trib.strip()
+
+    # Valores principais
+    v_serv = get_text(".//n:DPS/n:infDPS/n:valores/n:vServPrest/n:vServ")
+    dados["valor_servico"] = _parse_valor_monetario(v_serv) if v_serv else None
+
+    v_bc = get_text(".//n:infNFSe/n:valores/n:vBC")
+    dados["base_calculo"] = _parse_valor_monetario(v_bc) if v_bc else None
+
+    v_liq = get_text(".//n:infNFSe/n:valores/n:vLiq")
+    dados["valor_liquido"] = _parse_valor_monetario(v_liq) if v_liq else None
+
+    v_total_ret_txt = get_text(".//n:infNFSe/n:valores/n:vTotalRet")
+    v_total_ret = _parse_valor_monetario(v_total_ret_txt) if v_total_ret_txt else None
+
+    # Alíquota ISS (quando vier)
+    aliq_txt = get_text(".//n:DPS/n:infDPS/n:valores/n:trib/n:tribMun/n:pAliq")
+    dados["aliquota"] = _parse_valor_monetario(aliq_txt) if aliq_txt else None
+
+    # ISS e ISS Retido
+    v_iss_txt = get_text(".//n:infNFSe/n:valores/n:vISSQN") or get_text(".//n:valores/n:vISSQN")
+    dados["iss"] = _parse_valor_monetario(v_iss_txt) if v_iss_txt else None
+
+    v_iss_ret_txt = None
+    for elem in root.iter():
+        tag = elem.tag.split('}')[-1].lower()
+        txt = (elem.text or "").strip()
+        if not txt:
+            continue
+        if tag in ("vissqnret", "vretissqn"):
+            v_iss_ret_txt = txt
+            break
+    dados["iss_retido"] = _parse_valor_monetario(v_iss_ret_txt) if v_iss_ret_txt else None
+
+    # Tributos federais
+    tribFed = root.find(".//n:DPS/n:infDPS/n:valores/n:trib/n:tribFed", ns)
+    if tribFed is not None:
+        piscofins = tribFed.find("n:piscofins", ns)
+        if piscofins is not None:
+            vpis = piscofins.find("n:vPis", ns)
+            vcof = piscofins.find("n:vCofins", ns)
+            if vpis is not None and vpis.text:
+                dados["pis"] = _parse_valor_monetario(vpis.text)
+            if vcof is not None and vcof.text:
+                dados["cofins"] = _parse_valor_monetario(vcof.text)
+        vRetCSLL = tribFed.find("n:vRetCSLL", ns)
+        if vRetCSLL is not None and vRetCSLL.text:
+            dados["csll"] = _parse_valor_monetario(vRetCSLL.text)
+
+        # INSS / IRRF se existirem
+        for elem in tribFed.iter():
+            tag = elem.tag.split('}')[-1].lower()
+            txt = (elem.text or "").strip()
+            if not txt:
+                continue
+            if tag in ("vretinss", "vinss"):
+                dados["inss"] = _parse_valor_monetario(txt)
+            if tag in ("vretir", "vretirrf", "virrf"):
+                dados["ir"] = _parse_valor_monetario(txt)
+
+    # Deduções / Descontos (somente tags vDesc*)
+    for elem in root.iter():
+        tag = elem.tag.split('}')[-1]
+        txt = (elem.text or "").strip()
+        if not txt or txt == "-":
+            continue
+        tag_low = tag.lower()
+        # Descontos incondicional/condicional
+        if tag_low.startswith("vdesc"):
+            if "cond" in tag_low:
+                if dados["desc_cond"] is None:
+                    dados["desc_cond"] = _parse_valor_monetario(txt)
+            else:
+                if dados["desc_incond"] is None:
+                    dados["desc_incond"] = _parse_valor_monetario(txt)
+        # Deduções
+        if "deduc" in tag_low or "dedu" in tag_low:
+            if dados["deducoes"] is None:
+                dados["deducoes"] = _parse_valor_monetario(txt)
+
+    # Outras retenções = vTotalRet - (IR + ISS_RET + CSLL + PIS + COFINS + INSS)
+    soma_explicita = 0.0
+    for k in ("ir", "iss_retido", "csll", "pis", "cofins", "inss"):
+        v = dados[k]
+        if isinstance(v, (int, float)):
+            soma_explicita += v
+
+    if v_total_ret is not None:
+        outras = v_total_ret - soma_explicita
+        if abs(outras) > 0.009:
+            dados["outras_retencoes"] = outras
+        else:
+            dados["outras_retencoes"] = 0.0
+    else:
+        dados["outras_retencoes"] = None
+
+    # Situação via cStat
+    cstat = get_text(".//n:infNFSe/n:cStat")
+    if cstat == "100":
+        dados["situacao"] = "NORMAL"
+    elif cstat in ("135", "136", "151"):
+        dados["situacao"] = "CANCELADA"
+    elif cstat:
+        dados["situacao"] = f"COD_{cstat}"
+
+    return dados
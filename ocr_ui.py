@@ -1,20 +1,91 @@
 # ocr_ui.py
+from __future__ import annotations
+
+import collections
+import hashlib
+import os
+import threading
 import time
+from dataclasses import astuple, dataclass
 from typing import Optional, Tuple, List, Dict
 
-import pyautogui as pg
-from PIL import Image
-import pytesseract
+import bot_logging
+import lazy_import
+
+log = bot_logging.obter_logger("ocr_ui")
+
+# Ajuste aqui o caminho do executável do Tesseract no seu Windows, se for diferente
+# (ou defina TESSERACT_CMD). Só é aplicado quando o OCR é usado pela primeira vez.
+TESSERACT_CMD = os.environ.get("TESSERACT_CMD", r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+
+
+def _configurar_tesseract(mod) -> None:
+    if TESSERACT_CMD and os.path.exists(TESSERACT_CMD):
+        mod.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+
+def _configurar_pyautogui(mod) -> None:
+    mod.FAILSAFE = True
+    mod.PAUSE = 0.2
+
+
+pg = lazy_import.modulo("pyautogui", "o OCR de tela", ao_carregar=_configurar_pyautogui)
+pytesseract = lazy_import.modulo("pytesseract", "o OCR de tela", ao_carregar=_configurar_tesseract)
+Image = lazy_import.modulo("PIL.Image", "o OCR de tela", pacote_pip="pillow")
+ImageFilter = lazy_import.modulo("PIL.ImageFilter", "o OCR de tela", pacote_pip="pillow")
+ImageOps = lazy_import.modulo("PIL.ImageOps", "o OCR de tela", pacote_pip="pillow")
+
+# A tela é lida em faixas horizontais sobrepostas: só as faixas que mudaram desde a captura anterior
+# voltam ao Tesseract. Com a sobreposição, uma linha de até SOBREPOSICAO px de altura cabe inteira
+# em alguma faixa.
+ALTURA_FAIXA = 160
+SOBREPOSICAO = 40
+
+# "Mudou" é decidido pelo conteúdo exato da faixa (blake2b dos pixels): um hash perceptual com tolerância
+# deixava passar texto pequeno aparecendo (item novo num diálogo) e a faixa nunca era relida.
+# O mesmo digest é a chave do cache de linhas (junto com o pré-processamento).
+MAX_CACHE = 512
+
+INTERVALO_POLLING = 0.8
+
+
+@dataclass(frozen=True)
+class Preprocessamento:
+    """
+    Ajustes da imagem antes do OCR (fazem parte da chave do cache).
+
+    escala: ampliar ajuda o Tesseract com fontes pequenas de diálogo (ex.: 2.0).
+    limiar: 0-255 binariza (preto/branco); None mantém tons de cinza.
+    inverter: texto claro em fundo escuro.
+    nitidez: filtro SHARPEN antes do limiar.
+    config: opções extras do Tesseract (ex.: "--psm 6").
+    """
+
+    escala: float = 1.0
+    limiar: Optional[int] = None
+    inverter: bool = False
+    nitidez: bool = False
+    config: str = ""
+
+    def aplicar(self, im: Image.Image) -> Image.Image:
+        im = im.convert("L")
+        if self.escala != 1.0:
+            w, h = im.size
+            im = im.resize((max(1, round(w * self.escala)), max(1, round(h * self.escala))), Image.LANCZOS)
+        if self.nitidez:
+            im = im.filter(ImageFilter.SHARPEN)
+        if self.inverter:
+            im = ImageOps.invert(im)
+        if self.limiar is not None:
+            limiar = int(self.limiar)
+            im = im.point(lambda v: 255 if v > limiar else 0)
+        return im
 
-# Ajuste aqui o caminho do executável do Tesseract no seu Windows, se for diferente:
-# Exemplo padrão:
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
-pg.FAILSAFE = True
-pg.PAUSE = 0.2
+PREPROCESSAMENTO_PADRAO = Preprocessamento()
 
 
-def _ocr_linhas(im: Image.Image) -> List[Dict]:
+def _ocr_linhas(im: Image.Image, config: str = "") -> List[Dict]:
     """
     Roda OCR na imagem e devolve uma lista de linhas com bounding box consolidado.
 
@@ -31,10 +102,11 @@ def _ocr_linhas(im: Image.Image) -> List[Dict]:
     # o idioma padrão (geralmente eng) é suficiente para ler nomes e "OK".
     data = pytesseract.image_to_data(
         im,
+        config=config,
         output_type=pytesseract.Output.DICT
     )
 
-    linhas: Dict[int, Dict] = {}
+    linhas: Dict[Tuple[int, int, int], Dict] = {}
     n = len(data["text"])
 
     for i in range(n):
@@ -42,14 +114,15 @@ def _ocr_linhas(im: Image.Image) -> List[Dict]:
         if not txt:
             continue
 
-        line_num = data["line_num"][i]
+        # line_num só é único dentro do bloco/parágrafo
+        chave = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
         left = data["left"][i]
         top = data["top"][i]
         w = data["width"][i]
         h = data["height"][i]
 
-        if line_num not in linhas:
-            linhas[line_num] = {
+        if chave not in linhas:
+            linhas[chave] = {
                 "text": txt,
                 "left": left,
                 "top": top,
@@ -57,75 +130,214 @@ def _ocr_linhas(im: Image.Image) -> List[Dict]:
                 "bottom": top + h,
             }
         else:
-            linhas[line_num]["text"] += " " + txt
-            linhas[line_num]["left"] = min(linhas[line_num]["left"], left)
-            linhas[line_num]["top"] = min(linhas[line_num]["top"], top)
-            linhas[line_num]["right"] = max(linhas[line_num]["right"], left + w)
-            linhas[line_num]["bottom"] = max(linhas[line_num]["bottom"], top + h)
+            linhas[chave]["text"] += " " + txt
+            linhas[chave]["left"] = min(linhas[chave]["left"], left)
+            linhas[chave]["top"] = min(linhas[chave]["top"], top)
+            linhas[chave]["right"] = max(linhas[chave]["right"], left + w)
+            linhas[chave]["bottom"] = max(linhas[chave]["bottom"], top + h)
 
     # retorna lista ordenada por posição vertical
     return sorted(linhas.values(), key=lambda x: x["top"])
 
 
+# ----------------------------
+# Cache de OCR / leitura incremental
+# ----------------------------
+_cache_lock = threading.Lock()
+_cache: "collections.OrderedDict[Tuple, List[Dict]]" = collections.OrderedDict()
+_contadores = {"faixas_ocr": 0, "faixas_cache": 0, "faixas_iguais": 0}
+
+
+def estatisticas(zerar: bool = False) -> Dict[str, int]:
+    """
+    faixas_ocr: faixas enviadas ao Tesseract; faixas_cache: lidas do cache por conteúdo;
+    faixas_iguais: reaproveitadas da captura anterior (pixels idênticos).
+    """
+    with _cache_lock:
+        atual = dict(_contadores)
+        if zerar:
+            for k in _contadores:
+                _contadores[k] = 0
+    return atual
+
+
+def limpar_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def _contar(chave: str) -> None:
+    with _cache_lock:
+        _contadores[chave] += 1
+
+
+def _digest(im: Image.Image) -> bytes:
+    """Digest exato dos pixels da faixa. Cursor piscando alterna entre dois digests, ambos no cache."""
+    return hashlib.blake2b(im.tobytes(), digest_size=16).digest()
+
+
+def _faixas(altura: int) -> List[Tuple[int, int, int, int]]:
+    """
+    (y0, y1, dono_y0, dono_y1) de cada faixa. Uma linha fica com a faixa cuja zona "dona"
+    contém o centro dela, para as áreas sobrepostas não duplicarem linhas.
+    """
+    if altura <= ALTURA_FAIXA:
+        return [(0, altura, 0, altura)]
+    passo = ALTURA_FAIXA - SOBREPOSICAO
+    faixas = []
+    y0 = 0
+    while True:
+        y1 = min(y0 + ALTURA_FAIXA, altura)
+        ultima = y1 >= altura
+        dono_y0 = 0 if y0 == 0 else y0 + SOBREPOSICAO // 2
+        dono_y1 = altura if ultima else y1 - SOBREPOSICAO // 2
+        faixas.append((y0, y1, dono_y0, dono_y1))
+        if ultima:
+            return faixas
+        y0 += passo
+
+
+def _ocr_com_cache(faixa: Image.Image, prep: Preprocessamento, digest: Optional[bytes] = None) -> List[Dict]:
+    """
+    Linhas da faixa (coordenadas da faixa, já desfeita a escala). Cache por conteúdo + pré-processamento:
+    o pré-processamento é determinístico, então a chave usa o digest da faixa original e um acerto nem o aplica.
+    """
+    chave = (digest or _digest(faixa), faixa.size, astuple(prep))
+    with _cache_lock:
+        linhas = _cache.get(chave)
+        if linhas is not None:
+            _cache.move_to_end(chave)
+            _contadores["faixas_cache"] += 1
+            return linhas
+
+    linhas = _ocr_linhas(prep.aplicar(faixa), prep.config)
+    if prep.escala != 1.0:
+        linhas = [
+            {**l, **{k: int(round(l[k] / prep.escala)) for k in ("left", "top", "right", "bottom")}}
+            for l in linhas
+        ]
+    with _cache_lock:
+        _contadores["faixas_ocr"] += 1
+        _cache[chave] = linhas
+        while len(_cache) > MAX_CACHE:
+            _cache.popitem(last=False)
+    return linhas
+
+
+class EstadoTela:
+    """Digest e linhas de cada faixa da captura anterior (uma instância por busca)."""
+
+    def __init__(self):
+        self.tamanho: Optional[Tuple[int, int]] = None
+        self.faixas: Dict[Tuple[int, int], Tuple[bytes, List[Dict]]] = {}
+
+
+def ler_linhas(
+    im: Image.Image,
+    prep: Preprocessamento = PREPROCESSAMENTO_PADRAO,
+    estado: Optional[EstadoTela] = None,
+) -> Tuple[List[Dict], bool]:
+    """
+    OCR incremental da imagem. Retorna (linhas, mudou): mudou=False quando nenhuma faixa
+    mudou desde a captura anterior registrada em `estado` (as linhas são as mesmas).
+    """
+    estado = estado or EstadoTela()
+    if estado.tamanho != im.size:
+        estado.tamanho = im.size
+        estado.faixas = {}
+
+    largura, altura = im.size
+    linhas: List[Dict] = []
+    mudou = False
+    for y0, y1, dono_y0, dono_y1 in _faixas(altura):
+        faixa = im.crop((0, y0, largura, y1))
+        digest = _digest(faixa)
+        anterior = estado.faixas.get((y0, y1))
+        if anterior is not None and anterior[0] == digest:
+            _contar("faixas_iguais")
+            linhas_faixa = anterior[1]
+        else:
+            mudou = True
+            linhas_faixa = [
+                {**l, "top": l["top"] + y0, "bottom": l["bottom"] + y0}
+                for l in _ocr_com_cache(faixa, prep, digest)
+            ]
+            estado.faixas[(y0, y1)] = (digest, linhas_faixa)
+        linhas.extend(l for l in linhas_faixa if dono_y0 <= (l["top"] + l["bottom"]) // 2 < dono_y1)
+    return sorted(linhas, key=lambda x: x["top"]), mudou
+
+
+def procurar_texto(linhas: List[Dict], texto_alvo: str) -> Optional[Dict]:
+    alvo = texto_alvo.strip().lower()
+    for linha in linhas:
+        if alvo in linha["text"].lower():
+            return linha
+    return None
+
+
 def clicar_texto_na_tela(
     texto_alvo: str,
     timeout: int = 15,
     region: Optional[Tuple[int, int, int, int]] = None,
     debug: bool = False,
+    preprocessamento: Preprocessamento = PREPROCESSAMENTO_PADRAO,
 ) -> bool:
     """
     Procura um TEXTO na tela via OCR e clica no centro da linha onde esse texto aparece.
 
     texto_alvo: string que deve aparecer na linha (case-insensitive).
     region: (left, top, width, height) ou None pra tela toda.
+    preprocessamento: ajustes da imagem antes do OCR (escala, limiar, ...).
+
+    A cada captura, só as faixas da tela que mudaram passam pelo OCR; tela igual à anterior
+    não é relida.
     """
-    texto_alvo_norm = texto_alvo.strip().lower()
-    if not texto_alvo_norm:
-        print("[ERRO] texto_alvo vazio em clicar_texto_na_tela.")
+    if not texto_alvo.strip():
+        log.error("texto_alvo vazio em clicar_texto_na_tela.")
         return False
 
+    estado = EstadoTela()
     inicio = time.time()
     while (time.time() - inicio) < timeout:
         # screenshot
         im = pg.screenshot(region=region)
 
-        # OCR por linhas
-        linhas = _ocr_linhas(im)
-
-        for linha in linhas:
-            linha_txt_norm = linha["text"].lower()
-            if texto_alvo_norm in linha_txt_norm:
-                # bounding box da linha
-                left = linha["left"]
-                top = linha["top"]
-                right = linha["right"]
-                bottom = linha["bottom"]
-
-                # se tiver region, somar offset
-                if region is not None:
-                    rx, ry, _, _ = region
-                    left += rx
-                    right += rx
-                    top += ry
-                    bottom += ry
-
-                x_centro = (left + right) // 2
-                y_centro = (top + bottom) // 2
-
-                if debug:
-                    print(f"[DEBUG] Encontrado texto '{texto_alvo}' na linha: {linha['text']}")
-                    print(f"[DEBUG] BBox linha: left={left}, top={top}, right={right}, bottom={bottom}")
-                    print(f"[DEBUG] Clicando em ({x_centro}, {y_centro})")
-
-                try:
-                    pg.moveTo(x_centro, y_centro, duration=0.3)
-                    pg.click()
-                    return True
-                except Exception as e:
-                    print(f"[ERRO] Falha ao clicar no texto '{texto_alvo}': {e}")
-                    return False
-
-        time.sleep(0.8)
-
-    print(f"[ERRO] Não encontrei o texto '{texto_alvo}' na tela dentro do timeout.")
+        # OCR por linhas (incremental)
+        linhas, mudou = ler_linhas(im, preprocessamento, estado)
+        linha = procurar_texto(linhas, texto_alvo) if mudou else None
+
+        if linha is not None:
+            # bounding box da linha
+            left = linha["left"]
+            top = linha["top"]
+            right = linha["right"]
+            bottom = linha["bottom"]
+
+            # se tiver region, somar offset
+            if region is not None:
+                rx, ry, _, _ = region
+                left += rx
+                right += rx
+                top += ry
+                bottom += ry
+
+            x_centro = (left + right) // 2
+            y_centro = (top + bottom) // 2
+
+            if debug:
+                log.debug(f"Encontrado texto '{texto_alvo}' na linha: {linha['text']}")
+                log.debug(f"BBox linha: left={left}, top={top}, right={right}, bottom={bottom}")
+                log.debug(f"Clicando em ({x_centro}, {y_centro})")
+
+            try:
+                pg.moveTo(x_centro, y_centro, duration=0.3)
+                pg.click()
+                return True
+            except Exception as e:
+                log.error(f"Falha ao clicar no texto '{texto_alvo}': {e}")
+                return False
+
+        time.sleep(INTERVALO_POLLING)
+
+    log.error(f"Não encontrei o texto '{texto_alvo}' na tela dentro do timeout.")
     return False
@@ -0,0 +1,160 @@
+# progress.py
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+MAX_LOGS_PADRAO = 500
+
+
+class CanalProgresso:
+    """
+    Canal de progresso entre o worker (thread do robô) e a UI.
+
+    - logs num ring buffer de tamanho fixo (memória constante em execuções de horas)
+    - contadores agregados (clientes, notas, bytes)
+    - status por cliente coalescido: só o último estado de cada cliente é guardado
+
+    O worker só chama os métodos de escrita (nunca st.*); a UI lê snapshot()
+    quando quiser, sem fila para drenar.
+    """
+
+    def __init__(
+        self,
+        max_logs: int = MAX_LOGS_PADRAO,
+        observador: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self._lock = threading.Lock()
+        # chamado (fora do lock) nos marcos: fim de cliente, conclusão e falha
+        self._observador = observador
+        self._logs: collections.deque = collections.deque(maxlen=max_logs)
+        self._status: Dict[str, Dict[str, Any]] = {}  # empresa -> linha (ordem de início)
+        self._contadores = {
+            "clientes_total": 0,
+            "clientes_concluidos": 0,
+            "clientes_falha": 0,
+            "notas": 0,
+            "bytes": 0,
+        }
+        self._ativo = False
+        self._erro: Optional[str] = None
+        self._output_folder: Optional[str] = None
+        self._inicio: Optional[float] = None
+        self._fim: Optional[float] = None
+        self._makespan_previsto: Optional[float] = None  # segundos, quando há plano de despacho
+        self._versao = 0  # incrementa a cada mudança (UI pode pular render se não mudou)
+
+    def _tocar(self) -> None:
+        self._versao += 1
+
+    def _notificar(self) -> None:
+        if self._observador is None:
+            return
+        try:
+            self._observador(self.snapshot(ultimos_logs=0))
+        except Exception:
+            pass
+
+    # ---------- escrita (worker) ----------
+
+    def iniciar(self, output_folder: Optional[str], clientes_total: int) -> None:
+        """
+        Marca o início da execução. Chamado de novo com ela já ativa (o job manager inicia antes de carregar
+        a planilha; o robô, quando sabe a pasta), só completa pasta e total: o relógio do tempo decorrido
+        e da ETA continua contando do primeiro.
+        """
+        with self._lock:
+            if not self._ativo:
+                self._inicio = time.time()
+                self._fim = None
+            self._ativo = True
+            if output_folder is not None:
+                self._output_folder = output_folder
+            self._contadores["clientes_total"] = int(clientes_total)
+            self._tocar()
+
+    def planejar(self, makespan_previsto_s: float) -> None:
+        with self._lock:
+            self._makespan_previsto = float(makespan_previsto_s)
+            self._tocar()
+
+    def log(self, mensagem: str) -> None:
+        with self._lock:
+            self._logs.append(mensagem)
+            self._tocar()
+
+    def cliente_inicio(self, empresa: str, linha: Dict[str, Any]) -> None:
+        with self._lock:
+            self._status[empresa] = {
+                **linha, "STATUS": "EM EXECUÇÃO", "DETALHE": "", "NOTAS": 0, "INICIO": time.time(), "FIM": None
+            }
+            self._tocar()
+
+    def cliente_fim(self, empresa: str, status: str, detalhe: str = "") -> None:
+        with self._lock:
+            linha = self._status.setdefault(empresa, {"EMPRESA": empresa, "NOTAS": 0})
+            linha["STATUS"] = status
+            linha["DETALHE"] = detalhe
+            linha["FIM"] = time.time()
+            self._contadores["clientes_concluidos"] += 1
+            if status != "OK":
+                self._contadores["clientes_falha"] += 1
+            self._tocar()
+        self._notificar()
+
+    def nota_baixada(self, empresa: str, tamanho_bytes: int = 0) -> None:
+        with self._lock:
+            self._contadores["notas"] += 1
+            self._contadores["bytes"] += int(tamanho_bytes or 0)
+            if empresa in self._status:
+                self._status[empresa]["NOTAS"] = self._status[empresa].get("NOTAS", 0) + 1
+            self._tocar()
+
+    def falhar(self, mensagem: str) -> None:
+        with self._lock:
+            self._erro = mensagem
+            self._ativo = False
+            self._fim = time.time()
+            self._tocar()
+        self._notificar()
+
+    def concluir(self) -> None:
+        with self._lock:
+            self._ativo = False
+            self._fim = time.time()
+            self._tocar()
+        self._notificar()
+
+    # ---------- leitura (UI) ----------
+
+    @property
+    def ativo(self) -> bool:
+        with self._lock:
+            return self._ativo
+
+    @property
+    def versao(self) -> int:
+        with self._lock:
+            return self._versao
+
+    def snapshot(self, ultimos_logs: Optional[int] = 200) -> Dict[str, Any]:
+        """ultimos_logs: None = todos, 0 = nenhum (só status/contadores)."""
+        with self._lock:
+            if ultimos_logs is None:
+                logs: List[str] = list(self._logs)
+            elif ultimos_logs > 0:
+                logs = list(self._logs)[-ultimos_logs:]
+            else:
+                logs = []
+            fim = self._fim or time.time()
+            return {
+                "active": self._ativo,
+                "error": self._erro,
+                "output_folder": self._output_folder,
+                "status": [dict(v) for v in self._status.values()],
+                "logs": logs,
+                "contadores": dict(self._contadores),
+                "decorrido": (fim - self._inicio) if self._inicio else 0.0,
+                "makespan_previsto": self._makespan_previsto,
+                "versao": self._versao,
+            }
@@ -0,0 +1,343 @@
+# run_ledger.py
+import contextlib
+import datetime
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+ARQUIVO_HISTORICO = "_execucoes.sqlite3"
+
+# Fases cronometradas por cliente (segundos)
+FASES = ("navegador", "login", "navegacao", "notas")
+
+# Status do cliente numa execução
+OK = "OK"
+FALHA_LOGIN = "FALHA_LOGIN"
+FALHA_NAVEGACAO = "FALHA_NAVEGACAO"
+ERRO = "ERRO"
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS execucoes (
+    id TEXT PRIMARY KEY,
+    competencia TEXT NOT NULL,
+    origem TEXT,
+    usuario TEXT,
+    inicio REAL NOT NULL,
+    fim REAL,
+    status TEXT,
+    clientes_total INTEGER,
+    clientes INTEGER DEFAULT 0,
+    falhas INTEGER DEFAULT 0,
+    notas INTEGER DEFAULT 0,
+    bytes INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_execucoes_inicio ON execucoes (inicio);
+CREATE TABLE IF NOT EXISTS execucoes_clientes (
+    id INTEGER PRIMARY KEY,
+    execucao_id TEXT NOT NULL,
+    competencia TEXT,
+    empresa TEXT NOT NULL,
+    cnpj TEXT,
+    tipo_acesso TEXT,
+    inicio REAL NOT NULL,
+    fim REAL,
+    status TEXT,
+    detalhe TEXT,
+    {", ".join(f"t_{f} REAL" for f in FASES)},
+    paginas INTEGER DEFAULT 0,
+    notas INTEGER DEFAULT 0,
+    bytes INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_exec_clientes_execucao ON execucoes_clientes (execucao_id);
+CREATE INDEX IF NOT EXISTS ix_exec_clientes_empresa ON execucoes_clientes (empresa, inicio);
+"""
+
+
+@dataclass
+class MetricasCliente:
+    """Métricas de UM cliente numa execução, preenchidas pelo robô durante o processamento."""
+
+    empresa: str
+    cnpj: str = ""
+    tipo_acesso: str = ""
+    inicio: float = field(default_factory=time.time)
+    fim: Optional[float] = None
+    status: str = OK
+    detalhe: str = ""
+    fases: Dict[str, float] = field(default_factory=dict)
+    paginas: int = 0
+    notas: int = 0
+    bytes: int = 0
+
+    @contextlib.contextmanager
+    def fase(self, nome: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.fases[nome] = self.fases.get(nome, 0.0) + (time.perf_counter() - t0)
+
+    def falhar(self, status: str, detalhe: str = "") -> None:
+        self.status = status
+        self.detalhe = detalhe
+
+    def encerrar(self) -> None:
+        self.fim = self.fim or time.time()
+
+    @property
+    def duracao(self) -> float:
+        return (self.fim or time.time()) - self.inicio
+
+
+def caminho_historico(pasta_base_saida: str) -> str:
+    return os.path.join(pasta_base_saida, ARQUIVO_HISTORICO)
+
+
+def conectar(pasta_base_saida: str) -> sqlite3.Connection:
+    os.makedirs(pasta_base_saida, exist_ok=True)
+    con = sqlite3.connect(caminho_historico(pasta_base_saida), timeout=30)
+    con.row_factory = sqlite3.Row
+    # journal padrão, sem WAL: o histórico fica na pasta de saída, em geral um compartilhamento de rede
+    if con.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+        with contextlib.suppress(sqlite3.OperationalError):
+            con.execute("PRAGMA journal_mode=DELETE")
+    con.executescript(_SCHEMA)
+    return con
+
+
+# ----------------------------
+# Escrita (robô)
+# ----------------------------
+def iniciar_execucao(
+    pasta_base_saida: str,
+    execucao_id: str,
+    competencia: str,
+    clientes_total: int,
+    origem: str = "",
+    usuario: str = "",
+) -> None:
+    con = conectar(pasta_base_saida)
+    try:
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO execucoes (id, competencia, origem, usuario, inicio, status, clientes_total) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (execucao_id, competencia, origem, usuario, time.time(), "EM EXECUÇÃO", int(clientes_total)),
+            )
+    finally:
+        con.close()
+
+
+def registrar_cliente(pasta_base_saida: str, execucao_id: str, competencia: str, m: MetricasCliente) -> None:
+    m.encerrar()
+    cols = ["execucao_id", "competencia", "empresa", "cnpj", "tipo_acesso", "inicio", "fim", "status", "detalhe"]
+    cols += [f"t_{f}" for f in FASES] + ["paginas", "notas", "bytes"]
+    valores = [execucao_id, competencia, m.empresa, m.cnpj, m.tipo_acesso, m.inicio, m.fim, m.status, m.detalhe]
+    valores += [m.fases.get(f) for f in FASES] + [m.paginas, m.notas, m.bytes]
+    con = conectar(pasta_base_saida)
+    try:
+        with con:
+            con.execute(
+                f"INSERT INTO execucoes_clientes ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})",
+                valores,
+            )
+    finally:
+        con.close()
+
+
+def finalizar_execucao(pasta_base_saida: str, execucao_id: str, status: str) -> None:
+    """Fecha a execução agregando os clientes registrados."""
+    con = conectar(pasta_base_saida)
+    try:
+        with con:
+            con.execute(
+                """
+                UPDATE execucoes SET
+                    fim = ?,
+                    status = ?,
+                    clientes = (SELECT COUNT(*) FROM execucoes_clientes WHERE execucao_id = ?),
+                    falhas = (SELECT COUNT(*) FROM execucoes_clientes WHERE execucao_id = ? AND status <> 'OK'),
+                    notas = (SELECT COALESCE(SUM(notas), 0) FROM execucoes_clientes WHERE execucao_id = ?),
+                    bytes = (SELECT COALESCE(SUM(bytes), 0) FROM execucoes_clientes WHERE execucao_id = ?)
+                WHERE id = ?
+                """,
+                (time.time(), status, *([execucao_id] * 5)),
+            )
+    finally:
+        con.close()
+
+
+# ----------------------------
+# Leitura (Painel)
+# ----------------------------
+def _fmt_ts(ts: Optional[float]) -> str:
+    return datetime.datetime.fromtimestamp(ts).strftime("%d/%m/%Y %H:%M") if ts else ""
+
+
+def listar_execucoes(pasta_base_saida: str, limite: int = 50) -> List[Dict]:
+    """Execuções mais recentes primeiro, com duração e vazão (notas/min)."""
+    if not os.path.exists(caminho_historico(pasta_base_saida)):
+        return []
+    con = conectar(pasta_base_saida)
+    try:
+        rows = [dict(r) for r in con.execute("SELECT * FROM execucoes ORDER BY inicio DESC LIMIT ?", (int(limite),))]
+    finally:
+        con.close()
+    for r in rows:
+        dur = (r["fim"] - r["inicio"]) if r["fim"] else None
+        r["duracao_min"] = round(dur / 60, 1) if dur else None
+        r["notas_por_min"] = round(r["notas"] / (dur / 60), 2) if dur and r["notas"] else 0.0
+        r["inicio_fmt"] = _fmt_ts(r["inicio"])
+    return rows
+
+
+def listar_clientes_execucoes(pasta_base_saida: str, ultimas_execucoes: int = 20) -> List[Dict]:
+    """Linhas por cliente das últimas N execuções (base para ranking de lentidão, falhas e fases)."""
+    if not os.path.exists(caminho_historico(pasta_base_saida)):
+        return []
+    sql = """
+        SELECT ec.*, e.inicio AS inicio_execucao
+          FROM execucoes_clientes ec
+          JOIN (SELECT id, inicio FROM execucoes ORDER BY inicio DESC LIMIT ?) e ON e.id = ec.execucao_id
+         ORDER BY ec.inicio
+    """
+    con = conectar(pasta_base_saida)
+    try:
+        rows = [dict(r) for r in con.execute(sql, (int(ultimas_execucoes),))]
+    finally:
+        con.close()
+    for r in rows:
+        r["duracao_s"] = round(r["fim"] - r["inicio"], 1) if r["fim"] else None
+    return rows
+
+
+def resumo_por_cliente(pasta_base_saida: str, ultimas_execucoes: int = 20) -> List[Dict]:
+    """Por cliente: execuções, taxa de falha, duração média/máxima e média de cada fase."""
+    medias_fases = ", ".join(f"ROUND(AVG(t_{f}), 1) AS media_{f}_s" for f in FASES)
+    sql = f"""
+        SELECT ec.empresa,
+               COUNT(*) AS execucoes,
+               SUM(CASE WHEN ec.status <> 'OK' THEN 1 ELSE 0 END) AS falhas,
+               ROUND(100.0 * SUM(CASE WHEN ec.status <> 'OK' THEN 1 ELSE 0 END) / COUNT(*), 1) AS taxa_falha_pct,
+               ROUND(AVG(ec.fim - ec.inicio), 1) AS media_s,
+               ROUND(MAX(ec.fim - ec.inicio), 1) AS max_s,
+               ROUND(AVG(ec.notas), 1) AS media_notas,
+               {medias_fases}
+          FROM execucoes_clientes ec
+          JOIN (SELECT id FROM execucoes ORDER BY inicio DESC LIMIT ?) e ON e.id = ec.execucao_id
+         WHERE ec.fim IS NOT NULL
+         GROUP BY ec.empresa
+         ORDER BY media_s DESC
+    """
+    if not os.path.exists(caminho_historico(pasta_base_saida)):
+        return []
+    con = conectar(pasta_base_saida)
+    try:
+        return [dict(r) for r in con.execute(sql, (int(ultimas_execucoes),))]
+    finally:
+        con.close()
+
+
+def fases_por_execucao(pasta_base_saida: str, ultimas_execucoes: int = 30) -> List[Dict]:
+    """Média de cada fase por execução (ordem cronológica), para ver a tendência do portal."""
+    medias_fases = ", ".join(f"AVG(ec.t_{f}) AS {f}" for f in FASES)
+    sql = f"""
+        SELECT e.id, e.inicio, {medias_fases}
+          FROM execucoes e
+          JOIN execucoes_clientes ec ON ec.execucao_id = e.id
+         WHERE e.id IN (SELECT id FROM execucoes ORDER BY inicio DESC LIMIT ?)
+         GROUP BY e.id, e.inicio
+         ORDER BY e.inicio
+    """
+    if not os.path.exists(caminho_historico(pasta_base_saida)):
+        return []
+    con = conectar(pasta_base_saida)
+    try:
+        rows = [dict(r) for r in con.execute(sql, (int(ultimas_execucoes),))]
+    finally:
+        con.close()
+    for r in rows:
+        r["inicio_fmt"] = _fmt_ts(r["inicio"])
+    return rows
+
+
+def historico_clientes(pasta_base_saida: str, empresas: Iterable[str], ultimas_execucoes: int = 10) -> Dict[str, List[Dict]]:
+    """
+    Execuções concluídas (status OK) de cada cliente nas últimas N execuções em que ele apareceu,
+    mais recentes primeiro: {empresa: [{"duracao_s", "notas", "t_notas"}, ...]}.
+    """
+    empresas = [e for e in empresas if e]
+    if not empresas or not os.path.exists(caminho_historico(pasta_base_saida)):
+        return {}
+    sql = f"""
+        SELECT empresa, fim - inicio AS duracao_s, notas, t_notas
+          FROM execucoes_clientes
+         WHERE status = 'OK' AND fim IS NOT NULL AND empresa IN ({", ".join("?" for _ in empresas)})
+         ORDER BY inicio DESC
+    """
+    con = conectar(pasta_base_saida)
+    try:
+        rows = con.execute(sql, empresas).fetchall()
+    finally:
+        con.close()
+    saida: Dict[str, List[Dict]] = {}
+    for r in rows:
+        lista = saida.setdefault(r["empresa"], [])
+        if len(lista) < ultimas_execucoes:
+            lista.append({"duracao_s": r["duracao_s"], "notas": r["notas"], "t_notas": r["t_notas"]})
+    return saida
+
+
+def ultimo_status_por_cliente(pasta_base_saida: str, competencia: str) -> Dict[str, str]:
+    """Status da tentativa mais recente de cada cliente na competência (retomar uma execução interrompida)."""
+    if not os.path.exists(caminho_historico(pasta_base_saida)):
+        return {}
+    con = conectar(pasta_base_saida)
+    try:
+        rows = con.execute(
+            "SELECT empresa, status FROM execucoes_clientes WHERE competencia = ? ORDER BY inicio",
+            (competencia,),
+        ).fetchall()
+    finally:
+        con.close()
+    # ordenado por início: a última linha de cada empresa prevalece
+    return {r["empresa"]: r["status"] for r in rows}
+
+
+def importar_historico(pasta_base_saida: str, pasta_origem: str) -> int:
+    """
+    Copia para este histórico as execuções de outra pasta de saída (ex.: um shard) que ainda não estão nele,
+    com os clientes de cada uma. Idempotente. Retorna quantas execuções foram incluídas.
+    """
+    if not os.path.exists(caminho_historico(pasta_origem)):
+        return 0
+    origem = conectar(pasta_origem)
+    try:
+        execucoes = [dict(r) for r in origem.execute("SELECT * FROM execucoes ORDER BY inicio")]
+        clientes = [dict(r) for r in origem.execute("SELECT * FROM execucoes_clientes ORDER BY id")]
+    finally:
+        origem.close()
+
+    con = conectar(pasta_base_saida)
+    try:
+        conhecidas = {r[0] for r in con.execute("SELECT id FROM execucoes")}
+        novas = [e for e in execucoes if e["id"] not in conhecidas]
+        ids = {e["id"] for e in novas}
+        with con:
+            for e in novas:
+                cols = list(e)
+                con.execute(f"INSERT INTO execucoes ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})", list(e.values()))
+            for c in clientes:
+                if c["execucao_id"] not in ids:
+                    continue
+                c.pop("id")
+                cols = list(c)
+                con.execute(
+                    f"INSERT INTO execucoes_clientes ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})",
+                    list(c.values()),
+                )
+    finally:
+        con.close()
+    return len(novas)
@@ -0,0 +1,119 @@
+# scripts/bench_importtime.py
+"""
+Mede o custo de import dos módulos do app com `python -X importtime`.
+
+Cada módulo roda num processo novo (cache frio de módulos, como na subida do Render).
+Mostra o tempo total por módulo e os pacotes de terceiros que mais pesam.
+
+Uso:
+    python scripts/bench_importtime.py                 # módulos padrão
+    python scripts/bench_importtime.py bot_nfse app_cache --top 15
+    python scripts/bench_importtime.py --json > importtime.json
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.py executa a página do Streamlit no import; medimos os módulos que ele carrega
+MODULOS_PADRAO = [
+    "app_cache",
+    "job_manager",
+    "catalog",
+    "file_index",
+    "run_ledger",
+    "eta",
+    "bot_nfse",
+    "ocr_ui",
+    "cert_image_selector",
+    "cert_selector",
+    "streamlit",
+]
+
+# "import time: self [us] | cumulative | imported package"
+_RE_LINHA = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+
+def medir(modulo: str, repeticoes: int = 1) -> Dict:
+    """Roda `import <modulo>` em processo novo e devolve o melhor tempo e a árvore de imports."""
+    melhor = None
+    for _ in range(max(1, repeticoes)):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+            cwd=RAIZ,
+            capture_output=True,
+            text=True,
+        )
+        entradas = []
+        for linha in proc.stderr.splitlines():
+            m = _RE_LINHA.match(linha)
+            if m:
+                entradas.append({
+                    "self_us": int(m.group(1)),
+                    "cumulativo_us": int(m.group(2)),
+                    "nivel": len(m.group(3)) // 2,
+                    "nome": m.group(4).strip(),
+                })
+        total = next((e["cumulativo_us"] for e in reversed(entradas) if e["nome"] == modulo), None)
+        resultado = {
+            "modulo": modulo,
+            "ok": proc.returncode == 0,
+            "erro": proc.stderr.strip().splitlines()[-1] if proc.returncode != 0 and proc.stderr.strip() else "",
+            "total_ms": round(total / 1000, 1) if total is not None else None,
+            "entradas": entradas,
+        }
+        if melhor is None or (resultado["total_ms"] or 0) < (melhor["total_ms"] or 0):
+            melhor = resultado
+    return melhor
+
+
+def por_pacote(entradas: List[Dict]) -> Dict[str, float]:
+    """Soma o tempo 'self' por pacote de topo (selenium, pandas, ...), em ms."""
+    soma: Dict[str, float] = {}
+    for e in entradas:
+        topo = e["nome"].split(".")[0]
+        soma[topo] = soma.get(topo, 0.0) + e["self_us"] / 1000
+    return soma
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Relatório de tempo de import (python -X importtime).")
+    ap.add_argument("modulos", nargs="*", help="módulos a medir (padrão: módulos do app)")
+    ap.add_argument("--top", type=int, default=8, help="pacotes mais pesados por módulo")
+    ap.add_argument("--repeticoes", type=int, default=3, help="execuções por módulo (vale a melhor)")
+    ap.add_argument("--json", action="store_true", help="saída em JSON")
+    args = ap.parse_args()
+
+    resultados = []
+    for modulo in args.modulos or MODULOS_PADRAO:
+        r = medir(modulo, args.repeticoes)
+        pacotes = sorted(por_pacote(r["entradas"]).items(), key=lambda kv: kv[1], reverse=True)
+        resultados.append({
+            "modulo": modulo,
+            "ok": r["ok"],
+            "erro": r["erro"],
+            "total_ms": r["total_ms"],
+            "modulos_importados": len(r["entradas"]),
+            "pacotes": [{"pacote": p, "ms": round(ms, 1)} for p, ms in pacotes[: args.top]],
+        })
+
+    if args.json:
+        print(json.dumps(resultados, ensure_ascii=False, indent=2))
+        return
+
+    for r in resultados:
+        if not r["ok"]:
+            print(f"{r['modulo']:<14} FALHOU: {r['erro']}")
+            continue
+        print(f"{r['modulo']:<14} {r['total_ms']:>8.1f} ms  ({r['modulos_importados']} módulos)")
+        for p in r["pacotes"]:
+            print(f"    {p['pacote']:<24} {p['ms']:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
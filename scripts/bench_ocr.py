@@ -0,0 +1,150 @@
+# scripts/bench_ocr.py
+"""
+Custo de CPU por busca de texto do ocr_ui: OCR da tela inteira a cada captura (modo antigo)
+x OCR incremental (só faixas que mudaram + cache por conteúdo).
+
+Fixtures: capturas gravadas em PNG. Cada subpasta é uma sequência (uma busca), lida em ordem de nome;
+PNGs soltos na pasta formam uma sequência só. A CPU inclui os processos do Tesseract.
+
+Uso:
+    python scripts/bench_ocr.py --gravar fixtures/ocr/popup --quadros 20 --intervalo 0.8
+    python scripts/bench_ocr.py fixtures/ocr --texto "OK"
+    python scripts/bench_ocr.py fixtures/ocr --texto "OK" --escala 2 --limiar 160 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import ocr_ui  # noqa: E402
+
+
+def _cpu() -> float:
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def carregar_sequencias(pasta: str) -> Dict[str, List[str]]:
+    def pngs(p: str) -> List[str]:
+        return sorted(os.path.join(p, n) for n in os.listdir(p) if n.lower().endswith(".png"))
+
+    sequencias = {}
+    soltos = pngs(pasta)
+    if soltos:
+        sequencias[os.path.basename(os.path.normpath(pasta))] = soltos
+    for nome in sorted(os.listdir(pasta)):
+        sub = os.path.join(pasta, nome)
+        if os.path.isdir(sub) and pngs(sub):
+            sequencias[nome] = pngs(sub)
+    return sequencias
+
+
+def _buscar(quadros: List[str], texto: Optional[str], incremental: bool, prep: ocr_ui.Preprocessamento) -> Dict:
+    estado = ocr_ui.EstadoTela()
+    lidos = ocr_calls = 0
+    achou = False
+    for caminho in quadros:
+        with ocr_ui.Image.open(caminho) as im:
+            im.load()
+            lidos += 1
+            if incremental:
+                antes = ocr_ui.estatisticas()["faixas_ocr"]
+                linhas, mudou = ocr_ui.ler_linhas(im, prep, estado)
+                ocr_calls += ocr_ui.estatisticas()["faixas_ocr"] - antes
+                if not mudou:
+                    continue
+            else:
+                linhas = ocr_ui._ocr_linhas(prep.aplicar(im), prep.config)
+                ocr_calls += 1
+        if texto and ocr_ui.procurar_texto(linhas, texto):
+            achou = True
+            break
+    return {"quadros": lidos, "chamadas_tesseract": ocr_calls, "achou": achou}
+
+
+def medir(sequencias: Dict[str, List[str]], texto: Optional[str], prep: ocr_ui.Preprocessamento, cache_frio: bool) -> List[Dict]:
+    resultados = []
+    for modo, incremental in (("completo", False), ("incremental", True)):
+        ocr_ui.limpar_cache()
+        cpu0, wall0 = _cpu(), time.perf_counter()
+        buscas = []
+        for nome, quadros in sequencias.items():
+            if cache_frio:
+                ocr_ui.limpar_cache()
+            c0 = _cpu()
+            r = _buscar(quadros, texto, incremental, prep)
+            r.update(sequencia=nome, cpu_s=round(_cpu() - c0, 3))
+            buscas.append(r)
+        cpu = _cpu() - cpu0
+        resultados.append({
+            "modo": modo,
+            "buscas": len(buscas),
+            "cpu_s": round(cpu, 3),
+            "cpu_por_busca_s": round(cpu / max(1, len(buscas)), 3),
+            "tempo_s": round(time.perf_counter() - wall0, 3),
+            "chamadas_tesseract": sum(b["chamadas_tesseract"] for b in buscas),
+            "detalhe": buscas,
+        })
+    return resultados
+
+
+def gravar(pasta: str, quadros: int, intervalo: float, region: Optional[List[int]]) -> None:
+    os.makedirs(pasta, exist_ok=True)
+    for i in range(quadros):
+        ocr_ui.pg.screenshot(region=tuple(region) if region else None).save(os.path.join(pasta, f"{i:04d}.png"))
+        time.sleep(intervalo)
+    print(f"{quadros} captura(s) em {pasta}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="CPU por busca de texto: OCR completo x incremental (ocr_ui).")
+    ap.add_argument("pasta", nargs="?", help="pasta de fixtures (PNG)")
+    ap.add_argument("--texto", help="texto procurado (para a busca ao achar); sem ele, lê todos os quadros")
+    ap.add_argument("--escala", type=float, default=1.0)
+    ap.add_argument("--limiar", type=int, default=None)
+    ap.add_argument("--inverter", action="store_true")
+    ap.add_argument("--nitidez", action="store_true")
+    ap.add_argument("--config", default="", help='opções do Tesseract, ex.: "--psm 6"')
+    ap.add_argument("--cache-frio", action="store_true", help="limpa o cache de OCR antes de cada busca")
+    ap.add_argument("--json", action="store_true", help="saída em JSON")
+    ap.add_argument("--gravar", metavar="PASTA", help="grava capturas da tela como fixtures")
+    ap.add_argument("--quadros", type=int, default=20)
+    ap.add_argument("--intervalo", type=float, default=ocr_ui.INTERVALO_POLLING)
+    ap.add_argument("--region", type=int, nargs=4, metavar=("LEFT", "TOP", "WIDTH", "HEIGHT"))
+    args = ap.parse_args()
+
+    if args.gravar:
+        gravar(args.gravar, args.quadros, args.intervalo, args.region)
+        return
+    if not args.pasta:
+        ap.error("informe a pasta de fixtures (ou --gravar)")
+
+    sequencias = carregar_sequencias(args.pasta)
+    if not sequencias:
+        ap.error(f"nenhum PNG em {args.pasta}")
+    prep = ocr_ui.Preprocessamento(args.escala, args.limiar, args.inverter, args.nitidez, args.config)
+    resultados = medir(sequencias, args.texto, prep, args.cache_frio)
+
+    if args.json:
+        print(json.dumps(resultados, ensure_ascii=False, indent=2))
+        return
+
+    total_quadros = sum(len(q) for q in sequencias.values())
+    print(f"{len(sequencias)} busca(s), {total_quadros} quadro(s)")
+    for r in resultados:
+        print(
+            f"{r['modo']:<12} CPU {r['cpu_s']:>8.2f}s  por busca {r['cpu_por_busca_s']:>7.2f}s  "
+            f"tempo {r['tempo_s']:>7.2f}s  Tesseract x{r['chamadas_tesseract']}"
+        )
+    base, novo = resultados[0]["cpu_s"], resultados[1]["cpu_s"]
+    if novo > 0:
+        print(f"CPU: {base / novo:.1f}x menor no modo incremental")
+
+
+if __name__ == "__main__":
+    main()
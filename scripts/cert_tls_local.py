@@ -0,0 +1,146 @@
+# scripts/cert_tls_local.py
+"""
+Servidor HTTPS local que exige certificado de cliente, para testar o login headless por
+certificado (cert_headless + política AutoSelectCertificateForUrls) sem o Portal Nacional.
+
+Gera uma CA de teste, o certificado do servidor (localhost) e um .p12 de cliente com o openssl.
+A página responde com o CN do certificado apresentado.
+
+Uso (Linux, com openssl, libnss3-tools, Chrome/Chromium e chromedriver):
+    python scripts/cert_tls_local.py gerar  --pasta /tmp/cert_teste
+    python scripts/cert_tls_local.py servir --pasta /tmp/cert_teste --porta 8443
+    python scripts/cert_tls_local.py testar --pasta /tmp/cert_teste --porta 8443   # gera, sobe e abre o Chrome
+
+"testar" grava a política do Chrome (precisa de root ou PORTALNFSE_CHROME_POLICY_DIR apontando
+para o diretório de políticas gerenciadas do navegador em uso).
+"""
+import argparse
+import http.server
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+CN_CLIENTE = "CLIENTE TESTE LTDA:12345678000199"
+SENHA_P12 = "teste123"
+
+
+def _openssl(*args: str) -> None:
+    subprocess.run(["openssl", *args], check=True, capture_output=True)
+
+
+def _assinar(pasta: str, nome: str, cn: str, extensoes: str) -> None:
+    chave, csr, crt, ext = (os.path.join(pasta, f"{nome}.{e}") for e in ("key", "csr", "pem", "ext"))
+    with open(ext, "w", encoding="utf-8") as f:
+        f.write(extensoes)
+    _openssl("req", "-newkey", "rsa:2048", "-nodes", "-keyout", chave, "-out", csr, "-subj", f"/CN={cn}")
+    _openssl(
+        "x509", "-req", "-in", csr, "-CA", os.path.join(pasta, "ca.pem"), "-CAkey", os.path.join(pasta, "ca.key"),
+        "-CAcreateserial", "-out", crt, "-days", "2", "-extfile", ext,
+    )
+
+
+def gerar(pasta: str) -> dict:
+    """CA, servidor (localhost/127.0.0.1) e cliente (.p12 com SENHA_P12). Retorna os caminhos."""
+    os.makedirs(pasta, exist_ok=True)
+    _openssl(
+        "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "2",
+        "-keyout", os.path.join(pasta, "ca.key"), "-out", os.path.join(pasta, "ca.pem"),
+        "-subj", "/CN=PortalNFSe CA de teste",
+    )
+    _assinar(pasta, "servidor", "localhost", "subjectAltName=DNS:localhost,IP:127.0.0.1\nextendedKeyUsage=serverAuth\n")
+    _assinar(pasta, "cliente", CN_CLIENTE, "extendedKeyUsage=clientAuth\n")
+    p12 = os.path.join(pasta, "cliente.p12")
+    # PBE SHA1/3DES: formato que qualquer versão do NSS (pk12util) importa
+    _openssl(
+        "pkcs12", "-export", "-in", os.path.join(pasta, "cliente.pem"), "-inkey", os.path.join(pasta, "cliente.key"),
+        "-out", p12, "-passout", f"pass:{SENHA_P12}",
+        "-keypbe", "PBE-SHA1-3DES", "-certpbe", "PBE-SHA1-3DES", "-macalg", "sha1",
+    )
+    return {"ca": os.path.join(pasta, "ca.pem"), "p12": p12}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        cert = self.connection.getpeercert() or {}
+        cn = next((v for rdn in cert.get("subject", ()) for k, v in rdn if k == "commonName"), "")
+        corpo = f"<html><body><h1 id='cn'>{cn}</h1></body></html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def criar_servidor(pasta: str, porta: int) -> http.server.HTTPServer:
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(os.path.join(pasta, "servidor.pem"), os.path.join(pasta, "servidor.key"))
+    ctx.load_verify_locations(os.path.join(pasta, "ca.pem"))
+    ctx.verify_mode = ssl.CERT_REQUIRED
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", porta), _Handler)
+    srv.socket = ctx.wrap_socket(srv.socket, server_side=True)
+    return srv
+
+
+def testar(pasta: str, porta: int) -> bool:
+    """Sobe o servidor, abre o Chrome headless pelo mesmo caminho do robô e confere o CN devolvido."""
+    import bot_nfse
+    import cert_headless
+
+    arquivos = gerar(pasta)
+    srv = criar_servidor(pasta, porta)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"https://localhost:{porta}/"
+
+    trabalho = tempfile.mkdtemp(prefix="portalnfse_teste_")
+    bot_nfse.PASTA_BASE_SAIDA = trabalho
+    bot_nfse.PASTA_DOWNLOAD_TEMP = os.path.join(trabalho, "downloads")
+    bot_nfse.PASTA_IMAGENS_CERT = pasta
+    bot = bot_nfse.NFSePortalBot()
+
+    arquivos_politica = cert_headless.instalar_politica([f"https://localhost:{porta}"])
+    print(f"Política gravada em: {', '.join(arquivos_politica)}")
+    perfil = cert_headless.preparar_perfil(arquivos["p12"], SENHA_P12, cas_confiaveis=[arquivos["ca"]])
+    try:
+        bot._inicializar_navegador(perfil)
+        bot.driver.get(url)
+        cn = bot.driver.find_element(bot_nfse.By.ID, "cn").text.strip()
+    finally:
+        bot._finalizar_navegador()
+        perfil.remover()
+        srv.shutdown()
+
+    ok = cn == CN_CLIENTE
+    print(f"CN recebido pelo servidor: {cn!r} -> {'OK' if ok else 'FALHOU'}")
+    return ok
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Servidor TLS local com certificado de cliente obrigatório.")
+    ap.add_argument("acao", choices=["gerar", "servir", "testar"])
+    ap.add_argument("--pasta", default=os.path.join(tempfile.gettempdir(), "portalnfse_cert_teste"))
+    ap.add_argument("--porta", type=int, default=8443)
+    args = ap.parse_args()
+
+    if args.acao == "gerar":
+        arquivos = gerar(args.pasta)
+        print(f"CA: {arquivos['ca']}\nCliente: {arquivos['p12']} (senha {SENHA_P12})")
+    elif args.acao == "servir":
+        if not os.path.exists(os.path.join(args.pasta, "servidor.pem")):
+            gerar(args.pasta)
+        print(f"Servindo https://localhost:{args.porta}/ (Ctrl+C para sair)")
+        criar_servidor(args.pasta, args.porta).serve_forever()
+    else:
+        sys.exit(0 if testar(args.pasta, args.porta) else 1)
+
+
+if __name__ == "__main__":
+    main()
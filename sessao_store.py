@@ -0,0 +1,145 @@
+# sessao_store.py
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+import bot_logging
+import lazy_import
+
+fernet = lazy_import.modulo("cryptography.fernet", "o reaproveitamento de sessão", pacote_pip="cryptography")
+
+log = bot_logging.obter_logger("sessoes")
+
+# Sessão autenticada do Portal (cookies + localStorage/sessionStorage) por cliente, cifrada com Fernet
+# (AES-128-CBC + HMAC-SHA256). Sem o pacote `cryptography` nada é gravado: sessão em texto puro não.
+#
+# Sessões e chave ficam por padrão numa pasta do usuário, fora do repositório (um `git add .` ou um upload de
+# artefato da pasta do projeto não leva sessões válidas junto com a chave), e em lugares diferentes entre si.
+# Chave: PORTALNFSE_CHAVE_SESSOES (chave Fernet em base64), senão o arquivo PORTALNFSE_ARQUIVO_CHAVE (padrão:
+# chave_sessoes na pasta do usuário), criado na primeira vez com permissão 0600. Chave trocada/perdida = sessões
+# antigas descartadas.
+
+
+def _pasta_usuario() -> str:
+    if os.name == "nt":
+        return os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local"), "PortalNFSe")
+    return os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "portalnfse")
+
+
+VALIDADE_PADRAO_S = 8 * 3600
+ARQUIVO_CHAVE = ".chave"  # dentro da pasta de sessões: só lido, se existir (instalações antigas)
+PASTA_PADRAO = os.environ.get("PORTALNFSE_PASTA_SESSOES") or os.path.join(_pasta_usuario(), "sessoes")
+ARQUIVO_CHAVE_PADRAO = os.environ.get("PORTALNFSE_ARQUIVO_CHAVE") or os.path.join(_pasta_usuario(), "chave_sessoes")
+
+# Segredos do cadastro (senha do .pfx) são cifrados com a mesma chave: "fernet:<token>" no banco
+PREFIXO_CIFRADO = "fernet:"
+
+
+def disponivel() -> bool:
+    return lazy_import.disponivel("cryptography")
+
+
+def _obter_chave(pasta: str) -> bytes:
+    chave = os.environ.get("PORTALNFSE_CHAVE_SESSOES", "").strip()
+    if chave:
+        return chave.encode("ascii")
+
+    caminho = os.path.join(pasta, ARQUIVO_CHAVE)
+    if not os.path.exists(caminho):
+        caminho = ARQUIVO_CHAVE_PADRAO
+        os.makedirs(os.path.dirname(caminho) or ".", mode=0o700, exist_ok=True)
+    try:
+        # O_EXCL: vários workers podem abrir o cofre ao mesmo tempo; só um cria a chave
+        fd = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            with open(caminho, "rb") as f:
+                chave_lida = f.read().strip()
+            if chave_lida:
+                return chave_lida
+            time.sleep(0.1)  # outro processo ainda está escrevendo
+        raise ValueError(f"Arquivo de chave vazio: {caminho}")
+    nova = fernet.Fernet.generate_key()
+    with os.fdopen(fd, "wb") as f:
+        f.write(nova)
+    log.info(f"Chave de sessões criada em {caminho} (proteja este arquivo).")
+    return nova
+
+
+def cifrar_texto(texto: str, pasta: Optional[str] = None) -> str:
+    """Texto -> 'fernet:<token>' com a chave do cofre (já cifrado ou vazio volta igual)."""
+    if not texto or texto.startswith(PREFIXO_CIFRADO):
+        return texto
+    if not disponivel():
+        raise ValueError("Segredo só é gravado cifrado: instale o pacote 'cryptography'.")
+    pasta = pasta or PASTA_PADRAO
+    token = fernet.Fernet(_obter_chave(pasta)).encrypt(texto.encode("utf-8"))
+    return PREFIXO_CIFRADO + token.decode("ascii")
+
+
+def decifrar_texto(valor: str, pasta: Optional[str] = None) -> str:
+    """Inverso de cifrar_texto; valor sem o prefixo volta igual."""
+    if not valor or not valor.startswith(PREFIXO_CIFRADO):
+        return valor
+    pasta = pasta or PASTA_PADRAO
+    try:
+        return fernet.Fernet(_obter_chave(pasta)).decrypt(valor[len(PREFIXO_CIFRADO):].encode("ascii")).decode("utf-8")
+    except fernet.InvalidToken:
+        raise ValueError(f"Segredo cifrado com outra chave (chave atual em {pasta} ou PORTALNFSE_CHAVE_SESSOES).") from None
+
+
+def conta_cliente(cliente: Dict) -> str:
+    """Impressão da forma de acesso: trocar login/certificado no cadastro invalida a sessão salva."""
+    partes = [str(cliente.get(c, "") or "").strip() for c in ("TIPO_ACESSO", "LOGIN", "IDENT_CERT", "CERT_PFX")]
+    return hashlib.sha256("|".join(partes).encode("utf-8")).hexdigest()
+
+
+class CofreSessoes:
+    """Um arquivo cifrado por cliente em `pasta` (nome = hash da identidade, sem CNPJ exposto)."""
+
+    def __init__(self, pasta: str, validade_s: int = VALIDADE_PADRAO_S):
+        os.makedirs(pasta, mode=0o700, exist_ok=True)
+        self.pasta = pasta
+        self.validade_s = int(validade_s)
+        self._fernet = fernet.Fernet(_obter_chave(pasta))
+
+    def _caminho(self, identidade: str) -> str:
+        nome = hashlib.sha256(identidade.encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.pasta, f"{nome}.sessao")
+
+    def carregar(self, identidade: str, conta: str) -> Optional[Dict[str, Any]]:
+        """Sessão salva ainda dentro da validade e da mesma conta; senão None (e o arquivo é descartado)."""
+        caminho = self._caminho(identidade)
+        try:
+            with open(caminho, "rb") as f:
+                token = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            dados = json.loads(self._fernet.decrypt(token, ttl=self.validade_s))
+        except (fernet.InvalidToken, ValueError):
+            # expirada, chave diferente ou arquivo corrompido
+            self.descartar(identidade)
+            return None
+        if dados.get("conta") != conta:
+            self.descartar(identidade)
+            return None
+        return dados
+
+    def salvar(self, identidade: str, conta: str, sessao: Dict[str, Any]) -> None:
+        dados = {**sessao, "conta": conta, "salva_em": time.time()}
+        token = self._fernet.encrypt(json.dumps(dados, ensure_ascii=False).encode("utf-8"))
+        caminho = self._caminho(identidade)
+        tmp = f"{caminho}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(token)
+        os.replace(tmp, caminho)
+
+    def descartar(self, identidade: str) -> None:
+        try:
+            os.remove(self._caminho(identidade))
+        except FileNotFoundError:
+            pass
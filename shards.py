@@ -0,0 +1,169 @@
+# shards.py
+import hashlib
+import os
+import re
+import shutil
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import bot_logging
+import catalog
+import data_store
+import file_index
+import log_writer
+import run_ledger
+
+log = bot_logging.obter_logger("shards")
+
+# Divisão dos clientes ATIVOS entre N execuções independentes (ex.: jobs de uma matriz do GitHub Actions),
+# cada uma com a sua pasta de saída; depois juntar() monta uma competência só.
+#
+# O shard de um cliente depende só do CNPJ (ou do nome, sem CNPJ): a mesma planilha dá sempre a mesma
+# divisão, em qualquer máquina, e incluir/remover um cliente não move os demais de shard.
+
+_RE_SHARD = re.compile(r"^\s*(\d+)\s*/\s*(\d+)\s*$")
+_RE_PASTA_COMPETENCIA = re.compile(r"^\d{4}-\d{2}$")
+
+
+def interpretar(texto: str) -> Tuple[int, int]:
+    """'k/N' (k de 1 a N) -> (k, N)."""
+    m = _RE_SHARD.match(texto or "")
+    if not m:
+        raise ValueError(f"shard inválido: {texto!r} (use k/N, ex.: 2/4)")
+    k, n = int(m.group(1)), int(m.group(2))
+    if n < 1 or not 1 <= k <= n:
+        raise ValueError(f"shard inválido: {texto!r} (k deve estar entre 1 e N)")
+    return k, n
+
+
+def shard_do_cliente(cliente: Dict, total: int) -> int:
+    """Shard (1..total) do cliente. sha256, não hash(): o hash de str muda a cada processo."""
+    digest = hashlib.sha256(data_store.identidade_cliente(cliente).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % total + 1
+
+
+def filtrar(clientes: Iterable[Dict], k: int, total: int) -> List[Dict]:
+    return [c for c in clientes if shard_do_cliente(c, total) == k]
+
+
+# ----------------------------
+# Junção das saídas
+# ----------------------------
+def _arquivo_de_log(nome: str) -> bool:
+    # LOG da competência (journal e derivados) é juntado pelo journal e regerado no destino
+    return nome.startswith("LOG_NFSE_")
+
+
+def _juntar_journal(origem: str, destino: str) -> int:
+    """Acrescenta ao journal de destino as linhas da origem que ele ainda não tem (juntar duas vezes não duplica)."""
+    if not os.path.exists(origem):
+        return 0
+    conteudo = ""
+    if os.path.exists(destino):
+        with open(destino, "r", encoding="utf-8") as f:
+            conteudo = f.read()
+    existentes = {linha.strip() for linha in conteudo.splitlines() if linha.strip()}
+    novas = []
+    with open(origem, "r", encoding="utf-8") as f:
+        for linha in f:
+            linha = linha.strip()
+            if linha and linha not in existentes:
+                existentes.add(linha)
+                novas.append(linha)
+    if not novas:
+        return 0
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino, "a", encoding="utf-8") as f:
+        if conteudo and not conteudo.endswith("\n"):
+            # linha truncada de uma queda no shard de destino: isola antes de acrescentar
+            f.write("\n")
+        f.write("\n".join(novas) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    return len(novas)
+
+
+def _juntar_competencia(origem: str, destino: str, competencia: str) -> Dict[str, int]:
+    contagem = {"novo": 0, "identico": 0, "versao": 0, "linhas_log": 0}
+    pasta_origem = os.path.join(origem, competencia)
+    pasta_destino = os.path.join(destino, competencia)
+    for raiz, dirs, _ in os.walk(pasta_origem):
+        # pastas '_' são internas (mesma regra da Auditoria)
+        dirs[:] = sorted(d for d in dirs if not d.startswith("_"))
+        relativo = os.path.relpath(raiz, pasta_origem)
+        alvo = pasta_destino if relativo == "." else os.path.join(pasta_destino, relativo)
+        for acao, n in file_index.importar_pasta(raiz, alvo, ignorar=_arquivo_de_log).items():
+            contagem[acao] += n
+    contagem["linhas_log"] = _juntar_journal(
+        log_writer.caminho_journal(pasta_origem, competencia),
+        log_writer.caminho_journal(pasta_destino, competencia),
+    )
+    return contagem
+
+
+def _copiar_logs_execucao(origem: str, destino: str) -> int:
+    pasta_origem = os.path.join(origem, bot_logging.PASTA_LOGS)
+    if not os.path.isdir(pasta_origem):
+        return 0
+    pasta_destino = os.path.join(destino, bot_logging.PASTA_LOGS)
+    os.makedirs(pasta_destino, exist_ok=True)
+    copiados = 0
+    for nome in os.listdir(pasta_origem):
+        alvo = os.path.join(pasta_destino, nome)
+        # nomes levam o id da execução: mesmo nome = mesmo arquivo
+        if not os.path.exists(alvo):
+            shutil.copy2(os.path.join(pasta_origem, nome), alvo)
+            copiados += 1
+    return copiados
+
+
+def juntar(
+    origens: List[str],
+    destino: str,
+    competencias: Optional[List[str]] = None,
+    formato_log: str = "xlsx",
+    empresas_por_cnpj: Optional[Dict[str, str]] = None,
+) -> Dict:
+    """
+    Junta as pastas de saída dos shards em `destino`: arquivos das competências (sem duplicar conteúdo igual),
+    linhas do LOG (journal), histórico de execuções e logs do robô. No fim o LOG de cada competência
+    é regerado no `formato_log` e o catálogo de notas é atualizado (empresas_por_cnpj: nomes do cadastro).
+    Pode ser repetido sem duplicar nada.
+    """
+    destino = os.path.abspath(destino)
+    os.makedirs(destino, exist_ok=True)
+    resumo: Dict = {"destino": destino, "origens": [], "competencias": {}}
+
+    for origem in origens:
+        origem = os.path.abspath(origem)
+        if origem == destino:
+            continue
+        if not os.path.isdir(origem):
+            raise FileNotFoundError(f"Pasta de shard não encontrada: {origem}")
+        comps = sorted(
+            p for p in os.listdir(origem)
+            if _RE_PASTA_COMPETENCIA.match(p) and os.path.isdir(os.path.join(origem, p))
+            and (not competencias or p in competencias)
+        )
+        item = {"pasta": origem, "competencias": comps, "execucoes": 0, "logs_execucao": 0}
+        for comp in comps:
+            contagem = _juntar_competencia(origem, destino, comp)
+            total = resumo["competencias"].setdefault(comp, {"novo": 0, "identico": 0, "versao": 0, "linhas_log": 0})
+            for k, v in contagem.items():
+                total[k] += v
+            log.info(
+                f"{comp} <- {origem}: {contagem['novo']} novo(s), {contagem['versao']} versão(ões), "
+                f"{contagem['identico']} idêntico(s), {contagem['linhas_log']} linha(s) de LOG."
+            )
+        item["execucoes"] = run_ledger.importar_historico(destino, origem)
+        item["logs_execucao"] = _copiar_logs_execucao(origem, destino)
+        resumo["origens"].append(item)
+
+    for comp, total in resumo["competencias"].items():
+        pasta = os.path.join(destino, comp)
+        total["log"] = log_writer.LogStreamWriter(pasta, comp).finalizar(formato_log)
+        try:
+            total["notas_catalogadas"] = catalog.backfill(destino, comp, empresas_por_cnpj)
+        except Exception as e:
+            # catálogo é derivado dos XMLs; dá para refazer depois pela Auditoria
+            log.warning(f"Falha ao atualizar o catálogo de {comp}: {e}")
+    return resumo
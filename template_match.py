@@ -0,0 +1,315 @@
+# template_match.py
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import bot_logging
+import lazy_import
+
+np = lazy_import.modulo("numpy", "a busca de imagem na tela")
+Image = lazy_import.modulo("PIL.Image", "a busca de imagem na tela", pacote_pip="pillow")
+pg = lazy_import.modulo("pyautogui", "a busca de imagem na tela")
+
+log = bot_logging.obter_logger("template_match")
+
+# Escalas testadas (DPI 100%, 125%, 150%, ... do Windows); a última que funcionou vai na frente
+ESCALAS_PADRAO = (1.0, 1.25, 1.5, 1.75, 2.0, 0.8)
+
+# Regiões acima disso são procuradas primeiro em meia resolução e refinadas no ponto achado
+AREA_MAX_BUSCA_DIRETA = 1_500_000
+
+# Polling adaptativo: começa rápido, desacelera enquanto a tela não muda. Uma captura por ciclo, só da
+# região de busca; a miniatura dela decide se vale rodar a correlação e a própria captura é a que é procurada.
+INTERVALO_MIN = 0.25
+INTERVALO_MAX = 1.0
+FATOR_INTERVALO = 1.6
+
+# Miniatura: média de blocos de REDUCAO_MINIATURA px. Cursor piscando ou relógio mexem em poucos blocos;
+# só conta como mudança mais de BLOCOS_TOLERADOS blocos com diferença acima de LIMIAR_BLOCO níveis de cinza.
+REDUCAO_MINIATURA = 8
+LIMIAR_BLOCO = 12.0
+BLOCOS_TOLERADOS = 4
+
+Regiao = Tuple[int, int, int, int]  # (left, top, width, height)
+
+
+@dataclass
+class Achado:
+    left: int
+    top: int
+    width: int
+    height: int
+    confianca: float
+    escala: float
+
+    def centro(self) -> Tuple[int, int]:
+        return self.left + self.width // 2, self.top + self.height // 2
+
+
+# ----------------------------
+# Templates (carregados e convertidos uma vez)
+# ----------------------------
+_cache_lock = threading.Lock()
+_templates: Dict[Tuple[str, int, float], "np.ndarray"] = {}
+_ultima_posicao: Dict[str, Regiao] = {}
+_ultima_escala: Dict[str, float] = {}
+
+
+def _cinza(im) -> "np.ndarray":
+    return np.asarray(im.convert("L"), dtype=np.float32)
+
+
+def carregar_template(caminho: str, escala: float = 1.0) -> "np.ndarray":
+    """PNG -> matriz em tons de cinza (float32), redimensionada para a escala. Cache por (arquivo, mtime, escala)."""
+    chave = (os.path.abspath(caminho), os.stat(caminho).st_mtime_ns, round(escala, 3))
+    with _cache_lock:
+        arr = _templates.get(chave)
+    if arr is not None:
+        return arr
+    with Image.open(caminho) as im:
+        im = im.convert("L")
+        if escala != 1.0:
+            w, h = im.size
+            im = im.resize((max(1, round(w * escala)), max(1, round(h * escala))), Image.BILINEAR)
+        arr = np.asarray(im, dtype=np.float32)
+    with _cache_lock:
+        _templates[chave] = arr
+    return arr
+
+
+# ----------------------------
+# Correlação cruzada normalizada (NumPy, via FFT + imagens integrais)
+# ----------------------------
+def _somas_janela(img: "np.ndarray", th: int, tw: int) -> "np.ndarray":
+    ii = np.zeros((img.shape[0] + 1, img.shape[1] + 1), dtype=np.float64)
+    ii[1:, 1:] = img.cumsum(0).cumsum(1)
+    return ii[th:, tw:] - ii[:-th, tw:] - ii[th:, :-tw] + ii[:-th, :-tw]
+
+
+def correlacao_normalizada(img: "np.ndarray", tpl: "np.ndarray") -> "np.ndarray":
+    """
+    Mapa NCC (-1..1) de todas as posições válidas do template na imagem
+    (mesma métrica do TM_CCOEFF_NORMED do OpenCV, sem depender dele).
+    """
+    H, W = img.shape
+    th, tw = tpl.shape
+    if th > H or tw > W:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    t = tpl.astype(np.float64) - float(tpl.mean())
+    t_norma = float(np.sqrt((t * t).sum()))
+    if t_norma == 0:
+        return np.zeros((H - th + 1, W - tw + 1), dtype=np.float32)
+
+    fh, fw = H + th - 1, W + tw - 1
+    forma = (1 << (fh - 1).bit_length(), 1 << (fw - 1).bit_length())
+    f_img = np.fft.rfft2(img.astype(np.float64), forma)
+    f_tpl = np.fft.rfft2(t[::-1, ::-1], forma)
+    corr = np.fft.irfft2(f_img * f_tpl, forma)[th - 1:H, tw - 1:W]
+
+    n = th * tw
+    s = _somas_janela(img.astype(np.float64), th, tw)
+    s2 = _somas_janela(img.astype(np.float64) ** 2, th, tw)
+    var = np.maximum(s2 - s * s / n, 0.0)
+    den = np.sqrt(var) * t_norma
+    # janelas praticamente lisas (desvio < 0.1 nível de cinza) não têm correlação definida
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ncc = np.where(var > n * 1e-2, corr / den, 0.0)
+    return np.clip(ncc, -1.0, 1.0).astype(np.float32)
+
+
+def _melhor(ncc: "np.ndarray") -> Tuple[float, int, int]:
+    if ncc.size == 0:
+        return -1.0, 0, 0
+    idx = int(np.argmax(ncc))
+    y, x = divmod(idx, ncc.shape[1])
+    return float(ncc[y, x]), x, y
+
+
+def _reduzir(arr: "np.ndarray") -> "np.ndarray":
+    h, w = (arr.shape[0] // 2) * 2, (arr.shape[1] // 2) * 2
+    a = arr[:h, :w]
+    return (a[0::2, 0::2] + a[1::2, 0::2] + a[0::2, 1::2] + a[1::2, 1::2]) / 4.0
+
+
+def procurar_em(img: "np.ndarray", tpl: "np.ndarray", confianca: float) -> Optional[Tuple[int, int, float]]:
+    """(x, y, score) do melhor ponto na imagem, ou None abaixo da confiança."""
+    th, tw = tpl.shape
+    if img.shape[0] * img.shape[1] > AREA_MAX_BUSCA_DIRETA and min(th, tw) >= 16:
+        # grossa em meia resolução; refina numa janela pequena na resolução original
+        score, x, y = _melhor(correlacao_normalizada(_reduzir(img), _reduzir(tpl)))
+        if score < confianca - 0.15:
+            return None
+        x0, y0 = max(0, 2 * x - 4), max(0, 2 * y - 4)
+        janela = img[y0:y0 + th + 8, x0:x0 + tw + 8]
+        score, dx, dy = _melhor(correlacao_normalizada(janela, tpl))
+        x, y = x0 + dx, y0 + dy
+    else:
+        score, x, y = _melhor(correlacao_normalizada(img, tpl))
+    return (x, y, score) if score >= confianca else None
+
+
+# ----------------------------
+# Tela
+# ----------------------------
+def _tamanho_tela() -> Tuple[int, int]:
+    w, h = pg.size()
+    return int(w), int(h)
+
+
+def _intersecao(regiao: Regiao, limite: Regiao) -> Optional[Regiao]:
+    l, t, w, h = regiao
+    ll, lt, lw, lh = limite
+    l2, t2 = max(ll, l), max(lt, t)
+    r2, b2 = min(ll + lw, l + w), min(lt + lh, t + h)
+    if r2 <= l2 or b2 <= t2:
+        return None
+    return (l2, t2, r2 - l2, b2 - t2)
+
+
+def _regiao_base(regiao: Optional[Regiao]) -> Optional[Regiao]:
+    """Região pedida recortada à tela (ou a tela inteira)."""
+    tela = (0, 0) + _tamanho_tela()
+    return _intersecao(regiao, tela) if regiao else tela
+
+
+def _regioes_busca(caminho: str, tpl_shape: Tuple[int, int], base: Regiao) -> Iterator[Regiao]:
+    """Última posição conhecida com margem crescente, depois a região base inteira (tudo dentro da base)."""
+    ultima = _ultima_posicao.get(caminho)
+    vistas: List[Regiao] = []
+    if ultima is not None:
+        l, t, w, h = ultima
+        th, tw = tpl_shape
+        for margem in (1, 4):
+            mw, mh = max(w, tw) * margem, max(h, th) * margem
+            r = _intersecao((l - mw, t - mh, w + 2 * mw, h + 2 * mh), base)
+            if r and r not in vistas:
+                vistas.append(r)
+                yield r
+    if base not in vistas:
+        yield base
+
+
+def _procurar_na_captura(
+    caminho: str,
+    img: "np.ndarray",
+    base: Regiao,
+    confianca: float,
+    escalas: Tuple[float, ...],
+) -> Optional[Achado]:
+    """Procura o template em recortes da captura `img` da região `base` (sem capturar a tela de novo)."""
+    ordem = list(escalas)
+    ultima = _ultima_escala.get(caminho)
+    if ultima is not None:
+        ordem = [ultima] + [e for e in ordem if e != ultima]
+
+    tpl_base = carregar_template(caminho, 1.0)
+    for reg in _regioes_busca(caminho, tpl_base.shape, base):
+        x0, y0 = reg[0] - base[0], reg[1] - base[1]
+        recorte = img[y0:y0 + reg[3], x0:x0 + reg[2]]
+        for escala in ordem:
+            tpl = carregar_template(caminho, escala)
+            achado = procurar_em(recorte, tpl, confianca)
+            if achado is None:
+                continue
+            x, y, score = achado
+            th, tw = tpl.shape
+            res = Achado(reg[0] + x, reg[1] + y, tw, th, score, escala)
+            _ultima_posicao[caminho] = (res.left, res.top, res.width, res.height)
+            _ultima_escala[caminho] = escala
+            return res
+    return None
+
+
+def localizar(
+    caminho: str,
+    confianca: float = 0.8,
+    regiao: Optional[Regiao] = None,
+    escalas: Tuple[float, ...] = ESCALAS_PADRAO,
+) -> Optional[Achado]:
+    """Uma tentativa: uma captura da região e as escalas testadas (a última que funcionou primeiro)."""
+    base = _regiao_base(regiao)
+    if base is None:
+        return None
+    return _procurar_na_captura(caminho, _cinza(pg.screenshot(region=base)), base, confianca, escalas)
+
+
+def _miniatura(img: "np.ndarray") -> "np.ndarray":
+    f = REDUCAO_MINIATURA
+    h, w = (img.shape[0] // f) * f, (img.shape[1] // f) * f
+    if not h or not w:
+        return img
+    return img[:h, :w].reshape(h // f, f, w // f, f).mean(axis=(1, 3))
+
+
+def _mudou(anterior: Optional["np.ndarray"], atual: "np.ndarray") -> bool:
+    if anterior is None or anterior.shape != atual.shape:
+        return True
+    return int((np.abs(atual - anterior) > LIMIAR_BLOCO).sum()) > BLOCOS_TOLERADOS
+
+
+def aguardar(
+    caminho: str,
+    timeout: float = 30.0,
+    confianca: float = 0.8,
+    regiao: Optional[Regiao] = None,
+    escalas: Tuple[float, ...] = ESCALAS_PADRAO,
+) -> Optional[Achado]:
+    """
+    Espera a imagem aparecer na tela (ou timeout).
+
+    Polling adaptativo: começa a cada INTERVALO_MIN e desacelera até INTERVALO_MAX enquanto a tela
+    não muda; qualquer mudança volta ao intervalo mínimo. Cada ciclo captura só a região de busca, uma vez:
+    se a miniatura dela é a mesma da última procura, a correlação não roda; senão a mesma captura é procurada.
+    """
+    if not (lazy_import.disponivel("numpy") and lazy_import.disponivel("PIL")):
+        return _aguardar_pyautogui(caminho, timeout, confianca, regiao)
+
+    base = _regiao_base(regiao)
+    if base is None:
+        log.warning(f"Região de busca fora da tela para '{os.path.basename(caminho)}': {regiao}")
+        return None
+
+    inicio = time.monotonic()
+    intervalo = INTERVALO_MIN
+    miniatura_anterior: Optional["np.ndarray"] = None
+    tentativas = 0
+    while True:
+        img = _cinza(pg.screenshot(region=base))
+        miniatura = _miniatura(img)
+        if _mudou(miniatura_anterior, miniatura):
+            tentativas += 1
+            achado = _procurar_na_captura(caminho, img, base, confianca, escalas)
+            if achado is not None:
+                log.debug(
+                    f"'{os.path.basename(caminho)}' em ({achado.left}, {achado.top}) score={achado.confianca:.2f} "
+                    f"escala={achado.escala} após {tentativas} tentativa(s), {time.monotonic() - inicio:.1f}s"
+                )
+                return achado
+            intervalo = INTERVALO_MIN
+            miniatura_anterior = miniatura
+        else:
+            intervalo = min(INTERVALO_MAX, intervalo * FATOR_INTERVALO)
+
+        if time.monotonic() - inicio + intervalo > timeout:
+            return None
+        time.sleep(intervalo)
+
+
+def _aguardar_pyautogui(caminho: str, timeout: float, confianca: float, regiao: Optional[Regiao]) -> Optional[Achado]:
+    """Sem NumPy/Pillow: comportamento antigo (locateOnScreen da tela a cada 1s)."""
+    log.debug("NumPy/Pillow indisponíveis: usando pyautogui.locateOnScreen.")
+    inicio = time.monotonic()
+    while time.monotonic() - inicio < timeout:
+        try:
+            box = pg.locateOnScreen(caminho, confidence=confianca, region=regiao)
+        except pg.ImageNotFoundException:
+            box = None
+        if box:
+            return Achado(int(box.left), int(box.top), int(box.width), int(box.height), confianca, 1.0)
+        time.sleep(1.0)
+    return None
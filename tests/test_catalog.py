@@ -0,0 +1,123 @@
+# tests/test_catalog.py
+import os
+import sqlite3
+
+import pytest
+
+import catalog
+
+XML_NFSE = """<?xml version="1.0" encoding="UTF-8"?>
+<NFSe xmlns="http://www.sped.fazenda.gov.br/nfse">
+  <infNFSe>
+    <nNFSe>{numero}</nNFSe>
+    <emit><CNPJ>{cnpj}</CNPJ><xNome>Acme Servicos</xNome></emit>
+    <DPS><infDPS>
+      <dhEmi>2025-03-10T10:00:00-03:00</dhEmi>
+      <toma><CNPJ>98765432000110</CNPJ><xNome>Tomador Ltda</xNome></toma>
+      <valores><vServPrest><vServ>100.50</vServ></vServPrest></valores>
+    </infDPS></DPS>
+  </infNFSe>
+</NFSe>
+"""
+
+
+def _xml(pasta, nome, numero, cnpj="12345678000190"):
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, nome)
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write(XML_NFSE.format(numero=numero, cnpj=cnpj))
+    return caminho
+
+
+@pytest.mark.parametrize("entrada, esperado", [("000123", "123"), ("123", "123"), (" 0042 ", "42"), ("0", "0"), ("000", "000"), (None, "")])
+def test_normalizar_numero(entrada, esperado):
+    assert catalog.normalizar_numero(entrada) == esperado
+
+
+def test_registrar_e_consultar_com_numero_normalizado(tmp_path):
+    base = str(tmp_path)
+    nota = {"competencia": "2025-03", "empresa": "ACME", "numero_nf": "000123",
+            "cnpj_prestador": "12.345.678/0001-90", "cnpj_tomador": "98.765.432/0001-10", "valor_servico": 10.0}
+    catalog.registrar_nota(base, nota)
+    # mesma nota de novo (reprocessamento), agora sem zeros: atualiza, não duplica
+    catalog.registrar_nota(base, {**nota, "numero_nf": "123", "valor_servico": 20.0})
+
+    notas = catalog.consultar_notas(base, numero_nf="0123")
+    assert len(notas) == 1
+    assert notas[0]["numero_nf"] == "123"
+    assert notas[0]["cnpj_prestador"] == "12345678000190"
+    assert notas[0]["valor_servico"] == 20.0
+    assert catalog.consultar_notas(base, cnpj="98765432000110") == notas
+
+
+def test_registrar_com_conexao_aberta(tmp_path):
+    base = str(tmp_path)
+    con = catalog.conectar(base)
+    try:
+        for n in ("1", "2", "3"):
+            catalog.registrar_nota(base, {"competencia": "2025-03", "numero_nf": n, "cnpj_prestador": "1"}, con=con)
+    finally:
+        con.close()
+    assert len(catalog.consultar_notas(base)) == 3
+
+
+def test_catalogo_fica_no_journal_padrao(tmp_path):
+    con = catalog.conectar(str(tmp_path))
+    try:
+        assert con.execute("PRAGMA journal_mode").fetchone()[0].lower() == "delete"
+    finally:
+        con.close()
+
+
+def test_migracao_de_catalogo_antigo(tmp_path):
+    # catálogo de versão anterior: WAL e números com zeros à esquerda (um deles repetido sem zeros)
+    caminho = catalog.caminho_catalogo(str(tmp_path))
+    con = sqlite3.connect(caminho)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(catalog._SCHEMA)
+    con.executemany(
+        "INSERT INTO notas (competencia, numero_nf, cnpj_prestador) VALUES (?, ?, ?)",
+        [("2025-03", "0007", "1"), ("2025-03", "7", "1"), ("2025-03", "0008", "1")],
+    )
+    con.commit()
+    con.close()
+
+    assert sorted(n["numero_nf"] for n in catalog.consultar_notas(str(tmp_path))) == ["7", "8"]
+    con = catalog.conectar(str(tmp_path))
+    try:
+        assert con.execute("PRAGMA journal_mode").fetchone()[0].lower() == "delete"
+        assert con.execute("PRAGMA user_version").fetchone()[0] == 2
+    finally:
+        con.close()
+
+
+def test_backfill_usa_nome_do_cadastro_e_nao_repete(tmp_path):
+    base = str(tmp_path)
+    xml1 = _xml(os.path.join(base, "2025-03", "ACME"), "ACME - NF 1.xml", "0001")
+    open(os.path.splitext(xml1)[0] + ".pdf", "wb").close()
+    _xml(os.path.join(base, "2025-03", "OUTRO"), "OUTRO - NF 2.xml", "2", cnpj="11111111000111")
+    _xml(os.path.join(base, "2025-04"), "NF 3.xml", "3")
+    os.makedirs(os.path.join(base, "_logs"))
+
+    n = catalog.backfill(base, "2025-03", empresas_por_cnpj={"12.345.678/0001-90": "ACME DO CADASTRO"})
+
+    assert n == 2
+    notas = {r["numero_nf"]: r for r in catalog.consultar_notas(base, competencia="2025-03")}
+    assert notas["1"]["empresa"] == "ACME DO CADASTRO"
+    assert notas["1"]["caminho_pdf"] == os.path.splitext(xml1)[0] + ".pdf"
+    assert notas["1"]["hash_xml"] == catalog.hash_arquivo(xml1)
+    assert notas["2"]["empresa"] == "ACME SERVICOS"  # fora do cadastro: razão social do XML
+    assert catalog.backfill(base, "2025-03") == 0
+    assert catalog.backfill(base) == 1  # só a 2025-04 faltava
+
+
+def test_listar_competencias_inclui_pastas_sem_catalogo(tmp_path):
+    base = str(tmp_path)
+    catalog.registrar_nota(base, {"competencia": "2025-01", "numero_nf": "1", "cnpj_prestador": "1"})
+    os.makedirs(os.path.join(base, "2025-02"))
+    os.makedirs(os.path.join(base, "_dataset"))
+
+    assert catalog.listar_competencias(base) == ["2025-01"]
+    assert catalog.listar_competencias(base, incluir_pastas=True) == ["2025-02", "2025-01"]
+    assert catalog.competencia_catalogada(base, "2025-01")
+    assert not catalog.competencia_catalogada(base, "2025-02")
@@ -0,0 +1,125 @@
+# tests/test_cli.py
+import argparse
+import json
+
+import pytest
+
+import bot_nfse
+import cli
+import data_store
+import job_manager
+import run_ledger
+
+CLIENTES = [
+    {"EMPRESA": "ACME LTDA", "CNPJ": "12.345.678/0001-90", "TIPO_ACESSO": "LOGIN_SENHA"},
+    {"EMPRESA": "BETA SERVICOS", "CNPJ": "98.765.432/0001-10", "TIPO_ACESSO": "CERTIFICADO"},
+    {"EMPRESA": "GAMA", "CNPJ": "", "TIPO_ACESSO": "LOGIN_SENHA"},
+]
+
+
+def test_competencias_intervalo_com_virada_de_ano():
+    assert cli.competencias(["2024-11..2025-02"]) == [(2024, 11), (2024, 12), (2025, 1), (2025, 2)]
+
+
+def test_competencias_repetidas_nao_duplicam():
+    assert cli.competencias(["2025-01..2025-03", "2025-02", "2025-03..2025-04"]) == [
+        (2025, 1), (2025, 2), (2025, 3), (2025, 4),
+    ]
+
+
+def test_competencias_sem_parametro_e_a_anterior():
+    assert cli.competencias([]) == [bot_nfse.calcular_competencia_anterior()]
+
+
+@pytest.mark.parametrize("espec", ["2025-03..2025-01", "2025-13", "25-01", "2025-00..2025-02"])
+def test_competencias_invalidas(espec):
+    with pytest.raises(argparse.ArgumentTypeError):
+        cli.competencias([espec])
+
+
+def test_intervalo_invertido_sai_com_codigo_2(capsys):
+    assert cli.main(["--competencia", "2025-03..2025-01"]) == cli.SAIDA_USO
+    assert "intervalo invertido" in capsys.readouterr().err
+
+
+def _args(*argv):
+    return cli._criar_parser().parse_args(list(argv))
+
+
+def _empresas(clientes):
+    return [c["EMPRESA"] for c in clientes]
+
+
+def test_cliente_por_cnpj_com_ou_sem_mascara():
+    assert _empresas(cli.selecionar_clientes(CLIENTES, _args("--cliente", "12345678000190"))) == ["ACME LTDA"]
+    assert _empresas(cli.selecionar_clientes(CLIENTES, _args("--cliente", "98.765.432/0001-10"))) == ["BETA SERVICOS"]
+
+
+def test_cliente_por_nome_ignora_caixa():
+    args = _args("--cliente", "gama", "--cliente", "Acme Ltda")
+    assert _empresas(cli.selecionar_clientes(CLIENTES, args)) == ["ACME LTDA", "GAMA"]
+
+
+def test_cliente_nao_encontrado_nao_seleciona_nada():
+    assert cli.selecionar_clientes(CLIENTES, _args("--cliente", "INEXISTENTE")) == []
+
+
+def test_excluir_e_tipo_acesso():
+    args = _args("--excluir", "GAMA", "--tipo-acesso", "LOGIN_SENHA")
+    assert _empresas(cli.selecionar_clientes(CLIENTES, args)) == ["ACME LTDA"]
+
+
+@pytest.fixture
+def execucao_falsa(tmp_path, monkeypatch):
+    """main() sem robô: clientes fixos e _rodar_competencia registrando quem seria processado."""
+    config = tmp_path / "ci.json"
+    config.write_text(json.dumps({"pasta_base_saida": str(tmp_path / "saidas")}), encoding="utf-8")
+    monkeypatch.setattr(job_manager, "patch_bot_paths", lambda cfg: None)
+    monkeypatch.setattr(data_store, "garantir_planilha_modelo", lambda caminho: None)
+    monkeypatch.setattr(bot_nfse, "carregar_clientes_da_planilha", lambda: [dict(c) for c in CLIENTES])
+    chamadas = []
+
+    def rodar(cfg, ano, mes, empresas, formato, stop_evt):
+        chamadas.append((f"{ano:04d}-{mes:02d}", list(empresas)))
+        return {
+            "competencia": f"{ano:04d}-{mes:02d}",
+            "status": job_manager.CONCLUIDO,
+            "clientes": [{"empresa": e, "status": "OK"} for e in empresas],
+        }
+
+    monkeypatch.setattr(cli, "_rodar_competencia", rodar)
+    return str(config), str(tmp_path / "saidas"), chamadas
+
+
+def _registrar(base, execucao_id, competencia, empresa, status):
+    m = run_ledger.MetricasCliente(empresa=empresa)
+    m.falhar(status)
+    run_ledger.iniciar_execucao(base, execucao_id, competencia, 1)
+    run_ledger.registrar_cliente(base, execucao_id, competencia, m)
+
+
+def test_retomar_pula_quem_terminou_ok(execucao_falsa, tmp_path):
+    config, base, chamadas = execucao_falsa
+    _registrar(base, "e1", "2025-01", "ACME LTDA", run_ledger.OK)
+    _registrar(base, "e1", "2025-01", "BETA SERVICOS", run_ledger.FALHA_LOGIN)
+    _registrar(base, "e2", "2025-02", "GAMA", run_ledger.ERRO)
+    _registrar(base, "e3", "2025-02", "GAMA", run_ledger.OK)  # última tentativa vale
+    resumo = tmp_path / "resumo.json"
+
+    codigo = cli.main(["--config", config, "-c", "2025-01..2025-02", "--retomar", "--resumo", str(resumo)])
+
+    assert codigo == cli.SAIDA_OK
+    assert chamadas == [
+        ("2025-01", ["BETA SERVICOS", "GAMA"]),
+        ("2025-02", ["ACME LTDA", "BETA SERVICOS"]),
+    ]
+    pulados = [c["pulados"] for c in json.loads(resumo.read_text(encoding="utf-8"))["competencias"]]
+    assert pulados == [["ACME LTDA"], ["GAMA"]]
+
+
+def test_sem_retomar_processa_todos(execucao_falsa):
+    config, base, chamadas = execucao_falsa
+    _registrar(base, "e1", "2025-01", "ACME LTDA", run_ledger.OK)
+
+    assert cli.main(["--config", config, "-c", "2025-01"]) == cli.SAIDA_OK
+    assert chamadas == [("2025-01", ["ACME LTDA", "BETA SERVICOS", "GAMA"])]
@@ -0,0 +1,76 @@
+# tests/test_dataset_export.py
+import os
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import dataset_export  # noqa: E402
+import log_writer  # noqa: E402
+
+
+@pytest.fixture(autouse=True, params=["parquet", "csv"])
+def formato(request, monkeypatch):
+    if request.param == "parquet":
+        pytest.importorskip("pyarrow")
+    else:
+        # mesma leitura pelo caminho de quem instalou sem pyarrow
+        monkeypatch.setattr(dataset_export, "_tem_parquet", lambda: False)
+    return request.param
+
+
+def _competencia(base, competencia, registros):
+    writer = log_writer.LogStreamWriter(os.path.join(base, competencia), competencia)
+    for r in registros:
+        writer.adicionar(r)
+    writer.fechar()
+    return dataset_export.exportar_competencia(base, competencia)
+
+
+REGISTROS = [
+    {"NUMERO_NF": "1", "CNPJ_PRESTADOR": "'12345678000190", "DATA_EMISSAO": "10/03/2025",
+     "VALOR_SERVICO": 100.5, "SITUACAO": "NORMAL"},
+    {"NUMERO_NF": "2", "CNPJ_PRESTADOR": "'12345678000190", "DATA_EMISSAO": "11/03/2025",
+     "VALOR_SERVICO": 10.0, "SITUACAO": "NORMAL"},
+    {"NUMERO_NF": "2", "CNPJ_PRESTADOR": "'12345678000190", "DATA_EMISSAO": "11/03/2025",
+     "VALOR_SERVICO": 0.0, "SITUACAO": "CANCELADA"},  # reprocessada: a última versão vale
+    {"NUMERO_NF": "9", "CNPJ_PRESTADOR": None, "DATA_EMISSAO": "12/03/2025", "VALOR_SERVICO": 5.0},
+]
+
+
+def test_tipos_sobrevivem_a_ida_e_volta(tmp_path):
+    base = str(tmp_path)
+    _competencia(base, "2025-03", REGISTROS)
+
+    df = dataset_export.carregar_dataset(base)
+
+    assert len(df) == 3
+    assert df["VALOR_SERVICO"].dtype == "float64"
+    assert pd.api.types.is_datetime64_any_dtype(df["DATA_EMISSAO"])
+    nf2 = df[df["NUMERO_NF"] == "2"].iloc[0]
+    assert nf2["SITUACAO"] == "CANCELADA" and nf2["VALOR_SERVICO"] == 0.0
+    assert set(df["CNPJ_PRESTADOR"]) == {"12345678000190", ""}
+    assert set(df["COMPETENCIA"]) == {"2025-03"}
+
+
+def test_prestador_sem_cnpj_volta_vazio_e_filtra(tmp_path):
+    base = str(tmp_path)
+    destino = _competencia(base, "2025-03", REGISTROS)
+    assert os.listdir(os.path.join(destino, f"cnpj_prestador={dataset_export.SEM_CNPJ}"))
+
+    sem_cnpj = dataset_export.carregar_dataset(base, cnpj_prestador="")
+
+    assert list(sem_cnpj["NUMERO_NF"]) == ["9"]
+    assert list(sem_cnpj["CNPJ_PRESTADOR"]) == [""]
+
+
+def test_projecao_e_intervalo(tmp_path):
+    base = str(tmp_path)
+    _competencia(base, "2025-02", REGISTROS[:1])
+    _competencia(base, "2025-03", REGISTROS)
+    _competencia(base, "2025-04", REGISTROS[:1])
+
+    df = dataset_export.carregar_dataset(base, "2025-03", "2025-04", ["VALOR_SERVICO", "CNPJ_PRESTADOR"])
+
+    assert list(df.columns) == ["VALOR_SERVICO", "CNPJ_PRESTADOR", "COMPETENCIA"]
+    assert sorted(set(df["COMPETENCIA"])) == ["2025-03", "2025-04"]
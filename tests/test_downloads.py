@@ -0,0 +1,89 @@
+# tests/test_downloads.py
+import os
+
+import pytest
+
+import bot_nfse
+
+
+@pytest.fixture
+def pasta_temp(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot_nfse, "PASTA_DOWNLOAD_TEMP", str(tmp_path))
+    return tmp_path
+
+
+def test_crdownload_anterior_renomeado_nao_conta_como_novo(pasta_temp):
+    # aba 1 ainda baixando quando a foto da aba 2 é tirada
+    (pasta_temp / "NFSe_111.xml.crdownload").write_text("")
+    antes = set(os.listdir(pasta_temp))
+    # depois da foto: o download da aba 1 termina e o da aba 2 começa
+    os.replace(pasta_temp / "NFSe_111.xml.crdownload", pasta_temp / "NFSe_111.xml")
+    (pasta_temp / "NFSe_222.xml.crdownload").write_text("")
+
+    caminho = bot_nfse.aguardar_inicio_download(".xml", antes, timeout=2)
+
+    assert caminho == os.path.join(str(pasta_temp), "NFSe_222.xml")
+
+
+def test_caminho_ja_atribuido_e_ignorado(pasta_temp):
+    antes = set(os.listdir(pasta_temp))
+    (pasta_temp / "NFSe_111.xml").write_text("")
+    (pasta_temp / "NFSe_222.xml.crdownload").write_text("")
+    ja_atribuido = os.path.join(str(pasta_temp), "NFSe_111.xml")
+
+    caminho = bot_nfse.aguardar_inicio_download(".xml", antes, timeout=2, ignorar=[ja_atribuido])
+
+    assert caminho == os.path.join(str(pasta_temp), "NFSe_222.xml")
+
+
+def test_sem_download_novo_retorna_none(pasta_temp):
+    (pasta_temp / "NFSe_111.xml.crdownload").write_text("")
+    antes = set(os.listdir(pasta_temp))
+    os.replace(pasta_temp / "NFSe_111.xml.crdownload", pasta_temp / "NFSe_111.xml")
+
+    assert bot_nfse.aguardar_inicio_download(".xml", antes, timeout=1) is None
+
+
+class _Botao:
+    def __init__(self, ao_clicar):
+        self._ao_clicar = ao_clicar
+
+    def click(self):
+        self._ao_clicar()
+
+
+class _SwitchTo:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def window(self, aba):
+        self._driver.aba_atual = aba
+
+
+class _Driver:
+    def __init__(self):
+        self.aba_atual = None
+        self.switch_to = _SwitchTo(self)
+
+
+def test_disparar_downloads_atribui_cada_arquivo_a_sua_aba(pasta_temp):
+    def clique_aba1():
+        (pasta_temp / "NFSe_111.xml.crdownload").write_text("")
+
+    def clique_aba2():
+        # o download da aba 1 termina no mesmo instante em que o da aba 2 começa
+        os.replace(pasta_temp / "NFSe_111.xml.crdownload", pasta_temp / "NFSe_111.xml")
+        (pasta_temp / "NFSe_222.xml.crdownload").write_text("")
+
+    cliques = {"aba1": clique_aba1, "aba2": clique_aba2}
+    bot = object.__new__(bot_nfse.NFSePortalBot)
+    bot.driver = _Driver()
+    bot._achar_botao = lambda xpaths: _Botao(cliques[bot.driver.aba_atual])
+    lote = [{"aba": "aba1", "linha": 1}, {"aba": "aba2", "linha": 2}]
+
+    resultado = bot._disparar_downloads(lote, ("//botao",), ".xml", "XML", timeout=5)
+
+    assert resultado == {
+        "aba1": os.path.join(str(pasta_temp), "NFSe_111.xml"),
+        "aba2": os.path.join(str(pasta_temp), "NFSe_222.xml"),
+    }
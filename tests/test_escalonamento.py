@@ -0,0 +1,88 @@
+# tests/test_escalonamento.py
+import pytest
+
+import escalonamento
+import run_ledger
+
+
+def _hist(*duracoes, notas=10):
+    return [{"duracao_s": d, "notas": notas, "t_notas": d} for d in duracoes]
+
+
+@pytest.fixture
+def historico(monkeypatch):
+    dados = {}
+    monkeypatch.setattr(run_ledger, "historico_clientes", lambda pasta, empresas, n=10: dados)
+    return dados
+
+
+def _empresas(plano):
+    return [c["EMPRESA"] for c in plano.clientes]
+
+
+def test_maiores_primeiro_pela_mediana(historico):
+    historico.update({
+        "PEQUENA": _hist(60, 50, 1000),  # um dia ruim não muda a mediana
+        "GRANDE": _hist(900, 1100, 1000),
+        "MEDIA": _hist(300),
+    })
+    clientes = [{"EMPRESA": "PEQUENA"}, {"EMPRESA": "MEDIA"}, {"EMPRESA": "GRANDE"}]
+
+    plano = escalonamento.planejar("saida", clientes, workers=2)
+
+    assert _empresas(plano) == ["GRANDE", "MEDIA", "PEQUENA"]
+    assert plano.estimativas == {"PEQUENA": 60, "MEDIA": 300, "GRANDE": 1000}
+    assert plano.sem_historico == []
+    assert plano.makespan_previsto_s == 1000
+    assert plano.makespan_ordem_original_s == 1060  # GRANDE só começaria quando a PEQUENA terminasse
+
+
+def test_sem_historico_usa_mediana_dos_outros(historico):
+    historico.update({"A": _hist(100), "B": _hist(500)})
+    clientes = [{"EMPRESA": "NOVA"}, {"EMPRESA": "A"}, {"EMPRESA": "B"}]
+
+    plano = escalonamento.planejar("saida", clientes, workers=1)
+
+    assert plano.estimativas["NOVA"] == 300
+    assert plano.sem_historico == ["NOVA"]
+    assert _empresas(plano) == ["B", "NOVA", "A"]
+
+
+def test_sem_historico_nenhum_mantem_a_ordem_da_planilha(historico):
+    clientes = [{"EMPRESA": e} for e in ("X", "Y", "Z")]
+
+    plano = escalonamento.planejar("saida", clientes, workers=2)
+
+    assert _empresas(plano) == ["X", "Y", "Z"]
+    assert set(plano.estimativas.values()) == {escalonamento.DURACAO_PADRAO_S}
+    assert escalonamento.planejar("saida", clientes, workers=2, padrao_s=60).estimativas["X"] == 60
+
+
+def test_empate_na_duracao_desempata_pelas_notas(historico):
+    historico.update({"POUCAS": _hist(200, notas=5), "MUITAS": _hist(200, notas=50)})
+
+    plano = escalonamento.planejar("saida", [{"EMPRESA": "POUCAS"}, {"EMPRESA": "MUITAS"}], workers=1)
+
+    assert _empresas(plano) == ["MUITAS", "POUCAS"]
+
+
+@pytest.mark.parametrize("duracoes, workers, esperado", [
+    ([], 3, 0.0),
+    ([10, 10, 10], 1, 30),
+    ([10, 10, 10], 3, 10),
+    ([50, 10, 10, 10, 10], 2, 50),
+    ([10, 10, 10, 10, 50], 2, 70),
+    ([10], 0, 10),  # workers inválido vira 1
+])
+def test_simular_makespan(duracoes, workers, esperado):
+    assert escalonamento.simular_makespan(duracoes, workers) == esperado
+
+
+def test_makespan_real():
+    status = [
+        {"EMPRESA": "A", "INICIO": 100.0, "FIM": 150.0},
+        {"EMPRESA": "B", "INICIO": 110.0, "FIM": 400.0},
+        {"EMPRESA": "C", "INICIO": 120.0},
+    ]
+    assert escalonamento.makespan_real(status) == 300.0
+    assert escalonamento.makespan_real([{"EMPRESA": "A", "INICIO": 100.0}]) is None
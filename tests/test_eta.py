@@ -0,0 +1,85 @@
+# tests/test_eta.py
+import pytest
+
+import eta
+import run_ledger
+
+AGORA = 1_000_000.0
+
+HISTORICO = {
+    "A": [{"duracao_s": d, "notas": 10, "t_notas": 150} for d in (100, 200, 300)],  # mediana 200s, 15s/nota
+    "B": [{"duracao_s": 600, "notas": 40, "t_notas": 600}],
+}
+
+
+@pytest.fixture
+def estimador(monkeypatch):
+    monkeypatch.setattr(run_ledger, "historico_clientes", lambda pasta, empresas, n=10: HISTORICO)
+    return eta.EstimadorETA("saida", ["A", "B", "C"])
+
+
+def _linha(resultado, empresa):
+    return next(c for c in resultado["clientes"] if c["EMPRESA"] == empresa)
+
+
+def test_historico_e_padrao_para_cliente_novo(estimador):
+    assert estimador.esperado == {"A": 200, "B": 600}
+    assert estimador.esperado_padrao == 400  # C: mediana dos que têm histórico
+
+    r = estimador.estimar([], agora=AGORA)
+
+    assert r["restante_s"] == 200 + 600 + 400
+    assert r["termino_previsto"] == AGORA + 1200
+    assert r["fator"] == 1.0 and not r["parcial"]
+
+
+def test_ritmo_do_dia_corrige_os_restantes(estimador):
+    status = [
+        {"EMPRESA": "A", "STATUS": "OK", "NOTAS": 10, "INICIO": AGORA - 500, "FIM": AGORA - 100},  # 2x o histórico
+        {"EMPRESA": "B", "STATUS": "EM ANDAMENTO", "NOTAS": 3, "INICIO": AGORA - 100},
+    ]
+
+    r = estimador.estimar(status, agora=AGORA)
+
+    assert r["fator"] == 2.0
+    # B: 600 x 2 - 100 já decorridos; C: mediana observada no job (400) x 2
+    assert r["restante_s"] == 1100 + 800
+    a = _linha(r, "A")
+    assert (a["ESPERADO_MIN"], a["REAL_MIN"], a["SITUACAO"]) == (3.3, 6.7, eta.SITUACAO_CONCLUIDO)
+    assert _linha(r, "B")["SITUACAO"] == eta.SITUACAO_NO_PRAZO
+    assert _linha(r, "C")["SITUACAO"] == eta.SITUACAO_AGUARDANDO
+
+
+@pytest.mark.parametrize("decorrido, situacao", [
+    (700, eta.SITUACAO_NO_PRAZO),  # acima do esperado, mas menos de ATRASO_MIN_S
+    (1000, eta.SITUACAO_ATRASADO),
+    (2000, eta.SITUACAO_TRAVADO),
+])
+def test_sinaliza_cliente_acima_do_esperado(estimador, decorrido, situacao):
+    status = [{"EMPRESA": "B", "STATUS": "EM ANDAMENTO", "NOTAS": 0, "INICIO": AGORA - decorrido}]
+    assert _linha(estimador.estimar(status, agora=AGORA), "B")["SITUACAO"] == situacao
+
+
+def test_passou_do_esperado_usa_as_notas_que_faltam(estimador):
+    status = [{"EMPRESA": "A", "STATUS": "EM ANDAMENTO", "NOTAS": 4, "INICIO": AGORA - 300}]
+
+    r = estimador.estimar(status, agora=AGORA)
+
+    # A: 6 notas x 15s/nota do histórico; B e C ainda não começaram
+    assert r["restante_s"] == 6 * 15 + 600 + 400
+
+
+def test_sem_historico_nao_inventa_eta(monkeypatch):
+    monkeypatch.setattr(run_ledger, "historico_clientes", lambda pasta, empresas, n=10: {})
+    estimador = eta.EstimadorETA("saida", ["C"])
+
+    r = estimador.estimar([], agora=AGORA)
+    assert r["restante_s"] is None and r["termino_previsto"] is None and r["parcial"]
+
+    fim = estimador.estimar([{"EMPRESA": "C", "STATUS": "OK", "INICIO": AGORA - 60, "FIM": AGORA}], agora=AGORA)
+    assert fim["restante_s"] == 0.0
+
+
+@pytest.mark.parametrize("segundos, texto", [(None, "—"), (45, "45s"), (125, "2min05s"), (3725, "1h02min")])
+def test_formatar_duracao(segundos, texto):
+    assert eta.formatar_duracao(segundos) == texto
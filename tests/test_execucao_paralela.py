@@ -0,0 +1,60 @@
+# tests/test_execucao_paralela.py
+import json
+
+import bot_logging
+import bot_nfse
+import config as cfgmod
+import execucao_paralela
+import run_ledger
+
+
+class _ProcessoQueCai:
+    """Processo do cliente que termina sem entregar resultado (crash do Chrome/driver)."""
+
+    def __init__(self, target=None, args=(), name=None, daemon=None):
+        self.pid = 4242
+        self.exitcode = -9
+
+    def start(self):
+        pass
+
+
+def test_falha_supervisionada_vai_para_o_log_da_execucao(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot_nfse, "PASTA_BASE_SAIDA", str(tmp_path / "saidas"))
+    monkeypatch.setattr(bot_nfse, "PASTA_DOWNLOAD_TEMP", str(tmp_path / "downloads"))
+    monkeypatch.setattr(execucao_paralela._ctx, "Process", _ProcessoQueCai, raising=False)
+    monkeypatch.setattr(execucao_paralela, "_supervisionar", lambda proc, limites: None)
+    cfg = cfgmod.AppConfig(
+        caminho_planilha=str(tmp_path / "clientes.xlsx"),
+        pasta_base_saida=str(tmp_path / "saidas"),
+        pasta_download_temp=str(tmp_path / "downloads"),
+        pasta_imagens_cert=str(tmp_path / "imagens"),
+    )
+    execucao = bot_logging.configurar_execucao(str(tmp_path / "saidas"))
+    finalizados = []
+    try:
+        with bot_logging.contexto(execucao=execucao.id, competencia="2025-03"):
+            execucao_paralela.processar_clientes(
+                cfg, 2025, 3, [{"EMPRESA": "ACME LTDA", "CNPJ": "12345678000190"}],
+                workers=1,
+                execucao_id=execucao.id,
+                ao_iniciar=lambda cliente: None,
+                ao_finalizar=lambda empresa, status, detalhe: finalizados.append((empresa, status, detalhe)),
+                ao_baixar_nota=lambda empresa, n: None,
+                parar=lambda: False,
+                limites=execucao_paralela.LimitesProcesso(reinicios=1),
+                com_display=False,
+            )
+    finally:
+        execucao.encerrar()
+
+    with open(execucao.caminho_arquivo, encoding="utf-8") as f:
+        registros = [json.loads(linha) for linha in f if linha.strip()]
+    mensagens = [r["msg"] for r in registros]
+    assert "Cliente ACME LTDA no processo 4242." in mensagens
+    assert mensagens.count("Cliente ACME LTDA: processo do cliente terminou com código -9.") == 2
+    assert any("nova tentativa num processo novo" in m for m in mensagens)
+    assert all(r["cliente"] == "ACME LTDA" and r["competencia"] == "2025-03" for r in registros)
+    assert finalizados == [("ACME LTDA", "FALHA", "Processo do cliente terminou com código -9.")]
+    falhas = run_ledger.ultimo_status_por_cliente(str(tmp_path / "saidas"), "2025-03")
+    assert falhas == {"ACME LTDA": run_ledger.ERRO}
@@ -0,0 +1,121 @@
+# tests/test_file_index.py
+import os
+
+import pytest
+
+import file_index
+from catalog import hash_arquivo
+
+
+def _origem(tmp_path, nome, conteudo):
+    pasta = tmp_path / "download"
+    pasta.mkdir(exist_ok=True)
+    caminho = pasta / nome
+    caminho.write_bytes(conteudo)
+    return str(caminho)
+
+
+@pytest.fixture
+def destino(tmp_path):
+    return str(tmp_path / "2025-03")
+
+
+def test_colocar_novo_identico_e_versao(tmp_path, destino):
+    indice = file_index.IndiceDestino(destino)
+
+    primeiro = _origem(tmp_path, "a.xml", b"<nota v1/>")
+    caminho, acao, sha = indice.colocar(primeiro, "ACME - NF 1")
+    assert (os.path.basename(caminho), acao) == ("ACME - NF 1.xml", "novo")
+    assert sha == hash_arquivo(caminho)
+    assert not os.path.exists(primeiro)
+
+    # mesmo conteúdo de novo: não duplica e a origem é descartada
+    repetido = _origem(tmp_path, "b.xml", b"<nota v1/>")
+    assert indice.colocar(repetido, "ACME - NF 1") == (caminho, "identico", sha)
+    assert not os.path.exists(repetido)
+
+    # conteúdo diferente (ex.: cancelada depois): nova versão ao lado
+    cancelada = _origem(tmp_path, "c.xml", b"<nota cancelada/>")
+    caminho2, acao2, sha2 = indice.colocar(cancelada, "ACME - NF 1")
+    assert (os.path.basename(caminho2), acao2) == ("ACME - NF 1 (2).xml", "versao")
+    assert sha2 != sha
+    assert indice.existente("ACME - NF 1", ".xml") == caminho2
+    assert sorted(os.listdir(destino)) == ["ACME - NF 1 (2).xml", "ACME - NF 1.xml"]
+
+
+def test_mesma_nota_com_outro_nome_e_reconhecida_pela_chave(tmp_path, destino):
+    indice = file_index.IndiceDestino(destino)
+    chave = ("12345678000190", "7")
+    caminho, _, _ = indice.colocar(_origem(tmp_path, "a.pdf", b"%PDF nota 7"), "ACME - NF 7", chave=chave)
+
+    # razão social mudou no portal: nome diferente, mesma nota
+    _, acao, _ = indice.colocar(_origem(tmp_path, "b.pdf", b"%PDF nota 7"), "ACME LTDA - NF 7", chave=chave)
+
+    assert acao == "identico"
+    assert indice.existente("QUALQUER", ".pdf", chave=chave) == caminho
+
+
+def test_indice_salvo_e_reaproveitado_por_outra_execucao(tmp_path, destino, monkeypatch):
+    indice = file_index.IndiceDestino(destino)
+    indice.colocar(_origem(tmp_path, "a.xml", b"<nota/>"), "ACME - NF 1", chave=("1", "1"))
+    assert not os.path.exists(os.path.join(destino, file_index.ARQUIVO_INDICE))  # gravação em lote
+    indice.salvar()
+
+    entradas = file_index.ler_indice_pasta(destino)
+    assert entradas["ACME - NF 1.xml"]["numero_nf"] == "1"
+
+    # próxima execução: hash vem do índice, sem reler o arquivo
+    monkeypatch.setattr(file_index, "hash_arquivo", lambda caminho: "nao-deveria-ler-" + os.path.basename(caminho))
+    outro = file_index.IndiceDestino(destino)
+    assert outro._hash("ACME - NF 1.xml") == entradas["ACME - NF 1.xml"]["sha256"]
+
+
+def test_salvar_junta_com_o_que_outro_processo_gravou(tmp_path, destino):
+    a = file_index.IndiceDestino(destino)
+    b = file_index.IndiceDestino(destino)  # outro worker na mesma pasta (layout plano)
+
+    caminho_a, _, _ = a.colocar(_origem(tmp_path, "a.xml", b"<nota A/>"), "NF 1")
+    a.salvar()
+    # b não sabe do arquivo de a: o nome reservado em disco força a próxima versão
+    caminho_b, acao, _ = b.colocar(_origem(tmp_path, "b.xml", b"<nota B/>"), "NF 1")
+    b.salvar()
+
+    assert os.path.basename(caminho_b) == "NF 1 (2).xml" and acao == "novo"
+    assert set(file_index.ler_indice_pasta(destino)) == {"NF 1.xml", "NF 1 (2).xml"}
+    # depois de salvar, b enxerga o arquivo de a e não o duplica
+    assert b.colocar(_origem(tmp_path, "c.xml", b"<nota A/>"), "NF 1")[:2] == (caminho_a, "identico")
+
+
+def test_trava_abandonada_e_retomada(destino, monkeypatch):
+    os.makedirs(destino)
+    trava = os.path.join(destino, file_index.ARQUIVO_INDICE + ".lock")
+    open(trava, "w").close()
+    os.utime(trava, (0, 0))  # de um processo que caiu há muito tempo
+
+    with file_index._trava_indice(destino):
+        assert os.path.exists(trava)
+    assert not os.path.exists(trava)
+
+    open(trava, "w").close()  # trava recente de outro processo vivo
+    monkeypatch.setattr(file_index, "TRAVA_ESPERA_S", 0.1)
+    with pytest.raises(OSError):
+        with file_index._trava_indice(destino):
+            pass
+
+
+def test_importar_pasta_conta_por_acao(tmp_path, destino):
+    origem = tmp_path / "antiga"
+    origem.mkdir()
+    (origem / "NF 1.xml").write_bytes(b"<nota 1/>")
+    (origem / "NF 2.xml").write_bytes(b"<nota 2/>")
+    (origem / "~$lock.xlsx").write_bytes(b"lixo")
+    indice = file_index.IndiceDestino(destino)
+    indice.colocar(_origem(tmp_path, "x.xml", b"<nota 1/>"), "NF 1")
+    indice.colocar(_origem(tmp_path, "y.xml", b"<nota 2 corrigida/>"), "NF 2")
+    indice.salvar()
+
+    contagem = file_index.importar_pasta(str(origem), destino)
+
+    assert contagem == {"novo": 0, "identico": 1, "versao": 1}
+    assert sorted(os.listdir(origem)) == ["NF 1.xml", "NF 2.xml", "~$lock.xlsx"]  # origem intacta
+    assert sorted(n for n in os.listdir(destino) if not n.startswith("_")) == ["NF 1.xml", "NF 2 (2).xml", "NF 2.xml"]
@@ -0,0 +1,46 @@
+# tests/test_lazy_import.py
+import os
+import subprocess
+import sys
+
+import pytest
+
+import lazy_import
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# módulos que o app/robô importa na subida: nenhum deles pode puxar as dependências pesadas
+MODULOS = ["bot_nfse", "ocr_ui", "template_match", "cert_image_selector", "cert_selector", "data_store", "catalog"]
+PESADOS = ["pyautogui", "selenium", "pywinauto", "pytesseract", "cv2", "PIL", "pandas", "numpy"]
+
+
+def test_import_dos_modulos_nao_carrega_dependencias_pesadas():
+    codigo = (
+        "import sys\n"
+        f"import {', '.join(MODULOS)}\n"
+        f"print(','.join(m for m in {PESADOS!r} if m in sys.modules))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == ""
+
+
+def test_configuracao_roda_no_primeiro_uso():
+    chamadas = []
+    mod = lazy_import.modulo("json", "o teste", ao_carregar=lambda m: chamadas.append(m.__name__))
+
+    assert not mod.carregado and chamadas == []
+    assert mod.dumps([1]) == "[1]"
+    mod.loads("1")
+    assert mod.carregado and chamadas == ["json"]
+
+
+def test_dependencia_ausente_falha_no_uso_dizendo_o_recurso():
+    mod = lazy_import.modulo("pacote_que_nao_existe_xyz", "o login por certificado", pacote_pip="pacote-xyz")
+    obj = lazy_import.objeto("pacote_que_nao_existe_xyz", "Desktop", "a janela do Windows")
+
+    with pytest.raises(ImportError, match="o login por certificado.*pip install pacote-xyz"):
+        mod.qualquer_coisa
+    with pytest.raises(ImportError, match="a janela do Windows"):
+        obj()
+    assert not lazy_import.disponivel("pacote_que_nao_existe_xyz")
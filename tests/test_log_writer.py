@@ -0,0 +1,97 @@
+# tests/test_log_writer.py
+import csv
+import os
+
+import pytest
+
+import log_writer
+
+COMP = "2025-03"
+
+
+def _nota(numero, situacao="NORMAL", cnpj="'12345678000190", valor=10.0):
+    return {"NUMERO_NF": numero, "CNPJ_PRESTADOR": cnpj, "VALOR_SERVICO": valor, "SITUACAO": situacao}
+
+
+def _linhas_csv(caminho):
+    with open(caminho, encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f, delimiter=";"))
+
+
+def test_journal_grava_cada_nota_na_hora(tmp_path):
+    pasta = str(tmp_path / COMP)
+    writer = log_writer.LogStreamWriter(pasta, COMP)
+    writer.adicionar(_nota("1"))
+    writer.adicionar({**_nota("2"), "CAMPO_EXTRA": "fora do layout"})
+
+    # sem fechar: outro leitor (ou o próximo processo, depois de uma queda) já vê as duas linhas
+    registros = list(log_writer.ler_journal(writer.caminho_journal))
+    writer.fechar()
+
+    assert [r["NUMERO_NF"] for r in registros] == ["1", "2"]
+    assert list(registros[1]) == log_writer.COLUNAS_LOG_ORDEM
+    assert writer.total == 2
+
+
+def test_linha_truncada_de_uma_queda_e_isolada(tmp_path):
+    pasta = str(tmp_path / COMP)
+    os.makedirs(pasta)
+    journal = log_writer.caminho_journal(pasta, COMP)
+    with open(journal, "w", encoding="utf-8") as f:
+        f.write('{"NUMERO_NF": "1", "SITUACAO": "NORMAL"}\n{"NUMERO_NF": "2", "SITU')  # queda no meio da escrita
+
+    writer = log_writer.LogStreamWriter(pasta, COMP)
+    writer.adicionar(_nota("3"))
+    writer.fechar()
+
+    assert [r["NUMERO_NF"] for r in log_writer.ler_journal(journal)] == ["1", "3"]
+
+
+def test_ultima_versao_de_cada_nota_vale(tmp_path):
+    pasta = str(tmp_path / COMP)
+    writer = log_writer.LogStreamWriter(pasta, COMP)
+    writer.adicionar(_nota("1"))
+    writer.adicionar(_nota("2"))
+    writer.adicionar(_nota("1", situacao="CANCELADA", valor=0.0))  # reprocessada depois do cancelamento
+    writer.adicionar(_nota("1", cnpj="'99999999000199"))  # mesmo número, outro prestador
+    writer.adicionar(_nota("SEM_NUMERO"))
+    writer.adicionar(_nota("SEM_NUMERO"))  # sem número: cada linha vale por si
+
+    caminho = writer.finalizar("csv")
+
+    linhas = _linhas_csv(caminho)
+    assert [(r["NUMERO_NF"], r["CNPJ_PRESTADOR"], r["SITUACAO"]) for r in linhas] == [
+        ("2", "'12345678000190", "NORMAL"),
+        ("1", "'12345678000190", "CANCELADA"),
+        ("1", "'99999999000199", "NORMAL"),
+        ("SEM_NUMERO", "'12345678000190", "NORMAL"),
+        ("SEM_NUMERO", "'12345678000190", "NORMAL"),
+    ]
+
+
+def test_xlsx_igual_ao_csv(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    pasta = str(tmp_path / COMP)
+    writer = log_writer.LogStreamWriter(pasta, COMP)
+    writer.adicionar(_nota("1"))
+    writer.adicionar(_nota("1", situacao="CANCELADA", valor=0.0))
+
+    caminho = log_writer.reconstruir_log_xlsx(pasta, COMP)
+
+    ws = openpyxl.load_workbook(caminho, read_only=True).active
+    linhas = list(ws.iter_rows(values_only=True))
+    assert list(linhas[0]) == log_writer.COLUNAS_LOG_ORDEM
+    assert len(linhas) == 2
+    dados = dict(zip(linhas[0], linhas[1]))
+    assert dados["SITUACAO"] == "CANCELADA" and dados["VALOR_SERVICO"] == 0
+    assert not os.path.exists(caminho + ".tmp")
+
+
+def test_finalizar_jsonl_so_fecha_o_journal(tmp_path):
+    pasta = str(tmp_path / COMP)
+    writer = log_writer.LogStreamWriter(pasta, COMP)
+    assert writer.finalizar("jsonl") is None  # nada gravado
+
+    writer.adicionar(_nota("1"))
+    assert writer.finalizar("jsonl") == writer.caminho_journal
+    assert sorted(os.listdir(pasta)) == [os.path.basename(writer.caminho_journal)]
@@ -0,0 +1,56 @@
+# tests/test_progress.py
+import time
+
+import progress
+
+
+def test_segundo_iniciar_nao_zera_o_relogio(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: agora[0])
+    canal = progress.CanalProgresso()
+
+    canal.iniciar(None, 3)  # job manager: antes de carregar a planilha
+    agora[0] += 40  # planilha + subida do robô
+    canal.iniciar("/saidas/2025-03", 2)  # robô: pasta e total reais
+
+    snap = canal.snapshot()
+    assert snap["decorrido"] == 40
+    assert snap["output_folder"] == "/saidas/2025-03"
+    assert snap["contadores"]["clientes_total"] == 2
+
+
+def test_nova_execucao_no_mesmo_canal_recomeca_o_relogio(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: agora[0])
+    canal = progress.CanalProgresso()
+    canal.iniciar("/a", 1)
+    agora[0] += 10
+    canal.concluir()
+    agora[0] += 100
+
+    canal.iniciar("/b", 1)
+    agora[0] += 5
+
+    assert canal.snapshot()["decorrido"] == 5
+
+
+def test_contadores_e_status_coalescido():
+    vistos = []
+    canal = progress.CanalProgresso(max_logs=3, observador=vistos.append)
+    canal.iniciar("/saidas", 2)
+    canal.cliente_inicio("ACME", {"EMPRESA": "ACME"})
+    canal.nota_baixada("ACME", 100)
+    canal.nota_baixada("ACME", 50)
+    canal.cliente_fim("ACME", "OK")
+    canal.cliente_inicio("BETA", {"EMPRESA": "BETA"})
+    canal.cliente_fim("BETA", "FALHA", "login")
+    for i in range(10):
+        canal.log(f"linha {i}")
+
+    snap = canal.snapshot()
+    assert snap["contadores"] == {
+        "clientes_total": 2, "clientes_concluidos": 2, "clientes_falha": 1, "notas": 2, "bytes": 150,
+    }
+    assert [(s["EMPRESA"], s["STATUS"], s["NOTAS"]) for s in snap["status"]] == [("ACME", "OK", 2), ("BETA", "FALHA", 0)]
+    assert snap["logs"] == ["linha 7", "linha 8", "linha 9"]  # ring buffer
+    assert len(vistos) == 2  # observador só nos marcos (fim de cliente)
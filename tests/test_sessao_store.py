@@ -0,0 +1,107 @@
+# tests/test_sessao_store.py
+import os
+import stat
+import time
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+import data_store  # noqa: E402
+import sessao_store  # noqa: E402
+
+
+@pytest.fixture
+def cofre_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("PORTALNFSE_CHAVE_SESSOES", raising=False)
+    monkeypatch.setattr(sessao_store, "ARQUIVO_CHAVE_PADRAO", str(tmp_path / "usuario" / "chave_sessoes"))
+    return str(tmp_path / "sessoes")
+
+
+SESSAO = {"cookies": [{"name": "JSESSIONID", "value": "abc"}], "local_storage": {"k": "v"}}
+
+
+def test_sessao_volta_igual_e_chave_fica_fora_da_pasta(cofre_dir):
+    cofre = sessao_store.CofreSessoes(cofre_dir)
+    cofre.salvar("12345678000190", "conta-1", SESSAO)
+
+    dados = cofre.carregar("12345678000190", "conta-1")
+
+    assert dados["cookies"] == SESSAO["cookies"] and dados["local_storage"] == {"k": "v"}
+    arquivos = os.listdir(cofre_dir)
+    assert len(arquivos) == 1 and "12345678000190" not in arquivos[0]
+    with open(os.path.join(cofre_dir, arquivos[0]), "rb") as f:
+        assert b"JSESSIONID" not in f.read()
+    chave = sessao_store.ARQUIVO_CHAVE_PADRAO
+    assert os.path.exists(chave) and not os.path.exists(os.path.join(cofre_dir, sessao_store.ARQUIVO_CHAVE))
+    if os.name == "posix":
+        assert stat.S_IMODE(os.stat(chave).st_mode) == 0o600
+
+
+def test_sessao_expirada_e_descartada(cofre_dir, monkeypatch):
+    cofre = sessao_store.CofreSessoes(cofre_dir, validade_s=60)
+    cofre.salvar("X", "conta", SESSAO)
+    agora = time.time()
+    monkeypatch.setattr(time, "time", lambda: agora + 61)
+
+    assert cofre.carregar("X", "conta") is None
+    assert os.listdir(cofre_dir) == []
+
+
+def test_outra_conta_descarta_a_sessao(cofre_dir):
+    cofre = sessao_store.CofreSessoes(cofre_dir)
+    cofre.salvar("X", "conta-antiga", SESSAO)
+
+    assert cofre.carregar("X", "conta-nova") is None
+    assert cofre.carregar("X", "conta-antiga") is None  # já foi descartada
+
+
+def test_chave_trocada_descarta_a_sessao(cofre_dir, monkeypatch):
+    sessao_store.CofreSessoes(cofre_dir).salvar("X", "conta", SESSAO)
+    from cryptography.fernet import Fernet
+
+    monkeypatch.setenv("PORTALNFSE_CHAVE_SESSOES", Fernet.generate_key().decode("ascii"))
+    assert sessao_store.CofreSessoes(cofre_dir).carregar("X", "conta") is None
+
+
+def test_chave_antiga_na_pasta_ainda_e_lida(cofre_dir):
+    from cryptography.fernet import Fernet
+
+    os.makedirs(cofre_dir)
+    chave = Fernet.generate_key()
+    with open(os.path.join(cofre_dir, sessao_store.ARQUIVO_CHAVE), "wb") as f:
+        f.write(chave)
+
+    token = sessao_store.cifrar_texto("segredo", cofre_dir)
+
+    assert Fernet(chave).decrypt(token[len(sessao_store.PREFIXO_CIFRADO):].encode()) == b"segredo"
+    assert not os.path.exists(sessao_store.ARQUIVO_CHAVE_PADRAO)
+
+
+def test_cifrar_e_decifrar_texto(cofre_dir, monkeypatch):
+    cifrado = sessao_store.cifrar_texto("senha do pfx", cofre_dir)
+
+    assert cifrado.startswith(sessao_store.PREFIXO_CIFRADO) and "senha" not in cifrado
+    assert sessao_store.cifrar_texto(cifrado, cofre_dir) == cifrado  # não cifra duas vezes
+    assert sessao_store.decifrar_texto(cifrado, cofre_dir) == "senha do pfx"
+    assert sessao_store.decifrar_texto("texto puro", cofre_dir) == "texto puro"
+    assert sessao_store.cifrar_texto("", cofre_dir) == ""
+
+    from cryptography.fernet import Fernet
+
+    monkeypatch.setenv("PORTALNFSE_CHAVE_SESSOES", Fernet.generate_key().decode("ascii"))
+    with pytest.raises(ValueError):
+        sessao_store.decifrar_texto(cifrado, cofre_dir)
+
+
+def test_conta_cliente_muda_com_a_forma_de_acesso():
+    cliente = {"TIPO_ACESSO": "LOGIN_SENHA", "LOGIN": "a", "SENHA": "x"}
+    conta = sessao_store.conta_cliente(cliente)
+
+    assert sessao_store.conta_cliente({**cliente, "SENHA": "y"}) == conta
+    assert sessao_store.conta_cliente({**cliente, "LOGIN": "b"}) != conta
+
+
+def test_identidade_do_cliente_ignora_mascara_e_caixa():
+    assert data_store.identidade_cliente({"CNPJ": "12.345.678/0001-90", "EMPRESA": "X"}) == "12345678000190"
+    assert data_store.identidade_cliente({"CNPJ": "", "EMPRESA": " acme "}) == "ACME"
@@ -0,0 +1,89 @@
+# tests/test_shards.py
+import json
+import os
+
+import pytest
+
+import log_writer
+import run_ledger
+import shards
+
+CLIENTES = [
+    {"EMPRESA": f"Empresa {i}", "CNPJ": f"{i:02d}.345.678/0001-{i % 100:02d}"} for i in range(1, 41)
+] + [{"EMPRESA": "Sem Cnpj Ltda", "CNPJ": ""}]
+
+
+def test_interpretar():
+    assert shards.interpretar("2/4") == (2, 4)
+    assert shards.interpretar(" 1 / 1 ") == (1, 1)
+    for texto in ("0/4", "5/4", "1/0", "2-4", ""):
+        with pytest.raises(ValueError):
+            shards.interpretar(texto)
+
+
+def test_shard_estavel():
+    # mesmo cliente, mesmo shard: formatação do CNPJ, nome e vizinhos não influem
+    a = {"EMPRESA": "Acme", "CNPJ": "12.345.678/0001-90"}
+    b = {"EMPRESA": "Acme Renomeada", "CNPJ": "12345678000190"}
+    for total in range(1, 9):
+        assert shards.shard_do_cliente(a, total) == shards.shard_do_cliente(b, total)
+    antes = {c["EMPRESA"]: shards.shard_do_cliente(c, 4) for c in CLIENTES}
+    novo = {"EMPRESA": "Nova", "CNPJ": "99.999.999/0001-99"}
+    depois = {c["EMPRESA"]: shards.shard_do_cliente(c, 4) for c in CLIENTES + [novo]}
+    assert all(depois[nome] == k for nome, k in antes.items())
+
+
+@pytest.mark.parametrize("total", range(1, 9))
+def test_shards_disjuntos_e_completos(total):
+    partes = [shards.filtrar(CLIENTES, k, total) for k in range(1, total + 1)]
+    nomes = [c["EMPRESA"] for parte in partes for c in parte]
+    assert sorted(nomes) == sorted(c["EMPRESA"] for c in CLIENTES)
+    assert len(nomes) == len(set(nomes))
+
+
+def _saida_do_shard(pasta, competencia, numero_nf, empresa, execucao_id):
+    pasta_comp = os.path.join(pasta, competencia)
+    os.makedirs(os.path.join(pasta_comp, empresa), exist_ok=True)
+    with open(os.path.join(pasta_comp, empresa, f"NFSe_{numero_nf}.pdf"), "wb") as f:
+        f.write(f"pdf {numero_nf}".encode())
+    writer = log_writer.LogStreamWriter(pasta_comp, competencia)
+    writer.adicionar({"NUMERO_NF": numero_nf, "CNPJ_PRESTADOR": "12345678000190", "RAZAO_PRESTADOR": empresa})
+    writer.fechar()
+    run_ledger.iniciar_execucao(pasta, execucao_id, competencia, 1, origem="cli")
+    run_ledger.registrar_cliente(pasta, execucao_id, competencia, run_ledger.MetricasCliente(empresa=empresa, notas=1))
+    run_ledger.finalizar_execucao(pasta, execucao_id, "OK")
+
+
+def _estado(destino, competencia):
+    pasta_comp = os.path.join(destino, competencia)
+    arquivos = sorted(
+        os.path.relpath(os.path.join(raiz, n), pasta_comp)
+        for raiz, dirs, nomes in os.walk(pasta_comp)
+        for n in nomes
+        if not n.startswith("_") and not n.startswith("LOG_NFSE_")
+    )
+    with open(log_writer.caminho_journal(pasta_comp, competencia), encoding="utf-8") as f:
+        linhas = [json.loads(linha) for linha in f if linha.strip()]
+    execucoes = run_ledger.listar_execucoes(destino)
+    clientes = sorted(r["empresa"] for r in run_ledger.listar_clientes_execucoes(destino))
+    return arquivos, linhas, execucoes, clientes
+
+
+def test_juntar_duas_vezes_nao_duplica(tmp_path):
+    comp = "2025-03"
+    s1, s2, destino = str(tmp_path / "s1"), str(tmp_path / "s2"), str(tmp_path / "saidas")
+    _saida_do_shard(s1, comp, "1", "EMPRESA A", "exec-1")
+    _saida_do_shard(s2, comp, "2", "EMPRESA B", "exec-2")
+
+    shards.juntar([s1, s2], destino, formato_log="jsonl")
+    estado = _estado(destino, comp)
+    arquivos, linhas, execucoes, clientes = estado
+    assert arquivos == [os.path.join("EMPRESA A", "NFSe_1.pdf"), os.path.join("EMPRESA B", "NFSe_2.pdf")]
+    assert sorted(r["NUMERO_NF"] for r in linhas) == ["1", "2"]
+    assert sorted(e["id"] for e in execucoes) == ["exec-1", "exec-2"]
+    assert clientes == ["EMPRESA A", "EMPRESA B"]
+
+    resumo = shards.juntar([s1, s2], destino, formato_log="jsonl")
+    assert _estado(destino, comp) == estado
+    assert resumo["competencias"][comp]["novo"] == 0
+    assert resumo["competencias"][comp]["linhas_log"] == 0
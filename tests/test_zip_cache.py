@@ -0,0 +1,57 @@
+# tests/test_zip_cache.py
+import os
+import zipfile
+
+import pytest
+
+import zip_cache
+
+
+@pytest.fixture
+def pasta(tmp_path):
+    p = tmp_path / "2025-03"
+    (p / "ACME").mkdir(parents=True)
+    (p / "ACME" / "NFSe_1.xml").write_text("<nfse/>" * 100, encoding="utf-8")
+    (p / "ACME" / "NFSe_1.pdf").write_bytes(b"%PDF-1.4 conteudo")
+    (p / "~$LOG.xlsx").write_bytes(b"lock do Excel")
+    return p
+
+
+def test_zip_tem_os_arquivos_e_ignora_temporarios(pasta, tmp_path):
+    caminho = zip_cache.obter_zip(str(pasta), str(tmp_path / "cache"))
+    with zipfile.ZipFile(caminho) as z:
+        infos = {i.filename: i for i in z.infolist()}
+        assert sorted(infos) == ["ACME/NFSe_1.pdf", "ACME/NFSe_1.xml"]
+        assert infos["ACME/NFSe_1.pdf"].compress_type == zipfile.ZIP_STORED
+        assert infos["ACME/NFSe_1.xml"].compress_type == zipfile.ZIP_DEFLATED
+        assert z.read("ACME/NFSe_1.xml") == ("<nfse/>" * 100).encode()
+
+
+def test_pasta_sem_mudanca_reaproveita_o_zip(pasta, tmp_path):
+    cache = str(tmp_path / "cache")
+    primeiro = zip_cache.obter_zip(str(pasta), cache)
+    os.utime(primeiro, ns=(1, 1))  # marca: se for regravado, o mtime muda
+
+    assert zip_cache.obter_zip(str(pasta), cache) == primeiro
+    assert os.stat(primeiro).st_mtime_ns == 1
+    assert zip_cache.em_dia(primeiro, str(pasta))
+
+
+def test_mudanca_na_pasta_invalida_o_zip(pasta, tmp_path):
+    cache = str(tmp_path / "cache")
+    antigo = zip_cache.obter_zip(str(pasta), cache)
+    fp_antes = zip_cache.fingerprint(str(pasta))
+
+    (pasta / "ACME" / "NFSe_2.xml").write_text("<nfse/>", encoding="utf-8")
+
+    assert zip_cache.fingerprint(str(pasta)) != fp_antes
+    assert not zip_cache.em_dia(antigo, str(pasta))
+    novo = zip_cache.obter_zip(str(pasta), cache)
+    assert novo != antigo
+    assert not os.path.exists(antigo)  # versão anterior da mesma pasta é apagada
+    with zipfile.ZipFile(novo) as z:
+        assert "ACME/NFSe_2.xml" in z.namelist()
+
+
+def test_em_dia_sem_arquivo(pasta, tmp_path):
+    assert not zip_cache.em_dia(str(tmp_path / "nao-existe.zip"), str(pasta))
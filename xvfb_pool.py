@@ -0,0 +1,185 @@
+# xvfb_pool.py
+import contextlib
+import os
+import queue
+import select
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from typing import Iterator, List, Optional
+
+import bot_logging
+
+log = bot_logging.obter_logger("xvfb")
+
+# Telas virtuais (Xvfb) para o login por certificado via imagem (pyautogui) rodar em paralelo no Linux:
+# cada cliente ganha um DISPLAY só seu enquanto roda; ao terminar, a tela volta ao pool para o próximo.
+
+RESOLUCAO_PADRAO = "1920x1080x24"
+
+
+class XvfbErro(RuntimeError):
+    pass
+
+
+def disponivel() -> bool:
+    return sys.platform.startswith("linux") and shutil.which("Xvfb") is not None
+
+
+class DisplayVirtual:
+    def __init__(self, numero: int, processo: subprocess.Popen):
+        self.numero = numero
+        self.processo = processo
+
+    @property
+    def nome(self) -> str:
+        return f":{self.numero}"
+
+    def ativo(self) -> bool:
+        return self.processo.poll() is None
+
+    def encerrar(self) -> None:
+        if not self.ativo():
+            return
+        self.processo.terminate()
+        try:
+            self.processo.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.processo.kill()
+            self.processo.wait()
+
+    def __repr__(self) -> str:
+        return f"<DisplayVirtual {self.nome} pid={self.processo.pid}>"
+
+
+def iniciar_display(resolucao: str = RESOLUCAO_PADRAO, timeout: float = 10.0) -> DisplayVirtual:
+    """
+    Sobe um Xvfb num número de display livre. O próprio Xvfb escolhe o número (-displayfd)
+    e o escreve no pipe quando já aceita conexões: sem corrida entre workers nem sleep fixo.
+    """
+    if not disponivel():
+        raise XvfbErro("Xvfb não encontrado (Linux: apt-get install xvfb).")
+
+    leitura, escrita = os.pipe()
+    try:
+        proc = subprocess.Popen(
+            ["Xvfb", "-displayfd", str(escrita), "-screen", "0", resolucao, "-nolisten", "tcp", "-nocursor"],
+            pass_fds=(escrita,),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    except OSError as e:
+        os.close(leitura)
+        raise XvfbErro(f"Falha ao iniciar o Xvfb: {e}") from e
+    finally:
+        os.close(escrita)
+
+    bruto = b""
+    limite = time.monotonic() + timeout
+    try:
+        while not bruto.endswith(b"\n"):
+            restante = limite - time.monotonic()
+            if restante <= 0 or not select.select([leitura], [], [], restante)[0]:
+                break
+            pedaco = os.read(leitura, 16)
+            if not pedaco:
+                break
+            bruto += pedaco
+    finally:
+        os.close(leitura)
+
+    try:
+        numero = int(bruto.strip())
+    except ValueError:
+        proc.kill()
+        proc.wait()
+        raise XvfbErro(f"Xvfb não informou o display em {timeout:.0f}s (código de saída: {proc.poll()}).")
+
+    display = DisplayVirtual(numero, proc)
+    log.debug(f"Xvfb iniciado em {display.nome} ({resolucao}, pid {proc.pid}).")
+    return display
+
+
+class PoolDisplays:
+    """
+    Até `tamanho` telas virtuais, criadas sob demanda e reaproveitadas entre clientes.
+
+        with PoolDisplays(3) as pool:
+            with pool.emprestar() as display:
+                ...  # DISPLAY=display.nome
+
+    Uma tela cujo Xvfb morreu é substituída na próxima vez que seria emprestada.
+    """
+
+    def __init__(self, tamanho: int, resolucao: str = RESOLUCAO_PADRAO):
+        self.tamanho = max(1, int(tamanho))
+        self.resolucao = resolucao
+        self._livres: "queue.Queue[DisplayVirtual]" = queue.Queue()
+        self._todos: List[DisplayVirtual] = []
+        self._reservados = 0
+        self._lock = threading.Lock()
+
+    def _subir(self) -> DisplayVirtual:
+        display = iniciar_display(self.resolucao)
+        with self._lock:
+            self._todos.append(display)
+        return display
+
+    def _obter(self, timeout: Optional[float]) -> DisplayVirtual:
+        try:
+            display = self._livres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                # reserva a vaga antes de subir o Xvfb (fora do lock)
+                criar = self._reservados < self.tamanho
+                if criar:
+                    self._reservados += 1
+            if criar:
+                try:
+                    return self._subir()
+                except Exception:
+                    with self._lock:
+                        self._reservados -= 1
+                    raise
+            try:
+                display = self._livres.get(timeout=timeout)
+            except queue.Empty:
+                raise XvfbErro(f"Nenhuma tela virtual livre em {timeout:.0f}s.") from None
+
+        if not display.ativo():
+            log.warning(f"Xvfb {display.nome} parou; subindo outra tela virtual.")
+            with self._lock:
+                self._todos.remove(display)
+            try:
+                return self._subir()
+            except Exception:
+                with self._lock:
+                    self._reservados -= 1
+                raise
+        return display
+
+    @contextlib.contextmanager
+    def emprestar(self, timeout: Optional[float] = None) -> Iterator[DisplayVirtual]:
+        display = self._obter(timeout)
+        try:
+            yield display
+        finally:
+            self._livres.put(display)
+
+    def encerrar(self) -> None:
+        with self._lock:
+            todos, self._todos = self._todos, []
+            self._reservados = 0
+        for display in todos:
+            try:
+                display.encerrar()
+            except Exception as e:
+                log.warning(f"Falha ao encerrar Xvfb {display.nome}: {e}")
+
+    def __enter__(self) -> "PoolDisplays":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.encerrar()
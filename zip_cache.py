@@ -0,0 +1,118 @@
+# zip_cache.py
+import hashlib
+import os
+import tempfile
+import threading
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+PASTA_CACHE_PADRAO = os.path.join(tempfile.gettempdir(), "portalnfse_zips")
+
+# Já comprimidos: deflate só gasta CPU e não reduz nada
+EXTENSOES_STORED = {".pdf", ".zip", ".png", ".jpg", ".jpeg", ".xlsx", ".parquet", ".gz"}
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _ignorar(nome: str) -> bool:
+    return nome.startswith("~$") or nome.endswith(".tmp")
+
+
+def _listar(folder: str) -> List[Tuple[str, str, int, int]]:
+    """(caminho, relativo, tamanho, mtime_ns) de todos os arquivos, só com stat (sem ler conteúdo)."""
+    saida = []
+    pendentes = [folder]
+    while pendentes:
+        atual = pendentes.pop()
+        try:
+            with os.scandir(atual) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        pendentes.append(entry.path)
+                        continue
+                    if _ignorar(entry.name):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    saida.append((entry.path, os.path.relpath(entry.path, folder), st.st_size, st.st_mtime_ns))
+        except OSError:
+            continue
+    saida.sort(key=lambda x: x[1])
+    return saida
+
+
+def _fingerprint_de(arquivos: List[Tuple[str, str, int, int]]) -> str:
+    h = hashlib.sha1()
+    for _, rel, tamanho, mtime in arquivos:
+        h.update(f"{rel}\0{tamanho}\0{mtime}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def fingerprint(folder: str) -> str:
+    """Impressão digital do conteúdo da pasta: muda quando qualquer arquivo entra, sai ou é alterado."""
+    return _fingerprint_de(_listar(folder))
+
+
+def _lock_para(chave: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(chave, threading.Lock())
+
+
+def _escrever_zip(destino: str, arquivos: List[Tuple[str, str, int, int]]) -> None:
+    """
+    Grava o ZIP direto no disco (arquivo temporário + troca atômica), sem BytesIO.
+
+    Hardening (Windows): arquivos bloqueados ou removidos no meio do caminho são ignorados.
+    """
+    tmp = destino + ".tmp"
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as z:
+        for full, rel, _, _ in arquivos:
+            ext = os.path.splitext(rel)[1].lower()
+            modo = zipfile.ZIP_STORED if ext in EXTENSOES_STORED else zipfile.ZIP_DEFLATED
+            try:
+                z.write(full, rel, compress_type=modo)
+            except (PermissionError, FileNotFoundError):
+                continue
+    os.replace(tmp, destino)
+
+
+def obter_zip(folder: str, pasta_cache: Optional[str] = None) -> str:
+    """
+    Devolve o caminho de um ZIP da pasta, reaproveitando o cache enquanto nada mudar.
+
+    O nome do arquivo em cache leva o hash do caminho da pasta e o fingerprint do
+    conteúdo; versões antigas da mesma pasta são apagadas ao gerar uma nova.
+    """
+    pasta_cache = pasta_cache or PASTA_CACHE_PADRAO
+    os.makedirs(pasta_cache, exist_ok=True)
+
+    folder = os.path.abspath(folder)
+    chave_pasta = hashlib.sha1(folder.encode("utf-8")).hexdigest()[:16]
+
+    with _lock_para(chave_pasta):
+        arquivos = _listar(folder)
+        destino = os.path.join(pasta_cache, f"{chave_pasta}-{_fingerprint_de(arquivos)[:16]}.zip")
+
+        if os.path.exists(destino):
+            return destino
+
+        for nome in os.listdir(pasta_cache):
+            if nome.startswith(chave_pasta + "-"):
+                try:
+                    os.remove(os.path.join(pasta_cache, nome))
+                except OSError:
+                    pass
+
+        _escrever_zip(destino, arquivos)
+        return destino
+
+
+def em_dia(caminho_zip: str, folder: str) -> bool:
+    """O ZIP devolvido por obter_zip() ainda existe e corresponde ao conteúdo atual da pasta."""
+    if not os.path.exists(caminho_zip):
+        return False
+    nome = os.path.splitext(os.path.basename(caminho_zip))[0]
+    return nome.rsplit("-", 1)[-1] == fingerprint(os.path.abspath(folder))[:16]